@@ -0,0 +1,73 @@
+"""
+Compares the native activation kernels with compositions of library ops, inside and outside grad mode.
+
+The composed relu allocated a zeros tensor, a comparison tensor and the condition result,
+so it reads the input twice and writes three full-size buffers. Inside no_grad() the native relu reads
+the input once and writes one buffer, or none at all in the in-place variant. In grad mode relu takes
+the library composition with a single comparison and condition op.
+
+The composed silu multiplies input by a sigmoid built from tanh, five library ops. The native silu
+writes the derivative and the offset of the output in its pass, and in grad mode connects them to
+autograd with one multiplication and one addition.
+
+Run with: python benchmarks/activation_benchmark.py
+"""
+
+import contextlib
+import time
+import numpy as np
+import tensor_array as ta
+import tensor_array.core as core
+from tensor_array import activation
+
+def composed_relu(input):
+    tensor_zeros = core.zeros(shape = input.shape(), dtype = input.dtype())
+    return core.condition(input > tensor_zeros, input, tensor_zeros)
+
+def composed_silu(input):
+    return input * (((input * 0.5).tanh() + 1.0) * 0.5)
+
+def measure(func, input, repeat):
+    func(input)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(input)
+    return (time.perf_counter() - start) / repeat
+
+def report(size, mode, name, seconds, moved):
+    print(f"{size:>10} {mode:>8} {name:>14} {seconds * 1e3:>9.3f} {moved / 1e6:>9.1f} {moved / seconds / 1e9:>7.2f}")
+
+def main():
+    repeat = 20
+    print(f"{'elements':>10} {'mode':>8} {'variant':>14} {'ms':>9} {'MB moved':>9} {'GB/s':>7}")
+    for size in (1 << 16, 1 << 20, 1 << 24):
+        input = core.Tensor(np.random.randn(size).astype(np.float32))
+        item_bytes = 4
+        # Bytes read + written per variant, counting each full-size buffer once.
+        composed_relu_moved = size * (item_bytes * 2 + item_bytes + 1 + item_bytes * 2)
+        composed_silu_moved = size * item_bytes * 2 * 5 + size * item_bytes
+        modes = (
+            ("no_grad", ta.no_grad, (
+                ("composed relu", composed_relu, composed_relu_moved),
+                ("native relu", activation.relu, size * item_bytes * 2),
+                ("composed silu", composed_silu, composed_silu_moved),
+                ("native silu", activation.silu, size * item_bytes * 2),
+            )),
+            # The native silu pass reads input and writes the derivative, the offset and a kept mask,
+            # then the multiplication and the addition each read two buffers and write one.
+            ("grad", contextlib.nullcontext, (
+                ("composed relu", composed_relu, composed_relu_moved),
+                ("relu", activation.relu, size * (item_bytes + 1 + item_bytes + 1 + item_bytes * 3)),
+                ("composed silu", composed_silu, composed_silu_moved),
+                ("native silu", activation.silu, size * (item_bytes * 3 + 1 + item_bytes * 6)),
+            )),
+        )
+        for mode, context, variants in modes:
+            with context():
+                for name, func, moved in variants:
+                    report(size, mode, name, measure(func, input, repeat), moved)
+        with ta.no_grad():
+            report(size, "no_grad", "native relu_", measure(activation.relu_, input, repeat), size * item_bytes * 2)
+
+if __name__ == "__main__":
+    main()
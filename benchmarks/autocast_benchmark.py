@@ -0,0 +1,45 @@
+"""
+Measures the inference time of a stack of transformer blocks in full precision and under autocast.
+
+Under autocast the weights are cast to BFLOAT16 or HALF once per region and the activations between the
+matmuls are stored in 16 bits, halving the memory they take and the bandwidth they need, while the
+products still accumulate in float. The peak scratch memory of the native kernels is reported next to the time.
+
+Run with: python benchmarks/autocast_benchmark.py
+"""
+
+import time
+import numpy as np
+import tensor_array as ta
+import tensor_array.core as core
+from tensor_array.layers.attention.transformer import TransformerEncoderImpl
+from tensor_array.layers.util import Sequential
+
+N_BLOCKS = 4
+BATCH, SEQUENCE, D_MODEL, N_HEAD, FF_SIZE = 8, 128, 512, 8, 2048
+
+def measure(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    repeat = 5
+    model = Sequential([TransformerEncoderImpl(D_MODEL, N_HEAD, FF_SIZE) for _ in range(N_BLOCKS)])
+    data = core.Tensor(np.random.randn(BATCH, SEQUENCE, D_MODEL).astype(np.float32))
+    print(f"{N_BLOCKS} blocks, input {BATCH}x{SEQUENCE}x{D_MODEL}, ff {FF_SIZE}, threads: {ta.get_num_threads()}")
+    print(f"{'precision':>10} {'forward ms':>12} {'scratch MB':>10}")
+    for name, dtype in (("float", None), ("bfloat16", core.DataTypes.BFLOAT16), ("half", core.DataTypes.HALF)):
+        def forward():
+            with core.inference_mode(), ta.autocast(dtype or core.DataTypes.BFLOAT16, enabled=dtype is not None):
+                model(data)
+        forward()
+        ta.reset_peak_memory_stats()
+        elapsed = measure(forward, repeat)
+        peak = ta.memory_stats()['peak_allocated_bytes'] / 2 ** 20
+        print(f"{name:>10} {elapsed * 1000:>12.1f} {peak:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measures the peak memory and the time of a training step of a stack of transformer blocks
+against the number of checkpointed segments of Sequential(checkpoint_segments=N).
+
+With N segments, only the activations at the boundaries of the segments and those of one segment
+being recomputed are alive during the backward pass, at the cost of running most of the forward twice.
+Every setting runs in its own process, so the peak resident set size of one does not hide another.
+
+Run with: python benchmarks/checkpoint_benchmark.py
+"""
+
+import resource
+import subprocess
+import sys
+import time
+import numpy as np
+import tensor_array.core as core
+from tensor_array.layers.attention.transformer import TransformerEncoderImpl
+from tensor_array.layers.util import Sequential
+
+N_BLOCKS = 8
+BATCH, SEQUENCE, D_MODEL, N_HEAD, FF_SIZE = 8, 128, 256, 4, 1024
+
+def resident_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() / 2 ** 20
+
+def run(segments):
+    model = Sequential([TransformerEncoderImpl(D_MODEL, N_HEAD, FF_SIZE) for _ in range(N_BLOCKS)], checkpoint_segments=segments)
+    data = core.Tensor(np.random.randn(BATCH, SEQUENCE, D_MODEL).astype(np.float32))
+    # The first call creates the parameters, the second one warms up the allocator.
+    with core.no_grad():
+        model(data)
+    params = list(model.parameters())
+    model(data).sum().calc_grad(inputs=params)
+    before = resident_mb()
+    start = time.perf_counter()
+    model(data).sum().calc_grad(inputs=params)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{segments:>9} {peak - before:>12.1f} {elapsed * 1000:>10.1f}")
+
+def main():
+    print(f"{N_BLOCKS} blocks, input {BATCH}x{SEQUENCE}x{D_MODEL}, ff {FF_SIZE}")
+    print(f"{'segments':>9} {'peak MB':>12} {'step ms':>10}")
+    sys.stdout.flush()
+    for segments in (0, 2, 4, 8):
+        subprocess.run([sys.executable, __file__, str(segments)], check=True)
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        main()
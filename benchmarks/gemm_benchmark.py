@@ -0,0 +1,49 @@
+"""
+Measures the throughput of matmul in GFLOP/s on square, skinny and batched shapes.
+
+The native GEMM (used without autograd) is compared with the library matmul (used when
+gradients are recorded) and with NumPy, which calls the BLAS it was built with.
+tensor2.has_blas() tells whether the native path dispatches to a CBLAS library
+(build with TENSOR_ARRAY_BLAS=openblas) or runs the built-in blocked kernel.
+
+Run with: python benchmarks/gemm_benchmark.py
+"""
+
+import time
+import numpy as np
+import tensor_array as ta
+import tensor_array.core as core
+from tensor_array import tensor2
+
+def measure(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    repeat = 5
+    shapes = (
+        ("square", (1024, 1024), (1024, 1024)),
+        ("skinny", (8, 4096), (4096, 4096)),
+        ("tall", (16384, 256), (256, 256)),
+        ("batched", (64, 128, 64), (64, 64, 128)),
+        ("broadcast", (32, 256, 512), (512, 512)),
+    )
+    print(f"blas: {tensor2.has_blas()}, threads: {ta.get_num_threads()}")
+    print(f"{'shape':>10} {'native':>10} {'library':>10} {'numpy':>10}  GFLOP/s")
+    for name, a_shape, b_shape in shapes:
+        a_data = np.random.randn(*a_shape).astype(np.float32)
+        b_data = np.random.randn(*b_shape).astype(np.float32)
+        flops = 2 * np.prod(np.broadcast_shapes(a_shape[:-2], b_shape[:-2]), dtype=np.float64) * a_shape[-2] * a_shape[-1] * b_shape[-1]
+        a = core.Tensor(a_data)
+        b = core.Tensor(b_data)
+        with ta.no_grad():
+            native = measure(lambda: a @ b, repeat)
+        library = measure(lambda: a @ b, repeat)
+        numpy = measure(lambda: a_data @ b_data, repeat)
+        print(f"{name:>10} {flops / native * 1e-9:>10.2f} {flops / library * 1e-9:>10.2f} {flops / numpy * 1e-9:>10.2f}")
+
+if __name__ == "__main__":
+    main()
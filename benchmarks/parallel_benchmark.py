@@ -0,0 +1,52 @@
+"""
+Measures how the native kernels scale with the size of the intra-op thread pool.
+
+Each kernel runs on one large input with 1, 2, 4, ... threads up to the number of hardware threads,
+and the speedup is relative to the serial run. Memory-bound kernels such as relu stop scaling
+once the memory bandwidth is saturated, compute-bound ones such as attention scale further.
+
+Run with: python benchmarks/parallel_benchmark.py
+"""
+
+import os
+import time
+import numpy as np
+import tensor_array as ta
+import tensor_array.core as core
+from tensor_array import activation
+from tensor_array.layers.attention.attention import scaled_dot_product_attention
+
+def measure(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    repeat = 10
+    x = core.Tensor(np.random.randn(1 << 24).astype(np.float32))
+    logits = core.Tensor(np.random.randn(4096, 1024).astype(np.float32))
+    q = core.Tensor(np.random.randn(32, 512, 64).astype(np.float32))
+    kernels = (
+        ("relu", lambda: activation.relu(x)),
+        ("softmax", lambda: activation.softmax(logits, -1)),
+        ("attention", lambda: scaled_dot_product_attention(q, q, q, is_causal=True)),
+    )
+    thread_counts = []
+    n = 1
+    while n <= (os.cpu_count() or 1):
+        thread_counts.append(n)
+        n *= 2
+    print(f"{'kernel':>10} {'threads':>8} {'ms':>9} {'speedup':>8}")
+    with ta.no_grad():
+        for name, func in kernels:
+            serial = None
+            for num_threads in thread_counts:
+                ta.set_num_threads(num_threads)
+                seconds = measure(func, repeat)
+                serial = serial or seconds
+                print(f"{name:>10} {num_threads:>8} {seconds * 1e3:>9.3f} {serial / seconds:>8.2f}")
+
+if __name__ == "__main__":
+    main()
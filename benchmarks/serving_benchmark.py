@@ -0,0 +1,43 @@
+"""
+Measures the throughput and the latency of BatchedInference against the size of its batches.
+
+A pool of local stand-in clients keeps sending requests of random sequence lengths to a small feed-forward
+network and waits for each answer before sending the next one, as concurrent callers of a web server would.
+A max_batch_size of 1 serves every request with its own forward pass.
+
+Run with: python benchmarks/serving_benchmark.py
+"""
+
+import asyncio
+import time
+import numpy as np
+from tensor_array import BatchedInference
+from tensor_array.activation import relu
+from tensor_array.layers.util import Activation, Linear, Sequential
+
+D_MODEL, FF_SIZE, MAX_LENGTH = 256, 1024, 32
+CLIENTS = 64
+DURATION = 3.0
+
+async def client(server, stop, rng):
+    while time.perf_counter() < stop:
+        await server(rng.standard_normal((int(rng.integers(1, MAX_LENGTH + 1)), D_MODEL), dtype=np.float32))
+
+async def measure(model, max_batch_size, max_wait_ms):
+    async with BatchedInference(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms) as server:
+        stop = time.perf_counter() + DURATION
+        await asyncio.gather(*(client(server, stop, np.random.default_rng(i)) for i in range(CLIENTS)))
+        return server.metrics()
+
+def main():
+    model = Sequential([Linear(FF_SIZE), Activation(relu), Linear(D_MODEL)])
+    model.eval()
+    print(f"{CLIENTS} clients, {DURATION:.0f} s per setting")
+    print(f"{'batch':>6} {'wait ms':>8} {'req/s':>9} {'mean batch':>11} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    for max_batch_size, max_wait_ms in ((1, 0.0), (8, 1.0), (32, 2.0), (64, 5.0)):
+        metrics = asyncio.run(measure(model, max_batch_size, max_wait_ms))
+        latency = metrics['latency_ms']
+        print(f"{max_batch_size:>6} {max_wait_ms:>8.1f} {metrics['requests'] / DURATION:>9.0f} {metrics['mean_batch_size']:>11.1f} {latency['p50']:>8.2f} {latency['p90']:>8.2f} {latency['p99']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares eager calls of a small layer stack with replays of its traced graph.
+
+With a batch of one, an eager call spends most of its time in Python: Layer.__call__,
+attribute lookups across the layer dictionaries and the Tensor wrappers of every op.
+A replay runs the recorded native ops from C++, so what remains is the cost of the ops themselves.
+
+Run with: python benchmarks/trace_benchmark.py
+"""
+
+import time
+import numpy as np
+import tensor_array as ta
+import tensor_array.core as core
+from tensor_array.layers import Layer
+from tensor_array.layers.util import Linear
+from tensor_array.activation import relu
+
+class MLP(Layer):
+    def __init__(self) -> None:
+        super().__init__()
+        self.fc1 = Linear(64)
+        self.fc2 = Linear(64)
+        self.fc3 = Linear(16)
+
+    def calculate(self, t):
+        return self.fc3(relu(self.fc2(relu(self.fc1(t)))))
+
+def measure(func, input, repeat):
+    func(input)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(input)
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    repeat = 200
+    print(f"{'batch':>6} {'eager us':>10} {'traced us':>10} {'speedup':>8}")
+    for batch in (1, 8, 64):
+        model = MLP()
+        model.eval()
+        input = core.Tensor(np.random.randn(batch, 64).astype(np.float32))
+        traced = ta.trace(model, input)
+        with ta.no_grad():
+            eager_seconds = measure(model, input, repeat)
+        traced_seconds = measure(traced, input, repeat)
+        print(f"{batch:>6} {eager_seconds * 1e6:>10.1f} {traced_seconds * 1e6:>10.1f} {eager_seconds / traced_seconds:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,559 @@
+#include "activation.hh"
+#include "autocast.hh"
+#include "binary.hh"
+#include "cpu_kernel.hh"
+#include "half.hh"
+#include <atomic>
+#include <cmath>
+#include <string>
+
+using namespace tensor_array::value;
+
+/*
+ * Runs an elementwise activation in a single pass over the input.
+ * kernel(x, dx) returns the activation of x and, when dx is not null,
+ * stores its derivative there for the backward pass.
+ * In grad mode the same pass writes what attach_elementwise_grad needs instead of the output.
+ * HALF and BFLOAT16 inputs are computed in float and stored back in their type.
+ */
+template <typename Kernel>
+Tensor elementwise_activation(const Tensor& input, Kernel kernel)
+{
+	TensorBase input_buffer = host_buffer(input);
+	const std::type_info& type = input_buffer.type();
+	std::vector<unsigned int> shape_vec = shape_of(input_buffer);
+	std::size_t size = element_count(input_buffer);
+	bool with_grad = is_grad_enabled();
+	/* The output, or in grad mode its offset from input * derivative. */
+	TensorBase output(type, shape_vec);
+	TensorBase derivative = with_grad ? TensorBase(type, shape_vec) : TensorBase();
+	TensorBase kept = with_grad ? TensorBase(typeid(bool), shape_vec) : TensorBase();
+	std::atomic<bool> any_dropped(false);
+	dispatch_floating_storage
+	(
+		type,
+		[&](auto tag)
+		{
+			using S = decltype(tag);
+			using T = compute_t<S>;
+			const S* x = static_cast<const S*>(input_buffer.data());
+			S* y = mutable_data<S>(output);
+			S* dx = with_grad ? mutable_data<S>(derivative) : nullptr;
+			bool* keep = with_grad ? mutable_data<bool>(kept) : nullptr;
+			parallel_for
+			(
+				0, size, DEFAULT_GRAIN_SIZE,
+				[&](std::size_t begin, std::size_t end)
+				{
+					if (dx)
+					{
+						bool dropped = false;
+						for (std::size_t i = begin; i < end; i++)
+						{
+							T d;
+							T value = kernel(load(x[i]), &d);
+							dx[i] = store<S>(d);
+							/* The product the library computes from the stored derivative. */
+							T product = load(x[i]) * load(dx[i]);
+							keep[i] = std::isfinite(product) || product == value;
+							dropped |= !keep[i];
+							y[i] = store<S>(!keep[i] ? value : std::isfinite(product) ? value - product : T(0));
+						}
+						if (dropped)
+							any_dropped.store(true, std::memory_order_relaxed);
+					}
+					else
+						for (std::size_t i = begin; i < end; i++)
+							y[i] = store<S>(kernel(load(x[i]), static_cast<T*>(nullptr)));
+				}
+			);
+		}
+	);
+	if (!with_grad)
+		return Tensor(to_device_of(std::move(output), input));
+	std::optional<TensorBase> kept_mask;
+	if (any_dropped.load())
+		kept_mask = std::move(kept);
+	return attach_elementwise_grad(input, std::move(output), std::move(derivative), std::move(kept_mask));
+}
+
+/*
+ * Checks that self can be overwritten by an activation. Like out= ops, in-place activations bypass
+ * autograd and the tracer, which would replay the graph without them, so both refuse them.
+ */
+void check_inplace_activation(const Tensor& self)
+{
+	if (is_grad_enabled())
+		throw std::runtime_error("in-place activations can not be recorded by autograd, use them inside no_grad()");
+	if (active_trace() != nullptr)
+		throw std::runtime_error("in-place activations can not be traced");
+	if (!is_host_buffer(self.get_buffer()))
+		throw std::runtime_error("in-place activations are only available for CPU tensors");
+}
+
+/* Overwrites the host buffer of self with the activation, for inference only. */
+template <typename Kernel>
+Tensor& elementwise_activation_(Tensor& self, Kernel kernel)
+{
+	check_inplace_activation(self);
+	const TensorBase& buffer = self.get_buffer();
+	std::size_t size = element_count(buffer);
+	dispatch_floating_storage
+	(
+		buffer.type(),
+		[&](auto tag)
+		{
+			using S = decltype(tag);
+			using T = compute_t<S>;
+			S* x = mutable_data<S>(buffer);
+			parallel_for
+			(
+				0, size, DEFAULT_GRAIN_SIZE,
+				[&](std::size_t begin, std::size_t end)
+				{
+					for (std::size_t i = begin; i < end; i++)
+						x[i] = store<S>(kernel(load(x[i]), static_cast<T*>(nullptr)));
+				}
+			);
+		}
+	);
+	return self;
+}
+
+auto relu_kernel()
+{
+	return [](auto x, auto* dx)
+	{
+		using T = decltype(x);
+		if (dx)
+			*dx = x > T(0) ? T(1) : T(0);
+		return x > T(0) ? x : T(0);
+	};
+}
+
+auto leaky_relu_kernel(double negative_slope)
+{
+	return [negative_slope](auto x, auto* dx)
+	{
+		using T = decltype(x);
+		T slope = static_cast<T>(negative_slope);
+		if (dx)
+			*dx = x > T(0) ? T(1) : slope;
+		return x > T(0) ? x : x * slope;
+	};
+}
+
+auto sigmoid_kernel()
+{
+	return [](auto x, auto* dx)
+	{
+		using T = decltype(x);
+		T s = T(1) / (T(1) + std::exp(-x));
+		if (dx)
+			*dx = s * (T(1) - s);
+		return s;
+	};
+}
+
+/* silu and gelu tend to relu at -inf and +inf, where their formulas would give x * 0 = NaN. */
+template <typename T>
+T relu_limit(T x, T* dx)
+{
+	if (dx)
+		*dx = x > T(0) ? T(1) : T(0);
+	return x > T(0) ? x : T(0);
+}
+
+auto silu_kernel()
+{
+	return [](auto x, auto* dx)
+	{
+		using T = decltype(x);
+		if (std::isinf(x))
+			return relu_limit(x, dx);
+		T s = T(1) / (T(1) + std::exp(-x));
+		if (dx)
+			*dx = s * (T(1) + x * (T(1) - s));
+		return x * s;
+	};
+}
+
+auto gelu_kernel(const std::string& approximate)
+{
+	if (approximate != "none" && approximate != "tanh")
+		throw pybind11::value_error("approximate must be \"none\" or \"tanh\", got \"" + approximate + "\"");
+	bool use_tanh = approximate == "tanh";
+	return [use_tanh](auto x, auto* dx)
+	{
+		using T = decltype(x);
+		if (std::isinf(x))
+			return relu_limit(x, dx);
+		if (use_tanh)
+		{
+			const T k = static_cast<T>(0.7978845608028654);
+			const T c = static_cast<T>(0.044715);
+			T t = std::tanh(k * (x + c * x * x * x));
+			if (dx)
+				*dx = T(0.5) * (T(1) + t) + T(0.5) * x * (T(1) - t * t) * k * (T(1) + T(3) * c * x * x);
+			return T(0.5) * x * (T(1) + t);
+		}
+		T cdf = T(0.5) * (T(1) + std::erf(x * static_cast<T>(0.7071067811865476)));
+		if (dx)
+			*dx = cdf + x * std::exp(T(-0.5) * x * x) * static_cast<T>(0.3989422804014327);
+		return x * cdf;
+	};
+}
+
+/*
+ * Device tensors stay on the device: their activations are composed of library ops,
+ * which autograd records as usual. So are the integer tensors relu took before the native kernels.
+ */
+bool on_device(const Tensor& input)
+{
+	return !is_host_buffer(input.get_buffer());
+}
+
+bool is_integer_type(const std::type_info& type)
+{
+	return is_arithmetic_type(type) && type != typeid(float) && type != typeid(double);
+}
+
+/* A Python number of the kind of type, so binary_scalar does not promote integer tensors. */
+Scalar number_like(const std::type_info& type, double value)
+{
+	return is_integer_type(type) ? Scalar(static_cast<long long>(value)) : Scalar(value);
+}
+
+Tensor library_leaky_relu(const Tensor& input, double negative_slope)
+{
+	const std::type_info& type = input.get_buffer().type();
+	Tensor positive = binary_scalar(input, number_like(type, 0.0), BinaryOp::GT, false);
+	/* A full-size zero keeps select on the library condition op, with no broadcast to record in grad mode. */
+	if (negative_slope == 0.0)
+		return select(positive, input, Tensor(zeros_like(input)));
+	return select(positive, input, binary_scalar(input, negative_slope, BinaryOp::MUL, false));
+}
+
+/* sigmoid(x) = (1 + tanh(x / 2)) / 2, the library having tanh but no exp. */
+Tensor library_sigmoid(const Tensor& input)
+{
+	Tensor t = binary_scalar(input, 0.5, BinaryOp::MUL, false).tanh();
+	return binary_scalar(binary_scalar(t, 1.0, BinaryOp::ADD, false), 0.5, BinaryOp::MUL, false);
+}
+
+Tensor library_gelu_tanh(const Tensor& input)
+{
+	Tensor cube = input * input * input;
+	Tensor inner = binary_scalar(input + binary_scalar(cube, 0.044715, BinaryOp::MUL, false), 0.7978845608028654, BinaryOp::MUL, false);
+	return binary_scalar(input * binary_scalar(inner.tanh(), 1.0, BinaryOp::ADD, false), 0.5, BinaryOp::MUL, false);
+}
+
+/*
+ * In grad mode FLOAT and DOUBLE relu and leaky_relu also take the library composition: a native
+ * comparison and one condition op move fewer bytes than the kernel and its two-op backward attachment.
+ */
+bool library_in_grad_mode(const Tensor& input)
+{
+	return is_grad_enabled() && is_arithmetic_type(input.get_buffer().type());
+}
+
+Tensor py_relu(const Tensor& input)
+{
+	if (on_device(input) || is_integer_type(input.get_buffer().type()) || library_in_grad_mode(input))
+		return library_leaky_relu(input, 0.0);
+	return elementwise_activation(input, relu_kernel());
+}
+
+Tensor py_leaky_relu(const Tensor& input, double negative_slope)
+{
+	if (on_device(input) || library_in_grad_mode(input))
+		return library_leaky_relu(input, negative_slope);
+	return elementwise_activation(input, leaky_relu_kernel(negative_slope));
+}
+
+Tensor py_sigmoid(const Tensor& input)
+{
+	if (on_device(input))
+		return library_sigmoid(input);
+	return elementwise_activation(input, sigmoid_kernel());
+}
+
+Tensor py_silu(const Tensor& input)
+{
+	if (on_device(input))
+		return input * library_sigmoid(input);
+	return elementwise_activation(input, silu_kernel());
+}
+
+/* The library has no erf, so the exact gelu of a device tensor runs on the host. */
+Tensor py_gelu(const Tensor& input, const std::string& approximate)
+{
+	auto kernel = gelu_kernel(approximate);
+	if (on_device(input) && approximate == "tanh")
+		return library_gelu_tanh(input);
+	return elementwise_activation(input, kernel);
+}
+
+/*
+ * Sum of value along dim broadcast back to the shape of value, built from library ops
+ * so that it is differentiable: two matmuls with vectors of ones along dim.
+ */
+Tensor broadcast_sum(const Tensor& value, int dim, int ndim, std::size_t length)
+{
+	const std::type_info& type = value.get_buffer().type();
+	TensorBase ones_column(type, {static_cast<unsigned int>(length), 1U});
+	TensorBase ones_row(type, {1U, static_cast<unsigned int>(length)});
+	dispatch_floating
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			std::fill_n(mutable_data<T>(ones_column), length, T(1));
+			std::fill_n(mutable_data<T>(ones_row), length, T(1));
+		}
+	);
+	bool is_last = dim == ndim - 1;
+	Tensor moved = is_last ? value : value.transpose(dim, ndim - 1, true);
+	Tensor summed = matmul(matmul(moved, Tensor(to_device_of(std::move(ones_column), value))), Tensor(to_device_of(std::move(ones_row), value)));
+	return is_last ? summed : summed.transpose(dim, ndim - 1, true);
+}
+
+/*
+ * Numerically stable softmax or log_softmax along dim, one pass for the maximum
+ * and the sum of exponentials and one pass for the output of each slice.
+ * Inside autocast, HALF and BFLOAT16 inputs are taken in FLOAT and so is the output.
+ */
+Tensor softmax_along(const Tensor& input, int dim, bool is_log)
+{
+	if (autocast_type() != nullptr && is_16bit_float_type(input.get_buffer().type()))
+		return softmax_along(autocast_upcast(input), dim, is_log);
+	TensorBase input_buffer = host_buffer(input);
+	const std::type_info& type = input_buffer.type();
+	std::vector<unsigned int> shape_vec = shape_of(input_buffer);
+	int ndim = static_cast<int>(shape_vec.size());
+	DimSplit split = split_at_dim(shape_vec, dim);
+	if (dim < 0)
+		dim += ndim;
+	bool with_grad = is_grad_enabled();
+	TensorBase output(type, shape_vec);
+	/* log_softmax needs the probabilities for its backward. */
+	TensorBase probs = with_grad && is_log ? TensorBase(type, shape_vec) : TensorBase();
+	dispatch_floating
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const T* x = static_cast<const T*>(input_buffer.data());
+			T* y = mutable_data<T>(output);
+			T* p = with_grad && is_log ? mutable_data<T>(probs) : nullptr;
+			parallel_for
+			(
+				0, split.outer * split.inner, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / std::max<std::size_t>(split.length, 1), 1),
+				[&](std::size_t row_begin, std::size_t row_end)
+				{
+					for (std::size_t row = row_begin; row < row_end; row++)
+					{
+						std::size_t base = row / split.inner * split.length * split.inner + row % split.inner;
+						T max_value = x[base];
+						for (std::size_t j = 1; j < split.length; j++)
+							max_value = std::max(max_value, x[base + j * split.inner]);
+						T sum = T(0);
+						for (std::size_t j = 0; j < split.length; j++)
+							sum += std::exp(x[base + j * split.inner] - max_value);
+						T log_sum = std::log(sum);
+						for (std::size_t j = 0; j < split.length; j++)
+						{
+							std::size_t index = base + j * split.inner;
+							T shifted = x[index] - max_value;
+							if (is_log)
+							{
+								y[index] = shifted - log_sum;
+								if (p)
+									p[index] = std::exp(y[index]);
+							}
+							else
+								y[index] = std::exp(shifted) / sum;
+						}
+					}
+				}
+			);
+		}
+	);
+	Tensor result(to_device_of(std::move(output), input));
+	if (!with_grad)
+		return result;
+	/*
+	 * With z = input - leaf(input), s the probabilities and B the broadcast sum along dim:
+	 *     softmax:     s + s * z - s * B(s * z)  passes input  s * (grad - B(grad * s))
+	 *     log_softmax: y + z - B(s * z)          passes input  grad - s * B(grad)
+	 */
+	Tensor z = identity_grad_zero(input);
+	if (is_log)
+	{
+		Tensor s(to_device_of(std::move(probs), input));
+		return result + z - broadcast_sum(s * z, dim, ndim, split.length);
+	}
+	Tensor s_times_z = result * z;
+	return result + s_times_z - result * broadcast_sum(s_times_z, dim, ndim, split.length);
+}
+
+Tensor& softmax_along_(Tensor& self, int dim, bool is_log)
+{
+	check_inplace_activation(self);
+	const TensorBase& buffer = self.get_buffer();
+	DimSplit split = split_at_dim(shape_of(buffer), dim);
+	dispatch_floating
+	(
+		buffer.type(),
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			T* x = mutable_data<T>(buffer);
+			parallel_for
+			(
+				0, split.outer * split.inner, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / std::max<std::size_t>(split.length, 1), 1),
+				[&](std::size_t row_begin, std::size_t row_end)
+				{
+					for (std::size_t row = row_begin; row < row_end; row++)
+					{
+						std::size_t base = row / split.inner * split.length * split.inner + row % split.inner;
+						T max_value = x[base];
+						for (std::size_t j = 1; j < split.length; j++)
+							max_value = std::max(max_value, x[base + j * split.inner]);
+						T sum = T(0);
+						for (std::size_t j = 0; j < split.length; j++)
+							sum += std::exp(x[base + j * split.inner] - max_value);
+						T log_sum = std::log(sum);
+						for (std::size_t j = 0; j < split.length; j++)
+						{
+							T& value = x[base + j * split.inner];
+							value = is_log ? value - max_value - log_sum : std::exp(value - max_value) / sum;
+						}
+					}
+				}
+			);
+		}
+	);
+	return self;
+}
+
+Tensor py_softmax(const Tensor& input, int dim)
+{
+	return softmax_along(input, dim, false);
+}
+
+Tensor py_log_softmax(const Tensor& input, int dim)
+{
+	return softmax_along(input, dim, true);
+}
+
+void bind_activation(pybind11::module_& m)
+{
+	m.def(
+		"relu",
+		traced(&py_relu, [](const Tensor&) { return unary_op_info("relu", relu_kernel()); }),
+		pybind11::arg("input")
+	);
+
+	m.def(
+		"leaky_relu",
+		traced(&py_leaky_relu, [](const Tensor&, double negative_slope) { return unary_op_info("leaky_relu", leaky_relu_kernel(negative_slope)); }),
+		pybind11::arg("input"),
+		pybind11::arg("negative_slope") = 0.01
+	);
+
+	m.def(
+		"gelu",
+		traced(&py_gelu, [](const Tensor&, const std::string& approximate) { return unary_op_info("gelu", gelu_kernel(approximate)); }),
+		pybind11::arg("input"),
+		pybind11::arg("approximate") = "none"
+	);
+
+	m.def(
+		"silu",
+		traced(&py_silu, [](const Tensor&) { return unary_op_info("silu", silu_kernel()); }),
+		pybind11::arg("input")
+	);
+
+	m.def(
+		"sigmoid",
+		traced(&py_sigmoid, [](const Tensor&) { return unary_op_info("sigmoid", sigmoid_kernel()); }),
+		pybind11::arg("input")
+	);
+
+	m.def(
+		"softmax",
+		traced(&py_softmax, "softmax"),
+		pybind11::arg("input"),
+		pybind11::arg("dim") = 0
+	);
+
+	m.def(
+		"log_softmax",
+		traced(&py_log_softmax, "log_softmax"),
+		pybind11::arg("input"),
+		pybind11::arg("dim") = 0
+	);
+
+	m.def(
+		"relu_",
+		[](Tensor& self) -> Tensor& { return elementwise_activation_(self, relu_kernel()); },
+		pybind11::arg("input"),
+		pybind11::return_value_policy::reference,
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"leaky_relu_",
+		[](Tensor& self, double negative_slope) -> Tensor& { return elementwise_activation_(self, leaky_relu_kernel(negative_slope)); },
+		pybind11::arg("input"),
+		pybind11::arg("negative_slope") = 0.01,
+		pybind11::return_value_policy::reference,
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"gelu_",
+		[](Tensor& self, const std::string& approximate) -> Tensor& { return elementwise_activation_(self, gelu_kernel(approximate)); },
+		pybind11::arg("input"),
+		pybind11::arg("approximate") = "none",
+		pybind11::return_value_policy::reference,
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"silu_",
+		[](Tensor& self) -> Tensor& { return elementwise_activation_(self, silu_kernel()); },
+		pybind11::arg("input"),
+		pybind11::return_value_policy::reference,
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"sigmoid_",
+		[](Tensor& self) -> Tensor& { return elementwise_activation_(self, sigmoid_kernel()); },
+		pybind11::arg("input"),
+		pybind11::return_value_policy::reference,
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"softmax_",
+		[](Tensor& self, int dim) -> Tensor& { return softmax_along_(self, dim, false); },
+		pybind11::arg("input"),
+		pybind11::arg("dim") = 0,
+		pybind11::return_value_policy::reference,
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"log_softmax_",
+		[](Tensor& self, int dim) -> Tensor& { return softmax_along_(self, dim, true); },
+		pybind11::arg("input"),
+		pybind11::arg("dim") = 0,
+		pybind11::return_value_policy::reference,
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+}
@@ -0,0 +1,7 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+
+tensor_array::value::Tensor softmax_along(const tensor_array::value::Tensor& input, int dim, bool is_log);
+
+void bind_activation(pybind11::module_& m);
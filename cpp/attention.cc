@@ -0,0 +1,598 @@
+#include "attention.hh"
+#include "cpu_kernel.hh"
+#include "activation.hh"
+#include "autocast.hh"
+#include "binary.hh"
+#include "half.hh"
+#include "host_allocator.hh"
+#include <pybind11/stl.h>
+#include <cmath>
+#include <limits>
+#include <string>
+
+using namespace tensor_array::value;
+
+/* Number of keys whose scores are computed together before the running softmax is rescaled. */
+constexpr std::size_t ATTENTION_KEY_BLOCK = 64;
+
+struct AttentionShape
+{
+	std::vector<unsigned int> batch_shape;
+	std::size_t batch;
+	std::size_t query_length;
+	std::size_t key_length;
+	std::size_t head_dim;
+	std::size_t value_dim;
+};
+
+AttentionShape check_attention_shape(const TensorBase& query, const TensorBase& key, const TensorBase& value)
+{
+	std::vector<unsigned int> q_shape = shape_of(query);
+	std::vector<unsigned int> k_shape = shape_of(key);
+	std::vector<unsigned int> v_shape = shape_of(value);
+	if (q_shape.size() < 2 || q_shape.size() != k_shape.size() || q_shape.size() != v_shape.size())
+		throw pybind11::value_error("query, key and value must have the same number of dimensions, at least 2");
+	std::size_t ndim = q_shape.size();
+	AttentionShape result;
+	result.batch_shape.assign(q_shape.begin(), q_shape.end() - 2);
+	if (!std::equal(result.batch_shape.begin(), result.batch_shape.end(), k_shape.begin()) || !std::equal(result.batch_shape.begin(), result.batch_shape.end(), v_shape.begin()))
+		throw pybind11::value_error("query, key and value must have the same batch dimensions");
+	result.batch = std::accumulate(result.batch_shape.begin(), result.batch_shape.end(), std::size_t(1), std::multiplies<std::size_t>());
+	result.query_length = q_shape[ndim - 2];
+	result.key_length = k_shape[ndim - 2];
+	result.head_dim = q_shape[ndim - 1];
+	result.value_dim = v_shape[ndim - 1];
+	if (k_shape[ndim - 1] != result.head_dim)
+		throw pybind11::value_error("query and key must have the same last dimension");
+	if (v_shape[ndim - 2] != result.key_length)
+		throw pybind11::value_error("key and value must have the same sequence length");
+	return result;
+}
+
+/*
+ * Offsets of the [query_length, key_length] mask matrix for each flattened batch index,
+ * broadcasting mask dimensions that are missing or of size 1.
+ */
+std::vector<std::size_t> mask_batch_offsets(const std::vector<unsigned int>& mask_shape, const AttentionShape& shape)
+{
+	std::size_t mask_ndim = mask_shape.size();
+	std::size_t batch_ndim = shape.batch_shape.size();
+	if (mask_ndim < 2 || mask_ndim - 2 > batch_ndim || mask_shape[mask_ndim - 2] != shape.query_length || mask_shape[mask_ndim - 1] != shape.key_length)
+		throw pybind11::value_error("mask must have shape [..., query_length, key_length] broadcastable to the attention scores");
+	std::vector<std::size_t> strides(batch_ndim, 0);
+	std::size_t stride = shape.query_length * shape.key_length;
+	for (std::size_t i = 0; i < mask_ndim - 2; i++)
+	{
+		std::size_t mask_dim = mask_ndim - 3 - i;
+		std::size_t batch_dim = batch_ndim - 1 - i;
+		if (mask_shape[mask_dim] != 1 && mask_shape[mask_dim] != shape.batch_shape[batch_dim])
+			throw pybind11::value_error("mask batch dimensions are not broadcastable to the attention scores");
+		strides[batch_dim] = mask_shape[mask_dim] == 1 ? 0 : stride;
+		stride *= mask_shape[mask_dim];
+	}
+	std::vector<std::size_t> offsets(shape.batch, 0);
+	for (std::size_t b = 0; b < shape.batch; b++)
+		for (std::size_t rest = b, i = batch_ndim; i-- > 0;)
+		{
+			offsets[b] += rest % shape.batch_shape[i] * strides[i];
+			rest /= shape.batch_shape[i];
+		}
+	return offsets;
+}
+
+/*
+ * Range of keys each query row attends to. key_lengths and query_offsets are given
+ * per sequence, that is per index of the first batch dimension, for padded batches
+ * and key/value caches; without them all keys are valid and the last query is
+ * aligned to the last key for causal masking.
+ */
+struct KeyRange
+{
+	const AttentionShape& shape;
+	const std::optional<std::vector<unsigned int>>& key_lengths;
+	const std::optional<std::vector<unsigned int>>& query_offsets;
+	bool is_causal;
+	std::size_t sequence_stride;
+
+	KeyRange
+	(
+		const AttentionShape& shape,
+		const std::optional<std::vector<unsigned int>>& key_lengths,
+		const std::optional<std::vector<unsigned int>>& query_offsets,
+		bool is_causal
+	):
+		shape(shape),
+		key_lengths(key_lengths),
+		query_offsets(query_offsets),
+		is_causal(is_causal),
+		sequence_stride(shape.batch_shape.empty() ? 1 : shape.batch / shape.batch_shape[0])
+	{
+		std::size_t sequences = shape.batch_shape.empty() ? 1 : shape.batch_shape[0];
+		if (key_lengths && key_lengths->size() != sequences)
+			throw pybind11::value_error("key_lengths must have one length per sequence of the first batch dimension");
+		if (query_offsets && query_offsets->size() != sequences)
+			throw pybind11::value_error("query_offsets must have one offset per sequence of the first batch dimension");
+		if (key_lengths)
+			for (unsigned int length: *key_lengths)
+				if (length > shape.key_length)
+					throw pybind11::value_error("key_lengths can not be larger than the key length");
+	}
+
+	std::size_t end(std::size_t b, std::size_t i) const
+	{
+		std::size_t sequence = b / sequence_stride;
+		std::size_t valid = key_lengths ? (*key_lengths)[sequence] : shape.key_length;
+		if (!is_causal)
+			return valid;
+		std::size_t offset = query_offsets ? (*query_offsets)[sequence] : valid - std::min(valid, shape.query_length);
+		return std::min(valid, i + offset + 1);
+	}
+};
+
+/*
+ * Converts a boolean mask (true means the key is attended) or an additive mask
+ * of the type S of the query to an additive mask of the type T the scores are computed in.
+ */
+template <typename S, typename T = compute_t<S>>
+host_vector<T> additive_mask(const TensorBase& mask)
+{
+	std::size_t size = element_count(mask);
+	host_vector<T> result(size);
+	if (mask.type() == typeid(bool))
+	{
+		const bool* data = static_cast<const bool*>(mask.data());
+		for (std::size_t i = 0; i < size; i++)
+			result[i] = data[i] ? T(0) : -std::numeric_limits<T>::infinity();
+	}
+	else if (mask.type() == typeid(S))
+	{
+		const S* data = static_cast<const S*>(mask.data());
+		for (std::size_t i = 0; i < size; i++)
+			result[i] = load(data[i]);
+	}
+	else
+		throw pybind11::type_error("mask must be a BOOL tensor or have the type of query");
+	return result;
+}
+
+/*
+ * Where the rows of one operand live in its buffer. The flattened batch index b is split
+ * into (b / heads, b % heads), so the heads of a packed [batch, length, heads * dim]
+ * projection are read in place instead of being reshaped and transposed first.
+ */
+struct RowLayout
+{
+	std::size_t heads;
+	std::size_t batch_stride;
+	std::size_t head_stride;
+	std::size_t row_stride;
+	std::size_t offset;
+
+	std::size_t at(std::size_t b, std::size_t i) const
+	{
+		return offset + b / heads * batch_stride + b % heads * head_stride + i * row_stride;
+	}
+
+	static RowLayout contiguous(std::size_t length, std::size_t dim)
+	{
+		return RowLayout{1, length * dim, 0, dim, 0};
+	}
+};
+
+/*
+ * Flash-attention style forward: for each query row, the keys are visited in blocks
+ * and the softmax is kept as a running maximum and sum, so the scores are never stored
+ * beyond one block. Operands stored as S are computed in T, float for HALF and BFLOAT16.
+ */
+template <typename S, typename T = compute_t<S>>
+void attention_kernel
+(
+	const S* q, const RowLayout& q_layout,
+	const S* k, const RowLayout& k_layout,
+	const S* v, const RowLayout& v_layout,
+	S* out, const RowLayout& out_layout,
+	const AttentionShape& shape,
+	const std::optional<Tensor>& mask,
+	const KeyRange& key_range,
+	double scale
+)
+{
+	host_vector<T> mask_values;
+	std::vector<std::size_t> mask_offsets;
+	if (mask)
+	{
+		TensorBase mask_buffer = host_buffer(*mask);
+		mask_values = additive_mask<S>(mask_buffer);
+		mask_offsets = mask_batch_offsets(shape_of(mask_buffer), shape);
+	}
+	const T neg_inf = -std::numeric_limits<T>::infinity();
+	/* Rows are independent, each thread visits its own range of (batch, query) rows with its own scratch. */
+	std::size_t row_cost = std::max<std::size_t>(shape.key_length * (shape.head_dim + shape.value_dim), 1);
+	parallel_for
+	(
+		0, shape.batch * shape.query_length, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / row_cost, 1),
+		[&](std::size_t row_begin, std::size_t row_end)
+		{
+			host_vector<T> scores(ATTENTION_KEY_BLOCK);
+			host_vector<T> acc(shape.value_dim);
+			for (std::size_t row = row_begin; row < row_end; row++)
+			{
+				std::size_t b = row / shape.query_length;
+				std::size_t i = row % shape.query_length;
+				const S* q_row = q + q_layout.at(b, i);
+				const T* mask_row = mask ? mask_values.data() + mask_offsets[b] + i * shape.key_length : nullptr;
+				std::size_t key_end = key_range.end(b, i);
+				T running_max = neg_inf;
+				T running_sum = T(0);
+				std::fill(acc.begin(), acc.end(), T(0));
+				for (std::size_t j0 = 0; j0 < key_end; j0 += ATTENTION_KEY_BLOCK)
+				{
+					std::size_t block = std::min(ATTENTION_KEY_BLOCK, key_end - j0);
+					T block_max = neg_inf;
+					for (std::size_t jj = 0; jj < block; jj++)
+					{
+						const S* k_row = k + k_layout.at(b, j0 + jj);
+						T dot = T(0);
+						for (std::size_t d = 0; d < shape.head_dim; d++)
+							dot += load(q_row[d]) * load(k_row[d]);
+						T score = dot * static_cast<T>(scale);
+						if (mask_row)
+							score += mask_row[j0 + jj];
+						scores[jj] = score;
+						block_max = std::max(block_max, score);
+					}
+					if (block_max == neg_inf)
+						continue;
+					T new_max = std::max(running_max, block_max);
+					T correction = running_max == neg_inf ? T(0) : std::exp(running_max - new_max);
+					running_sum *= correction;
+					for (std::size_t d = 0; d < shape.value_dim; d++)
+						acc[d] *= correction;
+					for (std::size_t jj = 0; jj < block; jj++)
+					{
+						T p = std::exp(scores[jj] - new_max);
+						running_sum += p;
+						const S* v_row = v + v_layout.at(b, j0 + jj);
+						for (std::size_t d = 0; d < shape.value_dim; d++)
+							acc[d] += p * load(v_row[d]);
+					}
+					running_max = new_max;
+				}
+				/* A row with every key masked out attends to nothing and outputs zeros. */
+				T inv_sum = running_sum > T(0) ? T(1) / running_sum : T(0);
+				S* out_row = out + out_layout.at(b, i);
+				for (std::size_t d = 0; d < shape.value_dim; d++)
+					out_row[d] = store<S>(acc[d] * inv_sum);
+			}
+		}
+	);
+}
+
+Tensor fused_attention(const Tensor& query, const Tensor& key, const Tensor& value, const std::optional<Tensor>& mask, const KeyRange& key_range, double scale)
+{
+	TensorBase q_buffer = host_buffer(query);
+	TensorBase k_buffer = host_buffer(key);
+	TensorBase v_buffer = host_buffer(value);
+	const AttentionShape& shape = key_range.shape;
+	const std::type_info& type = q_buffer.type();
+	if (k_buffer.type() != type || v_buffer.type() != type)
+		throw pybind11::type_error("query, key and value must have the same type");
+	std::vector<unsigned int> out_shape(shape.batch_shape);
+	out_shape.push_back(static_cast<unsigned int>(shape.query_length));
+	out_shape.push_back(static_cast<unsigned int>(shape.value_dim));
+	TensorBase output(type, out_shape);
+	dispatch_floating_storage
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			attention_kernel<T>
+			(
+				static_cast<const T*>(q_buffer.data()), RowLayout::contiguous(shape.query_length, shape.head_dim),
+				static_cast<const T*>(k_buffer.data()), RowLayout::contiguous(shape.key_length, shape.head_dim),
+				static_cast<const T*>(v_buffer.data()), RowLayout::contiguous(shape.key_length, shape.value_dim),
+				mutable_data<T>(output), RowLayout::contiguous(shape.query_length, shape.value_dim),
+				shape,
+				mask,
+				key_range,
+				scale
+			);
+		}
+	);
+	return Tensor(to_device_of(std::move(output), query));
+}
+
+/*
+ * Self-attention straight from a packed [batch, length, 3 * d_model] projection,
+ * laid out as the queries, keys and values of all heads one after another.
+ * The heads are read in place and the output is written merged as [batch, length, d_model].
+ */
+Tensor packed_attention(const Tensor& qkv, unsigned int n_head, const std::optional<Tensor>& mask, bool is_causal, std::optional<double> scale)
+{
+	if (is_grad_enabled())
+		throw std::runtime_error("packed_attention is not recorded by autograd, use it inside no_grad()");
+	TensorBase qkv_buffer = host_buffer(qkv);
+	std::vector<unsigned int> qkv_shape = shape_of(qkv_buffer);
+	if (qkv_shape.size() != 3 || qkv_shape[2] % (3 * n_head) != 0)
+		throw pybind11::value_error("qkv must have shape [batch, length, 3 * d_model] with d_model divisible by n_head");
+	std::size_t batch = qkv_shape[0];
+	std::size_t length = qkv_shape[1];
+	std::size_t d_model = qkv_shape[2] / 3;
+	std::size_t head_dim = d_model / n_head;
+	AttentionShape shape{{qkv_shape[0], n_head}, batch * n_head, length, length, head_dim, head_dim};
+	std::optional<std::vector<unsigned int>> no_lengths;
+	KeyRange key_range(shape, no_lengths, no_lengths, is_causal);
+	double scale_value = scale ? *scale : 1.0 / std::sqrt(static_cast<double>(head_dim));
+	RowLayout q_layout{n_head, length * 3 * d_model, head_dim, 3 * d_model, 0};
+	RowLayout k_layout{n_head, length * 3 * d_model, head_dim, 3 * d_model, d_model};
+	RowLayout v_layout{n_head, length * 3 * d_model, head_dim, 3 * d_model, 2 * d_model};
+	RowLayout out_layout{n_head, length * d_model, head_dim, d_model, 0};
+	const std::type_info& type = qkv_buffer.type();
+	TensorBase output(type, {qkv_shape[0], qkv_shape[1], static_cast<unsigned int>(d_model)});
+	dispatch_floating_storage
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const T* data = static_cast<const T*>(qkv_buffer.data());
+			attention_kernel<T>(data, q_layout, data, k_layout, data, v_layout, mutable_data<T>(output), out_layout, shape, mask, key_range, scale_value);
+		}
+	);
+	return Tensor(to_device_of(std::move(output), qkv));
+}
+
+/*
+ * Attention over unsplit [batch, length, n_head * dim] projections: the heads of query, key
+ * and value are read in place and the output is written merged as [batch, query_length, n_head * value_dim],
+ * so neither the head split nor the merge copies the projections.
+ */
+Tensor multihead_attention(const Tensor& query, const Tensor& key, const Tensor& value, unsigned int n_head, const std::optional<Tensor>& mask, bool is_causal, std::optional<double> scale)
+{
+	if (is_grad_enabled())
+		throw std::runtime_error("multihead_attention is not recorded by autograd, use it inside no_grad()");
+	TensorBase q_buffer = host_buffer(query);
+	TensorBase k_buffer = host_buffer(key);
+	TensorBase v_buffer = host_buffer(value);
+	std::vector<unsigned int> q_shape = shape_of(q_buffer);
+	std::vector<unsigned int> k_shape = shape_of(k_buffer);
+	std::vector<unsigned int> v_shape = shape_of(v_buffer);
+	if (q_shape.size() != 3 || k_shape.size() != 3 || v_shape.size() != 3 || q_shape[2] % n_head != 0 || v_shape[2] % n_head != 0)
+		throw pybind11::value_error("query, key and value must have shape [batch, length, features] with features divisible by n_head");
+	if (k_shape[0] != q_shape[0] || v_shape[0] != q_shape[0] || k_shape[2] != q_shape[2] || v_shape[1] != k_shape[1])
+		throw pybind11::value_error("key and value must match the batch of query, key the features of query and value the length of key");
+	const std::type_info& type = q_buffer.type();
+	if (k_buffer.type() != type || v_buffer.type() != type)
+		throw pybind11::type_error("query, key and value must have the same type");
+	std::size_t q_length = q_shape[1], k_length = k_shape[1];
+	std::size_t q_features = q_shape[2], v_features = v_shape[2];
+	std::size_t head_dim = q_features / n_head;
+	std::size_t value_dim = v_features / n_head;
+	AttentionShape shape{{q_shape[0], n_head}, q_shape[0] * std::size_t(n_head), q_length, k_length, head_dim, value_dim};
+	std::optional<std::vector<unsigned int>> no_lengths;
+	KeyRange key_range(shape, no_lengths, no_lengths, is_causal);
+	double scale_value = scale ? *scale : 1.0 / std::sqrt(static_cast<double>(head_dim));
+	RowLayout q_layout{n_head, q_length * q_features, head_dim, q_features, 0};
+	RowLayout k_layout{n_head, k_length * q_features, head_dim, q_features, 0};
+	RowLayout v_layout{n_head, k_length * v_features, value_dim, v_features, 0};
+	RowLayout out_layout{n_head, q_length * v_features, value_dim, v_features, 0};
+	TensorBase output(type, {q_shape[0], q_shape[1], v_shape[2]});
+	dispatch_floating_storage
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			attention_kernel<T>
+			(
+				static_cast<const T*>(q_buffer.data()), q_layout,
+				static_cast<const T*>(k_buffer.data()), k_layout,
+				static_cast<const T*>(v_buffer.data()), v_layout,
+				mutable_data<T>(output), out_layout,
+				shape, mask, key_range, scale_value
+			);
+		}
+	);
+	return Tensor(to_device_of(std::move(output), query));
+}
+
+/*
+ * Builds the additive mask of the composed path, of the full shape of the scores: the user mask
+ * converted to 0/MASKED and MASKED for the keys outside of the range of each query. MASKED is a large
+ * finite negative value rather than -inf, whose differences would make the backward of the softmax NaN.
+ * attends is set to a [..., query_length, 1] factor of 1 and 0 when some row attends to no key at all,
+ * as the fused path outputs zeros for such a row.
+ */
+Tensor composed_attention_mask(const Tensor& scores, const AttentionShape& shape, const std::optional<Tensor>& mask, const KeyRange& key_range, std::optional<Tensor>& attends)
+{
+	const std::type_info& type = scores.get_buffer().type();
+	std::vector<unsigned int> mask_shape(shape.batch_shape);
+	mask_shape.push_back(static_cast<unsigned int>(shape.query_length));
+	std::vector<unsigned int> row_shape(mask_shape);
+	mask_shape.push_back(static_cast<unsigned int>(shape.key_length));
+	row_shape.push_back(1U);
+	TensorBase result(type, mask_shape);
+	TensorBase rows(type, row_shape);
+	bool empty_row = false;
+	dispatch_floating
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const T masked = std::numeric_limits<T>::lowest() / T(2);
+			T* data = mutable_data<T>(result);
+			T* row_factor = mutable_data<T>(rows);
+			std::size_t matrix_size = shape.query_length * shape.key_length;
+			host_vector<T> mask_values;
+			std::vector<std::size_t> mask_offsets;
+			if (mask)
+			{
+				TensorBase mask_buffer = host_buffer(*mask);
+				mask_values = additive_mask<T>(mask_buffer);
+				mask_offsets = mask_batch_offsets(shape_of(mask_buffer), shape);
+			}
+			for (std::size_t b = 0; b < shape.batch; b++)
+			{
+				T* matrix = data + b * matrix_size;
+				if (mask)
+					std::transform(mask_values.data() + mask_offsets[b], mask_values.data() + mask_offsets[b] + matrix_size, matrix, [masked](T value) { return std::max(value, masked); });
+				else
+					std::fill_n(matrix, matrix_size, T(0));
+				for (std::size_t i = 0; i < shape.query_length; i++)
+				{
+					T* row = matrix + i * shape.key_length;
+					std::fill(row + key_range.end(b, i), row + shape.key_length, masked);
+					bool attends_any = std::any_of(row, row + shape.key_length, [masked](T value) { return value != masked; });
+					row_factor[b * shape.query_length + i] = attends_any ? T(1) : T(0);
+					empty_row = empty_row || !attends_any;
+				}
+			}
+		}
+	);
+	if (empty_row)
+		attends = Tensor(to_device_of(std::move(rows), scores));
+	return Tensor(to_device_of(std::move(result), scores));
+}
+
+Tensor scaled_dot_product_attention
+(
+	const Tensor& query,
+	const Tensor& key,
+	const Tensor& value,
+	const std::optional<Tensor>& mask,
+	bool is_causal,
+	std::optional<double> scale,
+	const std::optional<std::vector<unsigned int>>& key_lengths,
+	const std::optional<std::vector<unsigned int>>& query_offsets
+)
+{
+	AttentionShape shape = check_attention_shape(query.get_buffer(), key.get_buffer(), value.get_buffer());
+	KeyRange key_range(shape, key_lengths, query_offsets, is_causal);
+	double scale_value = scale ? *scale : 1.0 / std::sqrt(static_cast<double>(shape.head_dim));
+	if (!is_grad_enabled())
+		return fused_attention(query, key, value, mask, key_range, scale_value);
+	/*
+	 * The library has no hook for a custom backward, so a recorded attention is composed
+	 * of differentiable ops and keeps the probabilities for calc_grad().
+	 */
+	unsigned char last = static_cast<unsigned char>(shape.batch_shape.size() + 1);
+	/* Inside autocast the products run in the reduced precision type and the softmax in FLOAT. */
+	Tensor scores = autocast_upcast(matmul(query, key.transpose(last - 1, last, true)));
+	const std::type_info& type = scores.get_buffer().type();
+	TensorBase scale_buffer(type, {1U});
+	dispatch_floating
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			*mutable_data<T>(scale_buffer) = static_cast<T>(scale_value);
+		}
+	);
+	scores = scores * Tensor(to_device_of(std::move(scale_buffer), query));
+	std::optional<Tensor> attends;
+	if (mask || is_causal || key_lengths)
+		scores = scores + composed_attention_mask(scores, shape, mask, key_range, attends);
+	Tensor output = matmul(autocast_lower(softmax_along(scores, -1, false)), value);
+	return attends ? binary_tensor(output, autocast_lower(*attends), BinaryOp::MUL) : output;
+}
+
+/*
+ * Copies values [batch, ..., new_length, dim] into cache [batch, ..., max_length, dim]
+ * in place, the first valid_lengths[b] new entries of sequence b going to positions[b] onwards.
+ */
+void kv_cache_write(Tensor& cache, const Tensor& values, const std::vector<unsigned int>& positions, const std::vector<unsigned int>& valid_lengths)
+{
+	const TensorBase& cache_buffer = cache.get_buffer();
+	if (!is_host_buffer(cache_buffer))
+		throw std::runtime_error("the key/value cache must be a CPU tensor");
+	TensorBase values_buffer = host_buffer(values);
+	if (values_buffer.type() != cache_buffer.type())
+		throw pybind11::type_error("values must have the type of the cache");
+	std::vector<unsigned int> cache_shape = shape_of(cache_buffer);
+	std::vector<unsigned int> values_shape = shape_of(values_buffer);
+	std::size_t ndim = cache_shape.size();
+	if (ndim < 3 || values_shape.size() != ndim || !std::equal(cache_shape.begin(), cache_shape.end() - 2, values_shape.begin()) || cache_shape[ndim - 1] != values_shape[ndim - 1])
+		throw pybind11::value_error("values must have the shape of the cache except for the sequence dimension");
+	std::size_t sequences = cache_shape[0];
+	if (positions.size() != sequences || valid_lengths.size() != sequences)
+		throw pybind11::value_error("positions and valid_lengths must have one entry per sequence");
+	std::size_t max_length = cache_shape[ndim - 2];
+	std::size_t new_length = values_shape[ndim - 2];
+	std::size_t dim = cache_shape[ndim - 1];
+	std::size_t heads = std::accumulate(cache_shape.begin() + 1, cache_shape.end() - 2, std::size_t(1), std::multiplies<std::size_t>());
+	for (std::size_t b = 0; b < sequences; b++)
+		if (valid_lengths[b] > new_length || positions[b] + valid_lengths[b] > max_length)
+			throw pybind11::value_error("writing " + std::to_string(valid_lengths[b]) + " entries at position " + std::to_string(positions[b]) + " overflows the cache of sequence " + std::to_string(b));
+	dispatch_floating_storage
+	(
+		cache_buffer.type(),
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			T* cache_data = mutable_data<T>(cache_buffer);
+			const T* values_data = static_cast<const T*>(values_buffer.data());
+			for (std::size_t b = 0; b < sequences; b++)
+				for (std::size_t h = 0; h < heads; h++)
+				{
+					std::size_t row = b * heads + h;
+					std::copy_n
+					(
+						values_data + row * new_length * dim,
+						valid_lengths[b] * dim,
+						cache_data + (row * max_length + positions[b]) * dim
+					);
+				}
+		}
+	);
+}
+
+void bind_attention(pybind11::module_& m)
+{
+	m.def(
+		"scaled_dot_product_attention",
+		traced(&scaled_dot_product_attention, "scaled_dot_product_attention"),
+		pybind11::arg("query"),
+		pybind11::arg("key"),
+		pybind11::arg("value"),
+		pybind11::arg("mask") = pybind11::none(),
+		pybind11::arg("is_causal") = false,
+		pybind11::arg("scale") = pybind11::none(),
+		pybind11::arg("key_lengths") = pybind11::none(),
+		pybind11::arg("query_offsets") = pybind11::none()
+	);
+
+	m.def(
+		"packed_attention",
+		traced(&packed_attention, "packed_attention"),
+		pybind11::arg("qkv"),
+		pybind11::arg("n_head"),
+		pybind11::arg("mask") = pybind11::none(),
+		pybind11::arg("is_causal") = false,
+		pybind11::arg("scale") = pybind11::none()
+	);
+
+	m.def(
+		"multihead_attention",
+		traced(&multihead_attention, "multihead_attention"),
+		pybind11::arg("query"),
+		pybind11::arg("key"),
+		pybind11::arg("value"),
+		pybind11::arg("n_head"),
+		pybind11::arg("mask") = pybind11::none(),
+		pybind11::arg("is_causal") = false,
+		pybind11::arg("scale") = pybind11::none()
+	);
+
+	m.def(
+		"kv_cache_write",
+		&kv_cache_write,
+		pybind11::arg("cache"),
+		pybind11::arg("values"),
+		pybind11::arg("positions"),
+		pybind11::arg("valid_lengths"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+}
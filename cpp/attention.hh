@@ -0,0 +1,19 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+#include <optional>
+#include <vector>
+
+tensor_array::value::Tensor scaled_dot_product_attention
+(
+	const tensor_array::value::Tensor& query,
+	const tensor_array::value::Tensor& key,
+	const tensor_array::value::Tensor& value,
+	const std::optional<tensor_array::value::Tensor>& mask,
+	bool is_causal,
+	std::optional<double> scale,
+	const std::optional<std::vector<unsigned int>>& key_lengths,
+	const std::optional<std::vector<unsigned int>>& query_offsets
+);
+
+void bind_attention(pybind11::module_& m);
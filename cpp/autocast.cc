@@ -0,0 +1,58 @@
+#include "autocast.hh"
+#include "half.hh"
+#include <pybind11/stl.h>
+
+using namespace tensor_array::value;
+using namespace tensor_array::datatype;
+using namespace tensor_array::wrapper;
+
+thread_local std::optional<DataType> autocast_dtype;
+
+const std::type_info* autocast_type()
+{
+	return autocast_dtype ? &warp_type(*autocast_dtype) : nullptr;
+}
+
+Tensor autocast_lower(const Tensor& input)
+{
+	const std::type_info* type = autocast_type();
+	if (type == nullptr || input.get_buffer().type() != typeid(float))
+		return input;
+	return input.tensor_cast(*type);
+}
+
+Tensor autocast_upcast(const Tensor& input)
+{
+	if (autocast_type() == nullptr || !is_16bit_float_type(input.get_buffer().type()))
+		return input;
+	return input.tensor_cast(typeid(float));
+}
+
+std::optional<Tensor> autocast_upcast(const std::optional<Tensor>& input)
+{
+	if (!input)
+		return std::nullopt;
+	return autocast_upcast(*input);
+}
+
+void bind_autocast(pybind11::module_& m)
+{
+	m.def(
+		"get_autocast_dtype",
+		[]()
+		{
+			return autocast_dtype;
+		}
+	);
+
+	m.def(
+		"set_autocast_dtype",
+		[](std::optional<DataType> dtype)
+		{
+			if (dtype && *dtype != HALF_DTYPE && *dtype != BF16_DTYPE)
+				throw pybind11::value_error("autocast runs in HALF or BFLOAT16");
+			autocast_dtype = dtype;
+		},
+		pybind11::arg("dtype")
+	);
+}
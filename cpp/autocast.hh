@@ -0,0 +1,25 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <tensor-array/core/data_type_wrapper.hh>
+#include <pybind11/pybind11.h>
+#include <optional>
+#include <typeinfo>
+
+/*
+ * Mixed precision, switched per thread like grad mode.
+ * Inside autocast, matmul and attention take their FLOAT operands in the reduced precision type,
+ * while reductions, softmax and normalization take their HALF and BFLOAT16 inputs in FLOAT.
+ */
+
+/* The reduced precision type of the thread, nullptr outside of autocast. */
+const std::type_info* autocast_type();
+
+/* input in the reduced precision type if it is a FLOAT tensor inside autocast, else input. */
+tensor_array::value::Tensor autocast_lower(const tensor_array::value::Tensor& input);
+
+/* input in FLOAT if it is a HALF or BFLOAT16 tensor inside autocast, else input. */
+tensor_array::value::Tensor autocast_upcast(const tensor_array::value::Tensor& input);
+
+std::optional<tensor_array::value::Tensor> autocast_upcast(const std::optional<tensor_array::value::Tensor>& input);
+
+void bind_autocast(pybind11::module_& m);
@@ -0,0 +1,551 @@
+#include "binary.hh"
+#include "autocast.hh"
+#include "cpu_kernel.hh"
+#include "half.hh"
+#include "layout.hh"
+#include <pybind11/stl.h>
+#include <array>
+#include <cmath>
+#include <string>
+#include <type_traits>
+
+using namespace tensor_array::value;
+using namespace tensor_array::datatype;
+using namespace tensor_array::wrapper;
+
+constexpr bool is_comparison(BinaryOp op)
+{
+	return op >= BinaryOp::EQ;
+}
+
+/* base ** exponent by squaring, 0 for negative exponents as in integer division. */
+template <typename T>
+T integer_power(T base, T exponent)
+{
+	if constexpr (std::is_signed_v<T>)
+		if (exponent < 0)
+			return base == T(1) || base == T(-1) ? static_cast<T>(exponent % 2 == 0 ? 1 : base) : T(0);
+	T result = T(1);
+	for (unsigned long long e = static_cast<unsigned long long>(exponent); e != 0; e >>= 1)
+	{
+		if (e & 1)
+			result = static_cast<T>(result * base);
+		base = static_cast<T>(base * base);
+	}
+	return result;
+}
+
+template <BinaryOp Op, typename T>
+auto combine(T x, T y)
+{
+	if constexpr (Op == BinaryOp::ADD)
+		return static_cast<T>(x + y);
+	else if constexpr (Op == BinaryOp::SUB)
+		return static_cast<T>(x - y);
+	else if constexpr (Op == BinaryOp::MUL)
+		return static_cast<T>(x * y);
+	else if constexpr (Op == BinaryOp::DIV)
+		return static_cast<T>(x / y);
+	else if constexpr (Op == BinaryOp::POW)
+	{
+		if constexpr (std::is_floating_point_v<T>)
+			return static_cast<T>(std::pow(x, y));
+		else
+			return integer_power(x, y);
+	}
+	else if constexpr (Op == BinaryOp::EQ)
+		return x == y;
+	else if constexpr (Op == BinaryOp::NE)
+		return x != y;
+	else if constexpr (Op == BinaryOp::LT)
+		return x < y;
+	else if constexpr (Op == BinaryOp::LE)
+		return x <= y;
+	else if constexpr (Op == BinaryOp::GT)
+		return x > y;
+	else
+		return x >= y;
+}
+
+/* Calls func with std::integral_constant<BinaryOp, op>, so the op is a constant inside the kernel loops. */
+template <typename Func>
+void dispatch_op(BinaryOp op, Func&& func)
+{
+	switch (op)
+	{
+	case BinaryOp::ADD:
+		return func(std::integral_constant<BinaryOp, BinaryOp::ADD>());
+	case BinaryOp::SUB:
+		return func(std::integral_constant<BinaryOp, BinaryOp::SUB>());
+	case BinaryOp::MUL:
+		return func(std::integral_constant<BinaryOp, BinaryOp::MUL>());
+	case BinaryOp::DIV:
+		return func(std::integral_constant<BinaryOp, BinaryOp::DIV>());
+	case BinaryOp::POW:
+		return func(std::integral_constant<BinaryOp, BinaryOp::POW>());
+	case BinaryOp::EQ:
+		return func(std::integral_constant<BinaryOp, BinaryOp::EQ>());
+	case BinaryOp::NE:
+		return func(std::integral_constant<BinaryOp, BinaryOp::NE>());
+	case BinaryOp::LT:
+		return func(std::integral_constant<BinaryOp, BinaryOp::LT>());
+	case BinaryOp::LE:
+		return func(std::integral_constant<BinaryOp, BinaryOp::LE>());
+	case BinaryOp::GT:
+		return func(std::integral_constant<BinaryOp, BinaryOp::GT>());
+	case BinaryOp::GE:
+		return func(std::integral_constant<BinaryOp, BinaryOp::GE>());
+	}
+}
+
+Tensor library_binary(const Tensor& self, const Tensor& other, BinaryOp op)
+{
+	switch (op)
+	{
+	case BinaryOp::ADD:
+		return self + other;
+	case BinaryOp::SUB:
+		return self - other;
+	case BinaryOp::MUL:
+		return self * other;
+	case BinaryOp::DIV:
+		return self / other;
+	case BinaryOp::POW:
+		return power(self, other);
+	default:
+		throw pybind11::type_error("elementwise comparisons support the tensor types with a C++ equivalent, use Tensor.cast() first");
+	}
+}
+
+bool is_floating_type(const std::type_info& type)
+{
+	return type == typeid(float) || type == typeid(double) || !is_arithmetic_type(type);
+}
+
+/*
+ * The type an op with a Python number runs in: a float promotes integer and BOOL tensors to FLOAT,
+ * an int promotes BOOL tensors to INT, and arithmetic on BOOL tensors runs in INT.
+ */
+const std::type_info& promoted_type(const std::type_info& type, const Scalar& scalar, BinaryOp op)
+{
+	if (std::holds_alternative<double>(scalar) && !is_floating_type(type))
+		return warp_type(FLOAT_DTYPE);
+	if (type == typeid(bool) && (!std::holds_alternative<bool>(scalar) || !is_comparison(op)))
+		return warp_type(S_INT_32);
+	return type;
+}
+
+/* A 0-dimensional tensor of type holding value, on the device of like. */
+Tensor scalar_tensor(const Scalar& value, const std::type_info& type, const Tensor& like)
+{
+	const std::type_info& buffer_type = is_arithmetic_type(type) ? type : typeid(float);
+	TensorBase buffer(buffer_type, std::vector<unsigned int>());
+	dispatch_arithmetic
+	(
+		buffer_type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			*mutable_data<T>(buffer) = std::visit([](auto number) { return static_cast<T>(number); }, value);
+		}
+	);
+	Tensor result(to_device_of(std::move(buffer), like));
+	return buffer_type == type ? result : result.tensor_cast(type);
+}
+
+template <BinaryOp Op, typename T>
+void check_integer_division(const T* divisor, std::size_t size)
+{
+	if constexpr (Op == BinaryOp::DIV && std::is_integral_v<T>)
+		if (std::find(divisor, divisor + size, T(0)) != divisor + size)
+			throw pybind11::value_error("integer division by zero");
+}
+
+/* Writes buffer op other (other op buffer when reverse) to output, of the shape of buffer. */
+void scalar_into(const TensorBase& buffer, const Scalar& other, BinaryOp op, bool reverse, const TensorBase& output)
+{
+	std::size_t size = element_count(buffer);
+	dispatch_arithmetic
+	(
+		buffer.type(),
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			T number = std::visit([](auto number) { return static_cast<T>(number); }, other);
+			const T* x = static_cast<const T*>(buffer.data());
+			dispatch_op
+			(
+				op,
+				[&](auto op_tag)
+				{
+					constexpr BinaryOp Op = decltype(op_tag)::value;
+					using R = decltype(combine<Op>(T(), T()));
+					R* out = mutable_data<R>(output);
+					if (reverse)
+						check_integer_division<Op>(x, size);
+					else
+						check_integer_division<Op>(&number, 1);
+					parallel_for
+					(
+						0, size, DEFAULT_GRAIN_SIZE,
+						[&](std::size_t begin, std::size_t end)
+						{
+							if (reverse)
+								for (std::size_t i = begin; i < end; i++)
+									out[i] = combine<Op>(number, x[i]);
+							else
+								for (std::size_t i = begin; i < end; i++)
+									out[i] = combine<Op>(x[i], number);
+						}
+					);
+				}
+			);
+		}
+	);
+}
+
+Tensor binary_scalar(const Tensor& self, Scalar other, BinaryOp op, bool reverse)
+{
+	const std::type_info& type = promoted_type(self.get_buffer().type(), other, op);
+	Tensor value = type == self.get_buffer().type() ? self : self.tensor_cast(type);
+	/* Comparisons and integer ops have no gradient, so they always take the native kernel. */
+	bool native = is_arithmetic_type(type) && (is_comparison(op) || ((!is_grad_enabled() || !is_floating_type(type)) && is_host_buffer(value.get_buffer())));
+	if (!native)
+	{
+		Tensor operand = scalar_tensor(other, type, value);
+		return reverse ? library_binary(operand, value, op) : library_binary(value, operand, op);
+	}
+	TensorBase buffer = host_buffer(value);
+	TensorBase output(is_comparison(op) ? typeid(bool) : type, shape_of(buffer));
+	scalar_into(buffer, other, op, reverse, output);
+	return Tensor(to_device_of(std::move(output), value));
+}
+
+/*
+ * Calls func(out_offset, length, offsets) for each row of the last dimension of shape,
+ * offsets being the position of the row in each operand layout. The rows are split over the thread pool.
+ */
+template <std::size_t N, typename Func>
+void for_each_row(const std::vector<unsigned int>& shape, const std::array<const StridedLayout*, N>& layouts, Func&& func)
+{
+	std::size_t ndim = shape.size();
+	std::size_t count = std::accumulate(shape.begin(), shape.end(), std::size_t(1), std::multiplies<std::size_t>());
+	if (count == 0)
+		return;
+	std::size_t inner = ndim == 0 ? 1 : shape.back();
+	parallel_for
+	(
+		0, count / inner, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / inner, 1),
+		[&](std::size_t row_begin, std::size_t row_end)
+		{
+			for (std::size_t row = row_begin; row < row_end; row++)
+			{
+				std::array<std::ptrdiff_t, N> offsets;
+				for (std::size_t k = 0; k < N; k++)
+					offsets[k] = layouts[k]->offset;
+				std::size_t rest = row;
+				for (std::size_t d = ndim == 0 ? 0 : ndim - 1; d-- > 0;)
+				{
+					std::size_t index = rest % shape[d];
+					rest /= shape[d];
+					for (std::size_t k = 0; k < N; k++)
+						offsets[k] += index * layouts[k]->strides[d];
+				}
+				func(row * inner, inner, offsets);
+			}
+		}
+	);
+}
+
+/* The stride of the last dimension of a layout, 0 for a tensor of 0 dimensions. */
+std::ptrdiff_t inner_stride(const StridedLayout& layout)
+{
+	return layout.strides.empty() ? 0 : layout.strides.back();
+}
+
+/* Writes self op other to output, both operands being broadcast to the shape of output with stride 0. */
+void broadcast_into(const TensorBase& self_buffer, const TensorBase& other_buffer, BinaryOp op, const TensorBase& output)
+{
+	std::vector<unsigned int> shape = shape_of(output);
+	StridedLayout self_layout = broadcast_layout(shape_of(self_buffer), shape);
+	StridedLayout other_layout = broadcast_layout(shape_of(other_buffer), shape);
+	dispatch_arithmetic
+	(
+		self_buffer.type(),
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const T* a = static_cast<const T*>(self_buffer.data());
+			const T* b = static_cast<const T*>(other_buffer.data());
+			dispatch_op
+			(
+				op,
+				[&](auto op_tag)
+				{
+					constexpr BinaryOp Op = decltype(op_tag)::value;
+					using R = decltype(combine<Op>(T(), T()));
+					R* out = mutable_data<R>(output);
+					check_integer_division<Op>(b, element_count(other_buffer));
+					std::ptrdiff_t a_step = inner_stride(self_layout);
+					std::ptrdiff_t b_step = inner_stride(other_layout);
+					for_each_row<2>
+					(
+						shape, {&self_layout, &other_layout},
+						[&](std::size_t out_offset, std::size_t length, const std::array<std::ptrdiff_t, 2>& offsets)
+						{
+							const T* a_row = a + offsets[0];
+							const T* b_row = b + offsets[1];
+							R* out_row = out + out_offset;
+							/* The common cases get loops with unit or no strides, which the compiler vectorizes. */
+							if (a_step == 1 && b_step == 1)
+								for (std::size_t j = 0; j < length; j++)
+									out_row[j] = combine<Op>(a_row[j], b_row[j]);
+							else if (a_step == 1 && b_step == 0)
+								for (std::size_t j = 0; j < length; j++)
+									out_row[j] = combine<Op>(a_row[j], *b_row);
+							else if (a_step == 0 && b_step == 1)
+								for (std::size_t j = 0; j < length; j++)
+									out_row[j] = combine<Op>(*a_row, b_row[j]);
+							else
+								for (std::size_t j = 0; j < length; j++)
+									out_row[j] = combine<Op>(a_row[j * a_step], b_row[j * b_step]);
+						}
+					);
+				}
+			);
+		}
+	);
+}
+
+/* Inside autocast, a FLOAT operand meeting a HALF or BFLOAT16 one is lowered, so the op runs in the reduced precision type. */
+Tensor binary_tensor(const Tensor& self_value, const Tensor& other_value, BinaryOp op)
+{
+	bool mixed = is_16bit_float_type(self_value.get_buffer().type()) != is_16bit_float_type(other_value.get_buffer().type());
+	Tensor self = mixed ? autocast_lower(self_value) : self_value;
+	Tensor other = mixed ? autocast_lower(other_value) : other_value;
+	std::vector<unsigned int> self_shape = shape_of(self.get_buffer());
+	std::vector<unsigned int> other_shape = shape_of(other.get_buffer());
+	if (self_shape == other_shape)
+		return library_binary(self, other, op);
+	std::vector<unsigned int> shape = broadcast_shapes(self_shape, other_shape);
+	const std::type_info& type = self.get_buffer().type();
+	bool native = !is_grad_enabled()
+		&& type == other.get_buffer().type()
+		&& is_arithmetic_type(type)
+		&& is_host_buffer(self.get_buffer())
+		&& is_host_buffer(other.get_buffer());
+	if (!native)
+	{
+		std::vector<int> target(shape.begin(), shape.end());
+		return library_binary(layout_expand(self, target), layout_expand(other, target), op);
+	}
+	TensorBase output(is_comparison(op) ? typeid(bool) : type, shape);
+	broadcast_into(self.get_buffer(), other.get_buffer(), op, output);
+	return Tensor(std::move(output));
+}
+
+/* Writes condition ? if_true : if_false to output, the three operands being broadcast to the shape of output. */
+void select_into(const TensorBase& condition_buffer, const TensorBase& true_buffer, const TensorBase& false_buffer, const TensorBase& output)
+{
+	std::vector<unsigned int> shape = shape_of(output);
+	StridedLayout condition_layout = broadcast_layout(shape_of(condition_buffer), shape);
+	StridedLayout true_layout = broadcast_layout(shape_of(true_buffer), shape);
+	StridedLayout false_layout = broadcast_layout(shape_of(false_buffer), shape);
+	dispatch_arithmetic
+	(
+		output.type(),
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const bool* c = static_cast<const bool*>(condition_buffer.data());
+			const T* t = static_cast<const T*>(true_buffer.data());
+			const T* f = static_cast<const T*>(false_buffer.data());
+			T* out = mutable_data<T>(output);
+			std::ptrdiff_t c_step = inner_stride(condition_layout);
+			std::ptrdiff_t t_step = inner_stride(true_layout);
+			std::ptrdiff_t f_step = inner_stride(false_layout);
+			for_each_row<3>
+			(
+				shape, {&condition_layout, &true_layout, &false_layout},
+				[&](std::size_t out_offset, std::size_t length, const std::array<std::ptrdiff_t, 3>& offsets)
+				{
+					for (std::size_t j = 0; j < length; j++)
+						out[out_offset + j] = c[offsets[0] + j * c_step] ? t[offsets[1] + j * t_step] : f[offsets[2] + j * f_step];
+				}
+			);
+		}
+	);
+}
+
+/* The type of the result of select: the type of the tensor operands, or the kind of the numbers if both are. */
+const std::type_info& select_type(const Operand& value_if_true, const Operand& value_if_false)
+{
+	for (const Operand* operand: {&value_if_true, &value_if_false})
+		if (const Tensor* value = std::get_if<Tensor>(operand))
+			return value->get_buffer().type();
+	if (std::holds_alternative<double>(value_if_true) || std::holds_alternative<double>(value_if_false))
+		return warp_type(FLOAT_DTYPE);
+	if (std::holds_alternative<long long>(value_if_true) || std::holds_alternative<long long>(value_if_false))
+		return warp_type(S_INT_32);
+	return typeid(bool);
+}
+
+Tensor select(const Tensor& condition_value, const Operand& value_if_true, const Operand& value_if_false)
+{
+	const std::type_info& type = select_type(value_if_true, value_if_false);
+	/* Numbers become 0-dimensional tensors, read with stride 0 like any other broadcast operand. */
+	auto as_tensor = [&](const Operand& operand)
+	{
+		return std::visit
+		(
+			[&](const auto& number)
+			{
+				if constexpr (std::is_same_v<std::decay_t<decltype(number)>, Tensor>)
+					return number;
+				else
+					return scalar_tensor(Scalar(number), type, condition_value);
+			},
+			operand
+		);
+	};
+	Tensor if_true = as_tensor(value_if_true);
+	Tensor if_false = as_tensor(value_if_false);
+	std::vector<unsigned int> condition_shape = shape_of(condition_value.get_buffer());
+	std::vector<unsigned int> true_shape = shape_of(if_true.get_buffer());
+	std::vector<unsigned int> false_shape = shape_of(if_false.get_buffer());
+	if (condition_shape == true_shape && condition_shape == false_shape)
+		return condition(condition_value, if_true, if_false);
+	std::vector<unsigned int> shape = broadcast_shapes(broadcast_shapes(condition_shape, true_shape), false_shape);
+	bool native = (!is_grad_enabled() || !is_floating_type(type))
+		&& condition_value.get_buffer().type() == typeid(bool)
+		&& if_true.get_buffer().type() == type
+		&& if_false.get_buffer().type() == type
+		&& is_arithmetic_type(type)
+		&& is_host_buffer(condition_value.get_buffer())
+		&& is_host_buffer(if_true.get_buffer())
+		&& is_host_buffer(if_false.get_buffer());
+	if (!native)
+	{
+		std::vector<int> target(shape.begin(), shape.end());
+		return condition(layout_expand(condition_value, target), layout_expand(if_true, target), layout_expand(if_false, target));
+	}
+	TensorBase output(type, shape);
+	select_into(condition_value.get_buffer(), if_true.get_buffer(), if_false.get_buffer(), output);
+	return Tensor(std::move(output));
+}
+
+/* The number held by an operand that is not a tensor. */
+Scalar scalar_of(const Operand& operand)
+{
+	return std::visit
+	(
+		[](const auto& alternative) -> Scalar
+		{
+			if constexpr (std::is_same_v<std::decay_t<decltype(alternative)>, Tensor>)
+				throw pybind11::type_error("expected a number");
+			else
+				return alternative;
+		},
+		operand
+	);
+}
+
+/* Checks that the buffer of an operand of an out= op can be read in place. */
+void check_out_operand(const TensorBase& buffer, const std::type_info& type)
+{
+	if (!is_host_buffer(buffer))
+		throw std::runtime_error("out= ops run on CPU tensors");
+	if (buffer.type() != type)
+		throw pybind11::type_error("the operands of out= ops must have the same type");
+	if (!is_arithmetic_type(type))
+		throw pybind11::type_error("out= ops support the tensor types with a C++ equivalent, use Tensor.cast() first");
+}
+
+void binary_out(const Tensor& self, const Operand& other, BinaryOp op, const Tensor& out)
+{
+	const TensorBase& self_buffer = self.get_buffer();
+	const TensorBase& out_buffer = out.get_buffer();
+	const std::type_info& type = self_buffer.type();
+	check_out_operand(self_buffer, type);
+	const std::type_info& out_type = is_comparison(op) ? typeid(bool) : type;
+	if (const Tensor* value = std::get_if<Tensor>(&other))
+	{
+		const TensorBase& other_buffer = value->get_buffer();
+		check_out_operand(other_buffer, type);
+		check_out(out_buffer, out_type, broadcast_shapes(shape_of(self_buffer), shape_of(other_buffer)));
+		broadcast_into(self_buffer, other_buffer, op, out_buffer);
+		return;
+	}
+	Scalar number = scalar_of(other);
+	if (promoted_type(type, number, op) != type)
+		throw pybind11::type_error("the number would change the type of the result, cast the tensor first");
+	check_out(out_buffer, out_type, shape_of(self_buffer));
+	scalar_into(self_buffer, number, op, false, out_buffer);
+}
+
+void select_out(const Tensor& condition_value, const Operand& value_if_true, const Operand& value_if_false, const Tensor& out)
+{
+	const TensorBase& out_buffer = out.get_buffer();
+	const TensorBase& condition_buffer = condition_value.get_buffer();
+	if (!is_host_buffer(condition_buffer) || condition_buffer.type() != typeid(bool))
+		throw pybind11::type_error("the condition of condition with out= must be a BOOL CPU tensor");
+	const std::type_info& type = out_buffer.type();
+	if (!is_arithmetic_type(type))
+		throw pybind11::type_error("out= ops support the tensor types with a C++ equivalent, use Tensor.cast() first");
+	/* Numbers are read from 0-dimensional host buffers of the type of out. */
+	TensorBase true_number, false_number;
+	auto as_buffer = [&](const Operand& operand, TensorBase& number_buffer) -> const TensorBase&
+	{
+		if (const Tensor* value = std::get_if<Tensor>(&operand))
+		{
+			check_out_operand(value->get_buffer(), type);
+			return value->get_buffer();
+		}
+		number_buffer = TensorBase(type, std::vector<unsigned int>());
+		dispatch_arithmetic
+		(
+			type,
+			[&](auto tag)
+			{
+				using T = decltype(tag);
+				*mutable_data<T>(number_buffer) = std::visit([](auto number) { return static_cast<T>(number); }, scalar_of(operand));
+			}
+		);
+		return number_buffer;
+	};
+	const TensorBase& true_buffer = as_buffer(value_if_true, true_number);
+	const TensorBase& false_buffer = as_buffer(value_if_false, false_number);
+	check_out(out_buffer, type, broadcast_shapes(broadcast_shapes(shape_of(condition_buffer), shape_of(true_buffer)), shape_of(false_buffer)));
+	select_into(condition_buffer, true_buffer, false_buffer, out_buffer);
+}
+
+void bind_binary(pybind11::module_& m)
+{
+	m.def(
+		"condition",
+		grad_mode_aware(&select, "condition"),
+		pybind11::arg("condition_value"),
+		pybind11::arg("value_if_true"),
+		pybind11::arg("value_if_false")
+	);
+
+	for (const auto& [name, op]: std::initializer_list<std::pair<const char*, BinaryOp>>{{"add_out", BinaryOp::ADD}, {"multiply_out", BinaryOp::MUL}, {"divide_out", BinaryOp::DIV}, {"power_out", BinaryOp::POW}})
+		m.def(
+			name,
+			[op = op](const Tensor& value_1, const Operand& value_2, const Tensor& out) { binary_out(value_1, value_2, op, out); },
+			pybind11::arg("value_1"),
+			pybind11::arg("value_2"),
+			pybind11::arg("out"),
+			pybind11::call_guard<pybind11::gil_scoped_release>()
+		);
+
+	m.def(
+		"condition_out",
+		&select_out,
+		pybind11::arg("condition_value"),
+		pybind11::arg("value_if_true"),
+		pybind11::arg("value_if_false"),
+		pybind11::arg("out"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+}
@@ -0,0 +1,49 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+#include <variant>
+
+/* A Python number used as an operand, its kind deciding the type of the result. */
+using Scalar = std::variant<bool, long long, double>;
+
+/* A tensor or a Python number. */
+using Operand = std::variant<tensor_array::value::Tensor, bool, long long, double>;
+
+enum class BinaryOp
+{
+	ADD,
+	SUB,
+	MUL,
+	DIV,
+	POW,
+	EQ,
+	NE,
+	LT,
+	LE,
+	GT,
+	GE
+};
+
+/*
+ * self op other for tensors of any shapes broadcastable together. Operands of the same
+ * shape use the library op; otherwise the broadcast operand is read with stride 0 by a
+ * native kernel, or, when gradients are recorded, expanded so its gradient is summed back.
+ */
+tensor_array::value::Tensor binary_tensor(const tensor_array::value::Tensor& self, const tensor_array::value::Tensor& other, BinaryOp op);
+
+/*
+ * self op other (or other op self when reverse) with a Python number, which is never
+ * expanded to the shape of self. Comparisons return a BOOL tensor.
+ */
+tensor_array::value::Tensor binary_scalar(const tensor_array::value::Tensor& self, Scalar other, BinaryOp op, bool reverse);
+
+/* Chooses value_if_true where condition_value is true, value_if_false elsewhere, any of them broadcast. */
+tensor_array::value::Tensor select(const tensor_array::value::Tensor& condition_value, const Operand& value_if_true, const Operand& value_if_false);
+
+/*
+ * Writes self op other to out in place, out having the broadcast shape of the operands, and returns nothing.
+ * out may be self or other, so this also implements the in-place methods such as add_.
+ */
+void binary_out(const tensor_array::value::Tensor& self, const Operand& other, BinaryOp op, const tensor_array::value::Tensor& out);
+
+void bind_binary(pybind11::module_& m);
@@ -0,0 +1,55 @@
+#include "cpu_kernel.hh"
+#include "half.hh"
+#include <atomic>
+#include <cmath>
+
+using namespace tensor_array::value;
+
+/* A BOOL buffer, true where input is finite, or nothing when every element is. Device inputs are read from a host copy. */
+std::optional<TensorBase> finite_mask(const Tensor& input)
+{
+	const std::type_info& type = input.get_buffer().type();
+	if (type != typeid(float) && type != typeid(double) && !is_16bit_float_type(type))
+		return std::nullopt;
+	TensorBase input_buffer = host_buffer(input);
+	std::size_t size = element_count(input_buffer);
+	TensorBase mask(typeid(bool), shape_of(input_buffer));
+	std::atomic<bool> any_non_finite(false);
+	dispatch_floating_storage
+	(
+		type,
+		[&](auto tag)
+		{
+			using S = decltype(tag);
+			const S* x = static_cast<const S*>(input_buffer.data());
+			bool* finite = mutable_data<bool>(mask);
+			parallel_for
+			(
+				0, size, DEFAULT_GRAIN_SIZE,
+				[&](std::size_t begin, std::size_t end)
+				{
+					bool non_finite = false;
+					for (std::size_t i = begin; i < end; i++)
+					{
+						finite[i] = std::isfinite(load(x[i]));
+						non_finite |= !finite[i];
+					}
+					if (non_finite)
+						any_non_finite.store(true, std::memory_order_relaxed);
+				}
+			);
+		}
+	);
+	if (!any_non_finite.load())
+		return std::nullopt;
+	return mask;
+}
+
+Tensor identity_grad_zero(const Tensor& input)
+{
+	Tensor difference = input - Tensor(input.get_buffer());
+	std::optional<TensorBase> finite = finite_mask(input);
+	if (!finite)
+		return difference;
+	return condition(Tensor(to_device_of(std::move(*finite), input)), difference, Tensor(zeros_like(input)));
+}
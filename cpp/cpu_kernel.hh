@@ -0,0 +1,209 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <tensor-array/core/data_type_wrapper.hh>
+#include <pybind11/pybind11.h>
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
+#include <functional>
+#include <numeric>
+#include <optional>
+#include <vector>
+#include "grad_mode.hh"
+#include "parallel.hh"
+
+/*
+ * Helpers shared by the native CPU kernels of tensor2.
+ * The kernels read and write contiguous host buffers of TensorBase directly,
+ * so one kernel pass replaces a chain of library ops.
+ */
+
+inline tensor_array::value::TensorBase host_buffer(const tensor_array::value::Tensor& value)
+{
+	return value.get_buffer().change_device({tensor_array::devices::CPU, 0});
+}
+
+inline bool is_host_buffer(const tensor_array::value::TensorBase& buffer)
+{
+	return buffer.get_device().dev_type == tensor_array::devices::CPU;
+}
+
+inline std::vector<unsigned int> shape_of(const tensor_array::value::TensorBase& buffer)
+{
+	return std::vector<unsigned int>(buffer.shape());
+}
+
+inline std::size_t element_count(const tensor_array::value::TensorBase& buffer)
+{
+	std::initializer_list<unsigned int> shape_list = buffer.shape();
+	return std::accumulate(shape_list.begin(), shape_list.end(), std::size_t(1), std::multiplies<std::size_t>());
+}
+
+/* The size in bytes of one element of a tensor type, the types without a C++ equivalent being the 16-bit floats. */
+inline std::size_t element_size(const std::type_info& type)
+{
+	if (type == typeid(bool) || type == typeid(std::int8_t) || type == typeid(std::uint8_t))
+		return 1;
+	if (type == typeid(std::int16_t) || type == typeid(std::uint16_t))
+		return 2;
+	if (type == typeid(std::int32_t) || type == typeid(std::uint32_t) || type == typeid(float))
+		return 4;
+	if (type == typeid(std::int64_t) || type == typeid(std::uint64_t) || type == typeid(double))
+		return 8;
+	return 2;
+}
+
+template <typename T>
+T* mutable_data(const tensor_array::value::TensorBase& buffer)
+{
+	return static_cast<T*>(const_cast<void*>(buffer.data()));
+}
+
+/*
+ * Calls func with a value of the C++ type matching a floating point tensor type.
+ * Used as dispatch_floating(type, [&](auto tag) { using T = decltype(tag); ... }).
+ */
+template <typename Func>
+void dispatch_floating(const std::type_info& type, Func&& func)
+{
+	if (type == typeid(float))
+		func(float());
+	else if (type == typeid(double))
+		func(double());
+	else
+		throw pybind11::type_error("native kernels support FLOAT and DOUBLE tensors, use Tensor.cast() first");
+}
+
+inline bool is_arithmetic_type(const std::type_info& type)
+{
+	return type == typeid(bool)
+		|| type == typeid(std::int8_t) || type == typeid(std::int16_t) || type == typeid(std::int32_t) || type == typeid(std::int64_t)
+		|| type == typeid(std::uint8_t) || type == typeid(std::uint16_t) || type == typeid(std::uint32_t) || type == typeid(std::uint64_t)
+		|| type == typeid(float) || type == typeid(double);
+}
+
+/* Same as dispatch_floating, for every tensor type with a C++ equivalent. */
+template <typename Func>
+void dispatch_arithmetic(const std::type_info& type, Func&& func)
+{
+	if (type == typeid(bool))
+		func(bool());
+	else if (type == typeid(std::int8_t))
+		func(std::int8_t());
+	else if (type == typeid(std::int16_t))
+		func(std::int16_t());
+	else if (type == typeid(std::int32_t))
+		func(std::int32_t());
+	else if (type == typeid(std::int64_t))
+		func(std::int64_t());
+	else if (type == typeid(std::uint8_t))
+		func(std::uint8_t());
+	else if (type == typeid(std::uint16_t))
+		func(std::uint16_t());
+	else if (type == typeid(std::uint32_t))
+		func(std::uint32_t());
+	else if (type == typeid(std::uint64_t))
+		func(std::uint64_t());
+	else
+		dispatch_floating(type, std::forward<Func>(func));
+}
+
+/* Splits a shape into the sizes before, along and after dim. */
+struct DimSplit
+{
+	std::size_t outer;
+	std::size_t length;
+	std::size_t inner;
+};
+
+inline DimSplit split_at_dim(const std::vector<unsigned int>& shape_vec, int dim)
+{
+	int ndim = static_cast<int>(shape_vec.size());
+	if (dim < 0)
+		dim += ndim;
+	if (dim < 0 || dim >= ndim)
+		throw pybind11::index_error("dim " + std::to_string(dim) + " is out of range for a tensor of " + std::to_string(ndim) + " dimensions");
+	DimSplit split{1, shape_vec[dim], 1};
+	for (int i = 0; i < dim; i++)
+		split.outer *= shape_vec[i];
+	for (int i = dim + 1; i < ndim; i++)
+		split.inner *= shape_vec[i];
+	return split;
+}
+
+/*
+ * Checks that out can receive a result of type and shape in place. Writes into existing tensors
+ * bypass autograd and the tracer, so they are refused while either of them is recording.
+ * The library keeps no version counter and exposes no way to ask whether a recorded graph
+ * reads a buffer, so unlike frameworks that only refuse writes to tensors a graph saved,
+ * every out= and in-place op is refused in grad mode, accumulators included.
+ */
+inline void check_out(const tensor_array::value::TensorBase& out, const std::type_info& type, const std::vector<unsigned int>& shape_vec)
+{
+	if (is_grad_enabled())
+		throw std::runtime_error("out= and in-place ops are not recorded by autograd, use them inside no_grad()");
+	if (active_trace() != nullptr)
+		throw std::runtime_error("out= and in-place ops can not be traced");
+	if (!is_host_buffer(out))
+		throw std::runtime_error("out must be a CPU tensor");
+	if (out.type() != type)
+		throw pybind11::type_error("out must have the type of the result");
+	if (shape_of(out) != shape_vec)
+		throw pybind11::value_error("out must have the shape of the result");
+}
+
+/* Moves a host result back to the device of the tensor it was computed from. */
+inline tensor_array::value::TensorBase to_device_of(tensor_array::value::TensorBase&& result, const tensor_array::value::Tensor& like)
+{
+	if (is_host_buffer(like.get_buffer()))
+		return std::move(result);
+	return result.change_device(like.get_buffer().get_device());
+}
+
+/* A zero-filled buffer of the type and shape of like, on its device. */
+inline tensor_array::value::TensorBase zeros_like(const tensor_array::value::Tensor& like)
+{
+	const tensor_array::value::TensorBase& like_buffer = like.get_buffer();
+	tensor_array::value::TensorBase zeros(like_buffer.type(), shape_of(like_buffer));
+	std::memset(mutable_data<char>(zeros), 0, element_count(zeros) * element_size(zeros.type()));
+	return to_device_of(std::move(zeros), like);
+}
+
+/*
+ * A zero-valued tensor whose gradient with respect to input is the identity, (input - leaf(input)),
+ * through which the backward of a native kernel is connected to the autograd graph of the library.
+ * The difference is NaN where input is infinite or NaN, so there it is replaced by a zero leaf
+ * with a condition op; no extra op is recorded for finite inputs.
+ */
+tensor_array::value::Tensor identity_grad_zero(const tensor_array::value::Tensor& input);
+
+/*
+ * Connects the output of a native elementwise kernel to the autograd graph of input:
+ *     input * leaf(derivative) + leaf(offset)
+ * with offset = output - input * derivative, both written by the forward pass of the kernel,
+ * has the value of output and passes input the gradient grad * derivative, for two library ops.
+ * The value is exact where input * derivative is output or 0, as for relu, and otherwise within
+ * the rounding of the addition. Where input * derivative is not finite and not output, at an
+ * infinity where derivative is 0 or at NaN, the kernel clears kept and sets offset to output:
+ * input is replaced by a zero leaf there, which then gets no gradient.
+ */
+inline tensor_array::value::Tensor attach_elementwise_grad
+(
+	const tensor_array::value::Tensor& input,
+	tensor_array::value::TensorBase&& offset,
+	tensor_array::value::TensorBase&& derivative,
+	std::optional<tensor_array::value::TensorBase>&& kept
+)
+{
+	tensor_array::value::Tensor factor = input;
+	if (kept)
+		factor = tensor_array::value::condition
+		(
+			tensor_array::value::Tensor(to_device_of(std::move(*kept), input)),
+			input,
+			tensor_array::value::Tensor(zeros_like(input))
+		);
+	return factor * tensor_array::value::Tensor(to_device_of(std::move(derivative), input))
+		+ tensor_array::value::Tensor(to_device_of(std::move(offset), input));
+}
@@ -0,0 +1,345 @@
+#include "gemm.hh"
+#include "autocast.hh"
+#include "cpu_kernel.hh"
+#include "half.hh"
+#include "host_allocator.hh"
+#include <string>
+#ifdef TENSOR_ARRAY_CBLAS
+#include <cblas.h>
+#endif
+
+using namespace tensor_array::value;
+
+/* Block sizes of the fallback GEMM: a KC x NC panel of B stays in L2 while MC rows of C are updated. */
+constexpr std::size_t GEMM_MC = 64;
+constexpr std::size_t GEMM_KC = 256;
+constexpr std::size_t GEMM_NC = 512;
+
+/*
+ * A matrix operand read through strides, so a transposed operand is a swap of its strides.
+ * Elements of 16-bit floats are widened to float as they are read.
+ */
+template <typename S>
+struct MatrixView
+{
+	const S* data;
+	std::size_t row_stride;
+	std::size_t col_stride;
+
+	compute_t<S> at(std::size_t i, std::size_t j) const
+	{
+		return load(data[i * row_stride + j * col_stride]);
+	}
+};
+
+/*
+ * C[rows, :] = A[rows, :] @ B for rows in [row_begin, row_end), with C contiguous of n columns
+ * starting at row row_begin. B is packed by panels into a contiguous buffer, then four rows of C
+ * are updated at a time, so every load of B feeds four multiply-adds and the inner loop vectorizes
+ * over the columns. 16-bit operands are widened while packing, so C is accumulated in float.
+ */
+template <typename S, typename T = compute_t<S>>
+void gemm_rows(std::size_t row_begin, std::size_t row_end, std::size_t n, std::size_t k, const MatrixView<S>& a, const MatrixView<S>& b, T* c)
+{
+	host_vector<T> packed(std::min(k, GEMM_KC) * std::min(n, GEMM_NC));
+	for (std::size_t i = row_begin; i < row_end; i++)
+		std::fill_n(c + (i - row_begin) * n, n, T(0));
+	for (std::size_t jc = 0; jc < n; jc += GEMM_NC)
+	{
+		std::size_t nc = std::min(GEMM_NC, n - jc);
+		for (std::size_t pc = 0; pc < k; pc += GEMM_KC)
+		{
+			std::size_t kc = std::min(GEMM_KC, k - pc);
+			for (std::size_t p = 0; p < kc; p++)
+				for (std::size_t j = 0; j < nc; j++)
+					packed[p * nc + j] = b.at(pc + p, jc + j);
+			std::size_t i = row_begin;
+			for (; i + 4 <= row_end; i += 4)
+			{
+				T* c0 = c + (i - row_begin) * n + jc;
+				T* c1 = c0 + n;
+				T* c2 = c1 + n;
+				T* c3 = c2 + n;
+				for (std::size_t p = 0; p < kc; p++)
+				{
+					T a0 = a.at(i, pc + p);
+					T a1 = a.at(i + 1, pc + p);
+					T a2 = a.at(i + 2, pc + p);
+					T a3 = a.at(i + 3, pc + p);
+					const T* b_row = packed.data() + p * nc;
+					for (std::size_t j = 0; j < nc; j++)
+					{
+						T b_value = b_row[j];
+						c0[j] += a0 * b_value;
+						c1[j] += a1 * b_value;
+						c2[j] += a2 * b_value;
+						c3[j] += a3 * b_value;
+					}
+				}
+			}
+			for (; i < row_end; i++)
+			{
+				T* c_row = c + (i - row_begin) * n + jc;
+				for (std::size_t p = 0; p < kc; p++)
+				{
+					T a_value = a.at(i, pc + p);
+					const T* b_row = packed.data() + p * nc;
+					for (std::size_t j = 0; j < nc; j++)
+						c_row[j] += a_value * b_row[j];
+				}
+			}
+		}
+	}
+}
+
+#ifdef TENSOR_ARRAY_CBLAS
+/*
+ * The transpositions are passed explicitly rather than read from the strides of a view,
+ * which are both 1 for a transposed operand of a single row.
+ */
+void blas_gemm(std::size_t m, std::size_t n, std::size_t k, const float* a, bool transpose_a, std::size_t lda, const float* b, bool transpose_b, std::size_t ldb, float* c)
+{
+	cblas_sgemm
+	(
+		CblasRowMajor,
+		transpose_a ? CblasTrans : CblasNoTrans,
+		transpose_b ? CblasTrans : CblasNoTrans,
+		static_cast<int>(m), static_cast<int>(n), static_cast<int>(k),
+		1.0f, a, static_cast<int>(lda),
+		b, static_cast<int>(ldb),
+		0.0f, c, static_cast<int>(n)
+	);
+}
+
+void blas_gemm(std::size_t m, std::size_t n, std::size_t k, const double* a, bool transpose_a, std::size_t lda, const double* b, bool transpose_b, std::size_t ldb, double* c)
+{
+	cblas_dgemm
+	(
+		CblasRowMajor,
+		transpose_a ? CblasTrans : CblasNoTrans,
+		transpose_b ? CblasTrans : CblasNoTrans,
+		static_cast<int>(m), static_cast<int>(n), static_cast<int>(k),
+		1.0, a, static_cast<int>(lda),
+		b, static_cast<int>(ldb),
+		0.0, c, static_cast<int>(n)
+	);
+}
+#endif
+
+/* The offsets of the matrices of an operand for every batch of the broadcast batch shape, 0 strides for broadcast dimensions. */
+std::vector<std::size_t> batch_offsets(const std::vector<unsigned int>& shape, const std::vector<unsigned int>& batch_shape)
+{
+	std::size_t matrix_size = std::size_t(shape[shape.size() - 2]) * shape[shape.size() - 1];
+	std::size_t n_batch_dims = shape.size() - 2;
+	std::size_t pad = batch_shape.size() - n_batch_dims;
+	std::vector<std::size_t> strides(batch_shape.size(), 0);
+	std::size_t stride = matrix_size;
+	for (std::size_t d = n_batch_dims; d-- > 0;)
+	{
+		strides[d + pad] = shape[d] == 1 ? 0 : stride;
+		stride *= shape[d];
+	}
+	std::size_t batch = std::accumulate(batch_shape.begin(), batch_shape.end(), std::size_t(1), std::multiplies<std::size_t>());
+	std::vector<std::size_t> offsets(batch, 0);
+	for (std::size_t index = 0; index < batch; index++)
+	{
+		std::size_t rest = index;
+		for (std::size_t d = batch_shape.size(); d-- > 0;)
+		{
+			offsets[index] += rest % batch_shape[d] * strides[d];
+			rest /= batch_shape[d];
+		}
+	}
+	return offsets;
+}
+
+/* The sizes of a batched product and where the matrices of each batch start in its operands. */
+struct MatmulPlan
+{
+	std::size_t m;
+	std::size_t n;
+	std::size_t k;
+	std::size_t a_cols;
+	std::size_t b_cols;
+	std::vector<std::size_t> a_offsets;
+	std::vector<std::size_t> b_offsets;
+	std::vector<unsigned int> out_shape;
+};
+
+MatmulPlan plan_matmul(const std::vector<unsigned int>& a_shape, const std::vector<unsigned int>& b_shape, bool transpose_a, bool transpose_b)
+{
+	std::size_t a_rows = a_shape[a_shape.size() - 2], a_cols = a_shape.back();
+	std::size_t b_rows = b_shape[b_shape.size() - 2], b_cols = b_shape.back();
+	std::size_t m = transpose_a ? a_cols : a_rows;
+	std::size_t k = transpose_a ? a_rows : a_cols;
+	std::size_t n = transpose_b ? b_rows : b_cols;
+	if ((transpose_b ? b_cols : b_rows) != k)
+		throw pybind11::value_error("matmul: inner dimensions do not match, " + std::to_string(k) + " and " + std::to_string(transpose_b ? b_cols : b_rows));
+	std::vector<unsigned int> batch_shape(std::max(a_shape.size(), b_shape.size()) - 2, 1);
+	for (const std::vector<unsigned int>* shape: {&a_shape, &b_shape})
+	{
+		std::size_t pad = batch_shape.size() - (shape->size() - 2);
+		for (std::size_t d = 0; d + 2 < shape->size(); d++)
+		{
+			unsigned int dim = (*shape)[d];
+			unsigned int& out_dim = batch_shape[d + pad];
+			if (dim != 1 && out_dim != 1 && dim != out_dim)
+				throw pybind11::value_error("matmul: batch dimensions can not be broadcast together");
+			out_dim = std::max(out_dim, dim);
+		}
+	}
+	MatmulPlan plan{m, n, k, a_cols, b_cols, batch_offsets(a_shape, batch_shape), batch_offsets(b_shape, batch_shape), batch_shape};
+	plan.out_shape.push_back(static_cast<unsigned int>(m));
+	plan.out_shape.push_back(static_cast<unsigned int>(n));
+	return plan;
+}
+
+/* Writes the product planned by plan to output, which must not share storage with the operands. */
+void gemm_into(const MatmulPlan& plan, const TensorBase& a_buffer, const TensorBase& b_buffer, bool transpose_a, bool transpose_b, const TensorBase& output)
+{
+	std::size_t m = plan.m, n = plan.n, k = plan.k;
+	std::size_t batch = plan.a_offsets.size();
+	dispatch_floating_storage
+	(
+		a_buffer.type(),
+		[&](auto tag)
+		{
+			using S = decltype(tag);
+			const S* a_data = static_cast<const S*>(a_buffer.data());
+			const S* b_data = static_cast<const S*>(b_buffer.data());
+			S* c_data = mutable_data<S>(output);
+			auto view_a = [&](std::size_t index)
+			{
+				return transpose_a ? MatrixView<S>{a_data + plan.a_offsets[index], 1, plan.a_cols} : MatrixView<S>{a_data + plan.a_offsets[index], plan.a_cols, 1};
+			};
+			auto view_b = [&](std::size_t index)
+			{
+				return transpose_b ? MatrixView<S>{b_data + plan.b_offsets[index], 1, plan.b_cols} : MatrixView<S>{b_data + plan.b_offsets[index], plan.b_cols, 1};
+			};
+#ifdef TENSOR_ARRAY_CBLAS
+			/* The BLAS library threads each product itself. */
+			if constexpr (!is_16bit_float<S>)
+			{
+				for (std::size_t index = 0; index < batch; index++)
+					blas_gemm(m, n, k, a_data + plan.a_offsets[index], transpose_a, plan.a_cols, b_data + plan.b_offsets[index], transpose_b, plan.b_cols, c_data + index * m * n);
+				return;
+			}
+#endif
+			std::size_t row_blocks = (m + GEMM_MC - 1) / GEMM_MC;
+			std::size_t block_flops = std::max<std::size_t>(std::min(m, GEMM_MC) * n * k, 1);
+			parallel_for
+			(
+				0, batch * row_blocks, std::max<std::size_t>(DEFAULT_GRAIN_SIZE * 8 / block_flops, 1),
+				[&](std::size_t task_begin, std::size_t task_end)
+				{
+					for (std::size_t task = task_begin; task < task_end; task++)
+					{
+						std::size_t index = task / row_blocks;
+						std::size_t row_begin = task % row_blocks * GEMM_MC;
+						std::size_t row_end = std::min(m, row_begin + GEMM_MC);
+						S* c_rows = c_data + index * m * n + row_begin * n;
+						if constexpr (is_16bit_float<S>)
+						{
+							/* The block of C is accumulated in float and rounded once. */
+							host_vector<float> accumulated((row_end - row_begin) * n);
+							gemm_rows(row_begin, row_end, n, k, view_a(index), view_b(index), accumulated.data());
+							for (std::size_t i = 0; i < accumulated.size(); i++)
+								c_rows[i] = narrow<S>(accumulated[i]);
+						}
+						else
+							gemm_rows(row_begin, row_end, n, k, view_a(index), view_b(index), c_rows);
+					}
+				}
+			);
+		}
+	);
+}
+
+Tensor native_matmul(const TensorBase& a_buffer, const TensorBase& b_buffer, bool transpose_a, bool transpose_b)
+{
+	MatmulPlan plan = plan_matmul(shape_of(a_buffer), shape_of(b_buffer), transpose_a, transpose_b);
+	TensorBase output(a_buffer.type(), plan.out_shape);
+	gemm_into(plan, a_buffer, b_buffer, transpose_a, transpose_b, output);
+	return Tensor(std::move(output));
+}
+
+void matmul_out(const Tensor& a, const Tensor& b, bool transpose_a, bool transpose_b, const Tensor& out)
+{
+	const TensorBase& a_buffer = a.get_buffer();
+	const TensorBase& b_buffer = b.get_buffer();
+	const TensorBase& out_buffer = out.get_buffer();
+	std::vector<unsigned int> a_shape = shape_of(a_buffer), b_shape = shape_of(b_buffer);
+	if (a_shape.size() < 2 || b_shape.size() < 2)
+		throw pybind11::value_error("matmul with out= needs operands of at least 2 dimensions");
+	if (!is_host_buffer(a_buffer) || !is_host_buffer(b_buffer))
+		throw std::runtime_error("out= ops run on CPU tensors");
+	if (b_buffer.type() != a_buffer.type())
+		throw pybind11::type_error("matmul operands must have the same type");
+	if (out_buffer.data() == a_buffer.data() || out_buffer.data() == b_buffer.data())
+		throw pybind11::value_error("the out of matmul can not be one of its operands");
+	MatmulPlan plan = plan_matmul(a_shape, b_shape, transpose_a, transpose_b);
+	check_out(out_buffer, a_buffer.type(), plan.out_shape);
+	gemm_into(plan, a_buffer, b_buffer, transpose_a, transpose_b, out_buffer);
+}
+
+Tensor matmul_dispatch(const Tensor& a_input, const Tensor& b_input, bool transpose_a, bool transpose_b)
+{
+	Tensor a = autocast_lower(a_input);
+	Tensor b = autocast_lower(b_input);
+	const TensorBase& a_buffer = a.get_buffer();
+	const TensorBase& b_buffer = b.get_buffer();
+	std::size_t a_ndim = shape_of(a_buffer).size(), b_ndim = shape_of(b_buffer).size();
+	if ((transpose_a && a_ndim < 2) || (transpose_b && b_ndim < 2))
+		throw pybind11::value_error("matmul can only transpose operands of at least 2 dimensions");
+	bool native = !is_grad_enabled()
+		&& a_ndim >= 2 && b_ndim >= 2
+		&& is_host_buffer(a_buffer) && is_host_buffer(b_buffer)
+		&& a_buffer.type() == b_buffer.type()
+		&& (a_buffer.type() == typeid(float) || a_buffer.type() == typeid(double) || is_16bit_float_type(a_buffer.type()));
+	if (native)
+		return native_matmul(a_buffer, b_buffer, transpose_a, transpose_b);
+	bool with_grad = is_grad_enabled();
+	Tensor lhs = transpose_a ? a.transpose(static_cast<unsigned char>(a_ndim - 2), static_cast<unsigned char>(a_ndim - 1), with_grad) : a;
+	Tensor rhs = transpose_b ? b.transpose(static_cast<unsigned char>(b_ndim - 2), static_cast<unsigned char>(b_ndim - 1), with_grad) : b;
+	return matmul(lhs, rhs);
+}
+
+Tensor tensor_matmul(const Tensor& a, const Tensor& b)
+{
+	return matmul_dispatch(a, b, false, false);
+}
+
+void bind_gemm(pybind11::module_& m)
+{
+	m.def(
+		"matmul",
+		grad_mode_aware(&matmul_dispatch, "matmul"),
+		pybind11::arg("value_1"),
+		pybind11::arg("value_2"),
+		pybind11::arg("transpose_1") = false,
+		pybind11::arg("transpose_2") = false
+	);
+
+	m.def(
+		"matmul_out",
+		&matmul_out,
+		pybind11::arg("value_1"),
+		pybind11::arg("value_2"),
+		pybind11::arg("transpose_1"),
+		pybind11::arg("transpose_2"),
+		pybind11::arg("out"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"has_blas",
+		[]()
+		{
+#ifdef TENSOR_ARRAY_CBLAS
+			return true;
+#else
+			return false;
+#endif
+		}
+	);
+}
@@ -0,0 +1,14 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+
+/*
+ * Matrix product of the last two dimensions of a and b, broadcasting the leading batch dimensions.
+ * transpose_a and transpose_b read an operand as transposed through its strides, without a copy.
+ * CPU float and double products without autograd run on the native GEMM, others on the library matmul.
+ */
+tensor_array::value::Tensor matmul_dispatch(const tensor_array::value::Tensor& a, const tensor_array::value::Tensor& b, bool transpose_a, bool transpose_b);
+
+tensor_array::value::Tensor tensor_matmul(const tensor_array::value::Tensor& a, const tensor_array::value::Tensor& b);
+
+void bind_gemm(pybind11::module_& m);
@@ -0,0 +1,25 @@
+#pragma once
+#include <pybind11/pybind11.h>
+#include <functional>
+#include <type_traits>
+#include <utility>
+
+/* Whether one of the arguments is a Python object, which can only be touched while holding the GIL. */
+template <typename... Args>
+constexpr bool holds_python_object = (std::is_base_of_v<pybind11::handle, std::decay_t<Args>> || ...);
+
+/*
+ * Calls func(args...) with the GIL released, so other Python threads run while the native op computes.
+ * Ops taking Python objects (shape tuples, slices) keep the GIL, they only read them.
+ */
+template <typename Func, typename... Args>
+decltype(auto) call_without_gil(Func&& func, Args&&... args)
+{
+	if constexpr (holds_python_object<Args...>)
+		return std::invoke(std::forward<Func>(func), std::forward<Args>(args)...);
+	else
+	{
+		pybind11::gil_scoped_release release;
+		return std::invoke(std::forward<Func>(func), std::forward<Args>(args)...);
+	}
+}
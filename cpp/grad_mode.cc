@@ -0,0 +1,100 @@
+#include "grad_mode.hh"
+#include <mutex>
+
+using namespace tensor_array::value;
+
+/*
+ * Grad mode is per thread, like the "with no_grad()" blocks that switch it,
+ * so a serving thread can run without graph while another one trains.
+ */
+thread_local bool grad_enabled = true;
+
+bool is_grad_enabled()
+{
+	return grad_enabled;
+}
+
+void set_grad_enabled(bool mode)
+{
+	grad_enabled = mode;
+}
+
+Tensor record_grad(Tensor&& value)
+{
+	if (grad_enabled)
+		return std::move(value);
+	/* A leaf that holds only the result buffer, the graph behind value is released with it. */
+	return Tensor(value.get_buffer());
+}
+
+/*
+ * Backward passes of different threads can reach the same parameters and accumulate into
+ * their gradients, so they run one at a time. Forward ops only read shared tensors.
+ */
+std::mutex backward_mutex;
+
+void release_graph(Tensor& self)
+{
+	/*
+	 * The graph is owned by the tensors that reference it, dropping the reference
+	 * held by the output frees every intermediate that nothing else keeps alive.
+	 */
+	self = Tensor(self.get_buffer());
+}
+
+void backward(Tensor& self, bool retain_graph)
+{
+	pybind11::gil_scoped_release release;
+	std::lock_guard<std::mutex> lock(backward_mutex);
+	self.calc_grad();
+	if (!retain_graph)
+		release_graph(self);
+}
+
+/*
+ * Registered by tensor_array.core with set_calc_grad_hook(): collects the gradients into the grad
+ * of inputs and completes checkpointed calls, so that the tensors returned by ops, instances of
+ * the native class, support the whole calc_grad() of the Python Tensor. Allocated once and never
+ * released, as it would outlive the interpreter.
+ */
+pybind11::object* calc_grad_hook = nullptr;
+
+void set_calc_grad_hook(const pybind11::object& hook)
+{
+	if (calc_grad_hook == nullptr)
+		calc_grad_hook = new pybind11::object();
+	*calc_grad_hook = hook;
+}
+
+void calc_grad(Tensor& self, bool retain_graph, const pybind11::object& inputs, bool accumulate)
+{
+	if (calc_grad_hook == nullptr || calc_grad_hook->is_none())
+	{
+		if (!inputs.is_none())
+			throw std::runtime_error("calc_grad(inputs=...) needs tensor_array.core to be imported");
+		backward(self, retain_graph);
+		return;
+	}
+	/* The Python object of self, so that the hook releases the graph it holds. */
+	(*calc_grad_hook)(pybind11::cast(&self, pybind11::return_value_policy::reference), retain_graph, inputs, accumulate);
+}
+
+void bind_grad_mode(pybind11::module_& m)
+{
+	m.def(
+		"is_grad_enabled",
+		&is_grad_enabled
+	);
+
+	m.def(
+		"set_grad_enabled",
+		&set_grad_enabled,
+		pybind11::arg("mode")
+	);
+
+	m.def(
+		"set_calc_grad_hook",
+		&set_calc_grad_hook,
+		pybind11::arg("hook")
+	);
+}
@@ -0,0 +1,41 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+#include "gil.hh"
+#include "trace.hh"
+
+bool is_grad_enabled();
+
+void set_grad_enabled(bool mode);
+
+tensor_array::value::Tensor record_grad(tensor_array::value::Tensor&& value);
+
+void release_graph(tensor_array::value::Tensor& self);
+
+void backward(tensor_array::value::Tensor& self, bool retain_graph);
+
+void calc_grad(tensor_array::value::Tensor& self, bool retain_graph, const pybind11::object& inputs, bool accumulate);
+
+template <typename... Args>
+auto grad_mode_aware(tensor_array::value::Tensor (*func)(Args...), OpInfo info = OpInfo())
+{
+	return [func, info](Args... args)
+	{
+		tensor_array::value::Tensor result = record_grad(call_without_gil(func, args...));
+		trace_op(func, info, result, args...);
+		return result;
+	};
+}
+
+template <typename... Args>
+auto grad_mode_aware(tensor_array::value::Tensor (tensor_array::value::Tensor::*func)(Args...) const, OpInfo info = OpInfo())
+{
+	return [func, info](const tensor_array::value::Tensor& self, Args... args)
+	{
+		tensor_array::value::Tensor result = record_grad(call_without_gil(func, self, args...));
+		trace_op(func, info, result, self, args...);
+		return result;
+	};
+}
+
+void bind_grad_mode(pybind11::module_& m);
@@ -0,0 +1,153 @@
+#pragma once
+#include "cpu_kernel.hh"
+#include <cstdint>
+#include <cstring>
+#include <type_traits>
+
+/*
+ * The 16-bit float types, read from their bits, widened to float for computing
+ * and narrowed back with round-to-nearest-even for storing.
+ */
+struct Half
+{
+	std::uint16_t bits;
+};
+
+struct BFloat16
+{
+	std::uint16_t bits;
+};
+
+template <typename T>
+constexpr bool is_16bit_float = std::is_same_v<T, Half> || std::is_same_v<T, BFloat16>;
+
+inline float bits_to_float(std::uint32_t bits)
+{
+	float result;
+	std::memcpy(&result, &bits, sizeof(result));
+	return result;
+}
+
+inline std::uint32_t float_to_bits(float value)
+{
+	std::uint32_t result;
+	std::memcpy(&result, &value, sizeof(result));
+	return result;
+}
+
+inline float widen(BFloat16 value)
+{
+	return bits_to_float(std::uint32_t(value.bits) << 16);
+}
+
+inline float widen(Half value)
+{
+	std::uint32_t sign = std::uint32_t(value.bits & 0x8000U) << 16;
+	std::uint32_t exponent = (value.bits >> 10) & 0x1FU;
+	std::uint32_t mantissa = value.bits & 0x3FFU;
+	if (exponent == 0x1FU)
+		return bits_to_float(sign | 0x7F800000U | (mantissa << 13));
+	if (exponent != 0)
+		return bits_to_float(sign | ((exponent + 112) << 23) | (mantissa << 13));
+	if (mantissa == 0)
+		return bits_to_float(sign);
+	/* A subnormal half is a normal float: shift the mantissa up to its leading bit. */
+	exponent = 113;
+	while (!(mantissa & 0x400U))
+	{
+		mantissa <<= 1;
+		exponent--;
+	}
+	return bits_to_float(sign | (exponent << 23) | ((mantissa & 0x3FFU) << 13));
+}
+
+template <typename T>
+T narrow(float value);
+
+template <>
+inline BFloat16 narrow<BFloat16>(float value)
+{
+	std::uint32_t bits = float_to_bits(value);
+	if ((bits & 0x7FFFFFFFU) > 0x7F800000U)
+		return BFloat16{static_cast<std::uint16_t>((bits >> 16) | 0x40U)};
+	bits += 0x7FFFU + ((bits >> 16) & 1U);
+	return BFloat16{static_cast<std::uint16_t>(bits >> 16)};
+}
+
+template <>
+inline Half narrow<Half>(float value)
+{
+	std::uint32_t bits = float_to_bits(value);
+	std::uint32_t sign = (bits >> 16) & 0x8000U;
+	std::uint32_t magnitude = bits & 0x7FFFFFFFU;
+	if (magnitude >= 0x7F800000U)
+		return Half{static_cast<std::uint16_t>(sign | 0x7C00U | (magnitude > 0x7F800000U ? 0x200U : 0U))};
+	/* 65520 and above round to infinity. */
+	if (magnitude >= 0x477FF000U)
+		return Half{static_cast<std::uint16_t>(sign | 0x7C00U)};
+	/* Below 2^-14 the result is subnormal, and 2^-25 or less rounds to zero. */
+	if (magnitude < 0x38800000U)
+	{
+		if (magnitude < 0x33000000U)
+			return Half{static_cast<std::uint16_t>(sign)};
+		std::uint32_t shift = 126 - (magnitude >> 23);
+		std::uint32_t mantissa = (magnitude & 0x7FFFFFU) | 0x800000U;
+		std::uint32_t result = mantissa >> shift;
+		std::uint32_t remainder = mantissa & ((1U << shift) - 1);
+		std::uint32_t halfway = 1U << (shift - 1);
+		if (remainder > halfway || (remainder == halfway && (result & 1U)))
+			result++;
+		return Half{static_cast<std::uint16_t>(sign | result)};
+	}
+	/* Rebias the exponent from 127 to 15, then round the 13 dropped bits to nearest even. */
+	std::uint32_t rounded = magnitude - 0x38000000U;
+	rounded += 0xFFFU + ((rounded >> 13) & 1U);
+	return Half{static_cast<std::uint16_t>(sign | (rounded >> 13))};
+}
+
+/* The value of an element as the type it is computed in, float for the 16-bit floats. */
+template <typename T>
+auto load(T value)
+{
+	if constexpr (is_16bit_float<T>)
+		return widen(value);
+	else
+		return value;
+}
+
+/* The type elements of T are computed in. */
+template <typename T>
+using compute_t = decltype(load(std::declval<T>()));
+
+/* value stored as an element of S, narrowed for the 16-bit floats. */
+template <typename S>
+S store(compute_t<S> value)
+{
+	if constexpr (is_16bit_float<S>)
+		return narrow<S>(value);
+	else
+		return value;
+}
+
+inline bool is_16bit_float_type(const std::type_info& type)
+{
+	using namespace tensor_array::datatype;
+	using namespace tensor_array::wrapper;
+	DataType data_type = warp_type(type);
+	return data_type == HALF_DTYPE || data_type == BF16_DTYPE;
+}
+
+/* Same as dispatch_floating, with HALF and BFLOAT16 passed as their bit patterns. */
+template <typename Func>
+void dispatch_floating_storage(const std::type_info& type, Func&& func)
+{
+	using namespace tensor_array::datatype;
+	using namespace tensor_array::wrapper;
+	DataType data_type = warp_type(type);
+	if (data_type == HALF_DTYPE)
+		func(Half());
+	else if (data_type == BF16_DTYPE)
+		func(BFloat16());
+	else
+		dispatch_floating(type, std::forward<Func>(func));
+}
@@ -0,0 +1,183 @@
+#include "host_allocator.hh"
+#include <algorithm>
+#include <cstdlib>
+#include <string>
+
+/* The default cache limit, overridden by the TENSOR_ARRAY_HOST_CACHE_MB environment variable. */
+constexpr std::size_t DEFAULT_MAX_CACHED_BYTES = std::size_t(256) << 20;
+
+HostAllocator& HostAllocator::instance()
+{
+	/* Never destroyed, so kernels running during interpreter shutdown can still free their blocks. */
+	static HostAllocator* allocator = []
+	{
+		HostAllocator* result = new HostAllocator();
+		result->counters.max_cached_bytes = DEFAULT_MAX_CACHED_BYTES;
+		if (const char* limit = std::getenv("TENSOR_ARRAY_HOST_CACHE_MB"))
+			result->counters.max_cached_bytes = static_cast<std::size_t>(std::strtoull(limit, nullptr, 10)) << 20;
+		return result;
+	}();
+	return *allocator;
+}
+
+std::size_t HostAllocator::round_size(std::size_t bytes)
+{
+	if (bytes <= alignment)
+		return alignment;
+	/* The size classes between 2^k and 2^(k+1) are 2^k * (1, 1.25, 1.5, 1.75), so at most 25% is wasted. */
+	std::size_t power = alignment;
+	while (power * 2 < bytes)
+		power *= 2;
+	std::size_t step = std::max(power / 4, alignment);
+	return (bytes + step - 1) / step * step;
+}
+
+void* HostAllocator::allocate(std::size_t bytes)
+{
+	if (bytes == 0)
+		return nullptr;
+	std::size_t size = round_size(bytes);
+	void* ptr = nullptr;
+	{
+		std::lock_guard<std::mutex> lock(mutex);
+		counters.num_allocs++;
+		counters.allocated_bytes += size;
+		counters.requested_bytes += bytes;
+		counters.peak_allocated_bytes = std::max(counters.peak_allocated_bytes, counters.allocated_bytes);
+		auto found = free_blocks.find(size);
+		if (found != free_blocks.end() && !found->second.empty())
+		{
+			ptr = found->second.back();
+			found->second.pop_back();
+			counters.cached_bytes -= size;
+			counters.num_cache_hits++;
+			return ptr;
+		}
+		counters.num_system_allocs++;
+	}
+	try
+	{
+		return ::operator new(size, std::align_val_t(alignment));
+	}
+	catch (const std::bad_alloc&)
+	{
+		/* Give the cached blocks back to the system and try once more. */
+		empty_cache();
+		try
+		{
+			return ::operator new(size, std::align_val_t(alignment));
+		}
+		catch (const std::bad_alloc&)
+		{
+			std::lock_guard<std::mutex> lock(mutex);
+			counters.allocated_bytes -= size;
+			counters.requested_bytes -= bytes;
+			throw;
+		}
+	}
+}
+
+void HostAllocator::deallocate(void* ptr, std::size_t bytes)
+{
+	if (ptr == nullptr)
+		return;
+	std::size_t size = round_size(bytes);
+	std::lock_guard<std::mutex> lock(mutex);
+	counters.allocated_bytes -= size;
+	counters.requested_bytes -= bytes;
+	free_blocks[size].push_back(ptr);
+	counters.cached_bytes += size;
+	if (counters.cached_bytes > counters.max_cached_bytes)
+		trim(counters.max_cached_bytes);
+}
+
+void HostAllocator::trim(std::size_t limit)
+{
+	std::vector<std::size_t> sizes;
+	for (const auto& [size, blocks]: free_blocks)
+		if (!blocks.empty())
+			sizes.push_back(size);
+	std::sort(sizes.rbegin(), sizes.rend());
+	for (std::size_t size: sizes)
+	{
+		std::vector<void*>& blocks = free_blocks[size];
+		while (!blocks.empty() && counters.cached_bytes > limit)
+		{
+			::operator delete(blocks.back(), std::align_val_t(alignment));
+			blocks.pop_back();
+			counters.cached_bytes -= size;
+			counters.num_system_frees++;
+		}
+		if (counters.cached_bytes <= limit)
+			break;
+	}
+}
+
+void HostAllocator::empty_cache()
+{
+	std::lock_guard<std::mutex> lock(mutex);
+	trim(0);
+	free_blocks.clear();
+}
+
+void HostAllocator::set_max_cached_bytes(std::size_t bytes)
+{
+	std::lock_guard<std::mutex> lock(mutex);
+	counters.max_cached_bytes = bytes;
+	trim(bytes);
+}
+
+void HostAllocator::reset_peak_stats()
+{
+	std::lock_guard<std::mutex> lock(mutex);
+	counters.peak_allocated_bytes = counters.allocated_bytes;
+}
+
+HostMemoryStats HostAllocator::stats() const
+{
+	std::lock_guard<std::mutex> lock(mutex);
+	return counters;
+}
+
+pybind11::dict py_memory_stats()
+{
+	HostMemoryStats stats = HostAllocator::instance().stats();
+	pybind11::dict result;
+	result["allocated_bytes"] = stats.allocated_bytes;
+	result["peak_allocated_bytes"] = stats.peak_allocated_bytes;
+	result["requested_bytes"] = stats.requested_bytes;
+	result["cached_bytes"] = stats.cached_bytes;
+	result["reserved_bytes"] = stats.allocated_bytes + stats.cached_bytes;
+	result["max_cached_bytes"] = stats.max_cached_bytes;
+	result["num_allocs"] = stats.num_allocs;
+	result["num_cache_hits"] = stats.num_cache_hits;
+	result["num_system_allocs"] = stats.num_system_allocs;
+	result["num_system_frees"] = stats.num_system_frees;
+	/* The share of the blocks in use lost to the rounding to size classes. */
+	result["fragmentation"] = stats.allocated_bytes == 0 ? 0.0 : 1.0 - static_cast<double>(stats.requested_bytes) / static_cast<double>(stats.allocated_bytes);
+	return result;
+}
+
+void bind_host_allocator(pybind11::module_& m)
+{
+	m.def(
+		"memory_stats",
+		&py_memory_stats
+	);
+
+	m.def(
+		"empty_cache",
+		[]() { HostAllocator::instance().empty_cache(); }
+	);
+
+	m.def(
+		"set_max_cached_bytes",
+		[](std::size_t bytes) { HostAllocator::instance().set_max_cached_bytes(bytes); },
+		pybind11::arg("bytes")
+	);
+
+	m.def(
+		"reset_peak_memory_stats",
+		[]() { HostAllocator::instance().reset_peak_stats(); }
+	);
+}
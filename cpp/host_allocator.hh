@@ -0,0 +1,94 @@
+#pragma once
+#include <pybind11/pybind11.h>
+#include <cstddef>
+#include <mutex>
+#include <new>
+#include <unordered_map>
+#include <vector>
+
+struct HostMemoryStats
+{
+	std::size_t allocated_bytes = 0;
+	std::size_t peak_allocated_bytes = 0;
+	std::size_t requested_bytes = 0;
+	std::size_t cached_bytes = 0;
+	std::size_t max_cached_bytes = 0;
+	std::size_t num_allocs = 0;
+	std::size_t num_cache_hits = 0;
+	std::size_t num_system_allocs = 0;
+	std::size_t num_system_frees = 0;
+};
+
+/*
+ * A caching allocator for host scratch memory of the native kernels.
+ * Sizes are rounded up to size classes, four per power of two, and freed blocks are kept
+ * in a list per class to serve the next request of the same class without calling the system.
+ * When the cache grows over its limit, the largest cached blocks are released first.
+ */
+class HostAllocator
+{
+public:
+	static constexpr std::size_t alignment = 64;
+
+	static HostAllocator& instance();
+
+	static std::size_t round_size(std::size_t bytes);
+
+	void* allocate(std::size_t bytes);
+
+	void deallocate(void* ptr, std::size_t bytes);
+
+	void empty_cache();
+
+	void set_max_cached_bytes(std::size_t bytes);
+
+	void reset_peak_stats();
+
+	HostMemoryStats stats() const;
+
+private:
+	void trim(std::size_t limit);
+
+	mutable std::mutex mutex;
+	std::unordered_map<std::size_t, std::vector<void*>> free_blocks;
+	HostMemoryStats counters;
+};
+
+/* A standard allocator drawing from HostAllocator, for scratch vectors of the kernels. */
+template <typename T>
+struct CachingHostAllocator
+{
+	using value_type = T;
+
+	CachingHostAllocator() = default;
+
+	template <typename U>
+	CachingHostAllocator(const CachingHostAllocator<U>&) {}
+
+	T* allocate(std::size_t n)
+	{
+		return static_cast<T*>(HostAllocator::instance().allocate(n * sizeof(T)));
+	}
+
+	void deallocate(T* ptr, std::size_t n)
+	{
+		HostAllocator::instance().deallocate(ptr, n * sizeof(T));
+	}
+
+	template <typename U>
+	bool operator==(const CachingHostAllocator<U>&) const
+	{
+		return true;
+	}
+
+	template <typename U>
+	bool operator!=(const CachingHostAllocator<U>&) const
+	{
+		return false;
+	}
+};
+
+template <typename T>
+using host_vector = std::vector<T, CachingHostAllocator<T>>;
+
+void bind_host_allocator(pybind11::module_& m);
@@ -0,0 +1,438 @@
+#include "layout.hh"
+#include "cpu_kernel.hh"
+#include <cstring>
+#include <string>
+
+using namespace tensor_array::value;
+using namespace tensor_array::wrapper;
+
+StridedLayout StridedLayout::of(const std::vector<unsigned int>& shape)
+{
+	StridedLayout layout{shape, std::vector<std::ptrdiff_t>(shape.size()), 0};
+	std::ptrdiff_t stride = 1;
+	for (std::size_t d = shape.size(); d-- > 0;)
+	{
+		layout.strides[d] = stride;
+		stride *= shape[d];
+	}
+	return layout;
+}
+
+bool StridedLayout::is_contiguous() const
+{
+	std::ptrdiff_t stride = 1;
+	for (std::size_t d = shape.size(); d-- > 0;)
+	{
+		if (shape[d] != 1 && strides[d] != stride)
+			return false;
+		stride *= shape[d];
+	}
+	return true;
+}
+
+StridedLayout broadcast_layout(const std::vector<unsigned int>& shape, const std::vector<unsigned int>& target)
+{
+	if (shape.size() > target.size())
+		throw pybind11::value_error("can not broadcast a tensor of " + std::to_string(shape.size()) + " dimensions to " + std::to_string(target.size()) + " dimensions");
+	StridedLayout source = StridedLayout::of(shape);
+	StridedLayout layout{target, std::vector<std::ptrdiff_t>(target.size(), 0), 0};
+	std::size_t pad = target.size() - shape.size();
+	for (std::size_t d = pad; d < target.size(); d++)
+	{
+		unsigned int dim = shape[d - pad];
+		if (dim != 1 && dim != target[d])
+			throw pybind11::value_error("can not broadcast dimension " + std::to_string(d - pad) + " of size " + std::to_string(dim) + " to size " + std::to_string(target[d]));
+		if (dim != 1)
+			layout.strides[d] = source.strides[d - pad];
+	}
+	return layout;
+}
+
+std::vector<unsigned int> broadcast_shapes(const std::vector<unsigned int>& shape_1, const std::vector<unsigned int>& shape_2)
+{
+	std::vector<unsigned int> result(std::max(shape_1.size(), shape_2.size()), 1);
+	for (const std::vector<unsigned int>* shape: {&shape_1, &shape_2})
+	{
+		std::size_t pad = result.size() - shape->size();
+		for (std::size_t d = 0; d < shape->size(); d++)
+		{
+			unsigned int dim = (*shape)[d];
+			unsigned int& out_dim = result[d + pad];
+			if (dim != 1 && out_dim != 1 && dim != out_dim)
+				throw pybind11::value_error("shapes can not be broadcast together, dimension " + std::to_string(d + pad) + " has sizes " + std::to_string(out_dim) + " and " + std::to_string(dim));
+			if (dim != 1)
+				out_dim = dim;
+		}
+	}
+	return result;
+}
+
+/*
+ * Copies the elements [begin, end) of the layout, in row-major order, walking the source
+ * with a multi-dimensional counter so each element costs one addition of a stride.
+ */
+template <typename Word>
+void gather_elements(const Word* source, Word* target, const StridedLayout& layout, std::size_t begin, std::size_t end)
+{
+	const std::vector<unsigned int>& shape = layout.shape;
+	const std::vector<std::ptrdiff_t>& strides = layout.strides;
+	std::size_t ndim = shape.size();
+	std::vector<unsigned int> index(ndim);
+	std::ptrdiff_t position = layout.offset;
+	for (std::size_t rest = begin, d = ndim; d-- > 0;)
+	{
+		index[d] = static_cast<unsigned int>(rest % shape[d]);
+		rest /= shape[d];
+		position += index[d] * strides[d];
+	}
+	for (std::size_t i = begin; i < end; i++)
+	{
+		target[i] = source[position];
+		for (std::size_t d = ndim; d-- > 0;)
+		{
+			position += strides[d];
+			if (++index[d] < shape[d])
+				break;
+			position -= strides[d] * shape[d];
+			index[d] = 0;
+		}
+	}
+}
+
+TensorBase materialize(const TensorBase& source, const StridedLayout& layout)
+{
+	const std::type_info& type = source.type();
+	TensorBase result(type, layout.shape);
+	std::size_t count = element_count(result);
+	if (count == 0)
+		return result;
+	std::size_t size = element_size(type);
+	const char* source_data = static_cast<const char*>(source.data());
+	char* result_data = mutable_data<char>(result);
+	if (layout.is_contiguous())
+	{
+		parallel_for
+		(
+			0, count, DEFAULT_GRAIN_SIZE,
+			[&](std::size_t begin, std::size_t end)
+			{
+				std::memcpy(result_data + begin * size, source_data + (layout.offset + begin) * size, (end - begin) * size);
+			}
+		);
+		return result;
+	}
+	auto gather = [&](auto word)
+	{
+		using Word = decltype(word);
+		parallel_for
+		(
+			0, count, DEFAULT_GRAIN_SIZE,
+			[&](std::size_t begin, std::size_t end)
+			{
+				gather_elements(reinterpret_cast<const Word*>(source_data), reinterpret_cast<Word*>(result_data), layout, begin, end);
+			}
+		);
+	};
+	switch (size)
+	{
+	case 1:
+		gather(std::uint8_t());
+		break;
+	case 2:
+		gather(std::uint16_t());
+		break;
+	case 4:
+		gather(std::uint32_t());
+		break;
+	default:
+		gather(std::uint64_t());
+		break;
+	}
+	return result;
+}
+
+/* Materializes layout over the buffer of self on the host and moves the result back to the device of self. */
+Tensor apply_layout(const Tensor& self, const StridedLayout& layout)
+{
+	TensorBase source = host_buffer(self);
+	return Tensor(to_device_of(materialize(source, layout), self));
+}
+
+Tensor library_reshape(const Tensor& self, const std::vector<unsigned int>& shape_vec)
+{
+	return self.reshape(initializer_wrapper<unsigned int>(shape_vec.data(), shape_vec.data() + shape_vec.size()));
+}
+
+std::size_t normalize_dim(int dim, std::size_t ndim)
+{
+	int signed_ndim = static_cast<int>(ndim);
+	if (dim < -signed_ndim || dim >= signed_ndim)
+		throw pybind11::index_error("dim " + std::to_string(dim) + " is out of range for a tensor of " + std::to_string(ndim) + " dimensions");
+	return static_cast<std::size_t>(dim < 0 ? dim + signed_ndim : dim);
+}
+
+/*
+ * Each run of consecutive broadcast dimensions goes through one product with ones, whose backward
+ * is the sum of the gradient over the copies, exactly the reduction a broadcast needs. With O the
+ * size of the dimensions before the run, R the size of the run and I the size of those after it:
+ *     leading run, O == 1:   ones[R, 1] @ self[1, I]
+ *     trailing run, I == 1:  self[O, 1] @ ones[1, R]
+ *     otherwise:             ones[R, 1] @ self[1, O * I] as [R, O, I], transposed to [O, R, I]
+ * so a bias added to a batch of rows costs one outer product and no transpose.
+ */
+Tensor expand_with_grad(const Tensor& self, const std::vector<unsigned int>& target)
+{
+	std::vector<unsigned int> shape_vec = shape_of(self.get_buffer());
+	broadcast_layout(shape_vec, target);
+	if (shape_vec == target)
+		return self;
+	const std::type_info& type = self.get_buffer().type();
+	/* Only FLOAT and DOUBLE tensors carry gradients through the native ops, the others are broadcast by the gather. */
+	if (type != typeid(float) && type != typeid(double))
+		return apply_layout(self, broadcast_layout(shape_vec, target));
+	auto ones = [&](unsigned int rows, unsigned int columns)
+	{
+		TensorBase buffer(type, {rows, columns});
+		dispatch_floating(type, [&](auto tag) { std::fill_n(mutable_data<decltype(tag)>(buffer), std::size_t(rows) * columns, decltype(tag)(1)); });
+		return Tensor(to_device_of(std::move(buffer), self));
+	};
+	shape_vec.insert(shape_vec.begin(), target.size() - shape_vec.size(), 1U);
+	Tensor result = library_reshape(self, shape_vec);
+	std::size_t d = 0;
+	while (d < target.size())
+	{
+		if (shape_vec[d] == target[d])
+		{
+			d++;
+			continue;
+		}
+		/* The dimensions of size 1 following a broadcast one join its run. */
+		std::size_t end = d + 1;
+		while (end < target.size() && shape_vec[end] == 1U)
+			end++;
+		unsigned int outer = std::accumulate(target.begin(), target.begin() + d, 1U, std::multiplies<unsigned int>());
+		unsigned int run = std::accumulate(target.begin() + d, target.begin() + end, 1U, std::multiplies<unsigned int>());
+		unsigned int inner = std::accumulate(shape_vec.begin() + end, shape_vec.end(), 1U, std::multiplies<unsigned int>());
+		if (outer == 1U)
+			result = matmul(ones(run, 1U), library_reshape(result, {1U, inner}));
+		else if (inner == 1U)
+			result = matmul(library_reshape(result, {outer, 1U}), ones(1U, run));
+		else
+			result = library_reshape(matmul(ones(run, 1U), library_reshape(result, {1U, outer * inner})), {run, outer, inner}).transpose(0, 1, true);
+		std::copy(target.begin() + d, target.begin() + end, shape_vec.begin() + d);
+		result = library_reshape(result, shape_vec);
+		d = end;
+	}
+	return result;
+}
+
+/*
+ * Every layout op below returns a new tensor. It records through the differentiable library ops
+ * in grad mode, so gradients flow back to the source, and runs the strided gather otherwise.
+ * Device tensors take the library ops in both modes, as the gather runs on the host.
+ */
+
+bool use_library_layouts(const Tensor& self)
+{
+	return is_grad_enabled() || !is_host_buffer(self.get_buffer());
+}
+
+Tensor layout_transpose(const Tensor& self, int dim0, int dim1, bool is_derive)
+{
+	StridedLayout layout = StridedLayout::of(shape_of(self.get_buffer()));
+	std::size_t d0 = normalize_dim(dim0, layout.shape.size());
+	std::size_t d1 = normalize_dim(dim1, layout.shape.size());
+	if ((is_derive && is_grad_enabled()) || !is_host_buffer(self.get_buffer()))
+		return self.transpose(static_cast<unsigned char>(d0), static_cast<unsigned char>(d1), is_derive);
+	std::swap(layout.shape[d0], layout.shape[d1]);
+	std::swap(layout.strides[d0], layout.strides[d1]);
+	return apply_layout(self, layout);
+}
+
+Tensor layout_permute(const Tensor& self, const std::vector<int>& dims)
+{
+	StridedLayout source = StridedLayout::of(shape_of(self.get_buffer()));
+	std::size_t ndim = source.shape.size();
+	if (dims.size() != ndim)
+		throw pybind11::value_error("permute needs one dimension for each of the " + std::to_string(ndim) + " dimensions of the tensor");
+	std::vector<std::size_t> order(ndim);
+	std::vector<bool> seen(ndim, false);
+	for (std::size_t i = 0; i < ndim; i++)
+	{
+		order[i] = normalize_dim(dims[i], ndim);
+		if (seen[order[i]])
+			throw pybind11::value_error("permute got dimension " + std::to_string(order[i]) + " twice");
+		seen[order[i]] = true;
+	}
+	if (use_library_layouts(self))
+	{
+		/* Sorts the dimensions into place with transposes, at most ndim - 1 of them. */
+		Tensor result = self;
+		std::vector<std::size_t> current(ndim);
+		std::iota(current.begin(), current.end(), std::size_t(0));
+		for (std::size_t i = 0; i < ndim; i++)
+		{
+			std::size_t j = std::find(current.begin() + i, current.end(), order[i]) - current.begin();
+			if (j == i)
+				continue;
+			result = result.transpose(static_cast<unsigned char>(i), static_cast<unsigned char>(j), true);
+			std::swap(current[i], current[j]);
+		}
+		return result;
+	}
+	StridedLayout layout;
+	layout.offset = 0;
+	for (std::size_t d: order)
+	{
+		layout.shape.push_back(source.shape[d]);
+		layout.strides.push_back(source.strides[d]);
+	}
+	return apply_layout(self, layout);
+}
+
+Tensor layout_expand(const Tensor& self, const std::vector<int>& shape)
+{
+	std::vector<unsigned int> source_shape = shape_of(self.get_buffer());
+	if (shape.size() < source_shape.size())
+		throw pybind11::value_error("expand can not remove dimensions of the tensor");
+	std::size_t pad = shape.size() - source_shape.size();
+	std::vector<unsigned int> target(shape.size());
+	for (std::size_t d = 0; d < shape.size(); d++)
+	{
+		if (shape[d] == -1)
+		{
+			if (d < pad)
+				throw pybind11::value_error("expand can not infer the size of a new dimension");
+			target[d] = source_shape[d - pad];
+		}
+		else if (shape[d] < 0)
+			throw pybind11::value_error("invalid shape dimension " + std::to_string(shape[d]));
+		else
+			target[d] = static_cast<unsigned int>(shape[d]);
+	}
+	StridedLayout layout = broadcast_layout(source_shape, target);
+	if (use_library_layouts(self))
+		return expand_with_grad(self, target);
+	return apply_layout(self, layout);
+}
+
+Tensor layout_squeeze(const Tensor& self, std::optional<int> dim)
+{
+	std::vector<unsigned int> shape_vec = shape_of(self.get_buffer());
+	if (dim)
+	{
+		std::size_t d = normalize_dim(*dim, shape_vec.size());
+		if (shape_vec[d] != 1)
+			return self;
+		shape_vec.erase(shape_vec.begin() + d);
+	}
+	else
+		shape_vec.erase(std::remove(shape_vec.begin(), shape_vec.end(), 1U), shape_vec.end());
+	return library_reshape(self, shape_vec);
+}
+
+Tensor layout_unsqueeze(const Tensor& self, int dim)
+{
+	std::vector<unsigned int> shape_vec = shape_of(self.get_buffer());
+	std::size_t d = normalize_dim(dim, shape_vec.size() + 1);
+	shape_vec.insert(shape_vec.begin() + d, 1U);
+	return library_reshape(self, shape_vec);
+}
+
+/* Narrows dimension d of layout to the slice, or removes it when the item is an index. */
+void apply_item(StridedLayout& layout, std::size_t& d, pybind11::handle item)
+{
+	if (d >= layout.shape.size())
+		throw pybind11::index_error("too many indices for a tensor of " + std::to_string(layout.shape.size()) + " dimensions");
+	if (pybind11::isinstance<pybind11::slice>(item))
+	{
+		pybind11::ssize_t start, stop, step, length;
+		if (!item.cast<pybind11::slice>().compute(layout.shape[d], &start, &stop, &step, &length))
+			throw pybind11::error_already_set();
+		layout.offset += start * layout.strides[d];
+		layout.strides[d] *= step;
+		layout.shape[d] = static_cast<unsigned int>(length);
+		d++;
+		return;
+	}
+	long long index = item.cast<long long>();
+	long long size = layout.shape[d];
+	if (index < -size || index >= size)
+		throw pybind11::index_error("index " + std::to_string(index) + " is out of range for dimension " + std::to_string(d) + " of size " + std::to_string(size));
+	layout.offset += (index < 0 ? index + size : index) * layout.strides[d];
+	layout.shape.erase(layout.shape.begin() + d);
+	layout.strides.erase(layout.strides.begin() + d);
+}
+
+/* The library slices of the items, indices becoming slices of length 1, and the shape left once the indexed dimensions are dropped. */
+std::pair<std::vector<Tensor::Slice>, std::vector<unsigned int>> library_slices(const Tensor& self, pybind11::tuple items)
+{
+	std::vector<unsigned int> shape_vec = shape_of(self.get_buffer());
+	std::vector<Tensor::Slice> slices;
+	std::vector<unsigned int> result_shape;
+	for (std::size_t d = 0; d < shape_vec.size(); d++)
+	{
+		if (d >= items.size())
+		{
+			result_shape.push_back(shape_vec[d]);
+			continue;
+		}
+		pybind11::ssize_t start, stop, step, length;
+		if (pybind11::isinstance<pybind11::slice>(items[d]))
+		{
+			if (!items[d].cast<pybind11::slice>().compute(shape_vec[d], &start, &stop, &step, &length))
+				throw pybind11::error_already_set();
+			result_shape.push_back(static_cast<unsigned int>(length));
+		}
+		else
+		{
+			long long index = items[d].cast<long long>();
+			start = index < 0 ? index + shape_vec[d] : index;
+			stop = start + 1;
+			step = 1;
+		}
+		slices.push_back(Tensor::Slice{static_cast<int>(start), static_cast<int>(stop), static_cast<int>(step)});
+	}
+	return {slices, result_shape};
+}
+
+Tensor layout_tuple_slice(const Tensor& self, pybind11::tuple items)
+{
+	StridedLayout layout = StridedLayout::of(shape_of(self.get_buffer()));
+	if (items.size() > layout.shape.size())
+		throw pybind11::index_error("too many indices for a tensor of " + std::to_string(layout.shape.size()) + " dimensions");
+	if (use_library_layouts(self))
+	{
+		auto [slices, result_shape] = library_slices(self, items);
+		Tensor result = self[initializer_wrapper<Tensor::Slice>(slices.data(), slices.data() + slices.size())];
+		return shape_of(result.get_buffer()) == result_shape ? result : library_reshape(result, result_shape);
+	}
+	std::size_t d = 0;
+	for (pybind11::handle item: items)
+		apply_item(layout, d, item);
+	pybind11::gil_scoped_release release;
+	return apply_layout(self, layout);
+}
+
+Tensor layout_slice(const Tensor& self, pybind11::slice py_slice)
+{
+	return layout_tuple_slice(self, pybind11::make_tuple(py_slice));
+}
+
+Tensor layout_index(const Tensor& self, long long index)
+{
+	StridedLayout layout = StridedLayout::of(shape_of(self.get_buffer()));
+	if (layout.shape.empty())
+		throw pybind11::index_error("a tensor of 0 dimensions can not be indexed");
+	long long size = layout.shape[0];
+	if (index < -size || index >= size)
+		throw pybind11::index_error("index " + std::to_string(index) + " is out of range for dimension 0 of size " + std::to_string(size));
+	if (index < 0)
+		index += size;
+	if (use_library_layouts(self))
+		return self[static_cast<unsigned int>(index)];
+	layout.offset = index * layout.strides[0];
+	layout.shape.erase(layout.shape.begin());
+	layout.strides.erase(layout.strides.begin());
+	return apply_layout(self, layout);
+}
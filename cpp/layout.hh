@@ -0,0 +1,57 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+#include <cstddef>
+#include <optional>
+#include <vector>
+
+/*
+ * Shape, strides (in elements) and offset describing how the result of a layout op reads the buffer
+ * of its source. Transpose, permute, slicing, indexing and expand only change the layout, and their
+ * result is copied into a new buffer by one strided gather over the source instead of a chain of library copies.
+ */
+struct StridedLayout
+{
+	std::vector<unsigned int> shape;
+	std::vector<std::ptrdiff_t> strides;
+	std::ptrdiff_t offset = 0;
+
+	static StridedLayout of(const std::vector<unsigned int>& shape);
+
+	bool is_contiguous() const;
+};
+
+/* The layout reading a tensor of shape as broadcast to target, with stride 0 along the broadcast dimensions. */
+StridedLayout broadcast_layout(const std::vector<unsigned int>& shape, const std::vector<unsigned int>& target);
+
+/* The shape two operands broadcast to, numpy style. */
+std::vector<unsigned int> broadcast_shapes(const std::vector<unsigned int>& shape_1, const std::vector<unsigned int>& shape_2);
+
+/*
+ * Broadcasts self to target through differentiable library ops, so that calc_grad()
+ * sums the gradient back over the broadcast dimensions.
+ */
+tensor_array::value::Tensor expand_with_grad(const tensor_array::value::Tensor& self, const std::vector<unsigned int>& target);
+
+tensor_array::value::TensorBase materialize(const tensor_array::value::TensorBase& source, const StridedLayout& layout);
+
+/* dim counted from the end when negative, checked against ndim. */
+std::size_t normalize_dim(int dim, std::size_t ndim);
+
+tensor_array::value::Tensor library_reshape(const tensor_array::value::Tensor& self, const std::vector<unsigned int>& shape_vec);
+
+tensor_array::value::Tensor layout_transpose(const tensor_array::value::Tensor& self, int dim0, int dim1, bool is_derive);
+
+tensor_array::value::Tensor layout_permute(const tensor_array::value::Tensor& self, const std::vector<int>& dims);
+
+tensor_array::value::Tensor layout_expand(const tensor_array::value::Tensor& self, const std::vector<int>& shape);
+
+tensor_array::value::Tensor layout_squeeze(const tensor_array::value::Tensor& self, std::optional<int> dim);
+
+tensor_array::value::Tensor layout_unsqueeze(const tensor_array::value::Tensor& self, int dim);
+
+tensor_array::value::Tensor layout_index(const tensor_array::value::Tensor& self, long long index);
+
+tensor_array::value::Tensor layout_slice(const tensor_array::value::Tensor& self, pybind11::slice py_slice);
+
+tensor_array::value::Tensor layout_tuple_slice(const tensor_array::value::Tensor& self, pybind11::tuple items);
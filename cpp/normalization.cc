@@ -0,0 +1,342 @@
+#include "normalization.hh"
+#include "autocast.hh"
+#include "cpu_kernel.hh"
+#include "trace.hh"
+#include "layout.hh"
+#include <pybind11/stl.h>
+#include <cmath>
+#include <string>
+
+using namespace tensor_array::value;
+
+/* Independent accumulators interleaved along a row, so the statistics pass vectorizes. */
+constexpr std::size_t NORM_LANES = 8;
+
+/*
+ * The mean and the population variance of value_at(j) for j in [0, n) in one pass.
+ * Each lane runs Welford's update over every NORM_LANES-th element, the lanes seeing the same count,
+ * and they are merged with Chan's formula before the tail is added.
+ */
+template <typename T, typename ValueAt>
+void row_moments(const ValueAt& value_at, std::size_t n, T& mean, T& variance)
+{
+	T lane_mean[NORM_LANES] = {};
+	T lane_m2[NORM_LANES] = {};
+	std::size_t steps = n / NORM_LANES;
+	for (std::size_t s = 0; s < steps; s++)
+	{
+		T inv_count = T(1) / static_cast<T>(s + 1);
+		for (std::size_t lane = 0; lane < NORM_LANES; lane++)
+		{
+			T value = value_at(s * NORM_LANES + lane);
+			T delta = value - lane_mean[lane];
+			lane_mean[lane] += delta * inv_count;
+			lane_m2[lane] += delta * (value - lane_mean[lane]);
+		}
+	}
+	T count = static_cast<T>(steps);
+	mean = lane_mean[0];
+	T m2 = lane_m2[0];
+	for (std::size_t lane = 1; steps != 0 && lane < NORM_LANES; lane++)
+	{
+		T total = count + static_cast<T>(steps);
+		T delta = lane_mean[lane] - mean;
+		mean += delta * static_cast<T>(steps) / total;
+		m2 += lane_m2[lane] + delta * delta * count * static_cast<T>(steps) / total;
+		count = total;
+	}
+	for (std::size_t j = steps * NORM_LANES; j < n; j++)
+	{
+		T value = value_at(j);
+		count += T(1);
+		T delta = value - mean;
+		mean += delta / count;
+		m2 += delta * (value - mean);
+	}
+	variance = count > T(0) ? m2 / count : T(0);
+}
+
+template <typename T, typename ValueAt>
+T row_mean_square(const ValueAt& value_at, std::size_t n)
+{
+	T lanes[NORM_LANES] = {};
+	std::size_t j = 0;
+	for (; j + NORM_LANES <= n; j += NORM_LANES)
+		for (std::size_t lane = 0; lane < NORM_LANES; lane++)
+		{
+			T value = value_at(j + lane);
+			lanes[lane] += value * value;
+		}
+	for (; j < n; j++)
+	{
+		T value = value_at(j);
+		lanes[0] += value * value;
+	}
+	T sum = T(0);
+	for (T lane: lanes)
+		sum += lane;
+	return n != 0 ? sum / static_cast<T>(n) : T(0);
+}
+
+/*
+ * What the forward pass keeps for the backward of a row, see attach_norm_grad:
+ * the normalized values, the factor rstd * weight of each element, and the k vectors
+ * of the basis and coefficients of the rank k correction.
+ */
+template <typename T>
+struct NormGradBuffers
+{
+	T* normalized = nullptr;
+	T* scale = nullptr;
+	T* basis = nullptr;
+	T* coefficients = nullptr;
+};
+
+template <bool is_rms, typename T, typename ValueAt>
+void normalize_row
+(
+	const ValueAt& value_at,
+	std::size_t row,
+	std::size_t features,
+	const T* weight,
+	const T* bias,
+	T eps,
+	T* y,
+	const NormGradBuffers<T>& grad
+)
+{
+	constexpr std::size_t k = is_rms ? 1 : 2;
+	T mean = T(0);
+	T rstd;
+	if constexpr (is_rms)
+		rstd = T(1) / std::sqrt(row_mean_square<T>(value_at, features) + eps);
+	else
+	{
+		T variance;
+		row_moments(value_at, features, mean, variance);
+		rstd = T(1) / std::sqrt(variance + eps);
+	}
+	T* y_row = y + row * features;
+	for (std::size_t j = 0; j < features; j++)
+	{
+		T normalized = (value_at(j) - mean) * rstd;
+		y_row[j] = normalized * (weight ? weight[j] : T(1)) + (bias ? bias[j] : T(0));
+	}
+	if (!grad.scale)
+		return;
+	T inv_features = T(1) / static_cast<T>(features);
+	for (std::size_t j = 0; j < features; j++)
+	{
+		std::size_t index = row * features + j;
+		T normalized = (value_at(j) - mean) * rstd;
+		T scale = rstd * (weight ? weight[j] : T(1));
+		if (grad.normalized)
+			grad.normalized[index] = normalized;
+		grad.scale[index] = scale;
+		T* basis = grad.basis + index * k;
+		T* coefficients = grad.coefficients + row * k * features + j;
+		if constexpr (is_rms)
+		{
+			basis[0] = normalized;
+			coefficients[0] = scale * normalized * inv_features;
+		}
+		else
+		{
+			basis[0] = T(1);
+			basis[1] = normalized;
+			coefficients[0] = scale * inv_features;
+			coefficients[features] = scale * normalized * inv_features;
+		}
+	}
+}
+
+/*
+ * The derivative of the normalization of a row x with respect to x, applied to z, is
+ *     scale * z - ((z @ basis) @ coefficients)
+ * layer norm:  basis [1, xhat], coefficients [scale, scale * xhat] / n
+ * rms norm:    basis [xhat],    coefficients [scale * xhat] / n
+ * The library has no hook for a custom backward, so it is connected with z = identity_grad_zero(input),
+ * a zero whose gradient is the identity: two small batched products and three elementwise ops carry the
+ * gradient of every row, all the statistics coming from the forward pass. Weight and bias are
+ * connected the same way, with the normalized values as the derivative of the weight.
+ */
+Tensor attach_norm_grad
+(
+	const Tensor& input,
+	const std::optional<Tensor>& residual,
+	const std::optional<Tensor>& weight,
+	const std::optional<Tensor>& bias,
+	Tensor&& output,
+	std::size_t rows,
+	std::size_t features,
+	std::size_t k,
+	std::optional<TensorBase>&& normalized,
+	TensorBase&& scale,
+	TensorBase&& basis,
+	TensorBase&& coefficients
+)
+{
+	unsigned int n_rows = static_cast<unsigned int>(rows);
+	unsigned int n_features = static_cast<unsigned int>(features);
+	Tensor z = identity_grad_zero(input);
+	if (residual)
+		z = z + identity_grad_zero(*residual);
+	Tensor projected = matmul
+	(
+		matmul(library_reshape(z, {n_rows, 1U, n_features}), Tensor(to_device_of(std::move(basis), input))),
+		Tensor(to_device_of(std::move(coefficients), input))
+	);
+	Tensor delta = library_reshape(z, {n_rows, n_features}) * Tensor(to_device_of(std::move(scale), input)) - library_reshape(projected, {n_rows, n_features});
+	if (weight)
+		delta = delta + Tensor(to_device_of(std::move(*normalized), input)) * expand_with_grad(library_reshape(identity_grad_zero(*weight), {1U, n_features}), {n_rows, n_features});
+	if (bias)
+		delta = delta + expand_with_grad(library_reshape(identity_grad_zero(*bias), {1U, n_features}), {n_rows, n_features});
+	return output + library_reshape(delta, shape_of(input.get_buffer()));
+}
+
+/* Inside autocast, layer_norm and rms_norm take HALF and BFLOAT16 inputs in FLOAT and output FLOAT. */
+template <bool is_rms>
+Tensor normalize_last_dims
+(
+	const Tensor& input,
+	const std::optional<Tensor>& residual,
+	const std::optional<Tensor>& weight,
+	const std::optional<Tensor>& bias,
+	unsigned int normalized_ndim,
+	double eps
+)
+{
+	TensorBase input_buffer = host_buffer(input);
+	const std::type_info& type = input_buffer.type();
+	std::vector<unsigned int> shape_vec = shape_of(input_buffer);
+	if (normalized_ndim == 0 || normalized_ndim > shape_vec.size())
+		throw pybind11::value_error("normalized_ndim must be between 1 and the number of dimensions of input");
+	std::vector<unsigned int> normalized_shape(shape_vec.end() - normalized_ndim, shape_vec.end());
+	std::size_t features = std::accumulate(normalized_shape.begin(), normalized_shape.end(), std::size_t(1), std::multiplies<std::size_t>());
+	std::size_t rows = std::accumulate(shape_vec.begin(), shape_vec.end() - normalized_ndim, std::size_t(1), std::multiplies<std::size_t>());
+	auto operand_buffer = [&](const std::optional<Tensor>& operand, const std::vector<unsigned int>& expected, const std::string& name)
+	{
+		std::optional<TensorBase> buffer;
+		if (!operand)
+			return buffer;
+		buffer = host_buffer(*operand);
+		if (buffer->type() != type)
+			throw pybind11::type_error(name + " must have the type of input");
+		if (shape_of(*buffer) != expected)
+			throw pybind11::value_error(name + " must have the shape " + (name == "residual" ? "of input" : "of the normalized dimensions"));
+		return buffer;
+	};
+	std::optional<TensorBase> residual_buffer = operand_buffer(residual, shape_vec, "residual");
+	std::optional<TensorBase> weight_buffer = operand_buffer(weight, normalized_shape, "weight");
+	std::optional<TensorBase> bias_buffer = is_rms ? std::nullopt : operand_buffer(bias, normalized_shape, "bias");
+	constexpr std::size_t k = is_rms ? 1 : 2;
+	bool with_grad = is_grad_enabled();
+	TensorBase output(type, shape_vec);
+	std::optional<TensorBase> normalized;
+	TensorBase scale;
+	TensorBase basis;
+	TensorBase coefficients;
+	if (with_grad)
+	{
+		unsigned int n_rows = static_cast<unsigned int>(rows);
+		unsigned int n_features = static_cast<unsigned int>(features);
+		if (weight)
+			normalized.emplace(type, std::vector<unsigned int>{n_rows, n_features});
+		scale = TensorBase(type, {n_rows, n_features});
+		basis = TensorBase(type, {n_rows, n_features, static_cast<unsigned int>(k)});
+		coefficients = TensorBase(type, {n_rows, static_cast<unsigned int>(k), n_features});
+	}
+	dispatch_floating
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const T* x = static_cast<const T*>(input_buffer.data());
+			const T* r = residual_buffer ? static_cast<const T*>(residual_buffer->data()) : nullptr;
+			const T* w = weight_buffer ? static_cast<const T*>(weight_buffer->data()) : nullptr;
+			const T* b = bias_buffer ? static_cast<const T*>(bias_buffer->data()) : nullptr;
+			T* y = mutable_data<T>(output);
+			NormGradBuffers<T> grad;
+			if (with_grad)
+			{
+				grad.normalized = normalized ? mutable_data<T>(*normalized) : nullptr;
+				grad.scale = mutable_data<T>(scale);
+				grad.basis = mutable_data<T>(basis);
+				grad.coefficients = mutable_data<T>(coefficients);
+			}
+			T epsilon = static_cast<T>(eps);
+			parallel_for
+			(
+				0, rows, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / std::max<std::size_t>(features, 1), 1),
+				[&](std::size_t row_begin, std::size_t row_end)
+				{
+					for (std::size_t row = row_begin; row < row_end; row++)
+					{
+						const T* x_row = x + row * features;
+						if (r)
+						{
+							const T* r_row = r + row * features;
+							normalize_row<is_rms>([=](std::size_t j) { return x_row[j] + r_row[j]; }, row, features, w, b, epsilon, y, grad);
+						}
+						else
+							normalize_row<is_rms>([=](std::size_t j) { return x_row[j]; }, row, features, w, b, epsilon, y, grad);
+					}
+				}
+			);
+		}
+	);
+	Tensor result(to_device_of(std::move(output), input));
+	if (!with_grad)
+		return result;
+	return attach_norm_grad(input, residual, weight, is_rms ? std::nullopt : bias, std::move(result), rows, features, k, std::move(normalized), std::move(scale), std::move(basis), std::move(coefficients));
+}
+
+Tensor layer_norm
+(
+	const Tensor& input,
+	const std::optional<Tensor>& residual,
+	const std::optional<Tensor>& weight,
+	const std::optional<Tensor>& bias,
+	unsigned int normalized_ndim,
+	double eps
+)
+{
+	return normalize_last_dims<false>(autocast_upcast(input), autocast_upcast(residual), weight, bias, normalized_ndim, eps);
+}
+
+Tensor rms_norm
+(
+	const Tensor& input,
+	const std::optional<Tensor>& residual,
+	const std::optional<Tensor>& weight,
+	unsigned int normalized_ndim,
+	double eps
+)
+{
+	return normalize_last_dims<true>(autocast_upcast(input), autocast_upcast(residual), weight, std::nullopt, normalized_ndim, eps);
+}
+
+void bind_normalization(pybind11::module_& m)
+{
+	m.def(
+		"layer_norm",
+		traced(&layer_norm, "layer_norm"),
+		pybind11::arg("input"),
+		pybind11::arg("residual") = pybind11::none(),
+		pybind11::arg("weight") = pybind11::none(),
+		pybind11::arg("bias") = pybind11::none(),
+		pybind11::arg("normalized_ndim") = 1,
+		pybind11::arg("eps") = 1e-5
+	);
+
+	m.def(
+		"rms_norm",
+		traced(&rms_norm, "rms_norm"),
+		pybind11::arg("input"),
+		pybind11::arg("residual") = pybind11::none(),
+		pybind11::arg("weight") = pybind11::none(),
+		pybind11::arg("normalized_ndim") = 1,
+		pybind11::arg("eps") = 1e-6
+	);
+}
@@ -0,0 +1,31 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+#include <optional>
+
+/*
+ * Layer normalization over the last normalized_ndim dims of input + residual (or input alone),
+ * (x - mean) / sqrt(var + eps) * weight + bias, from one Welford pass for the statistics of each row
+ * and one pass writing the output. The sum with the residual is never materialized.
+ */
+tensor_array::value::Tensor layer_norm
+(
+	const tensor_array::value::Tensor& input,
+	const std::optional<tensor_array::value::Tensor>& residual,
+	const std::optional<tensor_array::value::Tensor>& weight,
+	const std::optional<tensor_array::value::Tensor>& bias,
+	unsigned int normalized_ndim,
+	double eps
+);
+
+/* Root mean square normalization, x / sqrt(mean(x * x) + eps) * weight, with the same passes as layer_norm. */
+tensor_array::value::Tensor rms_norm
+(
+	const tensor_array::value::Tensor& input,
+	const std::optional<tensor_array::value::Tensor>& residual,
+	const std::optional<tensor_array::value::Tensor>& weight,
+	unsigned int normalized_ndim,
+	double eps
+);
+
+void bind_normalization(pybind11::module_& m);
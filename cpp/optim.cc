@@ -0,0 +1,313 @@
+#include "optim.hh"
+#include "cpu_kernel.hh"
+#include <pybind11/stl.h>
+#include <cmath>
+#include <cstring>
+#include <string>
+
+using namespace tensor_array::value;
+
+/*
+ * Optimizer updates over a whole list of parameters in one call. Parameters and
+ * optimizer state are updated in place in their host buffers, so a step allocates nothing
+ * besides reading the gradients.
+ */
+
+void check_state(const std::vector<Tensor>& params, const std::vector<Tensor>& state, const char* name)
+{
+	if (state.size() != params.size())
+		throw pybind11::value_error(std::string(name) + " must have one tensor per parameter");
+	for (std::size_t i = 0; i < params.size(); i++)
+	{
+		const TensorBase& param_buffer = params[i].get_buffer();
+		const TensorBase& state_buffer = state[i].get_buffer();
+		if (!is_host_buffer(param_buffer) || !is_host_buffer(state_buffer))
+			throw std::runtime_error("optimizers update CPU tensors in place, parameter " + std::to_string(i) + " or its " + name + " is not on the CPU");
+		if (state_buffer.type() != param_buffer.type() || element_count(state_buffer) != element_count(param_buffer))
+			throw pybind11::value_error(std::string(name) + " " + std::to_string(i) + " does not match its parameter");
+	}
+}
+
+void check_grad(const TensorBase& grad_buffer, const TensorBase& param_buffer, std::size_t i)
+{
+	if (element_count(grad_buffer) != element_count(param_buffer))
+		throw pybind11::value_error("parameter " + std::to_string(i) + " has no gradient or a gradient of another shape");
+	if (grad_buffer.type() != param_buffer.type())
+		throw pybind11::value_error("the gradient of parameter " + std::to_string(i) + " does not have the type of the parameter");
+}
+
+void sgd_foreach
+(
+	const std::vector<Tensor>& params,
+	const std::vector<Tensor>& grads,
+	const std::vector<Tensor>& momentum_buffers,
+	double lr,
+	double momentum,
+	double dampening,
+	double weight_decay,
+	bool nesterov,
+	bool maximize,
+	bool first_step
+)
+{
+	check_state(params, momentum_buffers, "momentum_buffers");
+	if (grads.size() != params.size())
+		throw pybind11::value_error("grads must have one tensor per parameter");
+	for (std::size_t i = 0; i < params.size(); i++)
+	{
+		const TensorBase& param_buffer = params[i].get_buffer();
+		TensorBase grad_buffer = host_buffer(grads[i]);
+		check_grad(grad_buffer, param_buffer, i);
+		std::size_t size = element_count(param_buffer);
+		dispatch_floating
+		(
+			param_buffer.type(),
+			[&](auto tag)
+			{
+				using T = decltype(tag);
+				T* p = mutable_data<T>(param_buffer);
+				const T* g = static_cast<const T*>(grad_buffer.data());
+				T* buf = mutable_data<T>(momentum_buffers[i].get_buffer());
+				parallel_for
+				(
+					0, size, DEFAULT_GRAIN_SIZE,
+					[&](std::size_t begin, std::size_t end)
+					{
+						for (std::size_t j = begin; j < end; j++)
+						{
+							T d = maximize ? -g[j] : g[j];
+							if (weight_decay != 0)
+								d += static_cast<T>(weight_decay) * p[j];
+							if (momentum != 0)
+							{
+								buf[j] = first_step ? d : static_cast<T>(momentum) * buf[j] + static_cast<T>(1 - dampening) * d;
+								d = nesterov ? d + static_cast<T>(momentum) * buf[j] : buf[j];
+							}
+							p[j] -= static_cast<T>(lr) * d;
+						}
+					}
+				);
+			}
+		);
+	}
+}
+
+void adam_foreach
+(
+	const std::vector<Tensor>& params,
+	const std::vector<Tensor>& grads,
+	const std::vector<Tensor>& exp_avgs,
+	const std::vector<Tensor>& exp_avg_sqs,
+	unsigned long long step,
+	double lr,
+	double beta1,
+	double beta2,
+	double eps,
+	double weight_decay,
+	bool decoupled_weight_decay,
+	bool maximize
+)
+{
+	check_state(params, exp_avgs, "exp_avgs");
+	check_state(params, exp_avg_sqs, "exp_avg_sqs");
+	if (grads.size() != params.size())
+		throw pybind11::value_error("grads must have one tensor per parameter");
+	double bias_correction1 = 1 - std::pow(beta1, static_cast<double>(step));
+	double bias_correction2 = 1 - std::pow(beta2, static_cast<double>(step));
+	double step_size = lr / bias_correction1;
+	double inv_sqrt_bias_correction2 = 1 / std::sqrt(bias_correction2);
+	for (std::size_t i = 0; i < params.size(); i++)
+	{
+		const TensorBase& param_buffer = params[i].get_buffer();
+		TensorBase grad_buffer = host_buffer(grads[i]);
+		check_grad(grad_buffer, param_buffer, i);
+		std::size_t size = element_count(param_buffer);
+		dispatch_floating
+		(
+			param_buffer.type(),
+			[&](auto tag)
+			{
+				using T = decltype(tag);
+				T* p = mutable_data<T>(param_buffer);
+				const T* g = static_cast<const T*>(grad_buffer.data());
+				T* m = mutable_data<T>(exp_avgs[i].get_buffer());
+				T* v = mutable_data<T>(exp_avg_sqs[i].get_buffer());
+				parallel_for
+				(
+					0, size, DEFAULT_GRAIN_SIZE,
+					[&](std::size_t begin, std::size_t end)
+					{
+						for (std::size_t j = begin; j < end; j++)
+						{
+							T d = maximize ? -g[j] : g[j];
+							if (weight_decay != 0)
+							{
+								if (decoupled_weight_decay)
+									p[j] *= static_cast<T>(1 - lr * weight_decay);
+								else
+									d += static_cast<T>(weight_decay) * p[j];
+							}
+							m[j] = static_cast<T>(beta1) * m[j] + static_cast<T>(1 - beta1) * d;
+							v[j] = static_cast<T>(beta2) * v[j] + static_cast<T>(1 - beta2) * d * d;
+							T denom = std::sqrt(v[j]) * static_cast<T>(inv_sqrt_bias_correction2) + static_cast<T>(eps);
+							p[j] -= static_cast<T>(step_size) * m[j] / denom;
+						}
+					}
+				);
+			}
+		);
+	}
+}
+
+void zero_foreach(const std::vector<Tensor>& tensors)
+{
+	for (const Tensor& value: tensors)
+	{
+		const TensorBase& buffer = value.get_buffer();
+		if (!is_host_buffer(buffer))
+			throw std::runtime_error("zero_foreach fills CPU tensors in place");
+		dispatch_floating
+		(
+			buffer.type(),
+			[&](auto tag)
+			{
+				using T = decltype(tag);
+				std::fill_n(mutable_data<T>(buffer), element_count(buffer), T(0));
+			}
+		);
+	}
+}
+
+/*
+ * Copies every source tensor into the host buffer of its destination, so that the destination
+ * tensors keep their identity, for loading a state dict into existing parameters.
+ */
+void copy_foreach(const std::vector<Tensor>& dsts, const std::vector<Tensor>& srcs)
+{
+	if (srcs.size() != dsts.size())
+		throw pybind11::value_error("srcs must have one tensor per destination");
+	for (std::size_t i = 0; i < dsts.size(); i++)
+	{
+		const TensorBase& dst_buffer = dsts[i].get_buffer();
+		TensorBase src_buffer = host_buffer(srcs[i]);
+		if (!is_host_buffer(dst_buffer))
+			throw std::runtime_error("copy_foreach fills CPU tensors in place");
+		if (src_buffer.type() != dst_buffer.type() || element_count(src_buffer) != element_count(dst_buffer))
+			throw pybind11::value_error("source " + std::to_string(i) + " does not match its destination");
+		std::memcpy(mutable_data<char>(dst_buffer), src_buffer.data(), element_count(dst_buffer) * element_size(dst_buffer.type()));
+	}
+}
+
+/*
+ * Copies or adds the gradient of every parameter, as computed by the last calc_grad,
+ * into its persistent gradient buffer. A parameter without gradient leaves its buffer
+ * unchanged when accumulating and zeroes it otherwise.
+ */
+void accumulate_grad_foreach
+(
+	const std::vector<Tensor>& params,
+	const std::vector<Tensor>& grad_buffers,
+	const std::vector<bool>& accumulate
+)
+{
+	check_state(params, grad_buffers, "grad_buffers");
+	if (accumulate.size() != params.size())
+		throw pybind11::value_error("accumulate must have one flag per parameter");
+	for (std::size_t i = 0; i < params.size(); i++)
+	{
+		const TensorBase& dst_buffer = grad_buffers[i].get_buffer();
+		TensorBase grad_buffer = host_buffer(params[i].get_grad());
+		std::size_t size = element_count(dst_buffer);
+		bool has_grad = element_count(grad_buffer) == size && grad_buffer.type() == dst_buffer.type();
+		dispatch_floating
+		(
+			dst_buffer.type(),
+			[&](auto tag)
+			{
+				using T = decltype(tag);
+				T* dst = mutable_data<T>(dst_buffer);
+				if (!has_grad)
+				{
+					if (!accumulate[i])
+						std::fill_n(dst, size, T(0));
+					return;
+				}
+				const T* g = static_cast<const T*>(grad_buffer.data());
+				bool add = accumulate[i];
+				parallel_for
+				(
+					0, size, DEFAULT_GRAIN_SIZE,
+					[&](std::size_t begin, std::size_t end)
+					{
+						if (add)
+							for (std::size_t j = begin; j < end; j++)
+								dst[j] += g[j];
+						else
+							std::copy(g + begin, g + end, dst + begin);
+					}
+				);
+			}
+		);
+	}
+}
+
+void bind_optim(pybind11::module_& m)
+{
+	m.def(
+		"zero_foreach",
+		&zero_foreach,
+		pybind11::arg("tensors"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"copy_foreach",
+		&copy_foreach,
+		pybind11::arg("dsts"),
+		pybind11::arg("srcs"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"accumulate_grad_foreach",
+		&accumulate_grad_foreach,
+		pybind11::arg("params"),
+		pybind11::arg("grad_buffers"),
+		pybind11::arg("accumulate"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"sgd_foreach",
+		&sgd_foreach,
+		pybind11::arg("params"),
+		pybind11::arg("grads"),
+		pybind11::arg("momentum_buffers"),
+		pybind11::arg("lr"),
+		pybind11::arg("momentum"),
+		pybind11::arg("dampening"),
+		pybind11::arg("weight_decay"),
+		pybind11::arg("nesterov"),
+		pybind11::arg("maximize"),
+		pybind11::arg("first_step"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+
+	m.def(
+		"adam_foreach",
+		&adam_foreach,
+		pybind11::arg("params"),
+		pybind11::arg("grads"),
+		pybind11::arg("exp_avgs"),
+		pybind11::arg("exp_avg_sqs"),
+		pybind11::arg("step"),
+		pybind11::arg("lr"),
+		pybind11::arg("beta1"),
+		pybind11::arg("beta2"),
+		pybind11::arg("eps"),
+		pybind11::arg("weight_decay"),
+		pybind11::arg("decoupled_weight_decay"),
+		pybind11::arg("maximize"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+}
@@ -0,0 +1,219 @@
+#include "parallel.hh"
+#include <atomic>
+#include <condition_variable>
+#include <cstdlib>
+#include <exception>
+#include <mutex>
+#include <thread>
+#include <vector>
+#ifndef _WIN32
+#include <pthread.h>
+#endif
+
+/*
+ * The intra-op thread pool. Workers sleep until a parallel region is posted, then take task
+ * indices from a shared counter until none is left. One region runs at a time: a thread that
+ * finds the pool busy, for example another request handler, runs its region serially instead of waiting.
+ */
+class ThreadPool
+{
+public:
+	static ThreadPool& instance()
+	{
+		/* Never destroyed, so no worker is joined during static destruction at exit. */
+		static bool registered = []
+		{
+			current = new ThreadPool();
+#ifndef _WIN32
+			/* The workers do not survive fork(), a child process starts over with a new pool. */
+			pthread_atfork(nullptr, nullptr, [] { current = new ThreadPool(); });
+#endif
+			return true;
+		}();
+		(void)registered;
+		return *current;
+	}
+
+	std::size_t num_threads() const
+	{
+		return n_threads.load();
+	}
+
+	void set_num_threads(std::size_t num_threads)
+	{
+		std::lock_guard<std::mutex> region_lock(region_mutex);
+		stop_workers();
+		n_threads = std::max<std::size_t>(num_threads, 1);
+	}
+
+	void run(std::size_t n_tasks, const std::function<void(std::size_t)>& task)
+	{
+		std::unique_lock<std::mutex> region_lock(region_mutex, std::try_to_lock);
+		if (!region_lock.owns_lock())
+		{
+			for (std::size_t i = 0; i < n_tasks; i++)
+				task(i);
+			return;
+		}
+		start_workers();
+		{
+			std::lock_guard<std::mutex> lock(mutex);
+			job = &task;
+			job_size = n_tasks;
+			next_task = 0;
+			pending = n_tasks;
+			error = nullptr;
+			generation++;
+		}
+		work_ready.notify_all();
+		work();
+		std::unique_lock<std::mutex> lock(mutex);
+		work_done.wait(lock, [this] { return pending == 0; });
+		job = nullptr;
+		if (error)
+			std::rethrow_exception(error);
+	}
+
+private:
+	ThreadPool()
+	{
+		n_threads = default_num_threads();
+	}
+
+	static std::size_t default_num_threads()
+	{
+		for (const char* name: {"TENSOR_ARRAY_NUM_THREADS", "OMP_NUM_THREADS", "MKL_NUM_THREADS"})
+			if (const char* value = std::getenv(name))
+			{
+				long parsed = std::strtol(value, nullptr, 10);
+				if (parsed > 0)
+					return static_cast<std::size_t>(parsed);
+			}
+		return std::max<std::size_t>(std::thread::hardware_concurrency(), 1);
+	}
+
+	void start_workers()
+	{
+		std::size_t n_workers = n_threads.load() - 1;
+		while (workers.size() < n_workers)
+			workers.emplace_back([this] { worker_loop(); });
+	}
+
+	void stop_workers()
+	{
+		{
+			std::lock_guard<std::mutex> lock(mutex);
+			stopping = true;
+		}
+		work_ready.notify_all();
+		for (std::thread& worker: workers)
+			worker.join();
+		workers.clear();
+		std::lock_guard<std::mutex> lock(mutex);
+		stopping = false;
+	}
+
+	void worker_loop()
+	{
+		std::size_t seen_generation = 0;
+		{
+			std::lock_guard<std::mutex> lock(mutex);
+			seen_generation = generation;
+		}
+		while (true)
+		{
+			{
+				std::unique_lock<std::mutex> lock(mutex);
+				work_ready.wait(lock, [&] { return stopping || generation != seen_generation; });
+				if (stopping)
+					return;
+				seen_generation = generation;
+			}
+			work();
+		}
+	}
+
+	/* Takes and runs tasks of the current region until none is left. */
+	void work()
+	{
+		in_region = true;
+		while (true)
+		{
+			std::size_t i = next_task.fetch_add(1);
+			if (i >= job_size)
+				break;
+			try
+			{
+				(*job)(i);
+			}
+			catch (...)
+			{
+				std::lock_guard<std::mutex> lock(mutex);
+				if (!error)
+					error = std::current_exception();
+			}
+			std::lock_guard<std::mutex> lock(mutex);
+			if (--pending == 0)
+				work_done.notify_all();
+		}
+		in_region = false;
+	}
+
+	std::atomic<std::size_t> n_threads{1};
+	std::vector<std::thread> workers;
+	std::mutex region_mutex;
+	std::mutex mutex;
+	std::condition_variable work_ready;
+	std::condition_variable work_done;
+	const std::function<void(std::size_t)>* job = nullptr;
+	std::size_t job_size = 0;
+	std::atomic<std::size_t> next_task{0};
+	std::size_t pending = 0;
+	std::size_t generation = 0;
+	bool stopping = false;
+	std::exception_ptr error;
+
+	static ThreadPool* current;
+
+public:
+	static thread_local bool in_region;
+};
+
+ThreadPool* ThreadPool::current = nullptr;
+
+thread_local bool ThreadPool::in_region = false;
+
+std::size_t get_num_threads()
+{
+	return ThreadPool::instance().num_threads();
+}
+
+void set_num_threads(std::size_t num_threads)
+{
+	ThreadPool::instance().set_num_threads(num_threads);
+}
+
+bool in_parallel_region()
+{
+	return ThreadPool::in_region;
+}
+
+void run_parallel(std::size_t n_tasks, const std::function<void(std::size_t)>& task)
+{
+	ThreadPool::instance().run(n_tasks, task);
+}
+
+void bind_parallel(pybind11::module_& m)
+{
+	m.def(
+		"get_num_threads",
+		&get_num_threads
+	);
+
+	m.def(
+		"set_num_threads",
+		&set_num_threads,
+		pybind11::arg("num_threads"),
+		pybind11::call_guard<pybind11::gil_scoped_release>()
+	);
+}
@@ -0,0 +1,52 @@
+#pragma once
+#include <pybind11/pybind11.h>
+#include <algorithm>
+#include <cstddef>
+#include <functional>
+
+/* Below this many elements, elementwise work is not worth waking other threads for. */
+constexpr std::size_t DEFAULT_GRAIN_SIZE = std::size_t(1) << 15;
+
+std::size_t get_num_threads();
+
+void set_num_threads(std::size_t num_threads);
+
+bool in_parallel_region();
+
+/* Runs task(i) for every i in [0, n_tasks) on the intra-op thread pool, the calling thread included. */
+void run_parallel(std::size_t n_tasks, const std::function<void(std::size_t)>& task);
+
+/*
+ * Calls func(chunk_begin, chunk_end) over a partition of [begin, end) into chunks of at least grain_size items,
+ * spread over the intra-op threads. Ranges of at most grain_size items, and calls made from inside
+ * another parallel region, run serially on the calling thread.
+ */
+template <typename Func>
+void parallel_for(std::size_t begin, std::size_t end, std::size_t grain_size, const Func& func)
+{
+	if (begin >= end)
+		return;
+	std::size_t size = end - begin;
+	grain_size = std::max<std::size_t>(grain_size, 1);
+	std::size_t num_threads = get_num_threads();
+	if (size <= grain_size || num_threads <= 1 || in_parallel_region())
+	{
+		func(begin, end);
+		return;
+	}
+	std::size_t n_chunks = std::min(num_threads, (size + grain_size - 1) / grain_size);
+	std::size_t chunk_size = (size + n_chunks - 1) / n_chunks;
+	run_parallel
+	(
+		n_chunks,
+		[&](std::size_t chunk)
+		{
+			std::size_t chunk_begin = begin + chunk * chunk_size;
+			std::size_t chunk_end = std::min(end, chunk_begin + chunk_size);
+			if (chunk_begin < chunk_end)
+				func(chunk_begin, chunk_end);
+		}
+	);
+}
+
+void bind_parallel(pybind11::module_& m);
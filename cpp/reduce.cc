@@ -0,0 +1,612 @@
+#include "reduce.hh"
+#include "autocast.hh"
+#include "cpu_kernel.hh"
+#include "half.hh"
+#include "host_allocator.hh"
+#include "trace.hh"
+#include "layout.hh"
+#include <pybind11/stl.h>
+#include <cmath>
+#include <string>
+#include <type_traits>
+
+using namespace tensor_array::value;
+using namespace tensor_array::datatype;
+using namespace tensor_array::wrapper;
+
+/* The type sums of T are accumulated in: FLOAT for every float narrower than DOUBLE, 64-bit for integers. */
+template <typename T>
+using sum_accumulator_t = std::conditional_t
+<
+	std::is_same_v<T, double>,
+	double,
+	std::conditional_t
+	<
+		std::is_integral_v<T>,
+		std::conditional_t<std::is_unsigned_v<T> && !std::is_same_v<T, bool>, std::uint64_t, std::int64_t>,
+		float
+	>
+>;
+
+/* The type means and variances of T are computed in, integers being averaged in DOUBLE. */
+template <typename T>
+using mean_accumulator_t = std::conditional_t<std::is_integral_v<T>, double, sum_accumulator_t<T>>;
+
+/* Same as dispatch_arithmetic, with HALF and BFLOAT16 passed as their bit patterns. */
+template <typename Func>
+void dispatch_reducible(const std::type_info& type, Func&& func)
+{
+	DataType data_type = warp_type(type);
+	if (data_type == HALF_DTYPE)
+		func(Half());
+	else if (data_type == BF16_DTYPE)
+		func(BFloat16());
+	else
+		dispatch_arithmetic(type, std::forward<Func>(func));
+}
+
+/* A Kahan compensated sum, which keeps the error of a float sum independent of the number of terms. */
+template <typename Acc>
+struct KahanSum
+{
+	Acc sum = Acc(0);
+	Acc compensation = Acc(0);
+
+	void add(Acc value)
+	{
+		if constexpr (std::is_floating_point_v<Acc>)
+		{
+			Acc corrected = value - compensation;
+			Acc total = sum + corrected;
+			compensation = (total - sum) - corrected;
+			sum = total;
+		}
+		else
+			sum += value;
+	}
+
+	void add(const KahanSum& other)
+	{
+		add(other.sum);
+		add(Acc(0) - other.compensation);
+	}
+
+	Acc value() const
+	{
+		return sum - compensation;
+	}
+};
+
+/* Independent accumulators interleaved along a contiguous run, so the loop vectorizes. */
+constexpr std::size_t SUM_LANES = 8;
+
+/* Inner positions reduced together by a task when the reduced dims are not the last ones. */
+constexpr std::size_t LANE_BLOCK = 64;
+
+/* The compensated sum of transform(x[j], position) for j in [begin, end). */
+template <typename Acc, typename T, typename Transform>
+KahanSum<Acc> sum_run(const T* x, std::size_t begin, std::size_t end, std::size_t position, const Transform& transform)
+{
+	KahanSum<Acc> lanes[SUM_LANES];
+	std::size_t j = begin;
+	for (; j + SUM_LANES <= end; j += SUM_LANES)
+		for (std::size_t lane = 0; lane < SUM_LANES; lane++)
+			lanes[lane].add(transform(load(x[j + lane]), position));
+	for (; j < end; j++)
+		lanes[0].add(transform(load(x[j]), position));
+	for (std::size_t lane = 1; lane < SUM_LANES; lane++)
+		lanes[0].add(lanes[lane]);
+	return lanes[0];
+}
+
+/* The number of chunks a single reduction of length elements is split into. */
+inline std::size_t chunk_count(std::size_t length)
+{
+	if (in_parallel_region())
+		return 1;
+	return std::clamp<std::size_t>(length / DEFAULT_GRAIN_SIZE, 1, get_num_threads());
+}
+
+/*
+ * out[o * inner + i] is the compensated sum over j of transform(x[(o * length + j) * inner + i], o * inner + i).
+ * Many outputs are computed in parallel, one output is split into chunks whose partial sums are combined in order.
+ */
+template <typename T, typename Acc, typename Transform>
+void sum_rows(const T* x, const DimSplit& split, Acc* out, const Transform& transform)
+{
+	std::size_t length = split.length;
+	std::size_t inner = split.inner;
+	if (split.outer * inner == 1)
+	{
+		std::size_t n_chunks = chunk_count(length);
+		std::size_t chunk_size = (length + n_chunks - 1) / n_chunks;
+		host_vector<KahanSum<Acc>> partial(n_chunks);
+		run_parallel
+		(
+			n_chunks,
+			[&](std::size_t chunk)
+			{
+				std::size_t begin = std::min(length, chunk * chunk_size);
+				partial[chunk] = sum_run<Acc>(x, begin, std::min(length, begin + chunk_size), 0, transform);
+			}
+		);
+		for (std::size_t chunk = 1; chunk < n_chunks; chunk++)
+			partial[0].add(partial[chunk]);
+		out[0] = partial[0].value();
+		return;
+	}
+	if (inner == 1)
+	{
+		parallel_for
+		(
+			0, split.outer, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / std::max<std::size_t>(length, 1), 1),
+			[&](std::size_t row_begin, std::size_t row_end)
+			{
+				for (std::size_t row = row_begin; row < row_end; row++)
+					out[row] = sum_run<Acc>(x + row * length, 0, length, row, transform).value();
+			}
+		);
+		return;
+	}
+	std::size_t n_blocks = (inner + LANE_BLOCK - 1) / LANE_BLOCK;
+	parallel_for
+	(
+		0, split.outer * n_blocks, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / std::max<std::size_t>(length * LANE_BLOCK, 1), 1),
+		[&](std::size_t task_begin, std::size_t task_end)
+		{
+			for (std::size_t task = task_begin; task < task_end; task++)
+			{
+				std::size_t o = task / n_blocks;
+				std::size_t i_begin = task % n_blocks * LANE_BLOCK;
+				std::size_t i_end = std::min(inner, i_begin + LANE_BLOCK);
+				std::size_t position = o * inner;
+				KahanSum<Acc> lanes[LANE_BLOCK];
+				for (std::size_t j = 0; j < length; j++)
+				{
+					const T* line = x + (o * length + j) * inner;
+					for (std::size_t i = i_begin; i < i_end; i++)
+						lanes[i - i_begin].add(transform(load(line[i]), position + i));
+				}
+				for (std::size_t i = i_begin; i < i_end; i++)
+					out[position + i] = lanes[i - i_begin].value();
+			}
+		}
+	);
+}
+
+/* Whether value replaces best as the maximum (or minimum), NaN winning over any number as in numpy. */
+template <bool is_max, typename V>
+bool is_better(V value, V best)
+{
+	if constexpr (std::is_floating_point_v<V>)
+	{
+		if (std::isnan(best))
+			return false;
+		if (std::isnan(value))
+			return true;
+	}
+	return is_max ? value > best : value < best;
+}
+
+/* The first j in [begin, end) where x[j * stride] is the maximum (or minimum). */
+template <bool is_max, typename T>
+std::size_t first_extreme(const T* x, std::size_t begin, std::size_t end, std::size_t stride)
+{
+	std::size_t best = begin;
+	auto best_value = load(x[begin * stride]);
+	for (std::size_t j = begin + 1; j < end; j++)
+	{
+		auto value = load(x[j * stride]);
+		if (is_better<is_max>(value, best_value))
+		{
+			best = j;
+			best_value = value;
+		}
+	}
+	return best;
+}
+
+/* index[o * inner + i] is the first j where x[(o * length + j) * inner + i] is the maximum (or minimum). */
+template <bool is_max, typename T>
+void extreme_rows(const T* x, const DimSplit& split, std::int64_t* index)
+{
+	std::size_t length = split.length;
+	std::size_t inner = split.inner;
+	if (split.outer * inner == 1)
+	{
+		std::size_t n_chunks = chunk_count(length);
+		std::size_t chunk_size = (length + n_chunks - 1) / n_chunks;
+		host_vector<std::size_t> partial(n_chunks);
+		run_parallel
+		(
+			n_chunks,
+			[&](std::size_t chunk)
+			{
+				std::size_t begin = std::min(length - 1, chunk * chunk_size);
+				partial[chunk] = first_extreme<is_max>(x, begin, std::max(begin + 1, std::min(length, begin + chunk_size)), 1);
+			}
+		);
+		std::size_t best = partial[0];
+		for (std::size_t chunk = 1; chunk < n_chunks; chunk++)
+			if (is_better<is_max>(load(x[partial[chunk]]), load(x[best])))
+				best = partial[chunk];
+		index[0] = static_cast<std::int64_t>(best);
+		return;
+	}
+	parallel_for
+	(
+		0, split.outer * inner, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / std::max<std::size_t>(length, 1), 1),
+		[&](std::size_t row_begin, std::size_t row_end)
+		{
+			for (std::size_t row = row_begin; row < row_end; row++)
+			{
+				const T* base = x + row / inner * length * inner + row % inner;
+				index[row] = static_cast<std::int64_t>(first_extreme<is_max>(base, 0, length, inner));
+			}
+		}
+	);
+}
+
+/* How a reduction reads its input: the reduced dims form the middle of split, with the kept dims around them. */
+struct ReducePlan
+{
+	/* The host buffer of the input, or a copy with the reduced dims moved last. */
+	TensorBase source;
+	DimSplit split;
+	std::vector<unsigned int> out_shape;
+	/* The permutation moving the reduced dims last, empty when they are already adjacent. */
+	std::vector<int> order;
+};
+
+ReducePlan plan_reduction(const Tensor& input, const std::vector<int>& dims, bool keepdim)
+{
+	TensorBase buffer = host_buffer(input);
+	std::vector<unsigned int> shape_vec = shape_of(buffer);
+	std::size_t ndim = shape_vec.size();
+	std::vector<bool> reduced(ndim, dims.empty());
+	for (int dim: dims)
+	{
+		std::size_t d = normalize_dim(dim, ndim);
+		if (reduced[d])
+			throw pybind11::value_error("dim " + std::to_string(dim) + " is reduced more than once");
+		reduced[d] = true;
+	}
+	ReducePlan plan{TensorBase(), DimSplit{1, 1, 1}, {}, {}};
+	for (std::size_t d = 0; d < ndim; d++)
+		if (!reduced[d] || keepdim)
+			plan.out_shape.push_back(reduced[d] ? 1U : shape_vec[d]);
+	std::size_t first = 0;
+	while (first < ndim && !reduced[first])
+		first++;
+	std::size_t last = ndim;
+	while (last > first && !reduced[last - 1])
+		last--;
+	if (std::all_of(reduced.begin() + first, reduced.begin() + last, [](bool is_reduced) { return is_reduced; }))
+	{
+		for (std::size_t d = 0; d < ndim; d++)
+			(d < first ? plan.split.outer : d < last ? plan.split.length : plan.split.inner) *= shape_vec[d];
+		plan.source = std::move(buffer);
+		return plan;
+	}
+	for (std::size_t d = 0; d < ndim; d++)
+		if (!reduced[d])
+		{
+			plan.order.push_back(static_cast<int>(d));
+			plan.split.outer *= shape_vec[d];
+		}
+	for (std::size_t d = 0; d < ndim; d++)
+		if (reduced[d])
+		{
+			plan.order.push_back(static_cast<int>(d));
+			plan.split.length *= shape_vec[d];
+		}
+	StridedLayout contiguous = StridedLayout::of(shape_vec);
+	StridedLayout layout{std::vector<unsigned int>(ndim), std::vector<std::ptrdiff_t>(ndim), 0};
+	for (std::size_t d = 0; d < ndim; d++)
+	{
+		layout.shape[d] = shape_vec[plan.order[d]];
+		layout.strides[d] = contiguous.strides[plan.order[d]];
+	}
+	plan.source = materialize(buffer, layout);
+	return plan;
+}
+
+/* Whether the input of a reduction carries gradients, which only the FLOAT and DOUBLE kernels record. */
+inline bool records_grad(const TensorBase& source)
+{
+	return is_grad_enabled() && (source.type() == typeid(float) || source.type() == typeid(double));
+}
+
+/*
+ * The sum of value over the middle of split times weight, reshaped to shape_vec, from library ops so that it is
+ * differentiable: the product with a column of weights passes every element weight times the gradient of its sum.
+ */
+Tensor weighted_sum_with_grad(const Tensor& value, const DimSplit& split, const std::vector<unsigned int>& shape_vec, double weight)
+{
+	const std::type_info& type = value.get_buffer().type();
+	TensorBase weights(type, {static_cast<unsigned int>(split.length), 1U});
+	dispatch_floating(type, [&](auto tag) { std::fill_n(mutable_data<decltype(tag)>(weights), split.length, static_cast<decltype(tag)>(weight)); });
+	Tensor rows = library_reshape(value, {static_cast<unsigned int>(split.outer), static_cast<unsigned int>(split.length), static_cast<unsigned int>(split.inner)});
+	if (split.inner != 1)
+		rows = rows.transpose(1, 2, true);
+	return library_reshape(matmul(rows, Tensor(to_device_of(std::move(weights), value))), shape_vec);
+}
+
+/*
+ * Connects a native reduction to the autograd graph of input through identity_grad_zero:
+ *     output + S(z * derivative)  with  z = identity_grad_zero(work)
+ * has the value of output and passes each element of input grad * derivative, S being the weighted sum
+ * over the reduced dims. work is input with its reduced dims moved last when the plan did so,
+ * giving z the layout of derivative. Without a derivative, every element gets weight * grad.
+ */
+Tensor attach_reduction_grad(const Tensor& input, const ReducePlan& plan, const Tensor& output, std::optional<TensorBase> derivative, double weight)
+{
+	Tensor work = plan.order.empty() ? input : layout_permute(input, plan.order);
+	Tensor z = identity_grad_zero(work);
+	if (derivative)
+		z = z * Tensor(to_device_of(std::move(*derivative), input));
+	return output + weighted_sum_with_grad(z, plan.split, plan.out_shape, weight);
+}
+
+Tensor cast_result(const Tensor& output, const std::type_info& type)
+{
+	return output.get_buffer().type() == type ? output : output.tensor_cast(type);
+}
+
+/* Sum or mean of input, the two only differing by the scale of the result and its accumulator. */
+template <bool is_mean>
+Tensor sum_or_mean(const Tensor& input, const std::vector<int>& dims, bool keepdim, std::optional<DataType> dtype)
+{
+	ReducePlan plan = plan_reduction(input, dims, keepdim);
+	const std::type_info& type = plan.source.type();
+	const std::type_info* natural_type = &type;
+	TensorBase result;
+	dispatch_reducible
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			using Acc = std::conditional_t<is_mean, mean_accumulator_t<T>, sum_accumulator_t<T>>;
+			if constexpr (!is_16bit_float<T>)
+				natural_type = &typeid(Acc);
+			result = TensorBase(typeid(Acc), plan.out_shape);
+			Acc* out = mutable_data<Acc>(result);
+			sum_rows(static_cast<const T*>(plan.source.data()), plan.split, out, [](auto value, std::size_t) { return static_cast<Acc>(value); });
+			if constexpr (is_mean)
+				std::for_each(out, out + element_count(result), [&](Acc& value) { value /= static_cast<Acc>(plan.split.length); });
+		}
+	);
+	Tensor output(to_device_of(std::move(result), input));
+	if (records_grad(plan.source))
+		output = attach_reduction_grad(input, plan, output, std::nullopt, is_mean ? 1.0 / static_cast<double>(plan.split.length) : 1.0);
+	return cast_result(output, dtype ? warp_type(*dtype) : *natural_type);
+}
+
+/* Inside autocast, sums, means and variances take HALF and BFLOAT16 inputs in FLOAT and output FLOAT. */
+Tensor reduce_sum(const Tensor& input, const std::vector<int>& dims, bool keepdim, std::optional<DataType> dtype)
+{
+	return sum_or_mean<false>(autocast_upcast(input), dims, keepdim, dtype);
+}
+
+Tensor reduce_mean(const Tensor& input, const std::vector<int>& dims, bool keepdim, std::optional<DataType> dtype)
+{
+	return sum_or_mean<true>(autocast_upcast(input), dims, keepdim, dtype);
+}
+
+Tensor reduce_var(const Tensor& value, const std::vector<int>& dims, int correction, bool keepdim)
+{
+	Tensor input = autocast_upcast(value);
+	ReducePlan plan = plan_reduction(input, dims, keepdim);
+	const std::type_info& type = plan.source.type();
+	const std::type_info* natural_type = &type;
+	bool with_grad = records_grad(plan.source);
+	TensorBase result;
+	std::optional<TensorBase> derivative;
+	dispatch_reducible
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			using Acc = mean_accumulator_t<T>;
+			if constexpr (!is_16bit_float<T>)
+				natural_type = &typeid(Acc);
+			const T* x = static_cast<const T*>(plan.source.data());
+			const DimSplit& split = plan.split;
+			result = TensorBase(typeid(Acc), plan.out_shape);
+			Acc* out = mutable_data<Acc>(result);
+			std::size_t n_out = element_count(result);
+			Acc length = static_cast<Acc>(split.length);
+			Acc denominator = static_cast<Acc>(std::max<long long>(static_cast<long long>(split.length) - correction, 0));
+			/* The squared deviations are summed around the mean of a first pass, which is exact for constant inputs. */
+			host_vector<Acc> mean(n_out);
+			sum_rows(x, split, mean.data(), [](auto value, std::size_t) { return static_cast<Acc>(value); });
+			for (Acc& value: mean)
+				value /= length;
+			sum_rows
+			(
+				x, split, out,
+				[&](auto value, std::size_t position)
+				{
+					Acc deviation = static_cast<Acc>(value) - mean[position];
+					return deviation * deviation;
+				}
+			);
+			for (std::size_t k = 0; k < n_out; k++)
+				out[k] /= denominator;
+			if constexpr (std::is_same_v<T, Acc>)
+			{
+				if (!with_grad)
+					return;
+				derivative.emplace(type, shape_of(plan.source));
+				T* dx = mutable_data<T>(*derivative);
+				parallel_for
+				(
+					0, element_count(plan.source), DEFAULT_GRAIN_SIZE,
+					[&](std::size_t begin, std::size_t end)
+					{
+						for (std::size_t k = begin; k < end; k++)
+						{
+							std::size_t position = k / (split.length * split.inner) * split.inner + k % split.inner;
+							dx[k] = T(2) * (x[k] - mean[position]) / denominator;
+						}
+					}
+				);
+			}
+		}
+	);
+	Tensor output(to_device_of(std::move(result), input));
+	if (with_grad)
+		output = attach_reduction_grad(input, plan, output, std::move(derivative), 1.0);
+	return cast_result(output, *natural_type);
+}
+
+/* The position in the buffer of plan of the element index[k] along the reduced dims of output k. */
+inline std::size_t source_offset(const DimSplit& split, std::size_t k, std::int64_t index)
+{
+	return (k / split.inner * split.length + static_cast<std::size_t>(index)) * split.inner + k % split.inner;
+}
+
+template <bool is_max>
+Tensor reduce_extreme(const Tensor& input, const std::vector<int>& dims, bool keepdim)
+{
+	ReducePlan plan = plan_reduction(input, dims, keepdim);
+	if (plan.split.length == 0)
+		throw pybind11::value_error(std::string(is_max ? "max" : "min") + " of an empty tensor has no value");
+	const std::type_info& type = plan.source.type();
+	bool with_grad = records_grad(plan.source);
+	TensorBase result(type, plan.out_shape);
+	std::optional<TensorBase> derivative;
+	dispatch_reducible
+	(
+		type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const T* x = static_cast<const T*>(plan.source.data());
+			T* out = mutable_data<T>(result);
+			std::size_t n_out = element_count(result);
+			host_vector<std::int64_t> index(n_out);
+			extreme_rows<is_max>(x, plan.split, index.data());
+			for (std::size_t k = 0; k < n_out; k++)
+				out[k] = x[source_offset(plan.split, k, index[k])];
+			if constexpr (std::is_floating_point_v<T>)
+			{
+				if (!with_grad)
+					return;
+				/* The gradient goes to the first extreme element only. */
+				derivative.emplace(type, shape_of(plan.source));
+				T* dx = mutable_data<T>(*derivative);
+				std::fill_n(dx, element_count(plan.source), T(0));
+				for (std::size_t k = 0; k < n_out; k++)
+					dx[source_offset(plan.split, k, index[k])] = T(1);
+			}
+		}
+	);
+	Tensor output(to_device_of(std::move(result), input));
+	if (with_grad)
+		output = attach_reduction_grad(input, plan, output, std::move(derivative), 1.0);
+	return output;
+}
+
+Tensor reduce_max(const Tensor& input, const std::vector<int>& dims, bool keepdim)
+{
+	return reduce_extreme<true>(input, dims, keepdim);
+}
+
+Tensor reduce_min(const Tensor& input, const std::vector<int>& dims, bool keepdim)
+{
+	return reduce_extreme<false>(input, dims, keepdim);
+}
+
+template <bool is_max>
+Tensor reduce_arg_extreme(const Tensor& input, std::optional<int> dim, bool keepdim)
+{
+	ReducePlan plan = plan_reduction(input, dim ? std::vector<int>{*dim} : std::vector<int>(), keepdim);
+	if (plan.split.length == 0)
+		throw pybind11::value_error(std::string(is_max ? "argmax" : "argmin") + " of an empty tensor has no value");
+	TensorBase result(typeid(std::int64_t), plan.out_shape);
+	dispatch_reducible
+	(
+		plan.source.type(),
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			extreme_rows<is_max>(static_cast<const T*>(plan.source.data()), plan.split, mutable_data<std::int64_t>(result));
+		}
+	);
+	return Tensor(to_device_of(std::move(result), input));
+}
+
+Tensor reduce_argmax(const Tensor& input, std::optional<int> dim, bool keepdim)
+{
+	return reduce_arg_extreme<true>(input, dim, keepdim);
+}
+
+Tensor reduce_argmin(const Tensor& input, std::optional<int> dim, bool keepdim)
+{
+	return reduce_arg_extreme<false>(input, dim, keepdim);
+}
+
+void bind_reduce(pybind11::module_& m)
+{
+	m.def(
+		"sum",
+		traced(&reduce_sum, "sum"),
+		pybind11::arg("input"),
+		pybind11::arg("dims") = std::vector<int>(),
+		pybind11::arg("keepdim") = false,
+		pybind11::arg("dtype") = std::nullopt
+	);
+
+	m.def(
+		"mean",
+		traced(&reduce_mean, "mean"),
+		pybind11::arg("input"),
+		pybind11::arg("dims") = std::vector<int>(),
+		pybind11::arg("keepdim") = false,
+		pybind11::arg("dtype") = std::nullopt
+	);
+
+	m.def(
+		"var",
+		traced(&reduce_var, "var"),
+		pybind11::arg("input"),
+		pybind11::arg("dims") = std::vector<int>(),
+		pybind11::arg("correction") = 1,
+		pybind11::arg("keepdim") = false
+	);
+
+	m.def(
+		"max",
+		traced(&reduce_max, "max"),
+		pybind11::arg("input"),
+		pybind11::arg("dims") = std::vector<int>(),
+		pybind11::arg("keepdim") = false
+	);
+
+	m.def(
+		"min",
+		traced(&reduce_min, "min"),
+		pybind11::arg("input"),
+		pybind11::arg("dims") = std::vector<int>(),
+		pybind11::arg("keepdim") = false
+	);
+
+	m.def(
+		"argmax",
+		traced(&reduce_argmax, "argmax"),
+		pybind11::arg("input"),
+		pybind11::arg("dim") = std::nullopt,
+		pybind11::arg("keepdim") = false
+	);
+
+	m.def(
+		"argmin",
+		traced(&reduce_argmin, "argmin"),
+		pybind11::arg("input"),
+		pybind11::arg("dim") = std::nullopt,
+		pybind11::arg("keepdim") = false
+	);
+}
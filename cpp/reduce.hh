@@ -0,0 +1,30 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <tensor-array/core/data_type_wrapper.hh>
+#include <pybind11/pybind11.h>
+#include <optional>
+#include <vector>
+
+/*
+ * Reductions over any set of dims, an empty dims meaning all of them.
+ * Sums are compensated (Kahan) so long float reductions keep their accuracy, 16-bit floats
+ * being accumulated in FLOAT. dtype is the type of the result, by default the type of input,
+ * or S_INT_64/U_INT_64 for sums and DOUBLE for means of integers.
+ */
+tensor_array::value::Tensor reduce_sum(const tensor_array::value::Tensor& input, const std::vector<int>& dims, bool keepdim, std::optional<tensor_array::datatype::DataType> dtype);
+
+tensor_array::value::Tensor reduce_mean(const tensor_array::value::Tensor& input, const std::vector<int>& dims, bool keepdim, std::optional<tensor_array::datatype::DataType> dtype);
+
+/* Variance with the sum of squared deviations divided by n - correction, from two compensated passes. */
+tensor_array::value::Tensor reduce_var(const tensor_array::value::Tensor& input, const std::vector<int>& dims, int correction, bool keepdim);
+
+tensor_array::value::Tensor reduce_max(const tensor_array::value::Tensor& input, const std::vector<int>& dims, bool keepdim);
+
+tensor_array::value::Tensor reduce_min(const tensor_array::value::Tensor& input, const std::vector<int>& dims, bool keepdim);
+
+/* The S_INT_64 index of the first maximum along dim, or in the flattened tensor without dim. */
+tensor_array::value::Tensor reduce_argmax(const tensor_array::value::Tensor& input, std::optional<int> dim, bool keepdim);
+
+tensor_array::value::Tensor reduce_argmin(const tensor_array::value::Tensor& input, std::optional<int> dim, bool keepdim);
+
+void bind_reduce(pybind11::module_& m);
@@ -4,27 +4,98 @@
 #include <pybind11/numpy.h>
 #include <pybind11/operators.h>
 #include <pybind11/stl.h>
+#include "grad_mode.hh"
+#include "activation.hh"
+#include "attention.hh"
+#include "optim.hh"
+#include "host_allocator.hh"
+#include "parallel.hh"
+#include "gemm.hh"
+#include "layout.hh"
+#include "binary.hh"
+#include "reduce.hh"
+#include "normalization.hh"
+#include "autocast.hh"
+#include <optional>
+#include <variant>
 
 using namespace tensor_array::value;
 using namespace tensor_array::datatype;
 using namespace tensor_array::wrapper;
 
-template <typename T>
-TensorBase convert_numpy_to_tensor_base(pybind11::array_t<T> py_buf)
+DataType get_data_type(const pybind11::dtype& py_type)
 {
-	pybind11::buffer_info info = py_buf.request();
-	std::vector<unsigned int> shape_vec(info.ndim);
+	if (py_type.attr("name").cast<std::string>() == "bfloat16")
+		return BF16_DTYPE;
+	switch (py_type.kind())
+	{
+	case 'b':
+		return BOOL_DTYPE;
+	case 'i':
+		switch (py_type.itemsize())
+		{
+		case 1:
+			return S_INT_8;
+		case 2:
+			return S_INT_16;
+		case 4:
+			return S_INT_32;
+		case 8:
+			return S_INT_64;
+		}
+		break;
+	case 'u':
+		switch (py_type.itemsize())
+		{
+		case 1:
+			return U_INT_8;
+		case 2:
+			return U_INT_16;
+		case 4:
+			return U_INT_32;
+		case 8:
+			return U_INT_64;
+		}
+		break;
+	case 'f':
+		switch (py_type.itemsize())
+		{
+		case 2:
+			return HALF_DTYPE;
+		case 4:
+			return FLOAT_DTYPE;
+		case 8:
+			return DOUBLE_DTYPE;
+		}
+		break;
+	}
+	throw pybind11::type_error("unsupported dtype " + pybind11::str(py_type).cast<std::string>());
+}
+
+TensorBase convert_numpy_to_tensor_base(pybind11::array py_buf)
+{
+	/*
+	 * The tensor is filled straight from the buffer of the array in its own dtype.
+	 * Only arrays that are not C-contiguous need a compacting copy first.
+	 */
+	if (!(py_buf.flags() & pybind11::array::c_style))
+		py_buf = pybind11::array::ensure(py_buf, pybind11::array::c_style);
+	std::vector<unsigned int> shape_vec(py_buf.ndim());
 	std::transform
 	(
-		info.shape.cbegin(),
-		info.shape.cend(),
+		py_buf.shape(),
+		py_buf.shape() + py_buf.ndim(),
 		shape_vec.begin(),
-		[](pybind11::size_t dim)
+		[](pybind11::ssize_t dim)
 		{
 			return static_cast<unsigned int>(dim);
 		}
 	);
-	return TensorBase(warp_type(warp_type(typeid(T))), shape_vec, info.ptr);
+	const auto& type = warp_type(get_data_type(py_buf.dtype()));
+	const void* data = py_buf.data();
+	/* py_buf keeps the array alive while its buffer is copied without the GIL. */
+	pybind11::gil_scoped_release release;
+	return TensorBase(type, shape_vec, data);
 }
 
 pybind11::dtype get_py_type(const std::type_info& info)
@@ -51,13 +122,33 @@ pybind11::dtype get_py_type(const std::type_info& info)
 		return pybind11::dtype::of<float>();
 	if (info == typeid(double))
 		return pybind11::dtype::of<double>();
+	if (warp_type(info) == HALF_DTYPE)
+		return pybind11::dtype("float16");
+	if (warp_type(info) == BF16_DTYPE)
+	{
+		/* NumPy has no bfloat16 of its own, ml_dtypes registers the one get_data_type() accepts. */
+		pybind11::module_ ml_dtypes;
+		try
+		{
+			ml_dtypes = pybind11::module_::import("ml_dtypes");
+		}
+		catch (pybind11::error_already_set&)
+		{
+			throw pybind11::type_error("exporting a BFLOAT16 tensor to NumPy needs the ml_dtypes package, or cast it to FLOAT first");
+		}
+		return pybind11::dtype::from_args(ml_dtypes.attr("bfloat16"));
+	}
 	throw std::runtime_error("no dtype");
 }
 
-pybind11::array convert_tensor_to_numpy(const Tensor& self)
+bool is_cpu_tensor(const TensorBase& base_tensor)
+{
+	return base_tensor.get_device().dev_type == tensor_array::devices::CPU;
+}
+
+std::vector<pybind11::ssize_t> get_py_shape(const TensorBase& base_tensor)
 {
-	const TensorBase& base_tensor = self.get_buffer().change_device({tensor_array::devices::CPU, 0});
-	std::vector<pybind11::size_t> shape_vec(base_tensor.shape().size());
+	std::vector<pybind11::ssize_t> shape_vec(base_tensor.shape().size());
 	std::transform
 	(
 		base_tensor.shape().begin(),
@@ -65,61 +156,221 @@ pybind11::array convert_tensor_to_numpy(const Tensor& self)
 		shape_vec.begin(),
 		[](unsigned int dim)
 		{
-			return static_cast<pybind11::size_t>(dim);
+			return static_cast<pybind11::ssize_t>(dim);
 		}
 	);
-	auto ty0 = pybind11::detail::get_type_info(base_tensor.type());
-	pybind11::dtype ty1 = get_py_type(base_tensor.type());
-	return pybind11::array(ty1, shape_vec, base_tensor.data());
+	return shape_vec;
 }
 
-Tensor python_tuple_slice(const Tensor& self, pybind11::tuple tuple_slice)
+std::vector<pybind11::ssize_t> get_py_strides(const std::vector<pybind11::ssize_t>& shape_vec, pybind11::ssize_t itemsize)
 {
-	std::vector<Tensor::Slice> t_slices;
-	for (size_t i = 0; i < tuple_slice.size(); i++)
+	std::vector<pybind11::ssize_t> strides_vec(shape_vec.size());
+	pybind11::ssize_t stride = itemsize;
+	for (std::size_t i = shape_vec.size(); i-- > 0;)
 	{
-		ssize_t start, stop, step;
-		ssize_t length;
-		pybind11::slice py_slice = tuple_slice[i].cast<pybind11::slice>();
-		if (!py_slice.compute(self.get_buffer().shape().begin()[i], &start, &stop, &step, &length))
-			throw std::runtime_error("Invalid slice");
-		t_slices.insert
-		(
-			t_slices.begin() + i,
-			Tensor::Slice
-			{
-				static_cast<int>(start),
-				static_cast<int>(stop),
-				static_cast<int>(step)
-			}
-		);
+		strides_vec[i] = stride;
+		stride *= shape_vec[i];
 	}
-	return self[initializer_wrapper<Tensor::Slice>(t_slices.begin().operator->(), t_slices.end().operator->())];
+	return strides_vec;
 }
 
-Tensor python_slice(const Tensor& self, pybind11::slice py_slice)
+pybind11::array convert_tensor_to_numpy(const Tensor& self, bool copy)
 {
-	std::vector<Tensor::Slice> t_slices;
-	ssize_t start, stop, step;
-	ssize_t length;
-	if (!py_slice.compute(self.get_buffer().shape().begin()[0], &start, &stop, &step, &length))
-	throw std::runtime_error("Invalid slice");
-	return self
-	[
-		{
-			Tensor::Slice
-			{
-				static_cast<int>(start),
-				static_cast<int>(stop),
-				static_cast<int>(step)
-			}
-		}
-	];
+	const TensorBase& self_buffer = self.get_buffer();
+	pybind11::dtype ty1 = get_py_type(self_buffer.type());
+	std::vector<pybind11::ssize_t> shape_vec = get_py_shape(self_buffer);
+	std::vector<pybind11::ssize_t> strides_vec = get_py_strides(shape_vec, ty1.itemsize());
+	if (copy)
+	{
+		TensorBase base_tensor = call_without_gil([&self_buffer]() { return self_buffer.change_device({tensor_array::devices::CPU, 0}); });
+		return pybind11::array(ty1, shape_vec, strides_vec, base_tensor.data());
+	}
+	pybind11::capsule owner;
+	const void* data_ptr;
+	if (is_cpu_tensor(self_buffer))
+	{
+		/* The array shares the storage of the tensor, so keep a handle of it alive. */
+		Tensor* keep_alive = new Tensor(self);
+		owner = pybind11::capsule(keep_alive, [](void* ptr) { delete static_cast<Tensor*>(ptr); });
+		data_ptr = keep_alive->get_buffer().data();
+	}
+	else
+	{
+		/* The host copy made by change_device is owned by the array from now on. */
+		TensorBase* host_buffer = new TensorBase(call_without_gil([&self_buffer]() { return self_buffer.change_device({tensor_array::devices::CPU, 0}); }));
+		owner = pybind11::capsule(host_buffer, [](void* ptr) { delete static_cast<TensorBase*>(ptr); });
+		data_ptr = host_buffer->data();
+	}
+	pybind11::array result(ty1, shape_vec, strides_vec, data_ptr, owner);
+	/* Writing through the view would bypass the autograd graph. */
+	pybind11::detail::array_proxy(result.ptr())->flags &= ~pybind11::detail::npy_api::NPY_ARRAY_WRITEABLE_;
+	return result;
+}
+
+pybind11::buffer_info tensor_buffer_info(const Tensor& self)
+{
+	const TensorBase& base_tensor = self.get_buffer();
+	if (!is_cpu_tensor(base_tensor))
+		throw pybind11::buffer_error("buffer protocol is only available for CPU tensors, use Tensor.numpy() instead");
+	pybind11::dtype ty1 = get_py_type(base_tensor.type());
+	std::vector<pybind11::ssize_t> shape_vec = get_py_shape(base_tensor);
+	std::vector<pybind11::ssize_t> strides_vec = get_py_strides(shape_vec, ty1.itemsize());
+	return pybind11::buffer_info
+	(
+		const_cast<void*>(base_tensor.data()),
+		ty1.itemsize(),
+		pybind11::str(ty1.attr("char")).cast<std::string>(),
+		static_cast<pybind11::ssize_t>(shape_vec.size()),
+		shape_vec,
+		strides_vec,
+		true
+	);
+}
+
+pybind11::dict tensor_array_interface(const Tensor& self)
+{
+	const TensorBase& base_tensor = self.get_buffer();
+	if (!is_cpu_tensor(base_tensor))
+		/* numpy falls back to __array__ when the interface is missing. */
+		throw pybind11::attribute_error("__array_interface__ is only available for CPU tensors");
+	pybind11::dtype ty1 = get_py_type(base_tensor.type());
+	pybind11::dict interface;
+	interface["version"] = 3;
+	interface["shape"] = pybind11::tuple(pybind11::cast(get_py_shape(base_tensor)));
+	interface["typestr"] = ty1.attr("str");
+	interface["data"] = pybind11::make_tuple(reinterpret_cast<std::uintptr_t>(base_tensor.data()), true);
+	interface["strides"] = pybind11::none();
+	return interface;
+}
+
+Tensor tensor_add(const Tensor& self, const Tensor& other)
+{
+	return binary_tensor(self, other, BinaryOp::ADD);
+}
+
+Tensor tensor_sub(const Tensor& self, const Tensor& other)
+{
+	return binary_tensor(self, other, BinaryOp::SUB);
+}
+
+Tensor tensor_mul(const Tensor& self, const Tensor& other)
+{
+	return binary_tensor(self, other, BinaryOp::MUL);
+}
+
+Tensor tensor_div(const Tensor& self, const Tensor& other)
+{
+	return binary_tensor(self, other, BinaryOp::DIV);
+}
+
+Tensor tensor_pow(const Tensor& self, const Tensor& other)
+{
+	return binary_tensor(self, other, BinaryOp::POW);
+}
+
+/* The binding of self op other with a Python number, or other op self when reverse. */
+auto scalar_operator(BinaryOp op, bool reverse)
+{
+	return [op, reverse](const Tensor& self, Scalar other)
+	{
+		return grad_mode_aware(&binary_scalar, "binary_scalar")(self, other, op, reverse);
+	};
+}
+
+/* The binding of the in-place op self op= other, returning self like the in-place activations. */
+auto inplace_operator(BinaryOp op)
+{
+	return [op](Tensor& self, const Operand& other) -> Tensor&
+	{
+		binary_out(self, other, op, self);
+		return self;
+	};
+}
+
+auto tensor_eq(const Tensor& self, const Tensor& other)
+{
+	return self == other;
+}
+
+auto tensor_ne(const Tensor& self, const Tensor& other)
+{
+	return self != other;
+}
+
+auto tensor_ge(const Tensor& self, const Tensor& other)
+{
+	return self >= other;
+}
+
+auto tensor_le(const Tensor& self, const Tensor& other)
+{
+	return self <= other;
+}
+
+auto tensor_gt(const Tensor& self, const Tensor& other)
+{
+	return self > other;
 }
 
-Tensor python_index(const Tensor& self, unsigned int i)
+auto tensor_lt(const Tensor& self, const Tensor& other)
 {
-	return self[i];
+	return self < other;
+}
+
+/*
+ * Tensor-tensor comparisons as the library defines them. The ones returning a tensor are
+ * recorded by the tracer like the arithmetic operators, instead of being frozen as constants.
+ */
+template <typename Result>
+auto comparison_operator(Result (*func)(const Tensor&, const Tensor&), OpInfo info)
+{
+	if constexpr (std::is_same_v<Result, Tensor>)
+		return grad_mode_aware(func, info);
+	else
+		return func;
+}
+
+Tensor tensor_pos(const Tensor& self)
+{
+	return +self;
+}
+
+Tensor tensor_neg(const Tensor& self)
+{
+	return -self;
+}
+
+Tensor python_reshape(const Tensor& self, pybind11::tuple shape_tuple)
+{
+	std::size_t size = 1;
+	for (unsigned int dim: self.get_buffer().shape())
+		size *= dim;
+	std::vector<unsigned int> shape_vec;
+	std::size_t known_size = 1;
+	int inferred = -1;
+	for (auto& it: shape_tuple)
+	{
+		int dim = it.cast<int>();
+		if (dim == -1)
+		{
+			if (inferred != -1)
+				throw pybind11::value_error("only one dimension can be inferred");
+			inferred = static_cast<int>(shape_vec.size());
+			dim = 1;
+		}
+		else if (dim < 0)
+			throw pybind11::value_error("invalid shape dimension " + std::to_string(dim));
+		known_size *= dim;
+		shape_vec.push_back(static_cast<unsigned int>(dim));
+	}
+	if (inferred != -1 && known_size != 0)
+	{
+		shape_vec[inferred] = static_cast<unsigned int>(size / known_size);
+		known_size *= shape_vec[inferred];
+	}
+	if (known_size != size)
+		throw pybind11::value_error("can not reshape a tensor of " + std::to_string(size) + " elements to the requested shape");
+	return self.reshape(initializer_wrapper<unsigned int>(shape_vec.data(), shape_vec.data() + shape_vec.size()));
 }
 
 std::size_t python_len(const Tensor& self)
@@ -130,9 +381,31 @@ std::size_t python_len(const Tensor& self)
 
 pybind11::str tensor_to_string(const Tensor& self)
 {
-	return pybind11::repr(convert_tensor_to_numpy(self));
+	return pybind11::repr(convert_tensor_to_numpy(self, false));
+}
+
+/* The dims of a reduction method: a dim, a sequence of dims, or None for all of them. */
+std::vector<int> reduced_dims(const std::optional<std::variant<int, std::vector<int>>>& dim)
+{
+	if (!dim)
+		return {};
+	if (const int* value = std::get_if<int>(&*dim))
+		return {*value};
+	return std::get<std::vector<int>>(*dim);
 }
 
+/* A result type given as a native DataType or as a member of tensor_array.core.DataTypes. */
+std::optional<DataType> reduced_type(const pybind11::object& dtype)
+{
+	if (dtype.is_none())
+		return std::nullopt;
+	if (pybind11::isinstance<DataType>(dtype))
+		return dtype.cast<DataType>();
+	return dtype.attr("value").cast<DataType>();
+}
+
+using ReducedDims = std::optional<std::variant<int, std::vector<int>>>;
+
 Tensor tensor_cast_1(const Tensor& self, DataType dtype)
 {
 	return self.tensor_cast(warp_type(dtype));
@@ -158,7 +431,7 @@ Tensor py_zeros(pybind11::tuple shape_tuple, DataType dtype)
 	std::vector<unsigned int> shape_vec;
 	for (auto& it: shape_tuple)
 		shape_vec.push_back(it.cast<unsigned int>());
-	return TensorBase(warp_type(dtype), shape_vec);
+	return call_without_gil([&]() { return TensorBase(warp_type(dtype), shape_vec); });
 }
 
 Tensor py_rand(pybind11::tuple shape_tuple, unsigned int seed = std::rand())
@@ -166,7 +439,7 @@ Tensor py_rand(pybind11::tuple shape_tuple, unsigned int seed = std::rand())
 	std::vector<unsigned int> shape_vec;
 	for (auto& it: shape_tuple)
 		shape_vec.push_back(it.cast<unsigned int>());
-	return tensor_rand(shape_vec, seed);
+	return call_without_gil([&]() { return tensor_rand(shape_vec, seed); });
 }
 
 PYBIND11_MODULE(tensor2, m)
@@ -204,89 +477,146 @@ PYBIND11_MODULE(tensor2, m)
 
 	m.def(
 		"add",
-		&tensor_array::value::add,
+		grad_mode_aware(&tensor_add, {"add", '+'}),
 		pybind11::arg("value_1"),
 		pybind11::arg("value_2")
 	);
 
 	m.def(
 		"multiply",
-		&tensor_array::value::multiply,
+		grad_mode_aware(&tensor_mul, {"mul", '*'}),
 		pybind11::arg("value_1"),
 		pybind11::arg("value_2")
 	);
 
 	m.def(
 		"divide",
-		&tensor_array::value::divide,
+		grad_mode_aware(&tensor_div, {"div", '/'}),
 		pybind11::arg("value_1"),
 		pybind11::arg("value_2")
 	);
 
 	m.def(
 		"power",
-		&tensor_array::value::power,
-		pybind11::arg("value_1"),
-		pybind11::arg("value_2")
-	);
-	
-	m.def(
-		"matmul",
-		&tensor_array::value::matmul,
+		grad_mode_aware(&tensor_pow, "power"),
 		pybind11::arg("value_1"),
 		pybind11::arg("value_2")
 	);
 
-	m.def(
-		"condition",
-		&tensor_array::value::condition,
-		pybind11::arg("condition_value"),
-		pybind11::arg("value_if_true"),
-		pybind11::arg("value_if_false")
-	);
+	bind_binary(m);
+
+	bind_grad_mode(m);
+
+	bind_activation(m);
+
+	bind_attention(m);
+
+	bind_optim(m);
+
+	bind_trace(m);
+
+	bind_host_allocator(m);
+
+	bind_parallel(m);
+
+	bind_gemm(m);
+
+	bind_reduce(m);
+
+	bind_normalization(m);
+
+	bind_autocast(m);
 
-	pybind11::class_<Tensor>(m, "Tensor")
+	pybind11::class_<Tensor>(m, "Tensor", pybind11::buffer_protocol())
 		.def(pybind11::init())
 		.def(pybind11::init(&tensor_copying))
-		.def(pybind11::init(&convert_numpy_to_tensor_base<int>))
-		.def(pybind11::init(&convert_numpy_to_tensor_base<float>))
-		.def(pybind11::self + pybind11::self)
-		.def(pybind11::self - pybind11::self)
-		.def(pybind11::self * pybind11::self)
-		.def(pybind11::self / pybind11::self)
-		.def(pybind11::self += pybind11::self)
-		.def(pybind11::self -= pybind11::self)
-		.def(pybind11::self *= pybind11::self)
-		.def(pybind11::self /= pybind11::self)
-		.def(pybind11::self == pybind11::self)
-		.def(pybind11::self != pybind11::self)
-		.def(pybind11::self >= pybind11::self)
-		.def(pybind11::self <= pybind11::self)
-		.def(pybind11::self > pybind11::self)
-		.def(pybind11::self < pybind11::self)
-		.def(+pybind11::self)
-		.def(-pybind11::self)
+		.def(pybind11::init(&convert_numpy_to_tensor_base))
+		.def("__add__", grad_mode_aware(&tensor_add, {"add", '+'}), pybind11::is_operator())
+		.def("__sub__", grad_mode_aware(&tensor_sub, {"sub", '-'}), pybind11::is_operator())
+		.def("__mul__", grad_mode_aware(&tensor_mul, {"mul", '*'}), pybind11::is_operator())
+		.def("__truediv__", grad_mode_aware(&tensor_div, {"div", '/'}), pybind11::is_operator())
+		.def("__iadd__", [](Tensor& self, const Tensor& other) { return self = grad_mode_aware(&tensor_add, {"add", '+'})(self, other); }, pybind11::is_operator())
+		.def("__isub__", [](Tensor& self, const Tensor& other) { return self = grad_mode_aware(&tensor_sub, {"sub", '-'})(self, other); }, pybind11::is_operator())
+		.def("__imul__", [](Tensor& self, const Tensor& other) { return self = grad_mode_aware(&tensor_mul, {"mul", '*'})(self, other); }, pybind11::is_operator())
+		.def("__itruediv__", [](Tensor& self, const Tensor& other) { return self = grad_mode_aware(&tensor_div, {"div", '/'})(self, other); }, pybind11::is_operator())
+		.def("__add__", scalar_operator(BinaryOp::ADD, false), pybind11::is_operator())
+		.def("__sub__", scalar_operator(BinaryOp::SUB, false), pybind11::is_operator())
+		.def("__mul__", scalar_operator(BinaryOp::MUL, false), pybind11::is_operator())
+		.def("__truediv__", scalar_operator(BinaryOp::DIV, false), pybind11::is_operator())
+		.def("__radd__", scalar_operator(BinaryOp::ADD, true), pybind11::is_operator())
+		.def("__rsub__", scalar_operator(BinaryOp::SUB, true), pybind11::is_operator())
+		.def("__rmul__", scalar_operator(BinaryOp::MUL, true), pybind11::is_operator())
+		.def("__rtruediv__", scalar_operator(BinaryOp::DIV, true), pybind11::is_operator())
+		.def("__iadd__", [](Tensor& self, Scalar other) { return self = scalar_operator(BinaryOp::ADD, false)(self, other); }, pybind11::is_operator())
+		.def("__isub__", [](Tensor& self, Scalar other) { return self = scalar_operator(BinaryOp::SUB, false)(self, other); }, pybind11::is_operator())
+		.def("__imul__", [](Tensor& self, Scalar other) { return self = scalar_operator(BinaryOp::MUL, false)(self, other); }, pybind11::is_operator())
+		.def("__itruediv__", [](Tensor& self, Scalar other) { return self = scalar_operator(BinaryOp::DIV, false)(self, other); }, pybind11::is_operator())
+		.def("__pow__", grad_mode_aware(&tensor_pow, "power"), pybind11::is_operator())
+		.def("__pow__", scalar_operator(BinaryOp::POW, false), pybind11::is_operator())
+		.def("__rpow__", scalar_operator(BinaryOp::POW, true), pybind11::is_operator())
+		.def("add_", inplace_operator(BinaryOp::ADD), pybind11::arg("other"), pybind11::return_value_policy::reference, pybind11::call_guard<pybind11::gil_scoped_release>())
+		.def("sub_", inplace_operator(BinaryOp::SUB), pybind11::arg("other"), pybind11::return_value_policy::reference, pybind11::call_guard<pybind11::gil_scoped_release>())
+		.def("mul_", inplace_operator(BinaryOp::MUL), pybind11::arg("other"), pybind11::return_value_policy::reference, pybind11::call_guard<pybind11::gil_scoped_release>())
+		.def("div_", inplace_operator(BinaryOp::DIV), pybind11::arg("other"), pybind11::return_value_policy::reference, pybind11::call_guard<pybind11::gil_scoped_release>())
+		.def("pow_", inplace_operator(BinaryOp::POW), pybind11::arg("other"), pybind11::return_value_policy::reference, pybind11::call_guard<pybind11::gil_scoped_release>())
+		.def("__eq__", scalar_operator(BinaryOp::EQ, false), pybind11::is_operator())
+		.def("__ne__", scalar_operator(BinaryOp::NE, false), pybind11::is_operator())
+		.def("__lt__", scalar_operator(BinaryOp::LT, false), pybind11::is_operator())
+		.def("__le__", scalar_operator(BinaryOp::LE, false), pybind11::is_operator())
+		.def("__gt__", scalar_operator(BinaryOp::GT, false), pybind11::is_operator())
+		.def("__ge__", scalar_operator(BinaryOp::GE, false), pybind11::is_operator())
+		.def("__eq__", comparison_operator(&tensor_eq, "eq"), pybind11::is_operator())
+		.def("__ne__", comparison_operator(&tensor_ne, "ne"), pybind11::is_operator())
+		.def("__ge__", comparison_operator(&tensor_ge, "ge"), pybind11::is_operator())
+		.def("__le__", comparison_operator(&tensor_le, "le"), pybind11::is_operator())
+		.def("__gt__", comparison_operator(&tensor_gt, "gt"), pybind11::is_operator())
+		.def("__lt__", comparison_operator(&tensor_lt, "lt"), pybind11::is_operator())
+		.def("__pos__", grad_mode_aware(&tensor_pos, "pos"))
+		.def("__neg__", grad_mode_aware(&tensor_neg, "neg"))
 		.def(hash(pybind11::self))
-		.def("transpose", &Tensor::transpose)
-		.def("calc_grad", &Tensor::calc_grad)
+		.def("transpose", grad_mode_aware(&layout_transpose, "transpose"), pybind11::arg("dim0"), pybind11::arg("dim1"), pybind11::arg("is_derive") = true)
+		.def("permute", grad_mode_aware(&layout_permute, "permute"), pybind11::arg("dims"))
+		.def("expand", grad_mode_aware(&layout_expand, "expand"), pybind11::arg("shape"))
+		.def("squeeze", grad_mode_aware(&layout_squeeze, "squeeze"), pybind11::arg("dim") = pybind11::none())
+		.def("unsqueeze", grad_mode_aware(&layout_unsqueeze, "unsqueeze"), pybind11::arg("dim"))
+		.def("reshape", grad_mode_aware(&python_reshape, "reshape"), pybind11::arg("shape"))
+		.def("view", grad_mode_aware(&python_reshape, "reshape"), pybind11::arg("shape"))
+		/* No-ops: layout ops copy into a new buffer, so every tensor is contiguous. */
+		.def("contiguous", [](const Tensor& self) { return self; })
+		.def("is_contiguous", [](const Tensor&) { return true; })
+		.def("calc_grad", &calc_grad, pybind11::arg("retain_graph") = false, pybind11::arg("inputs") = pybind11::none(), pybind11::arg("accumulate") = true)
+		.def("_backward", &backward, pybind11::arg("retain_graph") = false)
+		.def("_release_graph", &release_graph)
+		/* A leaf holding the buffer of self, for checkpointing to run backward passes into fresh nodes. */
+		.def("_leaf", [](const Tensor& self) { return Tensor(self.get_buffer()); })
+		.def("_swap_node", [](Tensor& self, Tensor& other) { Tensor held = self; self = other; other = held; })
 		.def("get_grad", &Tensor::get_grad)
-		.def("sin", &Tensor::sin)
-		.def("cos", &Tensor::cos)
-		.def("tan", &Tensor::tan)
-		.def("sinh", &Tensor::sinh)
-		.def("cosh", &Tensor::cosh)
-		.def("tanh", &Tensor::tanh)
-		.def("log", &Tensor::log)
-		.def("clone", &Tensor::clone)
-		.def("cast", &tensor_cast_1)
-		.def("numpy", &convert_tensor_to_numpy)
+		.def("sum", [](const Tensor& self, const ReducedDims& dim, bool keepdim, const pybind11::object& dtype) { return traced(&reduce_sum, "sum")(self, reduced_dims(dim), keepdim, reduced_type(dtype)); }, pybind11::arg("dim") = pybind11::none(), pybind11::arg("keepdim") = false, pybind11::arg("dtype") = pybind11::none())
+		.def("mean", [](const Tensor& self, const ReducedDims& dim, bool keepdim, const pybind11::object& dtype) { return traced(&reduce_mean, "mean")(self, reduced_dims(dim), keepdim, reduced_type(dtype)); }, pybind11::arg("dim") = pybind11::none(), pybind11::arg("keepdim") = false, pybind11::arg("dtype") = pybind11::none())
+		.def("var", [](const Tensor& self, const ReducedDims& dim, int correction, bool keepdim) { return traced(&reduce_var, "var")(self, reduced_dims(dim), correction, keepdim); }, pybind11::arg("dim") = pybind11::none(), pybind11::arg("correction") = 1, pybind11::arg("keepdim") = false)
+		.def("max", [](const Tensor& self, const ReducedDims& dim, bool keepdim) { return traced(&reduce_max, "max")(self, reduced_dims(dim), keepdim); }, pybind11::arg("dim") = pybind11::none(), pybind11::arg("keepdim") = false)
+		.def("min", [](const Tensor& self, const ReducedDims& dim, bool keepdim) { return traced(&reduce_min, "min")(self, reduced_dims(dim), keepdim); }, pybind11::arg("dim") = pybind11::none(), pybind11::arg("keepdim") = false)
+		.def("argmax", traced(&reduce_argmax, "argmax"), pybind11::arg("dim") = pybind11::none(), pybind11::arg("keepdim") = false)
+		.def("argmin", traced(&reduce_argmin, "argmin"), pybind11::arg("dim") = pybind11::none(), pybind11::arg("keepdim") = false)
+		.def("sin", grad_mode_aware(&Tensor::sin, "sin"))
+		.def("cos", grad_mode_aware(&Tensor::cos, "cos"))
+		.def("tan", grad_mode_aware(&Tensor::tan, "tan"))
+		.def("sinh", grad_mode_aware(&Tensor::sinh, "sinh"))
+		.def("cosh", grad_mode_aware(&Tensor::cosh, "cosh"))
+		.def("tanh", grad_mode_aware(&Tensor::tanh, "tanh"))
+		.def("log", grad_mode_aware(&Tensor::log, "log"))
+		.def("clone", grad_mode_aware(&Tensor::clone))
+		.def("cast", grad_mode_aware(&tensor_cast_1, "cast"))
+		.def("numpy", &convert_tensor_to_numpy, pybind11::arg("copy") = false)
+		.def_buffer(&tensor_buffer_info)
+		.def_property_readonly("__array_interface__", &tensor_array_interface)
 		.def("shape", &tensor_shape)
 		.def("dtype", &tensor_type)
-		.def("__getitem__", &python_index)
-		.def("__getitem__", &python_slice)
-		.def("__getitem__", &python_tuple_slice)
+		.def("__getitem__", grad_mode_aware(&layout_index, "index"))
+		.def("__getitem__", grad_mode_aware(&layout_slice, "slice"))
+		.def("__getitem__", grad_mode_aware(&layout_tuple_slice, "slice"))
 		.def("__len__", &python_len)
-		.def("__matmul__", &matmul)
+		.def("__matmul__", grad_mode_aware(&tensor_matmul, "matmul"), pybind11::is_operator())
 		.def("__repr__", &tensor_to_string)
 		.def("__copy__", &tensor_copying);
 }
\ No newline at end of file
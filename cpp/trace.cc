@@ -0,0 +1,562 @@
+#include "trace.hh"
+#include "cpu_kernel.hh"
+#include <pybind11/stl.h>
+#include <algorithm>
+#include <cstdint>
+#include <memory>
+#include <sstream>
+#include <string>
+
+using namespace tensor_array::value;
+
+/* Tracing is per thread, ops run by other threads while tracing are not recorded. */
+thread_local TraceGraph* current_trace = nullptr;
+
+TraceGraph* active_trace()
+{
+	return current_trace;
+}
+
+/* Disables grad mode for the lifetime of the guard, graphs are replayed for inference only. */
+struct NoGradGuard
+{
+	bool prev = is_grad_enabled();
+
+	NoGradGuard()
+	{
+		set_grad_enabled(false);
+	}
+
+	~NoGradGuard()
+	{
+		set_grad_enabled(prev);
+	}
+};
+
+long long TraceGraph::add_slot(const Tensor& value)
+{
+	const TensorBase& buffer = value.get_buffer();
+	long long slot = static_cast<long long>(slot_shapes.size());
+	slot_shapes.push_back(shape_of(buffer));
+	slot_types.push_back(&buffer.type());
+	slot_on_host.push_back(is_host_buffer(buffer));
+	if (buffer.data() != nullptr)
+		slots[buffer.data()] = slot;
+	return slot;
+}
+
+void TraceGraph::begin(const std::vector<Tensor>& inputs)
+{
+	if (current_trace != nullptr)
+		throw std::runtime_error("a trace is already being recorded in this thread");
+	n_inputs = inputs.size();
+	nodes.clear();
+	output_slots.clear();
+	output_constants.clear();
+	slot_shapes.clear();
+	slot_types.clear();
+	slot_on_host.clear();
+	slots.clear();
+	traced_values = inputs;
+	for (const Tensor& input: inputs)
+		add_slot(input);
+	current_trace = this;
+}
+
+void TraceGraph::end(const std::vector<Tensor>& outputs)
+{
+	if (current_trace != this)
+		throw std::runtime_error("end() called on a trace that is not being recorded");
+	current_trace = nullptr;
+	for (const Tensor& output: outputs)
+	{
+		long long slot = slot_of(output);
+		output_slots.push_back(slot);
+		output_constants.push_back(slot < 0 ? output : Tensor());
+	}
+	slots.clear();
+	traced_values.clear();
+}
+
+void TraceGraph::record(TraceNode&& node, const Tensor& output)
+{
+	node.output = add_slot(output);
+	nodes.push_back(std::move(node));
+	traced_values.push_back(output);
+}
+
+long long TraceGraph::slot_of(const Tensor& value) const
+{
+	const void* address = value.get_buffer().data();
+	if (address == nullptr)
+		return -1;
+	auto found = slots.find(address);
+	return found == slots.end() ? -1 : found->second;
+}
+
+std::vector<Tensor> TraceGraph::run(const std::vector<Tensor>& inputs) const
+{
+	if (current_trace == this)
+		throw std::runtime_error("a trace can not be replayed while it is being recorded");
+	if (inputs.size() != n_inputs)
+		throw pybind11::value_error("the trace expects " + std::to_string(n_inputs) + " inputs, got " + std::to_string(inputs.size()));
+	NoGradGuard guard;
+	std::vector<Tensor> slot_values(slot_shapes.size());
+	std::copy(inputs.begin(), inputs.end(), slot_values.begin());
+	{
+		pybind11::gil_scoped_release release;
+		for (const TraceNode& node: nodes)
+			if (node.needs_gil)
+			{
+				pybind11::gil_scoped_acquire acquire;
+				slot_values[node.output] = record_grad(node.run(slot_values));
+			}
+			else
+				slot_values[node.output] = record_grad(node.run(slot_values));
+	}
+	std::vector<Tensor> outputs;
+	outputs.reserve(output_slots.size());
+	for (std::size_t i = 0; i < output_slots.size(); i++)
+		outputs.push_back(output_slots[i] < 0 ? output_constants[i] : slot_values[output_slots[i]]);
+	return outputs;
+}
+
+std::size_t TraceGraph::input_count() const
+{
+	return n_inputs;
+}
+
+std::size_t TraceGraph::node_count() const
+{
+	return nodes.size();
+}
+
+std::vector<unsigned int> TraceGraph::input_shape(const TraceNode& node, std::size_t i) const
+{
+	return node.inputs[i] < 0 ? shape_of(node.constants[i].get_buffer()) : slot_shapes[node.inputs[i]];
+}
+
+const std::type_info& TraceGraph::input_type(const TraceNode& node, std::size_t i) const
+{
+	return node.inputs[i] < 0 ? node.constants[i].get_buffer().type() : *slot_types[node.inputs[i]];
+}
+
+TraceNode constant_node(const Tensor& value, long long output)
+{
+	TraceNode node;
+	node.info = OpInfo("constant");
+	node.attributes = std::nullopt;
+	node.output = output;
+	node.run = [value](const std::vector<Tensor>&) { return value; };
+	return node;
+}
+
+TraceNode alias_node(long long source, long long output)
+{
+	TraceNode node;
+	node.info = OpInfo("alias");
+	node.inputs.push_back(source);
+	node.constants.emplace_back();
+	node.attributes = std::nullopt;
+	node.output = output;
+	node.run = [source](const std::vector<Tensor>& slot_values) { return slot_values[source]; };
+	return node;
+}
+
+/*
+ * Replaces every op whose tensor arguments are all constants, directly or through other folded ops,
+ * with its result. Parameters are constants of the graph, so their current values are frozen in.
+ */
+std::size_t TraceGraph::fold_constants()
+{
+	NoGradGuard guard;
+	std::vector<bool> is_constant(slot_shapes.size(), false);
+	std::vector<Tensor> values(slot_shapes.size());
+	std::size_t folded = 0;
+	for (TraceNode& node: nodes)
+	{
+		bool all_constant = std::all_of(node.inputs.begin(), node.inputs.end(), [&](long long slot) { return slot < 0 || is_constant[slot]; });
+		if (!all_constant)
+			continue;
+		values[node.output] = record_grad(node.run(values));
+		is_constant[node.output] = true;
+		if (node.info.name == "constant")
+			continue;
+		node = constant_node(values[node.output], node.output);
+		folded++;
+	}
+	return folded;
+}
+
+/* Replaces an op by an alias of an earlier op with the same name and the same arguments. */
+std::size_t TraceGraph::eliminate_common_subexpressions()
+{
+	std::vector<long long> canonical(slot_shapes.size());
+	for (std::size_t i = 0; i < canonical.size(); i++)
+		canonical[i] = static_cast<long long>(i);
+	std::unordered_map<std::string, long long> seen;
+	std::size_t merged = 0;
+	for (TraceNode& node: nodes)
+	{
+		if (!node.attributes || node.info.name.empty())
+			continue;
+		std::string key = node.info.name + "(" + *node.attributes + ")";
+		for (std::size_t i = 0; i < node.inputs.size(); i++)
+			if (node.inputs[i] < 0)
+				key += "c" + std::to_string(reinterpret_cast<std::uintptr_t>(node.constants[i].get_buffer().data())) + ",";
+			else
+				key += "%" + std::to_string(canonical[node.inputs[i]]) + ",";
+		auto [found, inserted] = seen.emplace(key, node.output);
+		if (inserted)
+			continue;
+		canonical[node.output] = found->second;
+		node = alias_node(found->second, node.output);
+		merged++;
+	}
+	return merged;
+}
+
+/* One elementwise op of a fused chain, applied in place to a tile of the running value. */
+struct FusedStep
+{
+	OpInfo info;
+	bool reversed = false;
+	long long other_slot = -1;
+	Tensor other_constant;
+	std::size_t other_size = 0;
+};
+
+struct FusedChain
+{
+	long long main_slot = -1;
+	Tensor main_constant;
+	std::vector<FusedStep> steps;
+	std::vector<unsigned int> shape;
+	const std::type_info* type = nullptr;
+	/* The original ops, run instead when the operands are not on the CPU. */
+	std::vector<TraceNode> original;
+};
+
+template <typename T>
+void apply_binary(char op, T* value, const T* other, std::size_t other_size, std::size_t begin, std::size_t count, bool reversed)
+{
+	std::size_t k = begin % other_size;
+	for (std::size_t j = 0; j < count; j++)
+	{
+		T a = value[j];
+		T b = other[k];
+		if (reversed)
+			std::swap(a, b);
+		switch (op)
+		{
+		case '+':
+			value[j] = a + b;
+			break;
+		case '-':
+			value[j] = a - b;
+			break;
+		case '*':
+			value[j] = a * b;
+			break;
+		default:
+			value[j] = a / b;
+			break;
+		}
+		if (++k == other_size)
+			k = 0;
+	}
+}
+
+/* Tile size of the fused loop, small enough for the running values to stay in the L1 cache. */
+constexpr std::size_t FUSED_TILE = 2048;
+
+Tensor run_fused(const FusedChain& chain, const std::vector<Tensor>& slot_values)
+{
+	const Tensor& main = chain.main_slot < 0 ? chain.main_constant : slot_values[chain.main_slot];
+	std::vector<const Tensor*> others;
+	bool on_host = is_host_buffer(main.get_buffer());
+	for (const FusedStep& step: chain.steps)
+	{
+		others.push_back(step.info.binary_op == 0 ? nullptr : step.other_slot < 0 ? &step.other_constant : &slot_values[step.other_slot]);
+		if (others.back() != nullptr)
+			on_host = on_host && is_host_buffer(others.back()->get_buffer());
+	}
+	if (!on_host)
+	{
+		std::vector<Tensor> local_values(slot_values);
+		for (const TraceNode& node: chain.original)
+			local_values[node.output] = record_grad(node.run(local_values));
+		return local_values[chain.original.back().output];
+	}
+	const TensorBase& main_buffer = main.get_buffer();
+	std::size_t size = element_count(main_buffer);
+	TensorBase output(*chain.type, chain.shape);
+	dispatch_floating
+	(
+		*chain.type,
+		[&](auto tag)
+		{
+			using T = decltype(tag);
+			const T* x = static_cast<const T*>(main_buffer.data());
+			T* y = mutable_data<T>(output);
+			std::size_t n_tiles = (size + FUSED_TILE - 1) / FUSED_TILE;
+			parallel_for
+			(
+				0, n_tiles, std::max<std::size_t>(DEFAULT_GRAIN_SIZE / FUSED_TILE, 1),
+				[&](std::size_t tile_begin, std::size_t tile_end)
+				{
+					for (std::size_t begin = tile_begin * FUSED_TILE; begin < std::min(size, tile_end * FUSED_TILE); begin += FUSED_TILE)
+					{
+						std::size_t count = std::min(FUSED_TILE, size - begin);
+						T* tile = y + begin;
+						std::copy_n(x + begin, count, tile);
+						for (std::size_t i = 0; i < chain.steps.size(); i++)
+						{
+							const FusedStep& step = chain.steps[i];
+							if (step.info.binary_op != 0)
+								apply_binary(step.info.binary_op, tile, static_cast<const T*>(others[i]->get_buffer().data()), step.other_size, begin, count, step.reversed);
+							else if constexpr (std::is_same_v<T, float>)
+								step.info.unary_float(tile, count);
+							else
+								step.info.unary_double(tile, count);
+						}
+					}
+				}
+			);
+		}
+	);
+	return Tensor(std::move(output));
+}
+
+/* Whether a tensor of shape other can be read cyclically along a tensor of shape full, as trailing broadcasting does. */
+bool is_trailing_broadcast(const std::vector<unsigned int>& other, const std::vector<unsigned int>& full)
+{
+	std::vector<unsigned int> trimmed(std::find_if(other.begin(), other.end(), [](unsigned int dim) { return dim != 1; }), other.end());
+	if (trimmed.size() > full.size())
+		return false;
+	return std::equal(trimmed.rbegin(), trimmed.rend(), full.rbegin());
+}
+
+/*
+ * Fuses chains of elementwise ops on CPU float tensors into one loop over tiles,
+ * where every intermediate result is used only by the next op of the chain.
+ * The chain writes a single output buffer instead of one buffer per op.
+ */
+std::size_t TraceGraph::fuse_elementwise()
+{
+	std::vector<std::size_t> uses(slot_shapes.size(), 0);
+	std::vector<long long> consumer(slot_shapes.size(), -1);
+	for (std::size_t i = 0; i < nodes.size(); i++)
+		for (long long slot: nodes[i].inputs)
+			if (slot >= 0)
+			{
+				uses[slot]++;
+				consumer[slot] = static_cast<long long>(i);
+			}
+	for (long long slot: output_slots)
+		if (slot >= 0)
+			uses[slot] += 2;
+	auto is_fusable = [&](const TraceNode& node)
+	{
+		const std::type_info& type = *slot_types[node.output];
+		if (!node.info.is_elementwise() || !slot_on_host[node.output] || (type != typeid(float) && type != typeid(double)))
+			return false;
+		for (std::size_t i = 0; i < node.inputs.size(); i++)
+			if (input_type(node, i) != type)
+				return false;
+		return node.info.binary_op != 0 ? node.inputs.size() == 2 : node.inputs.size() == 1;
+	};
+	auto binary_step = [&](const TraceNode& node, std::size_t main_index, FusedStep& step)
+	{
+		std::size_t other_index = 1 - main_index;
+		std::vector<unsigned int> other_shape = input_shape(node, other_index);
+		if (!is_trailing_broadcast(other_shape, slot_shapes[node.output]))
+			return false;
+		step.info = node.info;
+		step.reversed = main_index == 1;
+		step.other_slot = node.inputs[other_index];
+		step.other_constant = node.constants[other_index];
+		step.other_size = std::max<std::size_t>(1, std::accumulate(other_shape.begin(), other_shape.end(), std::size_t(1), std::multiplies<std::size_t>()));
+		return true;
+	};
+	std::vector<bool> removed(nodes.size(), false);
+	std::size_t fused = 0;
+	for (std::size_t head = 0; head < nodes.size(); head++)
+	{
+		if (removed[head] || !is_fusable(nodes[head]))
+			continue;
+		const std::vector<unsigned int>& shape = slot_shapes[nodes[head].output];
+		auto chain = std::make_shared<FusedChain>();
+		chain->shape = shape;
+		chain->type = slot_types[nodes[head].output];
+		FusedStep head_step;
+		std::size_t main_index = 0;
+		if (nodes[head].info.binary_op != 0)
+		{
+			if (input_shape(nodes[head], 0) != shape)
+				main_index = 1;
+			if (input_shape(nodes[head], main_index) != shape || !binary_step(nodes[head], main_index, head_step))
+				continue;
+		}
+		else
+			head_step.info = nodes[head].info;
+		chain->main_slot = nodes[head].inputs[main_index];
+		chain->main_constant = nodes[head].constants[main_index];
+		chain->steps.push_back(head_step);
+		std::vector<std::size_t> members{head};
+		while (true)
+		{
+			const TraceNode& last = nodes[members.back()];
+			if (uses[last.output] != 1)
+				break;
+			std::size_t next = static_cast<std::size_t>(consumer[last.output]);
+			const TraceNode& node = nodes[next];
+			if (removed[next] || !is_fusable(node) || slot_shapes[node.output] != shape || *slot_types[node.output] != *chain->type)
+				break;
+			FusedStep step;
+			if (node.info.binary_op != 0)
+			{
+				std::size_t index = node.inputs[0] == last.output ? 0 : 1;
+				if (!binary_step(node, index, step))
+					break;
+			}
+			else
+				step.info = node.info;
+			chain->steps.push_back(step);
+			members.push_back(next);
+		}
+		if (members.size() < 2)
+			continue;
+		TraceNode fused_node;
+		fused_node.info = OpInfo("fused[");
+		fused_node.attributes = std::nullopt;
+		fused_node.inputs.push_back(chain->main_slot);
+		fused_node.constants.push_back(chain->main_constant);
+		for (std::size_t i = 0; i < members.size(); i++)
+		{
+			const FusedStep& step = chain->steps[i];
+			fused_node.info.name += (i == 0 ? "" : ", ") + nodes[members[i]].info.name;
+			if (step.info.binary_op != 0)
+			{
+				fused_node.inputs.push_back(step.other_slot);
+				fused_node.constants.push_back(step.other_constant);
+			}
+			chain->original.push_back(nodes[members[i]]);
+		}
+		fused_node.info.name += "]";
+		fused_node.output = nodes[members.back()].output;
+		fused_node.run = [chain](const std::vector<Tensor>& slot_values) { return run_fused(*chain, slot_values); };
+		for (std::size_t i = 0; i + 1 < members.size(); i++)
+			removed[members[i]] = true;
+		nodes[members.back()] = std::move(fused_node);
+		fused++;
+	}
+	std::vector<TraceNode> kept;
+	for (std::size_t i = 0; i < nodes.size(); i++)
+		if (!removed[i])
+			kept.push_back(std::move(nodes[i]));
+	nodes = std::move(kept);
+	return fused;
+}
+
+/* Removes the ops whose result does not reach an output of the graph. */
+std::size_t TraceGraph::eliminate_dead_nodes()
+{
+	std::vector<bool> live(slot_shapes.size(), false);
+	for (long long slot: output_slots)
+		if (slot >= 0)
+			live[slot] = true;
+	std::vector<bool> keep(nodes.size(), false);
+	for (std::size_t i = nodes.size(); i-- > 0;)
+	{
+		if (!live[nodes[i].output])
+			continue;
+		keep[i] = true;
+		for (long long slot: nodes[i].inputs)
+			if (slot >= 0)
+				live[slot] = true;
+	}
+	std::vector<TraceNode> kept;
+	for (std::size_t i = 0; i < nodes.size(); i++)
+		if (keep[i])
+			kept.push_back(std::move(nodes[i]));
+	std::size_t eliminated = nodes.size() - kept.size();
+	nodes = std::move(kept);
+	return eliminated;
+}
+
+std::string type_name(const std::type_info& type)
+{
+	if (type == typeid(float))
+		return "float32";
+	if (type == typeid(double))
+		return "float64";
+	if (type == typeid(int))
+		return "int32";
+	if (type == typeid(bool))
+		return "bool";
+	return type.name();
+}
+
+std::string shape_string(const std::vector<unsigned int>& shape)
+{
+	std::string result = "[";
+	for (std::size_t i = 0; i < shape.size(); i++)
+		result += (i == 0 ? "" : ", ") + std::to_string(shape[i]);
+	return result + "]";
+}
+
+std::string TraceGraph::dump() const
+{
+	std::ostringstream out;
+	out << "graph(";
+	for (std::size_t i = 0; i < n_inputs; i++)
+		out << (i == 0 ? "" : ", ") << "%" << i << ": " << shape_string(slot_shapes[i]) << " " << type_name(*slot_types[i]);
+	out << ")\n";
+	for (const TraceNode& node: nodes)
+	{
+		out << "  %" << node.output << " = " << (node.info.name.empty() ? "op" : node.info.name) << "(";
+		for (std::size_t i = 0; i < node.inputs.size(); i++)
+		{
+			out << (i == 0 ? "" : ", ");
+			if (node.inputs[i] < 0)
+				out << "const" << shape_string(input_shape(node, i));
+			else
+				out << "%" << node.inputs[i];
+		}
+		out << ") : " << shape_string(slot_shapes[node.output]) << " " << type_name(*slot_types[node.output]) << "\n";
+	}
+	out << "  return ";
+	for (std::size_t i = 0; i < output_slots.size(); i++)
+	{
+		out << (i == 0 ? "" : ", ");
+		if (output_slots[i] < 0)
+			out << "const" << shape_string(shape_of(output_constants[i].get_buffer()));
+		else
+			out << "%" << output_slots[i];
+	}
+	out << "\n";
+	return out.str();
+}
+
+void bind_trace(pybind11::module_& m)
+{
+	m.def(
+		"is_tracing",
+		[]() { return active_trace() != nullptr; }
+	);
+
+	pybind11::class_<TraceGraph>(m, "TraceGraph")
+		.def(pybind11::init())
+		.def("begin", &TraceGraph::begin, pybind11::arg("inputs"))
+		.def("end", &TraceGraph::end, pybind11::arg("outputs"))
+		.def("run", &TraceGraph::run, pybind11::arg("inputs"))
+		.def("input_count", &TraceGraph::input_count)
+		.def("node_count", &TraceGraph::node_count)
+		.def("fold_constants", &TraceGraph::fold_constants)
+		.def("eliminate_common_subexpressions", &TraceGraph::eliminate_common_subexpressions)
+		.def("fuse_elementwise", &TraceGraph::fuse_elementwise)
+		.def("eliminate_dead_nodes", &TraceGraph::eliminate_dead_nodes)
+		.def("dump", &TraceGraph::dump)
+		.def("__repr__", &TraceGraph::dump);
+}
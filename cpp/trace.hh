@@ -0,0 +1,288 @@
+#pragma once
+#include <tensor-array/core/tensor.hh>
+#include <pybind11/pybind11.h>
+#include "gil.hh"
+#include <cstddef>
+#include <functional>
+#include <optional>
+#include <string>
+#include <tuple>
+#include <type_traits>
+#include <unordered_map>
+#include <variant>
+#include <vector>
+
+/*
+ * What the optimization passes know about a traced op.
+ * name identifies the op for common subexpression elimination, unnamed ops are never merged.
+ * binary_op ('+', '-', '*' or '/') or the unary tile functions mark the op as elementwise,
+ * so it can be fused with its neighbours into one loop.
+ */
+struct OpInfo
+{
+	std::string name;
+	char binary_op = 0;
+	std::function<void(float*, std::size_t)> unary_float;
+	std::function<void(double*, std::size_t)> unary_double;
+
+	OpInfo() = default;
+
+	OpInfo(const char* name, char binary_op = 0): name(name), binary_op(binary_op) {}
+
+	bool is_elementwise() const
+	{
+		return binary_op != 0 || unary_float;
+	}
+};
+
+/* Describes an elementwise unary op from an activation kernel of the form kernel(x, dx). */
+template <typename Kernel>
+OpInfo unary_op_info(const char* name, Kernel kernel)
+{
+	OpInfo info(name);
+	info.unary_float = [kernel](float* x, std::size_t size)
+	{
+		for (std::size_t i = 0; i < size; i++)
+			x[i] = kernel(x[i], static_cast<float*>(nullptr));
+	};
+	info.unary_double = [kernel](double* x, std::size_t size)
+	{
+		for (std::size_t i = 0; i < size; i++)
+			x[i] = kernel(x[i], static_cast<double*>(nullptr));
+	};
+	return info;
+}
+
+/*
+ * One op of a traced graph. Slots number the tensors of the graph: the inputs first,
+ * then the output of every recorded op. Tensor arguments that are not slots are constants.
+ */
+struct TraceNode
+{
+	using Run = std::function<tensor_array::value::Tensor(const std::vector<tensor_array::value::Tensor>&)>;
+
+	OpInfo info;
+	/* For every tensor argument, its slot, or -1 and its handle in constants. */
+	std::vector<long long> inputs;
+	std::vector<tensor_array::value::Tensor> constants;
+	/* The non-tensor arguments, nullopt if one of them can not be compared. */
+	std::optional<std::string> attributes = std::string();
+	long long output = -1;
+	/* Whether run needs the GIL, because the op reads Python objects. */
+	bool needs_gil = false;
+	Run run;
+};
+
+/*
+ * A graph of native ops recorded while running Python code once, then replayed from C++.
+ * Every tensor produced while tracing gets a slot, keyed by the address of its buffer.
+ * Tensors the graph did not produce (parameters, constants) are captured by handle,
+ * so in-place updates of their storage are seen by later replays.
+ */
+class TraceGraph
+{
+public:
+	void begin(const std::vector<tensor_array::value::Tensor>& inputs);
+
+	void end(const std::vector<tensor_array::value::Tensor>& outputs);
+
+	void record(TraceNode&& node, const tensor_array::value::Tensor& output);
+
+	long long slot_of(const tensor_array::value::Tensor& value) const;
+
+	std::vector<tensor_array::value::Tensor> run(const std::vector<tensor_array::value::Tensor>& inputs) const;
+
+	std::size_t input_count() const;
+
+	std::size_t node_count() const;
+
+	std::size_t fold_constants();
+
+	std::size_t eliminate_common_subexpressions();
+
+	std::size_t fuse_elementwise();
+
+	std::size_t eliminate_dead_nodes();
+
+	std::string dump() const;
+
+private:
+	long long add_slot(const tensor_array::value::Tensor& value);
+
+	std::vector<unsigned int> input_shape(const TraceNode& node, std::size_t i) const;
+
+	const std::type_info& input_type(const TraceNode& node, std::size_t i) const;
+
+	std::size_t n_inputs = 0;
+	std::vector<TraceNode> nodes;
+	std::vector<long long> output_slots;
+	std::vector<tensor_array::value::Tensor> output_constants;
+	/* Shape, element type and device of every slot, as seen while tracing. */
+	std::vector<std::vector<unsigned int>> slot_shapes;
+	std::vector<const std::type_info*> slot_types;
+	std::vector<bool> slot_on_host;
+	std::unordered_map<const void*, long long> slots;
+	/* Keeps traced tensors alive while tracing, so their buffer addresses can not be reused. */
+	std::vector<tensor_array::value::Tensor> traced_values;
+};
+
+TraceGraph* active_trace();
+
+/* An argument of a traced op, resolved against the slots of the graph on replay. */
+template <typename T>
+struct TracedArg
+{
+	T value;
+
+	TracedArg(const TraceGraph&, const T& value): value(value) {}
+
+	const T& get(const std::vector<tensor_array::value::Tensor>&) const
+	{
+		return value;
+	}
+
+	void describe(TraceNode& node) const
+	{
+		if (!node.attributes)
+			return;
+		if constexpr (std::is_arithmetic_v<T>)
+			*node.attributes += std::to_string(value) + ",";
+		else if constexpr (std::is_enum_v<T>)
+			*node.attributes += std::to_string(static_cast<long long>(value)) + ",";
+		else if constexpr (std::is_same_v<T, std::string>)
+			*node.attributes += "\"" + value + "\",";
+		else
+			node.attributes = std::nullopt;
+	}
+};
+
+template <>
+struct TracedArg<tensor_array::value::Tensor>
+{
+	long long slot;
+	tensor_array::value::Tensor constant;
+
+	TracedArg(const TraceGraph& trace, const tensor_array::value::Tensor& value): slot(trace.slot_of(value))
+	{
+		if (slot < 0)
+			constant = value;
+	}
+
+	const tensor_array::value::Tensor& get(const std::vector<tensor_array::value::Tensor>& slot_values) const
+	{
+		return slot < 0 ? constant : slot_values[slot];
+	}
+
+	void describe(TraceNode& node) const
+	{
+		node.inputs.push_back(slot);
+		node.constants.push_back(constant);
+		if (node.attributes)
+			*node.attributes += "%,";
+	}
+};
+
+template <>
+struct TracedArg<std::optional<tensor_array::value::Tensor>>
+{
+	std::optional<TracedArg<tensor_array::value::Tensor>> value;
+
+	TracedArg(const TraceGraph& trace, const std::optional<tensor_array::value::Tensor>& value)
+	{
+		if (value)
+			this->value.emplace(trace, *value);
+	}
+
+	std::optional<tensor_array::value::Tensor> get(const std::vector<tensor_array::value::Tensor>& slot_values) const
+	{
+		if (!value)
+			return std::nullopt;
+		return value->get(slot_values);
+	}
+
+	void describe(TraceNode& node) const
+	{
+		if (value)
+			value->describe(node);
+		else if (node.attributes)
+			*node.attributes += "None,";
+	}
+};
+
+/* A variant argument, resolved as the alternative it holds, so a tensor in it is still a slot. */
+template <typename... Ts>
+struct TracedArg<std::variant<Ts...>>
+{
+	std::variant<TracedArg<Ts>...> value;
+
+	TracedArg(const TraceGraph& trace, const std::variant<Ts...>& value):
+		value(std::visit([&](const auto& alternative) { return std::variant<TracedArg<Ts>...>(std::in_place_type<TracedArg<std::decay_t<decltype(alternative)>>>, trace, alternative); }, value))
+	{
+	}
+
+	std::variant<Ts...> get(const std::vector<tensor_array::value::Tensor>& slot_values) const
+	{
+		return std::visit
+		(
+			[&](const auto& arg)
+			{
+				using T = std::decay_t<decltype(arg.get(slot_values))>;
+				return std::variant<Ts...>(std::in_place_type<T>, arg.get(slot_values));
+			},
+			value
+		);
+	}
+
+	void describe(TraceNode& node) const
+	{
+		if (node.attributes)
+			*node.attributes += std::to_string(value.index()) + ":";
+		std::visit([&](const auto& arg) { arg.describe(node); }, value);
+	}
+};
+
+/* Records func(args...) producing output into the active trace, if any. */
+template <typename Func, typename... Args>
+void trace_op(Func func, OpInfo info, const tensor_array::value::Tensor& output, const Args&... args)
+{
+	TraceGraph* trace = active_trace();
+	if (trace == nullptr)
+		return;
+	auto bound = std::make_tuple(TracedArg<std::decay_t<Args>>(*trace, args)...);
+	TraceNode node;
+	node.info = std::move(info);
+	node.needs_gil = holds_python_object<Args...>;
+	std::apply([&](const auto&... arg) { (arg.describe(node), ...); }, bound);
+	node.run = [func, bound](const std::vector<tensor_array::value::Tensor>& slot_values)
+	{
+		return std::apply([&](const auto&... arg) { return tensor_array::value::Tensor(std::invoke(func, arg.get(slot_values)...)); }, bound);
+	};
+	trace->record(std::move(node), output);
+}
+
+/* Wraps a native kernel that handles grad mode itself, so it is recorded while tracing. */
+template <typename... Args>
+auto traced(tensor_array::value::Tensor (*func)(Args...), OpInfo info = OpInfo())
+{
+	return [func, info](Args... args)
+	{
+		tensor_array::value::Tensor result = call_without_gil(func, args...);
+		trace_op(func, info, result, args...);
+		return result;
+	};
+}
+
+/* Same as traced(func), with the description of the op built from its arguments. */
+template <typename Describe, typename... Args, typename = std::enable_if_t<std::is_invocable_r_v<OpInfo, Describe, Args...>>>
+auto traced(tensor_array::value::Tensor (*func)(Args...), Describe describe)
+{
+	return [func, describe](Args... args)
+	{
+		tensor_array::value::Tensor result = call_without_gil(func, args...);
+		if (active_trace() != nullptr)
+			trace_op(func, describe(args...), result, args...);
+		return result;
+	};
+}
+
+void bind_trace(pybind11::module_& m);
@@ -16,14 +16,23 @@ def main():
     
     tensor_array_lib_path = os.environ['TENSOR_ARRAY_INSTALL_PATH']
 
+    # Optional CBLAS library for matmul, e.g. TENSOR_ARRAY_BLAS=openblas, blis or mkl_rt.
+    # Without it, matmul uses the built-in blocked kernel.
+    blas_library = os.environ.get('TENSOR_ARRAY_BLAS')
+    libraries = ["tensorarray_core", "tensorarray_layers"]
+    define_macros = [("VERSION_INFO", __version__)]
+    if blas_library:
+        libraries.append(blas_library)
+        define_macros.append(("TENSOR_ARRAY_CBLAS", None))
+
     ext_modules = [
         Pybind11Extension(
             "tensor_array.tensor2",
             sources = glob.glob(os.path.join("cpp", "*.cc")),
             include_dirs=[tensor_array_lib_path + "/include"],
             library_dirs=[tensor_array_lib_path + "/lib/tensor-array", tensor_array_lib_path + "/lib64/tensor-array"],
-            libraries=["tensorarray_core", "tensorarray_layers"],
-            define_macros=[("VERSION_INFO", __version__)],
+            libraries=libraries,
+            define_macros=define_macros,
             ),
     ]
 
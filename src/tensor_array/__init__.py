@@ -0,0 +1,7 @@
+from tensor_array.core.grad_mode import no_grad, enable_grad, inference_mode, set_grad_enabled, is_grad_enabled
+from tensor_array.checkpoint import save_checkpoint, load_checkpoint
+from tensor_array.tracing import trace, TracedLayer, optimize_graph
+from tensor_array.memory import memory_stats, empty_cache, set_max_cached_bytes, reset_peak_memory_stats
+from tensor_array.parallel import get_num_threads, set_num_threads
+from tensor_array.serving import BatchedInference
+from tensor_array.amp import autocast, GradScaler
@@ -1,13 +1,140 @@
+"""
+# src/tensor_array/activation.py
+# This module provides activation functions for tensors.
+# Each activation runs as a single native pass over the input. In grad mode the pass also writes the
+# derivative, which two library ops connect to autograd; relu and leaky_relu then take a comparison
+# and a condition op instead, which move less memory.
+# The functions with a trailing underscore overwrite their input and are meant for inference inside no_grad().
+"""
+
 from tensor_array.core import Tensor
-from tensor_array.core import zeros
-from tensor_array.core import condition
 
 def relu(input: Tensor) -> Tensor:
-    tensor_zeros = zeros(shape = input.shape(), dtype = input.dtype())
-    return condition(input > tensor_zeros, input, tensor_zeros)
+    """
+    Applies the rectified linear unit max(input, 0) element-wise.
+    Args:
+        input (Tensor): The input tensor.
+    Returns:
+        Tensor: A tensor with the activation of each element of input.
+    """
+    from tensor_array.tensor2 import relu as _relu
+    return _relu(input)
+
+def leaky_relu(input: Tensor, negative_slope: float = 0.01) -> Tensor:
+    """
+    Applies the leaky rectified linear unit element-wise.
+    Args:
+        input (Tensor): The input tensor.
+        negative_slope (float): The slope used for negative elements.
+    Returns:
+        Tensor: A tensor with the activation of each element of input.
+    """
+    from tensor_array.tensor2 import leaky_relu as _leaky_relu
+    return _leaky_relu(input, negative_slope)
+
+def gelu(input: Tensor, approximate: str = "none") -> Tensor:
+    """
+    Applies the Gaussian error linear unit element-wise.
+    Args:
+        input (Tensor): The input tensor.
+        approximate (str): "none" for the exact erf formulation, "tanh" for the tanh approximation.
+    Returns:
+        Tensor: A tensor with the activation of each element of input.
+    """
+    from tensor_array.tensor2 import gelu as _gelu
+    return _gelu(input, approximate)
+
+def silu(input: Tensor) -> Tensor:
+    """
+    Applies the sigmoid linear unit input * sigmoid(input) element-wise.
+    Args:
+        input (Tensor): The input tensor.
+    Returns:
+        Tensor: A tensor with the activation of each element of input.
+    """
+    from tensor_array.tensor2 import silu as _silu
+    return _silu(input)
 
 def sigmoid(input: Tensor) -> Tensor:
-    return input.sigmoid()
+    """
+    Applies the logistic sigmoid element-wise.
+    Args:
+        input (Tensor): The input tensor.
+    Returns:
+        Tensor: A tensor with the activation of each element of input.
+    """
+    from tensor_array.tensor2 import sigmoid as _sigmoid
+    return _sigmoid(input)
 
 def softmax(input: Tensor, dim: int = 0) -> Tensor:
-    return input.softmax(dim)
+    """
+    Applies a numerically stable softmax along a dimension.
+    Args:
+        input (Tensor): The input tensor.
+        dim (int): The dimension along which the softmax is computed, negative values count from the end.
+    Returns:
+        Tensor: A tensor of the same shape as input whose slices along dim sum to 1.
+    """
+    from tensor_array.tensor2 import softmax as _softmax
+    return _softmax(input, dim)
+
+def log_softmax(input: Tensor, dim: int = 0) -> Tensor:
+    """
+    Applies a numerically stable logarithm of the softmax along a dimension.
+    Args:
+        input (Tensor): The input tensor.
+        dim (int): The dimension along which the softmax is computed, negative values count from the end.
+    Returns:
+        Tensor: A tensor of the same shape as input with the log-probabilities along dim.
+    """
+    from tensor_array.tensor2 import log_softmax as _log_softmax
+    return _log_softmax(input, dim)
+
+def relu_(input: Tensor) -> Tensor:
+    """
+    In-place version of relu(), only available inside no_grad().
+    """
+    from tensor_array.tensor2 import relu_ as _relu_
+    return _relu_(input)
+
+def leaky_relu_(input: Tensor, negative_slope: float = 0.01) -> Tensor:
+    """
+    In-place version of leaky_relu(), only available inside no_grad().
+    """
+    from tensor_array.tensor2 import leaky_relu_ as _leaky_relu_
+    return _leaky_relu_(input, negative_slope)
+
+def gelu_(input: Tensor, approximate: str = "none") -> Tensor:
+    """
+    In-place version of gelu(), only available inside no_grad().
+    """
+    from tensor_array.tensor2 import gelu_ as _gelu_
+    return _gelu_(input, approximate)
+
+def silu_(input: Tensor) -> Tensor:
+    """
+    In-place version of silu(), only available inside no_grad().
+    """
+    from tensor_array.tensor2 import silu_ as _silu_
+    return _silu_(input)
+
+def sigmoid_(input: Tensor) -> Tensor:
+    """
+    In-place version of sigmoid(), only available inside no_grad().
+    """
+    from tensor_array.tensor2 import sigmoid_ as _sigmoid_
+    return _sigmoid_(input)
+
+def softmax_(input: Tensor, dim: int = 0) -> Tensor:
+    """
+    In-place version of softmax(), only available inside no_grad().
+    """
+    from tensor_array.tensor2 import softmax_ as _softmax_
+    return _softmax_(input, dim)
+
+def log_softmax_(input: Tensor, dim: int = 0) -> Tensor:
+    """
+    In-place version of log_softmax(), only available inside no_grad().
+    """
+    from tensor_array.tensor2 import log_softmax_ as _log_softmax_
+    return _log_softmax_(input, dim)
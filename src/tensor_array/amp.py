@@ -0,0 +1,278 @@
+"""
+# src/tensor_array/amp.py
+# This module runs models in mixed precision.
+# Inside autocast, matmul, Linear, attention and elementwise ops run in HALF or BFLOAT16, which halves the memory
+# read for weights and activations, while reductions, softmax and normalization take their inputs in FLOAT.
+# Parameters stay FLOAT and are the master weights the optimizer updates, their reduced precision copies
+# being cast once per autocast region and optimizer step. GradScaler scales the loss so that small HALF gradients do not flush to zero.
+"""
+
+import functools
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+from tensor_array.core import Tensor
+from tensor_array.core import DataTypes
+from tensor_array.core import no_grad
+from tensor_array.core import is_grad_enabled
+
+_local = threading.local()
+# Bumped whenever parameters change, the casts of every thread made before it are dropped.
+_generation = 0
+
+def _parameter_casts() -> Dict[Tuple[int, DataTypes, bool], Tuple[Tensor, Tensor]]:
+    if getattr(_local, 'generation', None) != _generation:
+        _local.casts = {}
+        _local.generation = _generation
+    return _local.casts
+
+def invalidate_parameter_casts() -> None:
+    """
+    Drops the parameter casts made by cast_parameter() in every thread, so the next ones read the current values.
+    Called after every Optimizer.step() and by Layer.load_state_dict(); call it after other in-place updates of parameters.
+    """
+    global _generation
+    _generation += 1
+
+def get_autocast_dtype() -> Optional[DataTypes]:
+    """
+    Returns the reduced precision type of autocast in the current thread.
+    Returns:
+        Optional[DataTypes]: HALF or BFLOAT16 inside autocast, None outside of it.
+    """
+    from tensor_array.tensor2 import get_autocast_dtype as _get_autocast_dtype
+    dtype = _get_autocast_dtype()
+    return None if dtype is None else DataTypes(dtype)
+
+def is_autocast_enabled() -> bool:
+    """
+    Checks if the current thread runs inside autocast.
+    Returns:
+        bool: True inside an enabled autocast, False otherwise.
+    """
+    return get_autocast_dtype() is not None
+
+class autocast:
+    """
+    Context manager and decorator that runs tensor operations in mixed precision.
+    The mode is thread-local and the previous mode is restored on exit. Parameter casts made by cast_parameter()
+    are reused until the outermost autocast exits or an optimizer step updates the parameters,
+    so one region can span a whole training loop.
+    Example:
+        with autocast(DataTypes.BFLOAT16):
+            for input in batches:
+                loss = model(input).mean()
+                loss.calc_grad(inputs = params)
+                optimizer.step()
+    """
+
+    def __init__(self, dtype: DataTypes = DataTypes.BFLOAT16, enabled: bool = True) -> None:
+        """
+        Initializes the context manager.
+        Args:
+            dtype (DataTypes): The reduced precision type, BFLOAT16 or HALF. HALF needs a GradScaler to train.
+            enabled (bool): False to run in full precision, for example inside an outer autocast.
+        Raises:
+            ValueError: If dtype is neither HALF nor BFLOAT16.
+        """
+        if dtype not in (DataTypes.HALF, DataTypes.BFLOAT16):
+            raise ValueError(f"autocast runs in HALF or BFLOAT16, got {dtype}")
+        self.dtype = dtype
+        self.enabled = enabled
+        self.prev = []
+
+    def __enter__(self) -> None:
+        from tensor_array.tensor2 import get_autocast_dtype as _get_autocast_dtype
+        from tensor_array.tensor2 import set_autocast_dtype as _set_autocast_dtype
+        self.prev.append(_get_autocast_dtype())
+        _set_autocast_dtype(self.dtype.value if self.enabled else None)
+        _local.depth = getattr(_local, 'depth', 0) + 1
+
+    def __exit__(self, *args: Any) -> None:
+        from tensor_array.tensor2 import set_autocast_dtype as _set_autocast_dtype
+        _set_autocast_dtype(self.prev.pop())
+        _local.depth -= 1
+        if _local.depth == 0:
+            _parameter_casts().clear()
+
+    def __call__(self, func: Callable) -> Callable:
+        """
+        Decorates a function so that it runs in this autocast mode.
+        Args:
+            func (Callable): The function to decorate.
+        Returns:
+            Callable: The decorated function.
+        """
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwds: Any) -> Any:
+            with autocast(self.dtype, self.enabled):
+                return func(*args, **kwds)
+        return wrapper
+
+def cast_parameter(param: Tensor) -> Tensor:
+    """
+    Returns a FLOAT parameter in the reduced precision type of autocast, cast once per autocast region and optimizer step.
+    The cast is recorded by autograd in grad mode, so the gradients reach the FLOAT parameter.
+    Args:
+        param (Tensor): The parameter.
+    Returns:
+        Tensor: The cast parameter inside autocast, param itself outside of it or if it is not FLOAT.
+    """
+    dtype = get_autocast_dtype()
+    if dtype is None or DataTypes(param.dtype()) != DataTypes.FLOAT:
+        return param
+    # Casts made without grad are detached, so they are kept apart from the recorded ones.
+    key = (id(param), dtype, is_grad_enabled())
+    casts = _parameter_casts()
+    entry = casts.get(key)
+    if entry is None:
+        # The parameter is kept with its cast so that its id is not reused while the entry lives.
+        entry = casts[key] = (param, param.cast(dtype.value))
+    return entry[1]
+
+class GradScaler:
+    """
+    Dynamic loss scaling for training in HALF.
+    The loss is multiplied by a scale before calc_grad, so that small gradients stay representable in HALF,
+    and the gradients are divided by it before the step. A step whose gradients are not finite is skipped
+    and the scale backed off; after growth_interval finite steps in a row the scale grows.
+    BFLOAT16 has the exponent range of FLOAT and trains without scaling.
+    Example:
+        scaler = GradScaler()
+        with autocast(DataTypes.HALF):
+            loss = model(input).mean()
+        scaler.scale(loss).calc_grad(inputs = params)
+        scaler.step(optimizer)
+        scaler.update()
+    """
+
+    def __init__(
+            self,
+            init_scale: float = 2.0 ** 16,
+            growth_factor: float = 2.0,
+            backoff_factor: float = 0.5,
+            growth_interval: int = 2000,
+            enabled: bool = True
+            ) -> None:
+        """
+        Initializes the scaler.
+        Args:
+            init_scale (float): The first scale.
+            growth_factor (float): The factor the scale grows by.
+            backoff_factor (float): The factor the scale shrinks by after a step with gradients that are not finite.
+            growth_interval (int): The number of finite steps in a row after which the scale grows.
+            enabled (bool): False to make every method a pass-through, for running the same loop in full precision.
+        Raises:
+            ValueError: If growth_factor is not above 1 or backoff_factor is not in (0, 1).
+        """
+        if growth_factor <= 1.0:
+            raise ValueError(f"growth_factor must be above 1, got {growth_factor}")
+        if not 0.0 < backoff_factor < 1.0:
+            raise ValueError(f"backoff_factor must be between 0 and 1, got {backoff_factor}")
+        self.scale_value = float(init_scale)
+        self.growth_factor = growth_factor
+        self.backoff_factor = backoff_factor
+        self.growth_interval = growth_interval
+        self.enabled = enabled
+        self._growth_tracker = 0
+        self._found_inf = False
+        self._unscaled = set()
+
+    def get_scale(self) -> float:
+        """
+        Returns:
+            float: The current scale, 1.0 if the scaler is disabled.
+        """
+        return self.scale_value if self.enabled else 1.0
+
+    def scale(self, loss: Tensor) -> Tensor:
+        """
+        Multiplies the loss by the scale.
+        Args:
+            loss (Tensor): The loss, computed inside or outside autocast.
+        Returns:
+            Tensor: The scaled loss, in FLOAT, to call calc_grad() on.
+        """
+        if not self.enabled:
+            return loss
+        if DataTypes(loss.dtype()) in (DataTypes.HALF, DataTypes.BFLOAT16):
+            loss = loss.cast(DataTypes.FLOAT.value)
+        return loss * self.scale_value
+
+    def unscale_(self, optimizer: Any) -> None:
+        """
+        Divides the gradients of the parameters of optimizer by the scale in place, and checks that they are finite.
+        Called by step() if it was not called before, call it first to clip or inspect the gradients.
+        Args:
+            optimizer (Any): The optimizer, whose grads() gives the gradients of each group.
+        Raises:
+            RuntimeError: If the gradients of optimizer were already unscaled since the last update().
+        """
+        if not self.enabled:
+            return
+        if id(optimizer) in self._unscaled:
+            raise RuntimeError("unscale_() was already called on this optimizer since the last update()")
+        inv_scale = 1.0 / self.scale_value
+        with no_grad():
+            for group in optimizer.param_groups:
+                for param, grad in zip(group['params'], optimizer.grads(group)):
+                    if getattr(param, 'grad', None) is None:
+                        # The gradient of the last calc_grad() is not owned by the parameter, keep the unscaled one.
+                        param.grad = grad * inv_scale
+                    else:
+                        param.grad.mul_(inv_scale)
+                    if not self._found_inf and not np.isfinite(param.grad.numpy()).all():
+                        self._found_inf = True
+        self._unscaled.add(id(optimizer))
+
+    def step(self, optimizer: Any) -> bool:
+        """
+        Unscales the gradients of optimizer if needed and updates the parameters if the gradients are finite.
+        Args:
+            optimizer (Any): The optimizer.
+        Returns:
+            bool: True if the parameters were updated, False if the step was skipped.
+        """
+        if not self.enabled:
+            optimizer.step()
+            return True
+        if id(optimizer) not in self._unscaled:
+            self.unscale_(optimizer)
+        if self._found_inf:
+            return False
+        optimizer.step()
+        return True
+
+    def update(self) -> None:
+        """
+        Adjusts the scale after the step of every optimizer: shrinks it if a gradient was not finite,
+        grows it after growth_interval finite steps in a row.
+        """
+        if not self.enabled:
+            return
+        if self._found_inf:
+            self.scale_value *= self.backoff_factor
+            self._growth_tracker = 0
+        else:
+            self._growth_tracker += 1
+            if self._growth_tracker == self.growth_interval:
+                self.scale_value *= self.growth_factor
+                self._growth_tracker = 0
+        self._found_inf = False
+        self._unscaled.clear()
+
+    def state_dict(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict[str, Any]: The scale and the number of finite steps since it last changed, to resume training.
+        """
+        return {'scale': self.scale_value, 'growth_tracker': self._growth_tracker}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        """
+        Restores the state returned by state_dict().
+        Args:
+            state (Dict[str, Any]): The state.
+        """
+        self.scale_value = float(state['scale'])
+        self._growth_tracker = int(state['growth_tracker'])
@@ -0,0 +1,109 @@
+"""
+# src/tensor_array/checkpoint.py
+# This module saves and loads checkpoints of tensors in a raw, memory-mappable format.
+# A checkpoint is a small JSON header with the name, kind, data type, shape and offset of every tensor,
+# followed by the raw buffers of the tensors, each aligned to CHECKPOINT_ALIGNMENT bytes.
+# Loading maps the file and copies each tensor out of the mapped pages in one pass, without unpickling or parsing.
+"""
+
+import json
+import mmap
+import struct
+from collections import OrderedDict
+from typing import Mapping, Union
+from tensor_array.core import Tensor
+from tensor_array.core import DataTypes
+from tensor_array.layers import Layer
+from tensor_array.layers import Parameter
+
+CHECKPOINT_MAGIC = b"TACKPT\0\0"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_ALIGNMENT = 64
+
+_DTYPE_NAMES = {
+    DataTypes.BOOL: "bool",
+    DataTypes.S_INT_8: "int8",
+    DataTypes.S_INT_16: "int16",
+    DataTypes.S_INT_32: "int32",
+    DataTypes.S_INT_64: "int64",
+    DataTypes.U_INT_8: "uint8",
+    DataTypes.U_INT_16: "uint16",
+    DataTypes.U_INT_32: "uint32",
+    DataTypes.U_INT_64: "uint64",
+    DataTypes.HALF: "float16",
+    DataTypes.FLOAT: "float32",
+    DataTypes.DOUBLE: "float64",
+}
+
+# magic, version, header length
+_PREAMBLE = struct.Struct("<8sIQ")
+
+def _align(offset: int) -> int:
+    return (offset + CHECKPOINT_ALIGNMENT - 1) // CHECKPOINT_ALIGNMENT * CHECKPOINT_ALIGNMENT
+
+def save_checkpoint(state: Union[Layer, Mapping[str, Tensor]], path: str) -> None:
+    """
+    Saves the tensors of a layer or of a state dict to a checkpoint file.
+    Args:
+        state (Union[Layer, Mapping[str, Tensor]]): A layer, whose state_dict() is saved, or a state dict.
+        path (str): The path of the checkpoint file.
+    Raises:
+        TypeError: If a tensor has a data type that can not be saved, such as BFLOAT16.
+    """
+    if isinstance(state, Layer):
+        state = state.state_dict()
+    entries = OrderedDict()
+    arrays = []
+    offset = 0
+    for name, tensor in state.items():
+        dtype = DataTypes(tensor.dtype())
+        if dtype not in _DTYPE_NAMES:
+            raise TypeError(f"can not save tensor '{name}' of type {dtype.name}")
+        array = tensor.numpy()
+        offset = _align(offset)
+        entries[name] = {
+            "kind": "parameter" if isinstance(tensor, Parameter) else "tensor",
+            "dtype": _DTYPE_NAMES[dtype],
+            "shape": list(array.shape),
+            "offset": offset,
+            "nbytes": array.nbytes,
+        }
+        arrays.append((offset, array))
+        offset += array.nbytes
+    header = json.dumps(entries).encode("utf-8")
+    data_start = _align(_PREAMBLE.size + len(header))
+    with open(path, "wb") as f:
+        f.write(_PREAMBLE.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, len(header)))
+        f.write(header)
+        for offset, array in arrays:
+            f.seek(data_start + offset)
+            f.write(memoryview(array).cast("B"))
+
+def _load_entry(mapped: mmap.mmap, data_start: int, entry: dict) -> Tensor:
+    import numpy as np
+    array = np.frombuffer(mapped, dtype = entry["dtype"], count = entry["nbytes"] // np.dtype(entry["dtype"]).itemsize, offset = data_start + entry["offset"])
+    array = array.reshape(entry["shape"])
+    return Parameter(array) if entry["kind"] == "parameter" else Tensor(array)
+
+def load_checkpoint(path: str) -> 'OrderedDict[str, Tensor]':
+    """
+    Loads the tensors of a checkpoint file saved by save_checkpoint().
+    The file is memory-mapped and every tensor is copied from its mapped pages when the file is loaded,
+    without any deserialization; the tensors do not keep the file open.
+    Args:
+        path (str): The path of the checkpoint file.
+    Returns:
+        OrderedDict[str, Tensor]: The tensors by name, Parameter for the ones saved from parameters,
+            ready for Layer.load_state_dict().
+    Raises:
+        ValueError: If the file is not a checkpoint or has an unsupported version.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mapped:
+        magic, version, header_length = _PREAMBLE.unpack_from(mapped, 0)
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError(f"'{path}' is not a tensor_array checkpoint")
+        if version != CHECKPOINT_VERSION:
+            raise ValueError(f"unsupported checkpoint version {version}")
+        entries = json.loads(mapped[_PREAMBLE.size:_PREAMBLE.size + header_length].decode("utf-8"))
+        data_start = _align(_PREAMBLE.size + header_length)
+        return OrderedDict((name, _load_entry(mapped, data_start, entry)) for name, entry in entries.items())
@@ -5,6 +5,8 @@
 """
 
 from .tensor import Tensor
+from .tensor import TensorCopyWarning
 from .constants import *
 from .datatypes import DataTypes
 from .operator import *
+from .grad_mode import no_grad, enable_grad, inference_mode, set_grad_enabled, is_grad_enabled
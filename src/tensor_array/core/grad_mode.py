@@ -0,0 +1,78 @@
+"""
+# src/tensor_array/core/grad_mode.py
+# This module provides context managers and decorators to switch the recording of the autograd graph.
+# Inside no_grad or inference_mode, tensor operations do not keep their inputs alive for calc_grad,
+# so intermediate tensors are freed as soon as they are no longer referenced.
+"""
+
+import functools
+from typing import Any, Callable
+
+def is_grad_enabled() -> bool:
+    """
+    Checks if tensor operations record the autograd graph in the current thread.
+    Returns:
+        bool: True if the autograd graph is recorded, False otherwise.
+    """
+    from ..tensor2 import is_grad_enabled as _is_grad_enabled
+    return _is_grad_enabled()
+
+class set_grad_enabled:
+    """
+    Context manager and decorator that sets whether tensor operations record the autograd graph.
+    The mode is thread-local and the previous mode is restored on exit.
+    """
+
+    def __init__(self, mode: bool) -> None:
+        """
+        Initializes the context manager.
+        Args:
+            mode (bool): True to record the autograd graph, False to stop recording it.
+        """
+        self.mode = mode
+        self.prev = []
+
+    def __enter__(self) -> None:
+        from ..tensor2 import set_grad_enabled as _set_grad_enabled
+        self.prev.append(is_grad_enabled())
+        _set_grad_enabled(self.mode)
+
+    def __exit__(self, *args: Any) -> None:
+        from ..tensor2 import set_grad_enabled as _set_grad_enabled
+        _set_grad_enabled(self.prev.pop())
+
+    def __call__(self, func: Callable) -> Callable:
+        """
+        Decorates a function so that it runs in this grad mode.
+        Args:
+            func (Callable): The function to decorate.
+        Returns:
+            Callable: The decorated function.
+        """
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwds: Any) -> Any:
+            with set_grad_enabled(self.mode):
+                return func(*args, **kwds)
+        return wrapper
+
+class no_grad(set_grad_enabled):
+    """
+    Context manager and decorator that stops tensor operations from recording the autograd graph.
+    Example:
+        with no_grad():
+            output = layer(input)
+    """
+
+    def __init__(self) -> None:
+        super().__init__(False)
+
+class enable_grad(set_grad_enabled):
+    """
+    Context manager and decorator that makes tensor operations record the autograd graph,
+    also inside a no_grad block.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(True)
+
+inference_mode = no_grad
@@ -1,80 +1,149 @@
 """
 # src/tensor_array/core/operator.py
 # This module provides various mathematical operations for tensors, including addition, division, multiplication, power, matrix multiplication, and conditional selection.
-# Each operation is implemented as a function that takes two tensors as input and returns a new tensor representing the result of the operation.
+# Each operation is implemented as a function that takes two tensors as input and returns a new tensor representing the result of the operation,
+# or writes it to a preallocated tensor passed as out, so loops can reuse their buffers.
+# Autograd can not tell whether a recorded graph reads out, so out is refused in grad mode for every tensor,
+# including accumulators no graph reads; keep such writes inside no_grad().
 """
 
+from typing import Optional, Union
 from .tensor import Tensor
 
-def add(value_1 : Tensor, value_2 : Tensor) -> Tensor:
+def add(value_1 : Tensor, value_2 : Union[Tensor, int, float, bool], out : Optional[Tensor] = None) -> Tensor:
     """
     Adds two tensors element-wise.
     Args:
         value_1 (Tensor): The first tensor.
-        value_2 (Tensor): The second tensor.
+        value_2 (Union[Tensor, int, float, bool]): The second tensor, or a number with out.
+        out (Optional[Tensor]): A CPU tensor of the type and broadcast shape of the result to write it to in place,
+            instead of allocating a new tensor. Only allowed inside no_grad(), as the write is not recorded by autograd.
     Returns:
-        Tensor: A tensor that is the element-wise sum of value_1 and value_2
+        Tensor: A tensor that is the element-wise sum of value_1 and value_2, out if it is given.
+    Raises:
+        RuntimeError: If out is given in grad mode.
+        TypeError: If out does not have the type of the result.
+        ValueError: If out does not have the shape of the result.
     """
+    if out is not None:
+        from ..tensor2 import add_out as _add_out
+        _add_out(value_1, value_2, out)
+        return out
     from ..tensor2 import add as _add
     return _add(value_1, value_2)
 
-def divide(value_1 : Tensor, value_2 : Tensor) -> Tensor:
+def divide(value_1 : Tensor, value_2 : Union[Tensor, int, float, bool], out : Optional[Tensor] = None) -> Tensor:
     """
     Divides two tensors element-wise.
     Args:
         value_1 (Tensor): The first tensor.
-        value_2 (Tensor): The second tensor.
+        value_2 (Union[Tensor, int, float, bool]): The second tensor, or a number with out.
+        out (Optional[Tensor]): A CPU tensor of the type and broadcast shape of the result to write it to in place,
+            instead of allocating a new tensor. Only allowed inside no_grad(), as the write is not recorded by autograd.
     Returns:
-        Tensor: A tensor that is the element-wise division of value_1 by value_2
+        Tensor: A tensor that is the element-wise division of value_1 by value_2, out if it is given.
+    Raises:
+        RuntimeError: If out is given in grad mode.
+        TypeError: If out does not have the type of the result.
+        ValueError: If out does not have the shape of the result.
     """
+    if out is not None:
+        from ..tensor2 import divide_out as _divide_out
+        _divide_out(value_1, value_2, out)
+        return out
     from ..tensor2 import divide as _divide
     return _divide(value_1, value_2)
 
-def multiply(value_1 : Tensor, value_2 : Tensor) -> Tensor:
+def multiply(value_1 : Tensor, value_2 : Union[Tensor, int, float, bool], out : Optional[Tensor] = None) -> Tensor:
     """
     Multiplies two tensors element-wise.
     Args:
         value_1 (Tensor): The first tensor.
-        value_2 (Tensor): The second tensor.
+        value_2 (Union[Tensor, int, float, bool]): The second tensor, or a number with out.
+        out (Optional[Tensor]): A CPU tensor of the type and broadcast shape of the result to write it to in place,
+            instead of allocating a new tensor. Only allowed inside no_grad(), as the write is not recorded by autograd.
     Returns:
-        Tensor: A tensor that is the element-wise product of value_1 and value_2
+        Tensor: A tensor that is the element-wise product of value_1 and value_2, out if it is given.
+    Raises:
+        RuntimeError: If out is given in grad mode.
+        TypeError: If out does not have the type of the result.
+        ValueError: If out does not have the shape of the result.
     """
+    if out is not None:
+        from ..tensor2 import multiply_out as _multiply_out
+        _multiply_out(value_1, value_2, out)
+        return out
     from ..tensor2 import multiply as _multiply
     return _multiply(value_1, value_2)
 
-def power(value_1 : Tensor, value_2 : Tensor) -> Tensor:
+def power(value_1 : Tensor, value_2 : Union[Tensor, int, float, bool], out : Optional[Tensor] = None) -> Tensor:
     """
     Raises the first tensor to the power of the second tensor element-wise.
     Args:
         value_1 (Tensor): The base tensor.
-        value_2 (Tensor): The exponent tensor.
+        value_2 (Union[Tensor, int, float, bool]): The exponent tensor, or a number with out.
+        out (Optional[Tensor]): A CPU tensor of the type and broadcast shape of the result to write it to in place,
+            instead of allocating a new tensor. Only allowed inside no_grad(), as the write is not recorded by autograd.
     Returns:
-        Tensor: A tensor that is the element-wise result of value_1 raised to the power of value_2
+        Tensor: A tensor that is the element-wise result of value_1 raised to the power of value_2, out if it is given.
+    Raises:
+        RuntimeError: If out is given in grad mode.
+        TypeError: If out does not have the type of the result.
+        ValueError: If out does not have the shape of the result.
     """
+    if out is not None:
+        from ..tensor2 import power_out as _power_out
+        _power_out(value_1, value_2, out)
+        return out
     from ..tensor2 import power as _power
     return _power(value_1, value_2)
 
-def matmul(value_1 : Tensor, value_2 : Tensor) -> Tensor:
+def matmul(value_1 : Tensor, value_2 : Tensor, transpose_1 : bool = False, transpose_2 : bool = False, out : Optional[Tensor] = None) -> Tensor:
     """
     Performs matrix multiplication between two tensors.
+    The leading (batch) dimensions are broadcast against each other.
     Args:
         value_1 (Tensor): The first tensor.
         value_2 (Tensor): The second tensor.
+        transpose_1 (bool): Multiply by the transpose of the last two dimensions of value_1, without copying it.
+        transpose_2 (bool): Multiply by the transpose of the last two dimensions of value_2, without copying it.
+        out (Optional[Tensor]): A FLOAT or DOUBLE CPU tensor of the shape of the result to write it to in place,
+            other than value_1 and value_2. Only allowed inside no_grad().
     Returns:
-        Tensor: A tensor that is the result of matrix multiplication between value_1 and value_2
+        Tensor: A tensor that is the result of matrix multiplication between value_1 and value_2, out if it is given.
+    Raises:
+        RuntimeError: If out is given in grad mode.
+        TypeError: If out does not have the type of the result.
+        ValueError: If an operand to transpose has fewer than 2 dimensions,
+            or out does not have the shape of the result or is one of the operands.
     """
+    if out is not None:
+        from ..tensor2 import matmul_out as _matmul_out
+        _matmul_out(value_1, value_2, transpose_1, transpose_2, out)
+        return out
     from ..tensor2 import matmul as _matmul
-    return _matmul(value_1, value_2)
+    return _matmul(value_1, value_2, transpose_1, transpose_2)
 
-def condition(condition_value : Tensor, value_if_true : Tensor, value_if_false : Tensor) -> Tensor:
+def condition(condition_value : Tensor, value_if_true : Union[Tensor, int, float, bool], value_if_false : Union[Tensor, int, float, bool], out : Optional[Tensor] = None) -> Tensor:
     """
     Chooses between two tensors based on a condition tensor.
+    The three operands are broadcast together, numbers being read in place instead of expanded to a full tensor.
     Args:
         condition_value (Tensor): The condition tensor.
-        value_if_true (Tensor): The tensor to return if the condition is true.
-        value_if_false (Tensor): The tensor to return if the condition is false.
+        value_if_true (Union[Tensor, int, float, bool]): The tensor or number to return if the condition is true.
+        value_if_false (Union[Tensor, int, float, bool]): The tensor or number to return if the condition is false.
+        out (Optional[Tensor]): A CPU tensor of the broadcast shape of the operands to write the result to in place,
+            numbers taking its type. Only allowed inside no_grad().
     Returns:
-        Tensor: A tensor that is either value_if_true or value_if_false, depending on the condition.
+        Tensor: A tensor that is either value_if_true or value_if_false, depending on the condition, out if it is given.
+    Raises:
+        RuntimeError: If out is given in grad mode.
+        TypeError: If condition_value is not BOOL or a tensor operand does not have the type of out.
+        ValueError: If out does not have the shape of the result.
     """
+    if out is not None:
+        from ..tensor2 import condition_out as _condition_out
+        _condition_out(condition_value, value_if_true, value_if_false, out)
+        return out
     from ..tensor2 import condition as _condition
     return _condition(condition_value, value_if_true, value_if_false)
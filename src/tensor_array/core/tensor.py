@@ -5,9 +5,51 @@
 """
 
 from __future__ import annotations
+from typing import Iterable, Optional, Sequence, Union
+import warnings
 from ..tensor2 import Tensor as _Tensor
+from ..tensor2 import set_calc_grad_hook as _set_calc_grad_hook
 from .datatypes import DataTypes
 
+class TensorCopyWarning(UserWarning):
+    """
+    Warning emitted when the source of a Tensor is not C-contiguous, so its data is copied twice:
+    compacted into a contiguous array first, then copied into the storage of the tensor like any source.
+    """
+    pass
+
+def _as_array(value, copy: Optional[bool]):
+    """
+    Converts a value accepted by the Tensor constructor to a NumPy array without copying if possible.
+    Args:
+        value: A NumPy array, an object implementing __dlpack__, or a Python scalar or sequence.
+        copy (Optional[bool]): If False, raise instead of compacting a non-contiguous array.
+    Returns:
+        numpy.ndarray: An array that shares memory with value whenever its layout allows it.
+    """
+    import numpy as np
+    if not isinstance(value, np.ndarray):
+        if hasattr(value, '__dlpack__'):
+            value = np.from_dlpack(value)
+        else:
+            value = np.asarray(value)
+            # Python numbers keep mapping to the default integer and float types of the library.
+            if value.dtype == np.int64:
+                value = value.astype(np.int32)
+            elif value.dtype == np.float64:
+                value = value.astype(np.float32)
+            return value
+    if not value.flags.c_contiguous:
+        if copy is False:
+            raise ValueError("the array is not C-contiguous, it has to be compacted before being copied into the Tensor")
+        warnings.warn(
+            f"creating a Tensor from a non-contiguous array of shape {value.shape} compacts the data before copying it into the tensor",
+            TensorCopyWarning,
+            stacklevel=3
+            )
+        value = np.ascontiguousarray(value)
+    return value
+
 class Tensor(_Tensor):
     """
     A class representing a multi-dimensional array (tensor) with various operations.
@@ -15,29 +57,216 @@ class Tensor(_Tensor):
     It is designed to be used in a computational graph for automatic differentiation.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, copy: Optional[bool] = None, **kwargs):
         """
         Initializes the Tensor instance.
-        """
+        Args:
+            *args: Nothing, another Tensor, or the data of the tensor.
+                The data can be a NumPy array of any data type in DataTypes, an object implementing
+                __dlpack__, or a Python scalar or sequence.
+            copy (Optional[bool]): The data is always copied into the storage of the tensor. If False,
+                raise a ValueError when it has to be compacted into a contiguous array before that copy.
+                If None, warn with TensorCopyWarning in that case.
+        """
+        if len(args) == 1 and not isinstance(args[0], _Tensor):
+            args = (_as_array(args[0], copy),)
         super().__init__(*args, **kwargs)
     
-    def transpose(self, dim0: int, dim1: int, isDevive: bool) -> Tensor:
+    def transpose(self, dim0: int, dim1: int, isDevive: bool = True) -> Tensor:
         """
         Transposes the tensor along the specified dimensions.
         Args:
             dim0 (int): The first dimension to transpose.
             dim1 (int): The second dimension to transpose.
-            isDevive (bool): Whether to perform the operation in-place on the original tensor.
+            isDevive (bool): Whether the transposition is recorded by autograd in grad mode.
         Returns:
-            Tensor: A new tensor that is the transposed version of the original tensor.
+            Tensor: A new tensor holding a transposed copy of the data of the original tensor.
         """
         return super().transpose(dim0, dim1, isDevive)
+
+    def reshape(self, shape: tuple) -> Tensor:
+        """
+        Changes the shape of the tensor, keeping the number and order of its elements.
+        Args:
+            shape (tuple): The new shape, one of its dimensions can be -1 to infer it from the others.
+        Returns:
+            Tensor: A tensor with the data of the original tensor and the new shape.
+        """
+        return super().reshape(shape)
+
+    def view(self, shape: tuple) -> Tensor:
+        """
+        Same as reshape. Tensors do not share storage, so the result is a new tensor, not a view.
+        Args:
+            shape (tuple): The new shape, one of its dimensions can be -1 to infer it from the others.
+        Returns:
+            Tensor: A new tensor with the data of the original tensor and the new shape.
+        """
+        return super().view(shape)
+
+    def permute(self, dims: Sequence[int]) -> Tensor:
+        """
+        Reorders the dimensions of the tensor.
+        Args:
+            dims (Sequence[int]): For each dimension of the result, the dimension of the tensor it comes from.
+        Returns:
+            Tensor: A new tensor holding a copy of the data, whose dimension i is dimension dims[i] of the original tensor.
+        """
+        return super().permute(list(dims))
+
+    def expand(self, shape: Sequence[int]) -> Tensor:
+        """
+        Broadcasts dimensions of size 1 to a larger size, new dimensions being added in front.
+        Args:
+            shape (Sequence[int]): The expanded shape, -1 keeps the size of an existing dimension.
+        Returns:
+            Tensor: A tensor of the expanded shape repeating the data along the broadcast dimensions.
+        """
+        return super().expand(list(shape))
+
+    def squeeze(self, dim: Optional[int] = None) -> Tensor:
+        """
+        Removes dimensions of size 1.
+        Args:
+            dim (Optional[int]): The dimension to remove if its size is 1, all dimensions of size 1 if None.
+        Returns:
+            Tensor: A tensor with the data of the original tensor without those dimensions.
+        """
+        return super().squeeze(dim)
+
+    def unsqueeze(self, dim: int) -> Tensor:
+        """
+        Inserts a dimension of size 1.
+        Args:
+            dim (int): The position of the new dimension in the result.
+        Returns:
+            Tensor: A tensor with the data of the original tensor and one more dimension.
+        """
+        return super().unsqueeze(dim)
+
+    def contiguous(self) -> Tensor:
+        """
+        A no-op kept for code written against strided tensors: transpose, permute, slicing and the other
+        shape ops copy their result into a new contiguous buffer, so every tensor is already contiguous.
+        Returns:
+            Tensor: The tensor itself.
+        """
+        return super().contiguous()
+
+    def is_contiguous(self) -> bool:
+        """
+        A no-op kept for code written against strided tensors, see contiguous().
+        Returns:
+            bool: Always True, every tensor has a contiguous row-major buffer.
+        """
+        return super().is_contiguous()
+
+    def sum(self, dim: Union[int, Sequence[int], None] = None, keepdim: bool = False, dtype: Optional[DataTypes] = None) -> Tensor:
+        """
+        Sums the elements over the given dimensions.
+        Float sums are compensated, so their error does not grow with the number of elements,
+        and HALF and BFLOAT16 tensors are accumulated in FLOAT.
+        Args:
+            dim (Union[int, Sequence[int], None]): The dimension or dimensions to reduce, all of them if None.
+            keepdim (bool): Whether the reduced dimensions are kept with size 1.
+            dtype (Optional[DataTypes]): The type of the result. By default the type of the tensor,
+                S_INT_64 or U_INT_64 for integer tensors. FLOAT keeps the accumulator of 16-bit floats.
+        Returns:
+            Tensor: The sums, with the reduced dimensions removed unless keepdim is True.
+        """
+        return super().sum(dim, keepdim, dtype)
+
+    def mean(self, dim: Union[int, Sequence[int], None] = None, keepdim: bool = False, dtype: Optional[DataTypes] = None) -> Tensor:
+        """
+        Averages the elements over the given dimensions, accumulated like sum().
+        Args:
+            dim (Union[int, Sequence[int], None]): The dimension or dimensions to reduce, all of them if None.
+            keepdim (bool): Whether the reduced dimensions are kept with size 1.
+            dtype (Optional[DataTypes]): The type of the result. By default the type of the tensor,
+                DOUBLE for integer tensors. FLOAT keeps the accumulator of 16-bit floats.
+        Returns:
+            Tensor: The means, with the reduced dimensions removed unless keepdim is True.
+        """
+        return super().mean(dim, keepdim, dtype)
+
+    def var(self, dim: Union[int, Sequence[int], None] = None, correction: int = 1, keepdim: bool = False) -> Tensor:
+        """
+        Computes the variance of the elements over the given dimensions.
+        The squared deviations are summed around the mean of a first pass, which avoids the cancellation
+        of the sum of squares formula.
+        Args:
+            dim (Union[int, Sequence[int], None]): The dimension or dimensions to reduce, all of them if None.
+            correction (int): The sum of squared deviations is divided by n - correction, 1 for the unbiased estimate.
+            keepdim (bool): Whether the reduced dimensions are kept with size 1.
+        Returns:
+            Tensor: The variances, in the type of mean().
+        """
+        return super().var(dim, correction, keepdim)
+
+    def max(self, dim: Union[int, Sequence[int], None] = None, keepdim: bool = False) -> Tensor:
+        """
+        Takes the maximum of the elements over the given dimensions, NaN being the maximum of any slice containing it.
+        Args:
+            dim (Union[int, Sequence[int], None]): The dimension or dimensions to reduce, all of them if None.
+            keepdim (bool): Whether the reduced dimensions are kept with size 1.
+        Returns:
+            Tensor: The maxima, in the type of the tensor. The gradient goes to the first maximum of each slice.
+        Raises:
+            ValueError: If a reduced dimension is empty.
+        """
+        return super().max(dim, keepdim)
+
+    def min(self, dim: Union[int, Sequence[int], None] = None, keepdim: bool = False) -> Tensor:
+        """
+        Takes the minimum of the elements over the given dimensions, NaN being the minimum of any slice containing it.
+        Args:
+            dim (Union[int, Sequence[int], None]): The dimension or dimensions to reduce, all of them if None.
+            keepdim (bool): Whether the reduced dimensions are kept with size 1.
+        Returns:
+            Tensor: The minima, in the type of the tensor. The gradient goes to the first minimum of each slice.
+        Raises:
+            ValueError: If a reduced dimension is empty.
+        """
+        return super().min(dim, keepdim)
+
+    def argmax(self, dim: Optional[int] = None, keepdim: bool = False) -> Tensor:
+        """
+        Finds the index of the first maximum along a dimension.
+        Args:
+            dim (Optional[int]): The dimension to search, or None for the index in the flattened tensor.
+            keepdim (bool): Whether the searched dimension is kept with size 1.
+        Returns:
+            Tensor: The S_INT_64 indices, which have no gradient.
+        Raises:
+            ValueError: If the searched dimension is empty.
+        """
+        return super().argmax(dim, keepdim)
+
+    def argmin(self, dim: Optional[int] = None, keepdim: bool = False) -> Tensor:
+        """
+        Finds the index of the first minimum along a dimension.
+        Args:
+            dim (Optional[int]): The dimension to search, or None for the index in the flattened tensor.
+            keepdim (bool): Whether the searched dimension is kept with size 1.
+        Returns:
+            Tensor: The S_INT_64 indices, which have no gradient.
+        Raises:
+            ValueError: If the searched dimension is empty.
+        """
+        return super().argmin(dim, keepdim)
     
-    def calc_grad(self) -> None:
+    def calc_grad(self, retain_graph: bool = False, inputs: Optional[Iterable[Tensor]] = None, accumulate: bool = True) -> None:
         """
         Calculates the gradient of the tensor with respect to its inputs.
+        Args:
+            retain_graph (bool): If False, release the recorded graph once the gradients are computed,
+                so the intermediate tensors are freed and calc_grad cannot be called on this tensor again.
+            inputs (Optional[Iterable[Tensor]]): Parameters whose grad receives the computed gradient.
+            accumulate (bool): If True, add the gradients to the current grad of the inputs, otherwise overwrite it.
+        Raises:
+            RuntimeError: If the graph contains checkpointed calls and inputs is None.
         """
-        super().calc_grad()
+        super().calc_grad(retain_graph, inputs, accumulate)
     
     def get_grad(self) -> Tensor:
         """
@@ -124,15 +353,40 @@ class Tensor(_Tensor):
         """
         return super().cast(dtype)
     
-    def numpy(self):
+    def numpy(self, copy: bool = False):
         """
         Converts the tensor to a NumPy array.
+        Args:
+            copy (bool): If True, the returned array owns a copy of the data.
         Returns:
             numpy.ndarray: A NumPy array containing the data of the tensor.
-        This method allows for easy interoperability with NumPy, enabling the use of NumPy functions and operations on the tensor data.
-        Note: This method does not perform any operations on the tensor; it simply returns a NumPy array representation of the tensor.
+        For CPU tensors the returned array is a read-only view that shares the storage of the tensor
+        and keeps it alive, so no data is copied. Tensors on other devices are copied to the host once.
+        Pass copy=True to get a writable array that is independent of the tensor.
+        """
+        return super().numpy(copy)
+
+    def __array__(self, dtype=None, copy=None):
         """
-        return super().numpy()
+        Converts the tensor to a NumPy array, used by numpy.asarray and numpy.array.
+        Args:
+            dtype: The NumPy data type of the result, or None to keep the data type of the tensor.
+            copy (bool): If True, always copy the data. If None, only copy when it is needed.
+                If False, never copy the data.
+        Returns:
+            numpy.ndarray: A NumPy array containing the data of the tensor.
+        Raises:
+            ValueError: If copy is False and the tensor is not on the CPU or dtype needs a conversion.
+        """
+        # __array_interface__ is only available for CPU tensors, whose storage the array can view.
+        if copy is False and not hasattr(self, "__array_interface__"):
+            raise ValueError("a tensor that is not on the CPU can not be converted to a NumPy array without a copy")
+        array = super().numpy(bool(copy))
+        if dtype is not None and array.dtype != dtype:
+            if copy is False:
+                raise ValueError(f"converting a tensor of {array.dtype} to {dtype} needs a copy")
+            array = array.astype(dtype)
+        return array
     
     def shape(self) -> tuple:
         """
@@ -158,9 +412,10 @@ class Tensor(_Tensor):
         """
         Gets an item or a slice from the tensor.
         Args:
-            item: The index or slice to retrieve.
+            item: An index, a slice or a tuple of them, indices removing their dimension.
+                Slices can have any step, including negative ones.
         Returns:
-            Tensor: A new tensor that is a view of the original tensor at the specified index or slice.
+            Tensor: A new tensor holding a copy of the elements at the specified index or slice.
         """
         return super().__getitem__(item)
     
@@ -188,60 +443,183 @@ class Tensor(_Tensor):
         """
         return super().__repr__()
     
-    def __add__(self, other: Tensor) -> Tensor:
+    def __add__(self, other: Union[Tensor, int, float, bool]) -> Tensor:
         """
         Adds two tensors element-wise.
         Args:
-            other (Tensor): The tensor to add to the current tensor.
+            other (Union[Tensor, int, float, bool]): The tensor or number to add to the current tensor.
+                Tensors are broadcast against each other, numbers are never expanded to a full tensor.
         Returns:
             Tensor: A new tensor that is the element-wise sum of the current tensor and the other tensor.
         This method does not modify the original tensors; it returns a new tensor with the result of the addition.
         """
         return super().__add__(other)
 
-    def __sub__(self, other: Tensor) -> Tensor:
+    def __sub__(self, other: Union[Tensor, int, float, bool]) -> Tensor:
         """
         Subtracts two tensors element-wise.
         Args:
-            other (Tensor): The tensor to subtract from the current tensor.
+            other (Union[Tensor, int, float, bool]): The tensor or number to subtract from the current tensor.
         Returns:
             Tensor: A new tensor that is the element-wise difference of the current tensor and the other tensor.
         This method does not modify the original tensors; it returns a new tensor with the result of the subtraction.
         """
         return super().__sub__(other)
     
-    def __mul__(self, other: Tensor) -> Tensor:
+    def __mul__(self, other: Union[Tensor, int, float, bool]) -> Tensor:
         """
         Multiplies two tensors element-wise.
         Args:
-            other (Tensor): The tensor to multiply with the current tensor.
+            other (Union[Tensor, int, float, bool]): The tensor or number to multiply with the current tensor.
         Returns:
             Tensor: A new tensor that is the element-wise product of the current tensor and the other tensor.
         This method does not modify the original tensors; it returns a new tensor with the result of the multiplication.
         """
         return super().__mul__(other)
     
-    def __truediv__(self, other: Tensor) -> Tensor:
+    def __truediv__(self, other: Union[Tensor, int, float, bool]) -> Tensor:
         """
         Divides two tensors element-wise.
         Args:
-            other (Tensor): The tensor to divide the current tensor by.
+            other (Union[Tensor, int, float, bool]): The tensor or number to divide the current tensor by.
         Returns:
             Tensor: A new tensor that is the element-wise quotient of the current tensor and the other tensor.
         This method does not modify the original tensors; it returns a new tensor with the result of the division.
         """
         return super().__truediv__(other)
     
-    def __pow__(self, other: Tensor) -> Tensor:
+    def __radd__(self, other: Union[int, float, bool]) -> Tensor:
+        """
+        Adds the tensor to a number element-wise, for number + tensor.
+        Args:
+            other (Union[int, float, bool]): The number on the left of the operator.
+        Returns:
+            Tensor: A new tensor that is the element-wise sum of other and the current tensor.
+        """
+        return super().__radd__(other)
+
+    def __rsub__(self, other: Union[int, float, bool]) -> Tensor:
+        """
+        Subtracts the tensor from a number element-wise, for number - tensor.
+        Args:
+            other (Union[int, float, bool]): The number on the left of the operator.
+        Returns:
+            Tensor: A new tensor that is the element-wise difference of other and the current tensor.
+        """
+        return super().__rsub__(other)
+
+    def __rmul__(self, other: Union[int, float, bool]) -> Tensor:
+        """
+        Multiplies a number by the tensor element-wise, for number * tensor.
+        Args:
+            other (Union[int, float, bool]): The number on the left of the operator.
+        Returns:
+            Tensor: A new tensor that is the element-wise product of other and the current tensor.
+        """
+        return super().__rmul__(other)
+
+    def __rtruediv__(self, other: Union[int, float, bool]) -> Tensor:
+        """
+        Divides a number by the tensor element-wise, for number / tensor.
+        Args:
+            other (Union[int, float, bool]): The number on the left of the operator.
+        Returns:
+            Tensor: A new tensor that is the element-wise quotient of other and the current tensor.
+        """
+        return super().__rtruediv__(other)
+
+    def __pow__(self, other: Union[Tensor, int, float, bool]) -> Tensor:
         """
         Raises the current tensor to the power of another tensor element-wise.
         Args:
-            other (Tensor): The tensor representing the exponent.
+            other (Union[Tensor, int, float, bool]): The tensor or number representing the exponent.
         Returns:
             Tensor: A new tensor that is the element-wise result of the current tensor raised to the power of the other tensor.
         """
         return super().__pow__(other)
-    
+
+    def __rpow__(self, other: Union[int, float, bool]) -> Tensor:
+        """
+        Raises a number to the power of the tensor element-wise, for number ** tensor.
+        Args:
+            other (Union[int, float, bool]): The base on the left of the operator.
+        Returns:
+            Tensor: A new tensor that is the element-wise result of other raised to the power of the current tensor.
+        """
+        return super().__rpow__(other)
+
+    # The in-place ops are refused in grad mode even for tensors no recorded graph reads, such as accumulators,
+    # as autograd keeps no version counter to tell them apart.
+    def add_(self, other: Union[Tensor, int, float, bool]) -> Tensor:
+        """
+        Adds other to the tensor in place.
+        Args:
+            other (Union[Tensor, int, float, bool]): A tensor broadcastable to the shape of this tensor and of its type, or a number.
+        Returns:
+            Tensor: This tensor.
+        Raises:
+            RuntimeError: In grad mode, the write is not recorded by autograd, use it inside no_grad().
+            TypeError: If other would change the type of the tensor.
+        """
+        super().add_(other)
+        return self
+
+    def sub_(self, other: Union[Tensor, int, float, bool]) -> Tensor:
+        """
+        Subtracts other from the tensor in place.
+        Args:
+            other (Union[Tensor, int, float, bool]): A tensor broadcastable to the shape of this tensor and of its type, or a number.
+        Returns:
+            Tensor: This tensor.
+        Raises:
+            RuntimeError: In grad mode, the write is not recorded by autograd, use it inside no_grad().
+            TypeError: If other would change the type of the tensor.
+        """
+        super().sub_(other)
+        return self
+
+    def mul_(self, other: Union[Tensor, int, float, bool]) -> Tensor:
+        """
+        Multiplies the tensor by other in place.
+        Args:
+            other (Union[Tensor, int, float, bool]): A tensor broadcastable to the shape of this tensor and of its type, or a number.
+        Returns:
+            Tensor: This tensor.
+        Raises:
+            RuntimeError: In grad mode, the write is not recorded by autograd, use it inside no_grad().
+            TypeError: If other would change the type of the tensor.
+        """
+        super().mul_(other)
+        return self
+
+    def div_(self, other: Union[Tensor, int, float, bool]) -> Tensor:
+        """
+        Divides the tensor by other in place.
+        Args:
+            other (Union[Tensor, int, float, bool]): A tensor broadcastable to the shape of this tensor and of its type, or a number.
+        Returns:
+            Tensor: This tensor.
+        Raises:
+            RuntimeError: In grad mode, the write is not recorded by autograd, use it inside no_grad().
+            TypeError: If other would change the type of the tensor.
+        """
+        super().div_(other)
+        return self
+
+    def pow_(self, other: Union[Tensor, int, float, bool]) -> Tensor:
+        """
+        Raises the tensor to the power of other in place.
+        Args:
+            other (Union[Tensor, int, float, bool]): A tensor broadcastable to the shape of this tensor and of its type, or a number.
+        Returns:
+            Tensor: This tensor.
+        Raises:
+            RuntimeError: In grad mode, the write is not recorded by autograd, use it inside no_grad().
+            TypeError: If other would change the type of the tensor.
+        """
+        super().pow_(other)
+        return self
+
     def __matmul__(self, other: Tensor) -> Tensor:
         """
         Performs matrix multiplication between two tensors.
@@ -253,7 +631,7 @@ class Tensor(_Tensor):
         """
         return super().__matmul__(other)
 
-    def __eq__(self, other: Tensor) -> bool:
+    def __eq__(self, other: Union[Tensor, int, float, bool]) -> Union[Tensor, bool]:
         """
         Checks if two tensors are equal.
         Args:
@@ -261,10 +639,12 @@ class Tensor(_Tensor):
         Returns:
             bool: True if the tensors are equal, False otherwise.
         This method compares the data, shape, and data type of the tensors to determine equality.
+        Compared with a number, it returns a BOOL tensor holding the element-wise comparison instead,
+        and so do the other comparison operators.
         """
         return super().__eq__(other)
     
-    def __ne__(self, other: Tensor) -> bool:
+    def __ne__(self, other: Union[Tensor, int, float, bool]) -> Union[Tensor, bool]:
         """
         Checks if two tensors are not equal.
         Args:
@@ -275,7 +655,7 @@ class Tensor(_Tensor):
         """
         return super().__ne__(other)
     
-    def __lt__(self, other: Tensor) -> bool:
+    def __lt__(self, other: Union[Tensor, int, float, bool]) -> Union[Tensor, bool]:
         """
         Checks if the current tensor is less than another tensor.
         Args:
@@ -285,7 +665,7 @@ class Tensor(_Tensor):
         """
         return super().__lt__(other)
     
-    def __le__(self, other: Tensor) -> bool:
+    def __le__(self, other: Union[Tensor, int, float, bool]) -> Union[Tensor, bool]:
         """
         Checks if the current tensor is less than or equal to another tensor.
         Args:
@@ -295,7 +675,7 @@ class Tensor(_Tensor):
         """
         return super().__le__(other)
     
-    def __gt__(self, other: Tensor) -> bool:
+    def __gt__(self, other: Union[Tensor, int, float, bool]) -> Union[Tensor, bool]:
         """
         Checks if the current tensor is greater than another tensor.
         Args:
@@ -305,7 +685,7 @@ class Tensor(_Tensor):
         """
         return super().__gt__(other)
     
-    def __ge__(self, other: Tensor) -> bool:
+    def __ge__(self, other: Union[Tensor, int, float, bool]) -> Union[Tensor, bool]:
         """
         Checks if the current tensor is greater than or equal to another tensor.
         Args:
@@ -348,3 +728,14 @@ class Tensor(_Tensor):
         This method is useful for using tensors as keys in dictionaries or sets.
         """
         return super()._hash__()
+
+def _calc_grad(tensor: _Tensor, retain_graph: bool, inputs: Optional[Iterable[Tensor]], accumulate: bool) -> None:
+    """
+    Runs calc_grad() for every tensor, registered with the native module so that the tensors returned by ops,
+    instances of the native class, take the same path. The backward pass and the collection of the gradients
+    are run by tensor_array.layers.util.checkpoint, which completes the checkpointed calls the pass reaches.
+    """
+    from tensor_array.layers.util.checkpoint import backward
+    backward(tensor, None if inputs is None else list(inputs), accumulate, retain_graph)
+
+_set_calc_grad_hook(_calc_grad)
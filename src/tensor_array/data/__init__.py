@@ -0,0 +1,6 @@
+from tensor_array.data.dataset import Dataset
+from tensor_array.data.dataset import IterableDataset
+from tensor_array.data.dataset import ArrayDataset
+from tensor_array.data.dataset import MemmapDataset
+from tensor_array.data.dataset import collate
+from tensor_array.data.dataloader import DataLoader
@@ -0,0 +1,460 @@
+"""
+# src/tensor_array/data/dataloader.py
+# This module defines DataLoader, which batches the samples of a dataset into Tensors in the background.
+# Thread workers load, collate and convert batches while the training thread computes, as the copies run without the GIL.
+# Process workers collate into blocks of shared memory, so a batch reaches the training process without pickling,
+# and only its indices and the number of its block go through the queues.
+"""
+
+import multiprocessing
+import queue
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from tensor_array.data.dataset import Dataset, IterableDataset
+from tensor_array.data.dataset import allocate_batch, collate, flatten_sample, shuffle_buffer, unflatten_sample
+
+# Blocks of shared memory hold the fields of a batch at offsets aligned to this many bytes.
+_SLOT_ALIGNMENT = 64
+# How long the training process waits on a queue before checking that the workers are alive, in seconds.
+_POLL_INTERVAL = 1.0
+
+def _to_tensors(batch: Any) -> Any:
+    """
+    Converts the arrays of a batch to Tensors, each with a single copy of its buffer.
+    """
+    from tensor_array.core import Tensor
+    leaves, structure = flatten_sample(batch)
+    return unflatten_sample(structure, [leaf if isinstance(leaf, Tensor) else Tensor(leaf) for leaf in leaves])
+
+def _matches(out: Any, sample: Any) -> bool:
+    """
+    Whether out, allocated by allocate_batch(), can hold samples shaped like sample.
+    """
+    arrays, out_structure = flatten_sample(out)
+    leaves, structure = flatten_sample(sample)
+    if structure != out_structure or len(arrays) != len(leaves):
+        return False
+    for array, leaf in zip(arrays, leaves):
+        leaf = np.asarray(leaf)
+        if array.shape[1:] != leaf.shape or array.dtype != leaf.dtype:
+            return False
+    return True
+
+def _worker_seed(seed: int, epoch: int, worker_id: int) -> int:
+    return (seed + epoch * 1000003 + worker_id * 7919) % 2 ** 32
+
+def _seed_worker(seed: int) -> None:
+    random.seed(seed)
+    np.random.seed(seed)
+
+class _SlotLayout:
+    """
+    Where the fields of a batch are in a block of shared memory.
+    Attributes:
+        structure (Any): The structure of a sample, see flatten_sample().
+        fields (List[Tuple[int, Tuple[int, ...], np.dtype]]): The offset, the shape of a sample and the data type of every field.
+        nbytes (int): The size of a block.
+    """
+
+    def __init__(self, sample: Any, batch_size: int) -> None:
+        leaves, self.structure = flatten_sample(sample)
+        self.fields = []
+        offset = 0
+        for leaf in leaves:
+            leaf = np.asarray(leaf)
+            offset = (offset + _SLOT_ALIGNMENT - 1) // _SLOT_ALIGNMENT * _SLOT_ALIGNMENT
+            self.fields.append((offset, leaf.shape, leaf.dtype))
+            offset += batch_size * leaf.nbytes
+        self.nbytes = max(offset, 1)
+        self.batch_size = batch_size
+
+    def views(self, buffer: memoryview) -> Any:
+        """
+        Returns:
+            Any: Arrays over buffer for a whole batch, in the structure of a sample.
+        """
+        arrays = [np.ndarray((self.batch_size,) + shape, dtype = dtype, buffer = buffer, offset = offset) for offset, shape, dtype in self.fields]
+        return unflatten_sample(self.structure, arrays)
+
+def _write_batch(out: Any, batch: Any) -> None:
+    """
+    Copies the fields of batch to out, unless they were already written there.
+    """
+    arrays, _ = flatten_sample(out)
+    leaves, _ = flatten_sample(batch)
+    for array, leaf in zip(arrays, leaves):
+        if not np.may_share_memory(array, leaf):
+            array[:len(leaf)] = leaf
+
+def _process_worker(dataset: Union[Dataset, IterableDataset], layout: _SlotLayout, slot_names: List[str], tasks: Any, free_slots: Any, results: Any, stop: Any, seed: int, options: Tuple[int, bool, int]) -> None:
+    """
+    The loop of a worker process. For a Dataset, tasks holds (batch index, indices, slot) and the training process
+    assigns the slots. For an IterableDataset, the worker reads its shard of the stream and takes the slots from free_slots.
+    Every batch is reported on results as (batch index, slot, number of samples), errors as (None, None, traceback).
+    """
+    worker_id, drop_last, shuffle_buffer_size = options
+    blocks = [shared_memory.SharedMemory(name = name) for name in slot_names]
+    try:
+        _seed_worker(seed)
+        outs = [layout.views(block.buf) for block in blocks]
+        if isinstance(dataset, IterableDataset):
+            samples = iter(dataset)
+            if shuffle_buffer_size > 0:
+                samples = shuffle_buffer(samples, shuffle_buffer_size, random.Random(seed))
+            batch = []
+            for sample in samples:
+                batch.append(sample)
+                if len(batch) < layout.batch_size:
+                    continue
+                slot = _take_slot(free_slots, stop)
+                if slot is None:
+                    return
+                collate(batch, outs[slot])
+                results.put((worker_id, slot, len(batch)))
+                batch = []
+            if batch and not drop_last:
+                slot = _take_slot(free_slots, stop)
+                if slot is None:
+                    return
+                collate(batch, outs[slot])
+                results.put((worker_id, slot, len(batch)))
+            results.put((worker_id, None, 0))
+        else:
+            while True:
+                task = tasks.get()
+                if task is None:
+                    return
+                batch_index, indices, slot = task
+                _write_batch(outs[slot], dataset.get_batch(indices, outs[slot]))
+                results.put((batch_index, slot, len(indices)))
+    except Exception:
+        results.put((None, None, traceback.format_exc()))
+    finally:
+        # The views must be released before the blocks can be closed.
+        outs = None
+        for block in blocks:
+            block.close()
+
+def _take_slot(free_slots: Any, stop: Any) -> Optional[int]:
+    while not stop.is_set():
+        try:
+            return free_slots.get(timeout = _POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    return None
+
+class DataLoader:
+    """
+    Iterates over a dataset in batches of Tensors.
+    A batch has the structure of a sample, every array or number of the samples becoming a Tensor with the batch as first dimension.
+    With num_workers > 0, up to num_workers * prefetch_factor batches are loaded ahead of the one being used.
+    """
+
+    def __init__(
+            self,
+            dataset: Union[Dataset, IterableDataset],
+            batch_size: int = 1,
+            shuffle: bool = False,
+            drop_last: bool = False,
+            collate_fn: Optional[Callable[[List[Any]], Any]] = None,
+            num_workers: int = 0,
+            worker_type: str = 'thread',
+            prefetch_factor: int = 2,
+            shuffle_buffer_size: int = 0,
+            seed: Optional[int] = None,
+            num_shards: int = 1,
+            shard_index: int = 0,
+            multiprocessing_context: Optional[str] = None
+            ) -> None:
+        """
+        Initializes the loader.
+        Args:
+            dataset (Union[Dataset, IterableDataset]): The samples.
+            batch_size (int): The number of samples of a batch.
+            shuffle (bool): If True, visit a Dataset in a new random order every epoch.
+            drop_last (bool): If True, skip the last batch when it has less than batch_size samples.
+            collate_fn (Optional[Callable[[List[Any]], Any]]): A function building a batch of arrays or Tensors from
+                a list of samples, instead of collate(). Not available with process workers.
+            num_workers (int): The number of workers loading batches in the background, 0 to load them on the calling thread.
+            worker_type (str): 'thread' or 'process'. Process workers need samples of fixed shapes and a picklable dataset,
+                and suit datasets whose __getitem__ holds the GIL.
+            prefetch_factor (int): The number of batches loaded ahead per worker.
+            shuffle_buffer_size (int): For an IterableDataset, shuffle the stream of every reader
+                through a buffer of this many samples, 0 to keep its order.
+            seed (Optional[int]): The seed of the shuffling and of the random generators of the workers,
+                combined with the epoch set by set_epoch(). Required to shuffle with num_shards > 1,
+                so that every shard draws the same order.
+            num_shards (int): The number of loaders splitting the dataset, such as one per training process.
+            shard_index (int): The part of the dataset read by this loader, from 0 to num_shards - 1.
+            multiprocessing_context (Optional[str]): The start method of the worker processes, the default of the platform if None.
+        Raises:
+            ValueError: If an argument is out of its range or the options do not go together.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+        if num_workers < 0:
+            raise ValueError(f"num_workers must not be negative, got {num_workers}")
+        if worker_type not in ('thread', 'process'):
+            raise ValueError(f"worker_type must be 'thread' or 'process', got {worker_type!r}")
+        if prefetch_factor < 1:
+            raise ValueError(f"prefetch_factor must be at least 1, got {prefetch_factor}")
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be in [0, {num_shards}), got {shard_index}")
+        if worker_type == 'process' and num_workers > 0 and collate_fn is not None:
+            raise ValueError("process workers collate into shared memory and do not take a collate_fn")
+        if seed is None and num_shards > 1 and (shuffle or shuffle_buffer_size > 0):
+            raise ValueError("shuffling a sharded dataset needs a seed shared by all the shards")
+        if isinstance(dataset, IterableDataset) and shuffle:
+            raise ValueError("an IterableDataset is shuffled with shuffle_buffer_size, not shuffle")
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.collate_fn = collate_fn
+        self.num_workers = num_workers
+        self.worker_type = worker_type
+        self.prefetch_factor = prefetch_factor
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.multiprocessing_context = multiprocessing_context
+        self.epoch = 0
+        self._staging = threading.local()
+
+    def set_epoch(self, epoch: int) -> None:
+        """
+        Sets the epoch the shuffling order and the seeds of the workers are drawn for.
+        Args:
+            epoch (int): The epoch.
+        """
+        self.epoch = epoch
+
+    def __len__(self) -> int:
+        """
+        Returns:
+            int: The number of batches of an epoch.
+        Raises:
+            TypeError: If the dataset is an IterableDataset, whose length is unknown.
+        """
+        if isinstance(self.dataset, IterableDataset):
+            raise TypeError("the length of a DataLoader over an IterableDataset is unknown")
+        count = len(range(self.shard_index, len(self.dataset), self.num_shards))
+        return count // self.batch_size if self.drop_last else (count + self.batch_size - 1) // self.batch_size
+
+    def batch_indices(self) -> List[np.ndarray]:
+        """
+        Returns:
+            List[np.ndarray]: The indices of the samples of every batch of the current epoch, for a Dataset.
+        """
+        order = np.arange(len(self.dataset))
+        if self.shuffle:
+            order = np.random.default_rng([self.seed, self.epoch]).permutation(order)
+        order = order[self.shard_index::self.num_shards]
+        stop = len(order) - len(order) % self.batch_size if self.drop_last else len(order)
+        return [order[i:i + self.batch_size] for i in range(0, stop, self.batch_size)]
+
+    def _stream(self, worker_id: int, num_workers: int) -> IterableDataset:
+        dataset = self.dataset
+        if self.num_shards > 1:
+            dataset = dataset.shard(self.num_shards, self.shard_index)
+        if num_workers > 1:
+            dataset = dataset.shard(num_workers, worker_id)
+        return dataset
+
+    def _collate(self, samples: List[Any]) -> Any:
+        if self.collate_fn is not None:
+            return _to_tensors(self.collate_fn(samples))
+        # Tensor() copies the batch, so the staging arrays of the thread are reused by its next batch.
+        out = getattr(self._staging, 'out', None)
+        if out is None or not _matches(out, samples[0]):
+            out = self._staging.out = allocate_batch(samples[0], self.batch_size)
+        return _to_tensors(collate(samples, out))
+
+    def _load(self, indices: np.ndarray) -> Any:
+        if self.collate_fn is not None:
+            return self._collate([self.dataset[int(index)] for index in indices])
+        sample = self.dataset[int(indices[0])]
+        out = getattr(self._staging, 'out', None)
+        if out is None or not _matches(out, sample):
+            out = self._staging.out = allocate_batch(sample, self.batch_size)
+        return _to_tensors(self.dataset.get_batch(indices, out))
+
+    def _batches_of(self, samples: Iterator[Any]) -> Iterator[Any]:
+        batch = []
+        for sample in samples:
+            batch.append(sample)
+            if len(batch) == self.batch_size:
+                yield self._collate(batch)
+                batch = []
+        if batch and not self.drop_last:
+            yield self._collate(batch)
+
+    def _samples(self, worker_id: int, num_workers: int) -> Iterator[Any]:
+        samples = iter(self._stream(worker_id, num_workers))
+        if self.shuffle_buffer_size > 0:
+            rng = random.Random(_worker_seed(self.seed, self.epoch, worker_id))
+            samples = shuffle_buffer(samples, self.shuffle_buffer_size, rng)
+        return samples
+
+    def __iter__(self) -> Iterator[Any]:
+        """
+        Returns:
+            Iterator[Any]: The batches of the current epoch. With workers, breaking out of the loop stops them.
+        """
+        if self.num_workers == 0:
+            if isinstance(self.dataset, IterableDataset):
+                return self._batches_of(self._samples(0, 1))
+            return (self._load(indices) for indices in self.batch_indices())
+        if self.worker_type == 'process':
+            return self._iter_processes()
+        if isinstance(self.dataset, IterableDataset):
+            return self._iter_thread_streams()
+        return self._iter_thread_pool()
+
+    def _iter_thread_pool(self) -> Iterator[Any]:
+        batches = self.batch_indices()
+        window = self.num_workers * self.prefetch_factor
+        with ThreadPoolExecutor(self.num_workers) as executor:
+            pending = [executor.submit(self._load, indices) for indices in batches[:window]]
+            try:
+                for i in range(len(batches)):
+                    batch = pending[i].result()
+                    pending[i] = None
+                    if i + window < len(batches):
+                        pending.append(executor.submit(self._load, batches[i + window]))
+                    yield batch
+            finally:
+                for future in pending:
+                    if future is not None:
+                        future.cancel()
+
+    def _iter_thread_streams(self) -> Iterator[Any]:
+        results = queue.Queue(self.num_workers * self.prefetch_factor)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout = _POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce(worker_id):
+            try:
+                for batch in self._batches_of(self._samples(worker_id, self.num_workers)):
+                    if not put((True, batch)):
+                        return
+                put((True, None))
+            except BaseException as error:
+                put((False, error))
+
+        threads = [threading.Thread(target = produce, args = (worker_id,), daemon = True) for worker_id in range(self.num_workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            running = self.num_workers
+            while running > 0:
+                ok, batch = results.get()
+                if not ok:
+                    raise batch
+                if batch is None:
+                    running -= 1
+                else:
+                    yield batch
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def _iter_processes(self) -> Iterator[Any]:
+        iterable = isinstance(self.dataset, IterableDataset)
+        if iterable:
+            sample = next(iter(self._stream(0, 1)), None)
+            if sample is None:
+                return
+        else:
+            batches = self.batch_indices()
+            if not batches:
+                return
+            sample = self.dataset[int(batches[0][0])]
+        layout = _SlotLayout(sample, self.batch_size)
+        context = multiprocessing.get_context(self.multiprocessing_context)
+        num_slots = self.num_workers * self.prefetch_factor
+        blocks = [shared_memory.SharedMemory(create = True, size = layout.nbytes) for _ in range(num_slots)]
+        tasks, free_slots, results, stop = context.Queue(), context.Queue(), context.Queue(), context.Event()
+        workers = []
+        outs = [layout.views(block.buf) for block in blocks]
+        try:
+            for worker_id in range(self.num_workers):
+                dataset = self._stream(worker_id, self.num_workers) if iterable else self.dataset
+                options = (worker_id, self.drop_last, self.shuffle_buffer_size)
+                worker = context.Process(
+                    target = _process_worker,
+                    args = (dataset, layout, [block.name for block in blocks], tasks, free_slots, results, stop, _worker_seed(self.seed, self.epoch, worker_id), options),
+                    daemon = True
+                    )
+                worker.start()
+                workers.append(worker)
+
+            def receive():
+                while True:
+                    try:
+                        key, slot, value = results.get(timeout = _POLL_INTERVAL)
+                    except queue.Empty:
+                        if any(worker.exitcode not in (None, 0) for worker in workers):
+                            raise RuntimeError("a DataLoader worker process exited unexpectedly")
+                        continue
+                    if key is None:
+                        raise RuntimeError(f"a DataLoader worker process raised an exception:\n{value}")
+                    return key, slot, value
+
+            def take(slot, count):
+                arrays, structure = flatten_sample(outs[slot])
+                return _to_tensors(unflatten_sample(structure, [array[:count] for array in arrays]))
+
+            if iterable:
+                for slot in range(num_slots):
+                    free_slots.put(slot)
+                running = self.num_workers
+                while running > 0:
+                    _, slot, count = receive()
+                    if slot is None:
+                        running -= 1
+                        continue
+                    batch = take(slot, count)
+                    free_slots.put(slot)
+                    yield batch
+            else:
+                for batch_index, indices in enumerate(batches[:num_slots]):
+                    tasks.put((batch_index, indices, batch_index))
+                ready = {}
+                for batch_index in range(len(batches)):
+                    while batch_index not in ready:
+                        key, slot, count = receive()
+                        ready[key] = (slot, count)
+                    slot, count = ready.pop(batch_index)
+                    batch = take(slot, count)
+                    # Every batch in flight has its own slot, so the workers never wait for the batch the loop waits for.
+                    if batch_index + num_slots < len(batches):
+                        tasks.put((batch_index + num_slots, batches[batch_index + num_slots], slot))
+                    yield batch
+        finally:
+            stop.set()
+            for _ in workers:
+                tasks.put(None)
+            for worker in workers:
+                worker.join(_POLL_INTERVAL * 5)
+                if worker.is_alive():
+                    worker.terminate()
+            outs = None
+            for block in blocks:
+                block.close()
+                block.unlink()
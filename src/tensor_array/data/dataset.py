@@ -0,0 +1,249 @@
+"""
+# src/tensor_array/data/dataset.py
+# This module defines the datasets read by DataLoader and the collation of samples into batches.
+# A sample is a NumPy array, a Python number, or a tuple, list or dict of them.
+# Collation writes the samples of a batch into one preallocated array per field, ready to become a Tensor in one copy.
+"""
+
+import random
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+import numpy as np
+
+class Dataset:
+    """
+    Base class of the datasets indexed by an integer, from 0 to len(dataset) - 1.
+    Subclasses implement __getitem__() and __len__(), and may override get_batch() to read a whole batch at once.
+    """
+
+    def __getitem__(self, index: int) -> Any:
+        """
+        Returns a sample.
+        Args:
+            index (int): The index of the sample.
+        Returns:
+            Any: The sample, an array, a number, or a tuple, list or dict of them.
+        """
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        """
+        Returns:
+            int: The number of samples.
+        """
+        raise NotImplementedError
+
+    def get_batch(self, indices: Sequence[int], out: Any = None) -> Any:
+        """
+        Returns the samples at indices collated into a batch.
+        Args:
+            indices (Sequence[int]): The indices of the samples.
+            out (Any): Arrays to write the batch to, as returned by allocate_batch(), or None.
+        Returns:
+            Any: The batch, see collate().
+        """
+        return collate([self[index] for index in indices], out)
+
+class IterableDataset:
+    """
+    Base class of the datasets read as a stream, such as files too large to be indexed or generated samples.
+    Subclasses implement __iter__(), and may override shard() to read only their part of the stream.
+    """
+
+    def __iter__(self) -> Iterator[Any]:
+        """
+        Returns:
+            Iterator[Any]: The samples.
+        """
+        raise NotImplementedError
+
+    def shard(self, num_shards: int, index: int) -> 'IterableDataset':
+        """
+        Returns the part of the stream read by one of num_shards readers.
+        The default keeps every num_shards-th sample starting at index, so every reader still reads the whole stream.
+        Args:
+            num_shards (int): The number of readers.
+            index (int): The reader, from 0 to num_shards - 1.
+        Returns:
+            IterableDataset: The samples of the reader.
+        """
+        return _StridedIterable(self, num_shards, index)
+
+class _StridedIterable(IterableDataset):
+    def __init__(self, dataset: IterableDataset, step: int, start: int) -> None:
+        self.dataset = dataset
+        self.step = step
+        self.start = start
+
+    def __iter__(self) -> Iterator[Any]:
+        for i, sample in enumerate(self.dataset):
+            if i % self.step == self.start:
+                yield sample
+
+class ArrayDataset(Dataset):
+    """
+    A dataset of NumPy arrays sharing their first dimension, sample i being the rows i of the arrays.
+    The arrays can be np.memmap, in which case a batch only reads its own rows from the file.
+    """
+    arrays: Tuple[np.ndarray, ...]
+
+    def __init__(self, *arrays: np.ndarray) -> None:
+        """
+        Initializes the dataset.
+        Args:
+            *arrays (np.ndarray): The arrays, a sample being a single row if there is one array, or a tuple of rows.
+        Raises:
+            ValueError: If there is no array or the arrays do not have the same length.
+        """
+        if not arrays:
+            raise ValueError("ArrayDataset needs at least one array")
+        if any(len(array) != len(arrays[0]) for array in arrays):
+            raise ValueError(f"the arrays must have the same length, got {[len(array) for array in arrays]}")
+        self.arrays = arrays
+
+    def __getitem__(self, index: int) -> Any:
+        rows = tuple(array[index] for array in self.arrays)
+        return rows[0] if len(rows) == 1 else rows
+
+    def __len__(self) -> int:
+        return len(self.arrays[0])
+
+    def get_batch(self, indices: Sequence[int], out: Any = None) -> Any:
+        indices = np.asarray(indices, dtype = np.int64)
+        if out is None:
+            out = allocate_batch(self[0], len(indices))
+        leaves = out if isinstance(out, tuple) else (out,)
+        # np.take gathers the rows straight into the preallocated batch.
+        batch = tuple(np.take(array, indices, axis = 0, out = leaf[:len(indices)]) for array, leaf in zip(self.arrays, leaves))
+        return batch[0] if len(batch) == 1 else batch
+
+class MemmapDataset(ArrayDataset):
+    """
+    An ArrayDataset over a raw binary file mapped with np.memmap, so the file can be larger than the memory.
+    The mapping is reopened rather than copied when the dataset is sent to a worker process.
+    """
+
+    def __init__(self, path: str, dtype: Any, shape: Sequence[int], offset: int = 0) -> None:
+        """
+        Initializes the dataset.
+        Args:
+            path (str): The path of the file, holding the samples one after another in C order.
+            dtype (Any): The NumPy data type of the elements.
+            shape (Sequence[int]): The shape of the whole file, the number of samples first.
+            offset (int): The offset of the first sample in bytes.
+        """
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.offset = offset
+        super().__init__(np.memmap(path, dtype = self.dtype, mode = 'r', shape = self.shape, offset = offset))
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'path': self.path, 'dtype': self.dtype, 'shape': self.shape, 'offset': self.offset}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(**state)
+
+def shuffle_buffer(samples: Iterable[Any], buffer_size: int, rng: random.Random) -> Iterator[Any]:
+    """
+    Shuffles a stream keeping at most buffer_size samples in memory.
+    Every incoming sample replaces a random sample of the buffer, which is yielded.
+    Args:
+        samples (Iterable[Any]): The stream.
+        buffer_size (int): The number of samples kept, the larger the closer to a full shuffle.
+        rng (random.Random): The generator choosing the samples.
+    Returns:
+        Iterator[Any]: The shuffled stream.
+    """
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        i = rng.randrange(buffer_size)
+        buffer[i], sample = sample, buffer[i]
+        yield sample
+    rng.shuffle(buffer)
+    yield from buffer
+
+def flatten_sample(sample: Any) -> Tuple[List[Any], Any]:
+    """
+    Splits a sample into its fields.
+    Args:
+        sample (Any): An array, a number, or a tuple, list or dict of them.
+    Returns:
+        Tuple[List[Any], Any]: The fields, and the structure unflatten_sample() rebuilds the sample with.
+    """
+    if isinstance(sample, (tuple, list)):
+        leaves = []
+        children = []
+        for item in sample:
+            item_leaves, child = flatten_sample(item)
+            leaves += item_leaves
+            children.append(child)
+        return leaves, (type(sample), children)
+    if isinstance(sample, dict):
+        leaves, structure = flatten_sample(list(sample.values()))
+        return leaves, (dict, list(sample.keys()), structure)
+    return [sample], None
+
+def unflatten_sample(structure: Any, leaves: List[Any]) -> Any:
+    """
+    Rebuilds a sample split by flatten_sample() from new fields.
+    Args:
+        structure (Any): The structure returned by flatten_sample().
+        leaves (List[Any]): The fields, in the order of flatten_sample().
+    Returns:
+        Any: The sample.
+    """
+    leaves = iter(leaves)
+    def build(structure):
+        if structure is None:
+            return next(leaves)
+        if structure[0] is dict:
+            return dict(zip(structure[1], build(structure[2])))
+        return structure[0](build(child) for child in structure[1])
+    return build(structure)
+
+def allocate_batch(sample: Any, batch_size: int) -> Any:
+    """
+    Allocates the arrays collate() writes a batch of samples shaped like sample to.
+    Args:
+        sample (Any): A sample of the dataset.
+        batch_size (int): The number of samples of the batch.
+    Returns:
+        Any: One uninitialized array of shape (batch_size, *field.shape) per field, in the structure of sample.
+    """
+    leaves, structure = flatten_sample(sample)
+    arrays = []
+    for leaf in leaves:
+        leaf = np.asarray(leaf)
+        arrays.append(np.empty((batch_size,) + leaf.shape, dtype = leaf.dtype))
+    return unflatten_sample(structure, arrays)
+
+def collate(samples: Sequence[Any], out: Any = None) -> Any:
+    """
+    Stacks the fields of samples along a new first dimension.
+    Args:
+        samples (Sequence[Any]): Samples sharing their structure and the shapes of their fields.
+        out (Any): Arrays allocated by allocate_batch() for at least len(samples) samples, or None to allocate them.
+    Returns:
+        Any: The batch, in the structure of a sample, every field being the first len(samples) rows of its array.
+    Raises:
+        ValueError: If samples is empty, or a sample does not match the structure or the shapes of out.
+    """
+    if not samples:
+        raise ValueError("can not collate an empty batch")
+    if out is None:
+        out = allocate_batch(samples[0], len(samples))
+    arrays, structure = flatten_sample(out)
+    arrays = [array[:len(samples)] for array in arrays]
+    for i, sample in enumerate(samples):
+        leaves, _ = flatten_sample(sample)
+        if len(leaves) != len(arrays):
+            raise ValueError(f"sample {i} of the batch has {len(leaves)} fields, expected {len(arrays)}")
+        for array, leaf in zip(arrays, leaves):
+            leaf = np.asarray(leaf)
+            if leaf.shape != array.shape[1:]:
+                raise ValueError(f"sample {i} of the batch has a field of shape {leaf.shape}, expected {array.shape[1:]}")
+            array[i] = leaf
+    return unflatten_sample(structure, arrays)
@@ -1,2 +1,2 @@
 from .layer import Layer
-from .parameter import Parameter
\ No newline at end of file
+from .parameter import Parameter
@@ -1 +1,2 @@
-from tensor_array.layers.attention.attention import MultiheadAttention
\ No newline at end of file
+from tensor_array.layers.attention.attention import MultiheadAttention
+from tensor_array.layers.attention.kv_cache import KVCache
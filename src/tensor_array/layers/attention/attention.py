@@ -1,34 +1,143 @@
-from typing import Any
+from typing import Any, Optional, Sequence
 from .. import Layer
+from .. import Parameter
 from ..util import Linear
+from .kv_cache import KVCache
 from tensor_array.core import Tensor
-from tensor_array.activation import softmax
+from tensor_array.core import is_grad_enabled
 
-def scaled_dot_product_attention(q, k, v, mask = None):
-    attn_scores = q @ k.transpose(len(k.shape()) - 2, len(k.shape()) - 1)
-    attn_probs = softmax(attn_scores, len(attn_scores.shape()) - 1)
-    return attn_probs @ v
+def scaled_dot_product_attention(q: Tensor, k: Tensor, v: Tensor, mask: Optional[Tensor] = None, is_causal: bool = False, scale: Optional[float] = None, key_lengths: Optional[Sequence[int]] = None, query_offsets: Optional[Sequence[int]] = None) -> Tensor:
+    """
+    Computes softmax(q @ k^T * scale + mask) @ v over the last two dimensions.
+    Outside of grad mode this runs a fused kernel that visits the keys in blocks with an online softmax,
+    so the [query_length, key_length] scores are never materialized.
+    Args:
+        q (Tensor): The queries, of shape [..., query_length, head_dim].
+        k (Tensor): The keys, of shape [..., key_length, head_dim].
+        v (Tensor): The values, of shape [..., key_length, value_dim].
+        mask (Optional[Tensor]): A BOOL tensor where True marks the keys to attend, or an additive tensor of the type of q,
+            of shape [..., query_length, key_length] broadcastable to the scores.
+        is_causal (bool): If True, each query only attends to keys up to its own position, with the last query aligned to the last key.
+        scale (Optional[float]): The factor applied to the scores, 1 / sqrt(head_dim) if None.
+        key_lengths (Optional[Sequence[int]]): The number of valid keys of each sequence of the first batch dimension,
+            the other keys are ignored. All keys are valid if None.
+        query_offsets (Optional[Sequence[int]]): The position of the first query of each sequence for causal masking,
+            key_lengths - query_length if None.
+    Returns:
+        Tensor: The attention output, of shape [..., query_length, value_dim].
+    """
+    from tensor_array.tensor2 import scaled_dot_product_attention as _scaled_dot_product_attention
+    return _scaled_dot_product_attention(q, k, v, mask, is_causal, scale, key_lengths, query_offsets)
 
 class MultiheadAttention(Layer):
-    def __init__(self, d_model, n_head) -> None:
+    def __init__(self, d_model, n_head, packed_qkv = False) -> None:
+        """
+        Initializes a multi-head attention layer.
+        Args:
+            d_model (int): The size of the input and output features.
+            n_head (int): The number of attention heads, d_model must be divisible by it.
+            packed_qkv (bool): If True, the query, key and value projections are one Linear layer with a
+                [d_model, 3 * d_model] weight, so self-attention reads its input once and runs one GEMM.
+        """
         super().__init__()
-        self.linear_q = Linear(d_model)
-        self.linear_k = Linear(d_model)
-        self.linear_v = Linear(d_model)
-        self.linear_o = Linear(d_model)
+        self.d_model = d_model
         self.n_head = n_head
+        self.packed_qkv = packed_qkv
+        if packed_qkv:
+            self.linear_qkv = Linear(3 * d_model)
+        else:
+            self.linear_q = Linear(d_model)
+            self.linear_k = Linear(d_model)
+            self.linear_v = Linear(d_model)
+        self.linear_o = Linear(d_model)
+
+    def pack_qkv(self) -> None:
+        """
+        Switches an initialized layer to the packed projection, concatenating the weights and biases
+        of linear_q, linear_k and linear_v into linear_qkv.
+        Raises:
+            RuntimeError: If the separate projections have not been initialized by a call yet.
+        """
+        import numpy as np
+        if self.packed_qkv:
+            return
+        if 'w' not in self.linear_q._parameters:
+            raise RuntimeError("the layer must be called once before its projections can be packed")
+        linear_qkv = Linear(3 * self.d_model)
+        projections = (self.linear_q, self.linear_k, self.linear_v)
+        linear_qkv.register_parameter('w', Parameter(Tensor(np.concatenate([linear.w.numpy() for linear in projections], axis = -1))))
+        linear_qkv.register_parameter('b', Parameter(Tensor(np.concatenate([linear.b.numpy() for linear in projections], axis = -1))))
+        del self.linear_q
+        del self.linear_k
+        del self.linear_v
+        self.linear_qkv = linear_qkv
+        self.packed_qkv = True
+
+    def _load_from_state_dict(self, state_dict, prefix, missing_keys) -> None:
+        """
+        Loads the layer, packing separate linear_q, linear_k and linear_v weights from the state dict
+        into linear_qkv when the layer uses the packed projection.
+        """
+        import numpy as np
+        separate = [prefix + f"linear_{name}.{param}" for name in "qkv" for param in "wb"]
+        if self.packed_qkv and all(key in state_dict for key in separate):
+            for param in "wb":
+                keys = [prefix + f"linear_{name}.{param}" for name in "qkv"]
+                state_dict[prefix + "linear_qkv." + param] = Tensor(np.concatenate([state_dict.pop(key).numpy() for key in keys], axis = -1))
+        super()._load_from_state_dict(state_dict, prefix, missing_keys)
+
+    def split_heads(self, t) -> Any:
+        """
+        Splits [batch, length, d_model] into [batch, n_head, length, d_model / n_head].
+        """
+        return t.reshape((t.shape()[0], t.shape()[1], self.n_head, t.shape()[-1] // self.n_head)).transpose(1, 2)
+
+    def projections(self, input_q, input_k, input_v) -> Any:
+        """
+        Computes the queries, keys and values as [batch, length, d_model], with the heads not split yet.
+        """
+        if not self.packed_qkv:
+            return self.linear_q(input_q), self.linear_k(input_k), self.linear_v(input_v)
+        d_model = self.d_model
+        if input_q is input_k and input_k is input_v:
+            temp_qkv = self.linear_qkv(input_q)
+            return tuple(
+                temp_qkv[(slice(None), slice(None), slice(i * d_model, (i + 1) * d_model))]
+                for i in range(3)
+            )
+        # Cross-attention still works in packed mode, with one GEMM per input against a column block.
+        w, b = self.linear_qkv.w, self.linear_qkv.b
+        return tuple(
+            t @ w[(slice(None), slice(i * d_model, (i + 1) * d_model))] + b[(slice(i * d_model, (i + 1) * d_model),)]
+            for i, t in enumerate((input_q, input_k, input_v))
+        )
+
+    def project(self, input_q, input_k, input_v) -> Any:
+        """
+        Computes the queries, keys and values with their heads split.
+        """
+        return tuple(self.split_heads(t) for t in self.projections(input_q, input_k, input_v))
+
+    def calculate(self, input_q, input_k, input_v, mask = None, is_causal = False, kv_cache: Optional[KVCache] = None, valid_lengths = None) -> Any:
+        if self.packed_qkv and kv_cache is None and input_q is input_k and input_k is input_v and not is_grad_enabled():
+            # The fused kernel reads the heads in place from the packed projection and writes them merged.
+            from tensor_array.tensor2 import packed_attention as _packed_attention
+            return self.linear_o(_packed_attention(self.linear_qkv(input_q), self.n_head, mask, is_causal))
 
-    def calculate(self, input_q, input_k, input_v, mask = None) -> Any:
-        temp_q = self.linear_q(input_q)
-        temp_k = self.linear_k(input_k)
-        temp_v = self.linear_v(input_v)
+        if kv_cache is None and not is_grad_enabled():
+            # The heads are read in place from the projections and written merged, so split_heads and the merge copy nothing.
+            from tensor_array.tensor2 import multihead_attention as _multihead_attention
+            return self.linear_o(_multihead_attention(*self.projections(input_q, input_k, input_v), self.n_head, mask, is_causal))
 
-        temp_q = temp_q.reshape((temp_q.shape()[0], temp_q.shape()[1], self.n_head, temp_q.shape()[-1] / self.n_head)).transpose(1, 2)
-        temp_k = temp_k.reshape((temp_k.shape()[0], temp_k.shape()[1], self.n_head, temp_k.shape()[-1] / self.n_head)).transpose(1, 2)
-        temp_v = temp_v.reshape((temp_v.shape()[0], temp_v.shape()[1], self.n_head, temp_v.shape()[-1] / self.n_head)).transpose(1, 2)
+        temp_q, temp_k, temp_v = self.project(input_q, input_k, input_v)
 
-        attention_output = scaled_dot_product_attention(temp_q, temp_k, temp_v, mask)
+        if kv_cache is None:
+            attention_output = scaled_dot_product_attention(temp_q, temp_k, temp_v, mask, is_causal)
+        else:
+            query_offsets = list(kv_cache.lengths)
+            temp_k, temp_v = kv_cache.append(temp_k, temp_v, valid_lengths)
+            attention_output = scaled_dot_product_attention(temp_q, temp_k, temp_v, mask, is_causal, key_lengths=kv_cache.lengths, query_offsets=query_offsets)
 
         attention_output = attention_output.transpose(1, 2)
-        attention_output = attention_output.reshape((temp_q.shape()[0], temp_q.shape()[1], temp_q.shape[-2] * temp_q.shape[-1]))
+        attention_output = attention_output.reshape((attention_output.shape()[0], attention_output.shape()[1], attention_output.shape()[-2] * attention_output.shape()[-1]))
         return self.linear_o(attention_output)
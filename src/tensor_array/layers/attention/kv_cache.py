@@ -0,0 +1,64 @@
+from typing import List, Optional, Sequence, Tuple
+from tensor_array.core import Tensor
+from tensor_array.core import DataTypes
+
+class KVCache:
+    """
+    Preallocated key/value cache of one attention layer for incremental decoding.
+    The keys and values of each step are written in place after the entries of the previous steps,
+    so only the new tokens are projected and nothing is reallocated while decoding.
+    Each sequence of the batch keeps its own valid length, so sequences of different lengths can be decoded together.
+    """
+
+    def __init__(self, batch_size: int, max_length: int, n_head: int, head_dim: int, dtype: DataTypes = DataTypes.FLOAT) -> None:
+        """
+        Initializes the cache with all sequences empty.
+        Args:
+            batch_size (int): The number of sequences decoded together.
+            max_length (int): The maximum number of cached positions of each sequence.
+            n_head (int): The number of attention heads.
+            head_dim (int): The size of the keys and values of each head.
+            dtype (DataTypes): The data type of the keys and values, FLOAT or DOUBLE, or HALF or BFLOAT16
+                for the keys and values projected inside autocast.
+        """
+        import numpy as np
+        np_dtype = {DataTypes.FLOAT: np.float32, DataTypes.DOUBLE: np.float64, DataTypes.HALF: np.float32, DataTypes.BFLOAT16: np.float32}[dtype]
+        shape = (batch_size, n_head, max_length, head_dim)
+        self.key = Tensor(np.zeros(shape, dtype=np_dtype))
+        self.value = Tensor(np.zeros(shape, dtype=np_dtype))
+        if dtype in (DataTypes.HALF, DataTypes.BFLOAT16):
+            self.key = self.key.cast(dtype.value)
+            self.value = self.value.cast(dtype.value)
+        self.max_length = max_length
+        self.lengths: List[int] = [0] * batch_size
+
+    def append(self, key: Tensor, value: Tensor, valid_lengths: Optional[Sequence[int]] = None) -> Tuple[Tensor, Tensor]:
+        """
+        Writes new keys and values after the cached entries of each sequence.
+        Args:
+            key (Tensor): The new keys, of shape [batch_size, n_head, new_length, head_dim].
+            value (Tensor): The new values, of shape [batch_size, n_head, new_length, head_dim].
+            valid_lengths (Optional[Sequence[int]]): How many of the new entries of each sequence are valid,
+                for right-padded prompts. All new_length entries if None.
+        Returns:
+            Tuple[Tensor, Tensor]: The whole key and value caches, valid up to lengths.
+        """
+        from tensor_array.tensor2 import kv_cache_write as _kv_cache_write
+        if valid_lengths is None:
+            valid_lengths = [key.shape()[-2]] * len(self.lengths)
+        valid_lengths = list(valid_lengths)
+        _kv_cache_write(self.key, key, self.lengths, valid_lengths)
+        _kv_cache_write(self.value, value, self.lengths, valid_lengths)
+        self.lengths = [length + valid for length, valid in zip(self.lengths, valid_lengths)]
+        return self.key, self.value
+
+    def reset(self, indices: Optional[Sequence[int]] = None) -> None:
+        """
+        Empties the cache without reallocating it, so that it can serve a new request.
+        Args:
+            indices (Optional[Sequence[int]]): The sequences to empty, all of them if None.
+        """
+        if indices is None:
+            indices = range(len(self.lengths))
+        for index in indices:
+            self.lengths[index] = 0
@@ -5,20 +5,32 @@ from tensor_array.activation import relu
 from ..util import Sequential
 from ..util import Linear
 from ..util import Activation
+from ..util import checkpoint
+from ..normalization import LayerNorm
 
 class TransformerEncoderImpl(Layer):
-    def __init__(self, d_model, n_head, ff_size) -> None:
+    def __init__(self, d_model, n_head, ff_size, use_checkpoint = False) -> None:
+        super().__init__()
+        # Recomputes the activations of the block during the backward pass instead of keeping them.
+        self.use_checkpoint = use_checkpoint
         self.feed_forward = Sequential([
             Linear(ff_size),
             Activation(relu),
             Linear(d_model)
         ])
         self.multihead_attn = MultiheadAttention(d_model, n_head)
-        self.layer_norm_1
-        self.layer_norm_2
+        self.layer_norm_1 = LayerNorm(d_model)
+        self.layer_norm_2 = LayerNorm(d_model)
 
-    def calculate(self, input) -> Any:
-        attn_output = self.multihead_attn(input, input, input)
-        attn_output = self.layer_norm_1(input + attn_output)
+    def calculate(self, input, mask = None, is_causal = False, kv_cache = None, valid_lengths = None) -> Any:
+        # A recomputation would append the keys and values to the cache a second time.
+        if self.use_checkpoint and kv_cache is None:
+            return checkpoint(self._block, input, mask, is_causal, None, valid_lengths)
+        return self._block(input, mask, is_causal, kv_cache, valid_lengths)
+
+    def _block(self, input, mask, is_causal, kv_cache, valid_lengths) -> Any:
+        attn_output = self.multihead_attn(input, input, input, mask, is_causal, kv_cache = kv_cache, valid_lengths = valid_lengths)
+        # The residual additions run inside the normalization kernels.
+        attn_output = self.layer_norm_1(attn_output, input)
         ff_output = self.feed_forward(attn_output)
-        return self.layer_norm_2(attn_output + ff_output)
\ No newline at end of file
+        return self.layer_norm_2(ff_output, attn_output)
\ No newline at end of file
@@ -5,11 +5,16 @@
 # as well as methods for initialization and calculation of the layer's output.
 """
 
+import threading
 from collections import OrderedDict, namedtuple
 from typing import Union, Tuple, Any, Callable, Iterator, Set, Optional, overload, TypeVar, Mapping, Dict, List
 from typing import Any
 from tensor_array.core import Tensor
+from tensor_array.core import set_grad_enabled
 from .parameter import Parameter
+from .parameter import zero_grad
+
+_layer_init_lock = threading.RLock()
 
 class Layer:
     """
@@ -18,6 +23,8 @@ class Layer:
     It also includes methods for initialization and calculation of the layer's output.
     """
     is_running: bool
+    training: bool
+    _lazy_parameters: Tuple[str, ...] = ()
     _layers: Dict[str, Optional['Layer']]
     _parameters: Dict[str, Optional[Parameter]]
     _tensors: Dict[str, Optional[Tensor]]
@@ -25,10 +32,11 @@ class Layer:
     def __init__(self) -> None:
         """
         Initializes the Layer instance.
-        Sets up the initial state of the layer, including whether it is running and initializing empty dictionaries
-        for layers, parameters, and tensors.
+        Sets up the initial state of the layer, including whether it is running, whether it is training,
+        and initializing empty dictionaries for layers, parameters, and tensors.
         """
         super().__setattr__('is_running', False)
+        super().__setattr__('training', True)
         super().__setattr__('_layers', OrderedDict())
         super().__setattr__('_parameters', OrderedDict())
         super().__setattr__('_tensors', OrderedDict())
@@ -38,6 +46,7 @@ class Layer:
         Calls the layer with the provided arguments and keyword arguments.
         If the layer is not currently running, it initializes the layer with the shapes of the tensors
         and parameters provided in the arguments and keyword arguments.
+        If the layer is not training, the calculation does not record the autograd graph.
         Args:
             *args: Positional arguments, which may include Tensors.
             **kwds: Keyword arguments, which may include Tensors.
@@ -45,16 +54,59 @@ class Layer:
             Any: The result of the layer's calculation.
         """
         if not self.__dict__['is_running']:
-            list_arg = (t.shape() for t in args if isinstance(t, Tensor))
-            dict_kwargs = {
-                key: val.shape()
-                for key, val in kwds
-                if isinstance(val, Tensor)
-            }
-            self.layer_init(*list_arg, **dict_kwargs)
-        super().__setattr__('is_running', True)
+            # Threads sharing the layer must not create its lazy parameters twice.
+            with _layer_init_lock:
+                if not self.__dict__['is_running']:
+                    list_arg = (t.shape() for t in args if isinstance(t, Tensor))
+                    dict_kwargs = {
+                        key: val.shape()
+                        for key, val in kwds.items()
+                        if isinstance(val, Tensor)
+                    }
+                    self.layer_init(*list_arg, **dict_kwargs)
+                    super().__setattr__('is_running', True)
+        if not self.__dict__['training']:
+            with set_grad_enabled(False):
+                return self.calculate(*args, **kwds)
         return self.calculate(*args, **kwds)
 
+    def train(self, mode: bool = True) -> 'Layer':
+        """
+        Sets the layer and all of its sub-layers to training or evaluation mode.
+        In evaluation mode, calling the layer does not record the autograd graph,
+        so intermediate tensors are freed as soon as they are no longer referenced.
+        Args:
+            mode (bool): True for training mode, False for evaluation mode.
+        Returns:
+            Layer: The layer itself.
+        """
+        super().__setattr__('training', mode)
+        for layer in self._layers.values():
+            if layer is not None:
+                layer.train(mode)
+        return self
+
+    def eval(self) -> 'Layer':
+        """
+        Sets the layer and all of its sub-layers to evaluation mode.
+        This is equivalent to train(False).
+        Returns:
+            Layer: The layer itself.
+        """
+        return self.train(False)
+
+    @property
+    def requires_grad(self) -> bool:
+        """
+        Whether calling the layer records the autograd graph.
+        Setting it to False is equivalent to eval(), setting it to True is equivalent to train().
+        """
+        return self.__dict__['training']
+
+    @requires_grad.setter
+    def requires_grad(self, mode: bool) -> None:
+        self.train(mode)
+
     def layer_init(self, *args: Tuple, **kwds: Tuple) -> None:
         """
         Initializes the layer with the provided shapes of tensors and parameters.
@@ -162,6 +214,152 @@ class Layer:
             raise KeyError("layer name can't be empty string \"\"")
         self._layers[name] = layer
 
+    def named_layers(self, prefix: str = '') -> Iterator[Tuple[str, 'Layer']]:
+        """
+        Iterates over this layer and all of its sub-layers, recursively.
+        Args:
+            prefix (str): The prefix added to the names of the layers.
+        Yields:
+            Tuple[str, Layer]: The dotted name of each layer, '' for this one, and the layer.
+        """
+        yield prefix, self
+        for name, layer in self._layers.items():
+            if layer is not None:
+                yield from layer.named_layers(prefix + ('.' if prefix else '') + name)
+
+    def layers(self) -> Iterator['Layer']:
+        """
+        Iterates over this layer and all of its sub-layers, recursively.
+        Yields:
+            Layer: Each layer.
+        """
+        for _, layer in self.named_layers():
+            yield layer
+
+    def named_parameters(self, prefix: str = '', recurse: bool = True) -> Iterator[Tuple[str, Parameter]]:
+        """
+        Iterates over the parameters of this layer and, if recurse is True, of its sub-layers.
+        Args:
+            prefix (str): The prefix added to the names of the parameters.
+            recurse (bool): Whether to include the parameters of the sub-layers.
+        Yields:
+            Tuple[str, Parameter]: The dotted name of each parameter and the parameter.
+        """
+        named_layers = self.named_layers(prefix) if recurse else iter([(prefix, self)])
+        for layer_prefix, layer in named_layers:
+            for name, param in layer._parameters.items():
+                if param is not None:
+                    yield layer_prefix + ('.' if layer_prefix else '') + name, param
+
+    def parameters(self, recurse: bool = True) -> Iterator[Parameter]:
+        """
+        Iterates over the parameters of this layer and, if recurse is True, of its sub-layers.
+        Args:
+            recurse (bool): Whether to include the parameters of the sub-layers.
+        Yields:
+            Parameter: Each parameter.
+        """
+        for _, param in self.named_parameters(recurse = recurse):
+            yield param
+
+    def named_tensors(self, prefix: str = '', recurse: bool = True) -> Iterator[Tuple[str, Tensor]]:
+        """
+        Iterates over the registered tensors, which are not parameters, of this layer and, if recurse is True, of its sub-layers.
+        Args:
+            prefix (str): The prefix added to the names of the tensors.
+            recurse (bool): Whether to include the tensors of the sub-layers.
+        Yields:
+            Tuple[str, Tensor]: The dotted name of each tensor and the tensor.
+        """
+        named_layers = self.named_layers(prefix) if recurse else iter([(prefix, self)])
+        for layer_prefix, layer in named_layers:
+            for name, tensor in layer._tensors.items():
+                if tensor is not None:
+                    yield layer_prefix + ('.' if layer_prefix else '') + name, tensor
+
+    def zero_grad(self, set_to_none: bool = True) -> None:
+        """
+        Resets the gradients of all parameters of the layer and its sub-layers.
+        Args:
+            set_to_none (bool): If True, set grad to None, otherwise fill the gradients with zeros in place.
+        """
+        zero_grad(self.parameters(), set_to_none)
+
+    def state_dict(self) -> 'OrderedDict[str, Tensor]':
+        """
+        Returns the state of the layer: every parameter and registered tensor, recursively.
+        The tensors are not copied.
+        Returns:
+            OrderedDict[str, Tensor]: The tensors by dotted name.
+        """
+        state = OrderedDict(self.named_parameters())
+        state.update(self.named_tensors())
+        return state
+
+    def load_state_dict(self, state_dict: Mapping[str, Tensor], strict: bool = True) -> Tuple[List[str], List[str]]:
+        """
+        Loads parameters and registered tensors from a state dict, as returned by state_dict() or load_checkpoint().
+        The values are copied in place into the existing parameters and tensors, which keep their identity.
+        Parameters that a layer creates lazily on its first call, listed in its _lazy_parameters such as the weight
+        of Linear, are registered from the state dict, so a freshly built model can be loaded before it is run.
+        Args:
+            state_dict (Mapping[str, Tensor]): The tensors by dotted name.
+            strict (bool): If True, raise when keys are missing or unexpected.
+        Returns:
+            Tuple[List[str], List[str]]: The missing keys and the unexpected keys.
+        Raises:
+            KeyError: If strict is True and keys are missing or unexpected.
+            ValueError: If a tensor does not have the shape of the tensor it replaces.
+        """
+        state_dict = OrderedDict(state_dict)
+        missing_keys: List[str] = []
+        for prefix, layer in self.named_layers():
+            layer._load_from_state_dict(state_dict, prefix + ('.' if prefix else ''), missing_keys)
+        unexpected_keys = list(state_dict.keys())
+        if strict and (missing_keys or unexpected_keys):
+            raise KeyError(f"error loading state dict, missing keys: {missing_keys}, unexpected keys: {unexpected_keys}")
+        return missing_keys, unexpected_keys
+
+    def _load_from_state_dict(self, state_dict: 'OrderedDict[str, Tensor]', prefix: str, missing_keys: List[str]) -> None:
+        """
+        Loads the parameters and registered tensors of this layer only, removing the used keys from state_dict.
+        Subclasses can override it to convert the keys of older layouts before calling it.
+        Args:
+            state_dict (OrderedDict[str, Tensor]): The remaining tensors by dotted name.
+            prefix (str): The dotted name of this layer followed by '.', or ''.
+            missing_keys (List[str]): The list the names of missing tensors are appended to.
+        """
+        known_names = set(self._parameters) | set(self._tensors) | set(self._lazy_parameters)
+        own_keys = [
+            key for key in state_dict
+            if key.startswith(prefix) and key[len(prefix):] in known_names
+        ]
+        for name in list(self._parameters) + list(self._tensors):
+            if prefix + name not in state_dict and (self._parameters.get(name) is not None or self._tensors.get(name) is not None):
+                missing_keys.append(prefix + name)
+        dsts = []
+        srcs = []
+        for key in own_keys:
+            name = key[len(prefix):]
+            value = state_dict.pop(key)
+            current = self._parameters.get(name, self._tensors.get(name))
+            if current is None:
+                if name in self._tensors:
+                    self.register_tensor(name, value)
+                else:
+                    self.register_parameter(name, value if isinstance(value, Parameter) else Parameter(value))
+                continue
+            if tuple(current.shape()) != tuple(value.shape()):
+                raise ValueError(f"size mismatch for {key}: expected {tuple(current.shape())}, got {tuple(value.shape())}")
+            # The values are copied into the current tensors, so optimizers and traces that hold them stay valid.
+            dsts.append(current)
+            srcs.append(value if value.dtype() == current.dtype() else value.cast(current.dtype()))
+        if dsts:
+            from tensor_array.tensor2 import copy_foreach as _copy_foreach
+            from tensor_array.amp import invalidate_parameter_casts
+            _copy_foreach(dsts, srcs)
+            invalidate_parameter_casts()
+
     def __setattr__(self, __name: str, __value: Any) -> None:
         """
         Sets an attribute on the layer.
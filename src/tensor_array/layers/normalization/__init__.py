@@ -1 +1,5 @@
-from tensor_array.layers.normalization import Normalization
\ No newline at end of file
+from tensor_array.layers.normalization.normalization import Normalization
+from tensor_array.layers.normalization.normalization import LayerNorm
+from tensor_array.layers.normalization.normalization import RMSNorm
+from tensor_array.layers.normalization.normalization import layer_norm
+from tensor_array.layers.normalization.normalization import rms_norm
@@ -1,4 +1,136 @@
+"""
+# src/tensor_array/layers/normalization/normalization.py
+# This module defines the normalization layers and the functions they run.
+# Each normalization is one native kernel that computes the statistics of a row and writes its output,
+# optionally normalizing the sum of the input and a residual without materializing it.
+"""
+
+from typing import Optional, Sequence, Tuple, Union
+import numpy as np
 from .. import Layer
+from .. import Parameter
+from tensor_array.core import Tensor
+
+def _check_normalized_shape(input: Tensor, normalized_shape: Tuple[int, ...]) -> None:
+    """
+    Checks that the trailing dimensions of input are the normalized shape.
+    Args:
+        input (Tensor): The tensor to normalize.
+        normalized_shape (Tuple[int, ...]): The shape of the normalized dimensions.
+    Raises:
+        ValueError: If input does not end with normalized_shape.
+    """
+    shape = tuple(input.shape())
+    if len(normalized_shape) == 0 or shape[len(shape) - len(normalized_shape):] != normalized_shape:
+        raise ValueError(f"expected an input of shape [..., {', '.join(map(str, normalized_shape))}], got {list(shape)}")
+
+def layer_norm(input: Tensor, normalized_shape: Sequence[int], weight: Optional[Tensor] = None, bias: Optional[Tensor] = None, eps: float = 1e-5, residual: Optional[Tensor] = None) -> Tensor:
+    """
+    Normalizes the trailing dimensions of input to zero mean and unit variance, then scales and shifts them.
+    The mean and variance of each row come from one Welford pass, and the output is written by a second pass.
+    Args:
+        input (Tensor): The tensor to normalize, of shape [..., *normalized_shape].
+        normalized_shape (Sequence[int]): The shape of the normalized dimensions.
+        weight (Optional[Tensor]): The scale, of shape normalized_shape, 1 if None.
+        bias (Optional[Tensor]): The shift, of shape normalized_shape, 0 if None.
+        eps (float): The value added to the variance for numerical stability.
+        residual (Optional[Tensor]): A tensor of the shape of input to add to it before normalizing,
+            read in the same passes instead of adding the two tensors first.
+    Returns:
+        Tensor: The normalized tensor, of the shape of input.
+    Raises:
+        ValueError: If the shapes do not match.
+        TypeError: If the tensors do not have the same type, FLOAT or DOUBLE.
+    """
+    from tensor_array.tensor2 import layer_norm as _layer_norm
+    normalized_shape = tuple(normalized_shape)
+    _check_normalized_shape(input, normalized_shape)
+    return _layer_norm(input, residual, weight, bias, len(normalized_shape), eps)
+
+def rms_norm(input: Tensor, normalized_shape: Sequence[int], weight: Optional[Tensor] = None, eps: float = 1e-6, residual: Optional[Tensor] = None) -> Tensor:
+    """
+    Divides the trailing dimensions of input by their root mean square, then scales them.
+    Args:
+        input (Tensor): The tensor to normalize, of shape [..., *normalized_shape].
+        normalized_shape (Sequence[int]): The shape of the normalized dimensions.
+        weight (Optional[Tensor]): The scale, of shape normalized_shape, 1 if None.
+        eps (float): The value added to the mean square for numerical stability.
+        residual (Optional[Tensor]): A tensor of the shape of input to add to it before normalizing,
+            read in the same passes instead of adding the two tensors first.
+    Returns:
+        Tensor: The normalized tensor, of the shape of input.
+    Raises:
+        ValueError: If the shapes do not match.
+        TypeError: If the tensors do not have the same type, FLOAT or DOUBLE.
+    """
+    from tensor_array.tensor2 import rms_norm as _rms_norm
+    normalized_shape = tuple(normalized_shape)
+    _check_normalized_shape(input, normalized_shape)
+    return _rms_norm(input, residual, weight, len(normalized_shape), eps)
 
 class Normalization(Layer):
-    pass
\ No newline at end of file
+    """
+    Base class of the layers normalizing the trailing dimensions of their input.
+    Attributes:
+        normalized_shape (Tuple[int, ...]): The shape of the normalized dimensions.
+        eps (float): The value added to the statistics for numerical stability.
+    """
+
+    def __init__(self, normalized_shape: Union[int, Sequence[int]], eps: float) -> None:
+        """
+        Initializes the normalized shape of the layer.
+        Args:
+            normalized_shape (Union[int, Sequence[int]]): The size of the last dimension, or the shape of the trailing dimensions.
+            eps (float): The value added to the statistics for numerical stability.
+        """
+        super().__init__()
+        self.normalized_shape = (normalized_shape,) if isinstance(normalized_shape, int) else tuple(normalized_shape)
+        self.eps = eps
+
+class LayerNorm(Normalization):
+    def __init__(self, normalized_shape: Union[int, Sequence[int]], eps: float = 1e-5, elementwise_affine: bool = True, bias: bool = True) -> None:
+        """
+        Initializes a layer normalization.
+        Args:
+            normalized_shape (Union[int, Sequence[int]]): The size of the last dimension, or the shape of the trailing dimensions.
+            eps (float): The value added to the variance for numerical stability.
+            elementwise_affine (bool): If True, the layer learns a weight initialized to ones.
+            bias (bool): If True and elementwise_affine, the layer also learns a bias initialized to zeros.
+        """
+        super().__init__(normalized_shape, eps)
+        self.weight = Parameter(np.ones(self.normalized_shape, dtype = np.float32)) if elementwise_affine else None
+        self.bias = Parameter(np.zeros(self.normalized_shape, dtype = np.float32)) if elementwise_affine and bias else None
+
+    def calculate(self, input: Tensor, residual: Optional[Tensor] = None) -> Tensor:
+        """
+        Normalizes input, or input + residual in the same kernel.
+        Args:
+            input (Tensor): The tensor to normalize, of shape [..., *normalized_shape].
+            residual (Optional[Tensor]): A tensor of the shape of input added to it before normalizing.
+        Returns:
+            Tensor: The normalized tensor.
+        """
+        return layer_norm(input, self.normalized_shape, self.weight, self.bias, self.eps, residual)
+
+class RMSNorm(Normalization):
+    def __init__(self, normalized_shape: Union[int, Sequence[int]], eps: float = 1e-6, elementwise_affine: bool = True) -> None:
+        """
+        Initializes a root mean square normalization.
+        Args:
+            normalized_shape (Union[int, Sequence[int]]): The size of the last dimension, or the shape of the trailing dimensions.
+            eps (float): The value added to the mean square for numerical stability.
+            elementwise_affine (bool): If True, the layer learns a weight initialized to ones.
+        """
+        super().__init__(normalized_shape, eps)
+        self.weight = Parameter(np.ones(self.normalized_shape, dtype = np.float32)) if elementwise_affine else None
+
+    def calculate(self, input: Tensor, residual: Optional[Tensor] = None) -> Tensor:
+        """
+        Normalizes input, or input + residual in the same kernel.
+        Args:
+            input (Tensor): The tensor to normalize, of shape [..., *normalized_shape].
+            residual (Optional[Tensor]): A tensor of the shape of input added to it before normalizing.
+        Returns:
+            Tensor: The normalized tensor.
+        """
+        return rms_norm(input, self.normalized_shape, self.weight, self.eps, residual)
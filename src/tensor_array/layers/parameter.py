@@ -1,4 +1,58 @@
+"""
+# src/tensor_array/layers/parameter.py
+# This module defines the Parameter class, a tensor trained by the layer that registers it.
+# A parameter keeps its gradient in a persistent buffer, allocated on the first calc_grad that targets it
+# and then overwritten or accumulated in place, so training steps do not allocate gradients.
+"""
+
+from typing import Iterable, Optional
 from tensor_array.core import Tensor
 
 class Parameter(Tensor):
-    pass
+    """
+    A tensor trained by the layer that registers it.
+    Attributes:
+        grad (Optional[Tensor]): The gradient written by calc_grad(inputs=...), or None.
+    """
+    grad: Optional[Tensor] = None
+    _grad_buffer: Optional[Tensor] = None
+
+def collect_grads(params: Iterable[Tensor], accumulate: bool = True) -> None:
+    """
+    Writes the gradients computed by the last calc_grad into the grad attribute of the parameters.
+    Args:
+        params (Iterable[Tensor]): The parameters.
+        accumulate (bool): If True, add the gradients to the current grad of the parameters,
+            otherwise overwrite it. A parameter whose grad is None is always overwritten.
+    """
+    from tensor_array.tensor2 import accumulate_grad_foreach as _accumulate_grad_foreach
+    import numpy as np
+    params = list(params)
+    buffers = []
+    flags = []
+    for param in params:
+        buffer = getattr(param, '_grad_buffer', None)
+        if buffer is None:
+            buffer = Tensor(np.empty(tuple(param.shape()), dtype = param.numpy().dtype))
+            param._grad_buffer = buffer
+        flags.append(accumulate and getattr(param, 'grad', None) is not None)
+        buffers.append(buffer)
+    _accumulate_grad_foreach(params, buffers, flags)
+    for param, buffer in zip(params, buffers):
+        param.grad = buffer
+
+def zero_grad(params: Iterable[Tensor], set_to_none: bool = True) -> None:
+    """
+    Resets the gradients of the parameters.
+    Args:
+        params (Iterable[Tensor]): The parameters.
+        set_to_none (bool): If True, set grad to None, keeping the buffer for the next calc_grad,
+            otherwise fill the gradients with zeros in place.
+    """
+    params = list(params)
+    if set_to_none:
+        for param in params:
+            param.grad = None
+        return
+    from tensor_array.tensor2 import zero_foreach as _zero_foreach
+    _zero_foreach([param.grad for param in params if getattr(param, 'grad', None) is not None])
@@ -1,3 +1,4 @@
 from tensor_array.layers.util.activation import Activation
 from tensor_array.layers.util.linear import Linear
 from tensor_array.layers.util.sequential import Sequential
+from tensor_array.layers.util.checkpoint import checkpoint
@@ -1,15 +1,28 @@
 from .. import Layer
-from typing import Any, Callable
+from tensor_array import activation
+from typing import Any, Callable, Union
 
 class Activation(Layer):
-    def __init__(self, activation_function: Callable) -> None:
+    def __init__(self, activation_function: Union[Callable, str], inplace: bool = False, **kwds: Any) -> None:
         """
         Initializes an Activation layer with a specified activation function.
         Args:
-            activation_function (Callable): The activation function to be applied.
+            activation_function (Union[Callable, str]): The activation function to be applied,
+                or the name of a native activation in tensor_array.activation such as "relu" or "gelu".
+            inplace (bool): If True and the layer is neither training nor being traced, a named activation
+                overwrites its input instead of allocating a new tensor.
+            **kwds (Any): Keyword arguments passed to a named activation, such as dim for "softmax".
         """
         super().__init__()
+        if isinstance(activation_function, str):
+            if not hasattr(activation, activation_function) or activation_function.endswith('_'):
+                raise ValueError(f"unknown activation function \"{activation_function}\"")
+            self.inplace_function = getattr(activation, activation_function + '_') if inplace else None
+            activation_function = getattr(activation, activation_function)
+        else:
+            self.inplace_function = None
         self.activation_function = activation_function
+        self.activation_kwds = kwds
 
     def calculate(self, *args: Any, **kwds: Any) -> Any:
         """
@@ -20,4 +33,8 @@ class Activation(Layer):
         Returns:
             Any: The result of applying the activation function to the input arguments.
         """
-        return self.activation_function(*args, **kwds)
\ No newline at end of file
+        from tensor_array.tensor2 import is_tracing as _is_tracing
+        # A traced graph replays only recorded ops, so the activation is recorded out of place.
+        if self.inplace_function is not None and not self.training and not _is_tracing():
+            return self.inplace_function(*args, **self.activation_kwds, **kwds)
+        return self.activation_function(*args, **self.activation_kwds, **kwds)
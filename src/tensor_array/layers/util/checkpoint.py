@@ -0,0 +1,246 @@
+"""
+# src/tensor_array/layers/util/checkpoint.py
+# This module implements activation checkpointing.
+# A checkpointed call runs without recording the autograd graph, so only its inputs and outputs stay alive.
+# calc_grad() runs the backward of the recorded graph, which stops at the outputs of the checkpointed calls,
+# then recomputes each call it reached with the graph, last call first, and runs its backward from the gradient of its outputs.
+# The recomputed passes run into fresh leaves of the parameters and inputs, so each one collects only its own gradients.
+"""
+
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import numpy as np
+from tensor_array.core import Tensor
+from tensor_array.core import is_grad_enabled, no_grad, set_grad_enabled
+
+_local = threading.local()
+
+class _Segment:
+    """
+    A checkpointed call, kept on the thread that made it until the next calc_grad() consumes it.
+    Attributes:
+        function (Callable[..., Any]): The layer or function that was called.
+        inputs (Tuple[Any, ...]): Its positional arguments.
+        kwds (Dict[str, Any]): Its keyword arguments.
+        outputs (List[Tensor]): The tensors it returned, leaves of the graph recorded after it.
+        rng_state (Optional[Tuple[Any, Any]]): The state of the Python and NumPy generators before the call.
+    """
+    __slots__ = ('function', 'inputs', 'kwds', 'outputs', 'rng_state')
+
+    def __init__(self, function: Callable[..., Any], inputs: Tuple[Any, ...], kwds: Dict[str, Any], outputs: List[Tensor], rng_state: Optional[Tuple[Any, Any]]) -> None:
+        self.function = function
+        self.inputs = inputs
+        self.kwds = kwds
+        self.outputs = outputs
+        self.rng_state = rng_state
+
+def _segments() -> List[_Segment]:
+    segments = getattr(_local, 'segments', None)
+    if segments is None:
+        segments = _local.segments = []
+    return segments
+
+def _output_tensors(outputs: Any) -> List[Tensor]:
+    from tensor_array.tensor2 import Tensor as _Tensor
+    # Op results are instances of the native class, not of the Python subclass.
+    return [output for output in (outputs if isinstance(outputs, tuple) else (outputs,)) if isinstance(output, _Tensor)]
+
+def _get_rng_state() -> Tuple[Any, Any]:
+    return random.getstate(), np.random.get_state()
+
+def _set_rng_state(state: Tuple[Any, Any]) -> None:
+    random.setstate(state[0])
+    np.random.set_state(state[1])
+
+def checkpoint(layer: Callable[..., Any], *inputs: Any, preserve_rng_state: bool = True, **kwds: Any) -> Any:
+    """
+    Calls layer(*inputs, **kwds) without keeping its intermediate tensors for the backward pass.
+    The call is recomputed with the graph by the next calc_grad() of this thread, from the same inputs,
+    so the inputs must not be modified in place in between. That calc_grad() consumes every call of the thread:
+    the calls its backward pass does not reach are dropped without being recomputed, and until then keep
+    their inputs alive. A parameter used both inside the call and outside the checkpointed calls only receives
+    the gradient through the call. Outside of grad mode this is a plain call.
+    Args:
+        layer (Callable[..., Any]): A layer or a function of tensors returning a tensor or a tuple.
+        *inputs (Any): The positional arguments of layer.
+        preserve_rng_state (bool): If True, the state of the Python and NumPy random generators is saved
+            before the call and restored for the recomputation, so stochastic layers draw the same numbers.
+            The library's rand() takes an explicit seed and needs no saving.
+        **kwds (Any): The keyword arguments of layer.
+    Returns:
+        Any: The result of layer, whose tensors are leaves of the graph recorded after them.
+    """
+    if not is_grad_enabled():
+        return layer(*inputs, **kwds)
+    rng_state = _get_rng_state() if preserve_rng_state else None
+    with no_grad():
+        outputs = layer(*inputs, **kwds)
+    _segments().append(_Segment(layer, inputs, kwds, _output_tensors(outputs), rng_state))
+    return outputs
+
+def has_checkpoints() -> bool:
+    """
+    Returns:
+        bool: Whether checkpointed calls of this thread are waiting for a calc_grad().
+    """
+    return bool(getattr(_local, 'segments', None))
+
+def _grad_of(tensor: Tensor) -> Optional[Tensor]:
+    grad = tensor.get_grad()
+    return grad if tuple(grad.shape()) == tuple(tensor.shape()) else None
+
+def _add_grad(pending: Dict[int, Any], key: int, grad: Tensor) -> None:
+    # A tensor can be read by the graph and by several checkpointed calls.
+    with no_grad():
+        pending[key] = grad if key not in pending else pending[key] + grad
+
+def _weighted_sum(tensors: List[Tensor], grads: List[Optional[Tensor]]) -> Optional[Tensor]:
+    """
+    The gradient of sum(tensor * grad) with respect to anything before tensor is its gradient through tensor.
+    Returns:
+        Optional[Tensor]: The sum of these terms over tensors, recorded by autograd, or None if no tensor has a gradient.
+    """
+    loss = None
+    with set_grad_enabled(True):
+        for tensor, grad in zip(tensors, grads):
+            if grad is not None:
+                term = (tensor * grad).sum()
+                loss = term if loss is None else loss + term
+    return loss
+
+def backward(tensor: Tensor, params: Optional[List[Tensor]], accumulate: bool, retain_graph: bool = False) -> None:
+    """
+    Runs the backward pass of Tensor.calc_grad() and collects the gradients into the grad of params,
+    completing the checkpointed calls of this thread that the pass reaches. Every reached call is recomputed
+    with the graph, last call first, and its backward is run from the gradients of its outputs. The calls
+    the pass does not reach, such as those of a forward that was never backwarded, are dropped without being recomputed.
+    Args:
+        tensor (Tensor): The tensor calc_grad() was called on.
+        params (Optional[List[Tensor]]): The parameters receiving the gradients, or None.
+        accumulate (bool): If True, add the gradients to the current grad of params, otherwise overwrite it.
+        retain_graph (bool): If True, keep the checkpointed calls and the graph so another calc_grad() can run.
+    Raises:
+        RuntimeError: If the pass reaches checkpointed calls and params is None, as get_grad() would only hold
+            the gradients of the last backward pass.
+    """
+    from tensor_array.layers.parameter import collect_grads, zero_grad
+    from tensor_array.tensor2 import Tensor as _Tensor
+    segments = list(_segments())
+    _local.segments = []
+    if not segments:
+        _Tensor._backward(tensor, retain_graph)
+        if params is not None:
+            collect_grads(params, accumulate)
+        return
+    try:
+        if params is not None and not accumulate:
+            # Every pass below adds its gradients, the first one reaching a parameter overwrites its grad.
+            zero_grad(params)
+        recomputed = _backward_through(tensor, segments, params, retain_graph)
+        if params is not None:
+            # The graph outside the checkpointed calls holds the original parameters, which the recomputed passes
+            # did not reach, so their get_grad() may be left from an earlier calc_grad().
+            collect_grads([param for param in params if id(param) not in recomputed], True)
+    finally:
+        _local.segments = segments if retain_graph else []
+
+def _backward_through(loss: Tensor, segments: List[_Segment], params: Optional[List[Tensor]], retain_graph: bool) -> Set[int]:
+    """
+    Runs the backward of loss, whose graph was recorded with the checkpointed calls segments, leaving the gradients
+    of the graph outside the calls in get_grad(). The gradients of the recomputed calls are collected into params.
+    Returns:
+        Set[int]: The ids of the parameters reached by a recomputed call.
+    """
+    from tensor_array.tensor2 import Tensor as _Tensor
+    if not segments:
+        _Tensor._backward(loss, retain_graph)
+        return set()
+    # The first pass only gives the outputs of the calls their gradients, the graph is kept for the last one.
+    _Tensor._backward(loss, True)
+    outputs = {id(output): output for segment in segments for output in segment.outputs}
+    pending = {}
+    for key, output in outputs.items():
+        grad = _grad_of(output)
+        if grad is not None:
+            pending[key] = grad
+    if pending and params is None:
+        if not retain_graph:
+            _Tensor._release_graph(loss)
+        raise RuntimeError("the graph contains checkpointed calls, pass the parameters to calc_grad(inputs=...) to receive their gradients")
+    recomputed = set()
+    boundary = {}
+    boundary_grads = {}
+    for segment in reversed(segments):
+        grads = [pending.pop(id(output), None) for output in segment.outputs]
+        if all(grad is None for grad in grads):
+            continue
+        input_grads, reached = _recompute_backward(segment, grads, params)
+        recomputed |= reached
+        for tensor, grad in zip(segment.inputs, input_grads):
+            if grad is None:
+                continue
+            if id(tensor) in outputs:
+                _add_grad(pending, id(tensor), grad)
+            else:
+                boundary[id(tensor)] = tensor
+                _add_grad(boundary_grads, id(tensor), grad)
+    if boundary:
+        # The graph before the calls is run again with loss, so that every node it shares with the graph after them
+        # gets its whole gradient from a single pass. The first pass already did the graph after the calls,
+        # this repeats it for the cost of a backward outside the checkpointed calls.
+        keys = list(boundary)
+        total = _weighted_sum([boundary[key] for key in keys], [boundary_grads[key] for key in keys])
+        with set_grad_enabled(True):
+            total = loss.sum() + total
+        _Tensor._backward(total, False)
+    if not retain_graph:
+        _Tensor._release_graph(loss)
+    return recomputed
+
+def _recompute_backward(segment: _Segment, grads: List[Optional[Tensor]], params: List[Tensor]) -> Tuple[List[Optional[Tensor]], Set[int]]:
+    """
+    Recomputes a checkpointed call with the graph and runs its backward from the gradients grads of its outputs,
+    collecting the gradients of the parameters it reaches. The parameters and the tensor inputs of the call are
+    replaced by fresh leaves for the pass, so get_grad() only holds what the pass computed.
+    Returns:
+        Tuple[List[Optional[Tensor]], Set[int]]: The gradient of each positional input of the call, None for the
+            inputs that are parameters, not tensors or not reached, and the ids of the parameters reached.
+    """
+    from tensor_array.layers.parameter import collect_grads
+    from tensor_array.tensor2 import Tensor as _Tensor
+    param_ids = {id(param) for param in params}
+    inputs = [
+        tensor._leaf() if isinstance(tensor, _Tensor) and id(tensor) not in param_ids else tensor
+        for tensor in segment.inputs
+    ]
+    nodes = [param._leaf() for param in params]
+    for param, node in zip(params, nodes):
+        param._swap_node(node)
+    try:
+        state = None
+        if segment.rng_state is not None:
+            state = _get_rng_state()
+            _set_rng_state(segment.rng_state)
+        try:
+            with set_grad_enabled(True):
+                recomputed = _output_tensors(segment.function(*inputs, **segment.kwds))
+        finally:
+            if state is not None:
+                _set_rng_state(state)
+        # Calls checkpointed while recomputing are completed from the graph of this one.
+        nested = _local.segments
+        _local.segments = []
+        loss = _weighted_sum(recomputed, grads)
+        reached = _backward_through(loss, nested, params, False) if loss is not None else set()
+        own = [param for param in params if _grad_of(param) is not None]
+        collect_grads(own, True)
+        reached.update(id(param) for param in own)
+        input_grads = [
+            _grad_of(tensor) if tensor is not original else None
+            for tensor, original in zip(inputs, segment.inputs)
+        ]
+    finally:
+        for param, node in zip(params, nodes):
+            param._swap_node(node)
+    return input_grads, reached
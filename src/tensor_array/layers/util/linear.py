@@ -3,10 +3,13 @@ from .. import Parameter
 from tensor_array.core import Tensor
 from tensor_array.core import zeros
 from tensor_array.core import DataTypes
+from tensor_array.amp import cast_parameter
 from typing import Any
 
 
 class Linear(Layer):
+    _lazy_parameters = ('w',)
+
     def __init__(self, bias) -> None:
         """
         Initializes a Linear layer with a specified bias shape.
@@ -20,18 +23,21 @@ class Linear(Layer):
     def layer_init(self, t):
         """
         Initializes the layer with the shape of the input tensor.
+        The weight is kept if it was already assigned, for example by MultiheadAttention.pack_qkv().
         Args:
             t (Tensor): The input tensor to determine the shape for the weight parameter.
         """
-        self.w = Parameter(zeros(shape = (t[-1], self.bias_shape), dtype = DataTypes.FLOAT))
+        if 'w' not in self._parameters:
+            self.w = Parameter(zeros(shape = (t[-1], self.bias_shape), dtype = DataTypes.FLOAT))
     
     def calculate(self, t):
         """
         Calculates the linear transformation of the input tensor.
+        Inside autocast, the weight and the bias are used in the reduced precision type, cast once per autocast region.
         Args:
             t (Tensor): The input tensor to be transformed.
         Returns:
             Tensor: The transformed tensor after applying the linear transformation.
         """
-        return t @ self.w + self.b
+        return t @ cast_parameter(self.w) + cast_parameter(self.b)
         
\ No newline at end of file
@@ -1,20 +1,44 @@
 from .. import Layer
-from .. import Parameter
-from tensor_array.core import Tensor
-from tensor_array.core import zeros
-from tensor_array.core import DataTypes
-from typing import Any, List, OrderedDict
+from tensor_array.core import is_grad_enabled
+from tensor_array.layers.util.checkpoint import checkpoint
+from typing import Iterable, List, Mapping, Union
 
 
 class Sequential(Layer):
-    def __init__(self, _layers: OrderedDict[str, Layer]) -> None:
+    def __init__(self, _layers: Union[Mapping[str, Layer], Iterable[Layer]], checkpoint_segments: int = 0) -> None:
         """
         Initializes a Sequential layer with a list of layers.
         Args:
-            _layers (OrderedDict[str, Layer]): An ordered dictionary of layers to be applied sequentially.
+            _layers (Union[Mapping[str, Layer], Iterable[Layer]]): The layers to be applied sequentially,
+                either named by an ordered mapping or numbered from 0 in the order of an iterable.
+            checkpoint_segments (int): If greater than 0, a training call in grad mode splits the layers into this many
+                contiguous segments and checkpoints all but the last one, so only the tensors at the boundaries
+                of the segments are kept for the backward pass and the rest is recomputed by calc_grad().
+        Raises:
+            ValueError: If checkpoint_segments is negative.
         """
-        self._layers = _layers
-    
+        super().__init__()
+        if checkpoint_segments < 0:
+            raise ValueError(f"checkpoint_segments must not be negative, got {checkpoint_segments}")
+        self.checkpoint_segments = checkpoint_segments
+        items = _layers.items() if isinstance(_layers, Mapping) else ((str(i), layer) for i, layer in enumerate(_layers))
+        for name, layer in items:
+            self.register_layer(name, layer)
+
+    def _segments(self) -> List[List[Layer]]:
+        layers = [layer for layer in self._layers.values() if layer is not None]
+        count = min(self.checkpoint_segments, len(layers))
+        if count == 0:
+            return [layers]
+        bounds = [len(layers) * i // count for i in range(count + 1)]
+        return [layers[bounds[i]:bounds[i + 1]] for i in range(count)]
+
+    @staticmethod
+    def _run_segment(layers: List[Layer], t):
+        for layer in layers:
+            t = layer(t)
+        return t
+
     def calculate(self, t):
         """
         Applies each layer in the sequential model to the input tensor in order.
@@ -23,7 +47,10 @@ class Sequential(Layer):
         Returns:
             Tensor: The output tensor after passing through all layers.
         """
-        tensorloop = t
-        for _, content in self._layers:
-            tensorloop = content(tensorloop)
-        return tensorloop
+        if self.checkpoint_segments == 0 or not is_grad_enabled():
+            return self._run_segment([layer for layer in self._layers.values() if layer is not None], t)
+        segments = self._segments()
+        for segment in segments[:-1]:
+            t = checkpoint(self._run_segment, segment, t)
+        # The last segment is recomputed right away by the backward pass, so it keeps its graph.
+        return self._run_segment(segments[-1], t)
@@ -0,0 +1,52 @@
+"""
+# src/tensor_array/memory.py
+# This module exposes the caching allocator that serves the host scratch memory of the native kernels.
+# Freed blocks are kept per size class and reused by later calls of the same size,
+# so a steady-state loop stops calling the system allocator once the cache is warm.
+"""
+
+from typing import Dict, Union
+
+def memory_stats() -> Dict[str, Union[int, float]]:
+    """
+    Returns the statistics of the host caching allocator.
+    Returns:
+        Dict[str, Union[int, float]]: The statistics, with the keys
+            allocated_bytes: bytes of the blocks in use, rounded to their size classes,
+            peak_allocated_bytes: the maximum of allocated_bytes since the start or reset_peak_memory_stats(),
+            requested_bytes: bytes requested by the blocks in use,
+            cached_bytes: bytes of the free blocks kept for reuse,
+            reserved_bytes: allocated_bytes + cached_bytes, what the allocator holds from the system,
+            max_cached_bytes: the limit of cached_bytes,
+            num_allocs: the number of allocations,
+            num_cache_hits: the number of allocations served from the cache,
+            num_system_allocs: the number of allocations from the system,
+            num_system_frees: the number of blocks given back to the system,
+            fragmentation: the share of allocated_bytes lost to the rounding to size classes.
+    """
+    from tensor_array.tensor2 import memory_stats as _memory_stats
+    return _memory_stats()
+
+def empty_cache() -> None:
+    """
+    Gives all cached free blocks back to the system. Blocks in use are not affected.
+    """
+    from tensor_array.tensor2 import empty_cache as _empty_cache
+    _empty_cache()
+
+def set_max_cached_bytes(max_bytes: int) -> None:
+    """
+    Sets the limit of cached free blocks, releasing the largest blocks first when the cache is over it.
+    The default limit is 256 MiB, or the TENSOR_ARRAY_HOST_CACHE_MB environment variable in MiB.
+    Args:
+        max_bytes (int): The maximum number of bytes kept in the cache, 0 to disable caching.
+    """
+    from tensor_array.tensor2 import set_max_cached_bytes as _set_max_cached_bytes
+    _set_max_cached_bytes(max_bytes)
+
+def reset_peak_memory_stats() -> None:
+    """
+    Resets peak_allocated_bytes to the bytes currently allocated.
+    """
+    from tensor_array.tensor2 import reset_peak_memory_stats as _reset_peak_memory_stats
+    _reset_peak_memory_stats()
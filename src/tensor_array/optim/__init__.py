@@ -0,0 +1,4 @@
+from tensor_array.optim.optimizer import Optimizer
+from tensor_array.optim.sgd import SGD
+from tensor_array.optim.adam import Adam
+from tensor_array.optim.adam import AdamW
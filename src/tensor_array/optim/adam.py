@@ -0,0 +1,79 @@
+from typing import Any, Dict, Iterable, Tuple, Union
+from tensor_array.layers import Layer
+from tensor_array.layers import Parameter
+from .optimizer import Optimizer
+from .optimizer import zeros_like
+
+class Adam(Optimizer):
+    """
+    The Adam optimizer, with weight decay added to the gradients as an L2 penalty.
+    """
+    decoupled_weight_decay = False
+
+    def __init__(
+            self,
+            params: Union[Layer, Iterable[Parameter], Iterable[Dict[str, Any]]],
+            lr: float = 1e-3,
+            betas: Tuple[float, float] = (0.9, 0.999),
+            eps: float = 1e-8,
+            weight_decay: float = 0,
+            maximize: bool = False,
+            foreach: bool = True
+            ) -> None:
+        """
+        Initializes the optimizer.
+        Args:
+            params (Union[Layer, Iterable[Parameter], Iterable[Dict[str, Any]]]): The parameters to optimize.
+            lr (float): The learning rate.
+            betas (Tuple[float, float]): The decay rates of the averages of the gradient and of its square.
+            eps (float): The term added to the denominator for numerical stability.
+            weight_decay (float): The weight decay factor.
+            maximize (bool): Whether to maximize the objective instead of minimizing it.
+            foreach (bool): If True, each group is updated by one native call, otherwise by one call per parameter.
+        """
+        defaults = dict(lr = lr, betas = betas, eps = eps, weight_decay = weight_decay, maximize = maximize, foreach = foreach)
+        super().__init__(params, defaults)
+
+    def init_state(self, param: Parameter, group: Dict[str, Any]) -> Dict[str, Any]:
+        return {'exp_avg': zeros_like(param), 'exp_avg_sq': zeros_like(param), 'step': 0}
+
+    def step(self) -> None:
+        """
+        Updates the parameters with their gradients.
+        Raises:
+            ValueError: If a parameter has no gradient or a gradient of another shape or type.
+        """
+        from tensor_array.tensor2 import adam_foreach as _adam_foreach
+        for group in self.param_groups:
+            params = group['params']
+            states = [self.state[id(param)] for param in params]
+            for state in states:
+                state['step'] += 1
+            grads = self.grads(group)
+            exp_avgs = [state['exp_avg'] for state in states]
+            exp_avg_sqs = [state['exp_avg_sq'] for state in states]
+            beta1, beta2 = group['betas']
+            hyperparameters = (states[0]['step'], group['lr'], beta1, beta2, group['eps'], group['weight_decay'], self.decoupled_weight_decay, group['maximize'])
+            if group['foreach']:
+                _adam_foreach(params, grads, exp_avgs, exp_avg_sqs, *hyperparameters)
+            else:
+                for param, grad, exp_avg, exp_avg_sq in zip(params, grads, exp_avgs, exp_avg_sqs):
+                    _adam_foreach([param], [grad], [exp_avg], [exp_avg_sq], *hyperparameters)
+
+class AdamW(Adam):
+    """
+    The Adam optimizer with decoupled weight decay, applied to the parameters directly.
+    """
+    decoupled_weight_decay = True
+
+    def __init__(
+            self,
+            params: Union[Layer, Iterable[Parameter], Iterable[Dict[str, Any]]],
+            lr: float = 1e-3,
+            betas: Tuple[float, float] = (0.9, 0.999),
+            eps: float = 1e-8,
+            weight_decay: float = 1e-2,
+            maximize: bool = False,
+            foreach: bool = True
+            ) -> None:
+        super().__init__(params, lr, betas, eps, weight_decay, maximize, foreach)
@@ -0,0 +1,121 @@
+"""
+# src/tensor_array/optim/optimizer.py
+# This module defines the Optimizer class, the base class of all optimizers.
+# An optimizer keeps its state in buffers allocated once, next to the parameters,
+# and updates the storage of the parameters in place.
+"""
+
+import functools
+from typing import Any, Dict, Iterable, List, Union
+from tensor_array.core import Tensor
+from tensor_array.layers import Layer
+from tensor_array.layers import Parameter
+from tensor_array.layers.parameter import zero_grad
+
+def zeros_like(tensor: Tensor) -> Tensor:
+    """
+    Creates a CPU tensor filled with zeros with the shape and data type of tensor.
+    Args:
+        tensor (Tensor): The tensor to copy the shape and data type from.
+    Returns:
+        Tensor: A new tensor filled with zeros.
+    """
+    import numpy as np
+    return Tensor(np.zeros(tuple(tensor.shape()), dtype = tensor.numpy().dtype))
+
+class Optimizer:
+    """
+    Base class for all optimizers.
+    Parameters are organized in groups, each group having its own hyperparameters.
+    Subclasses implement step() with one native call per group when foreach is True.
+    """
+    param_groups: List[Dict[str, Any]]
+    state: Dict[int, Dict[str, Any]]
+
+    def __init_subclass__(cls, **kwds: Any) -> None:
+        """
+        Makes the step() of every optimizer drop the reduced precision casts of the parameters it updated.
+        """
+        super().__init_subclass__(**kwds)
+        step = cls.__dict__.get('step')
+        if step is None:
+            return
+
+        @functools.wraps(step)
+        def wrapper(self, *args: Any, **kwds: Any) -> Any:
+            from tensor_array.amp import invalidate_parameter_casts
+            try:
+                return step(self, *args, **kwds)
+            finally:
+                invalidate_parameter_casts()
+        cls.step = wrapper
+
+    def __init__(self, params: Union[Layer, Iterable[Parameter], Iterable[Dict[str, Any]]], defaults: Dict[str, Any]) -> None:
+        """
+        Initializes the optimizer.
+        Args:
+            params (Union[Layer, Iterable[Parameter], Iterable[Dict[str, Any]]]): A layer whose parameters are optimized,
+                the parameters, or dicts with a 'params' key and hyperparameters overriding the defaults.
+            defaults (Dict[str, Any]): The default hyperparameters of the groups.
+        Raises:
+            ValueError: If there is no parameter to optimize.
+        """
+        if isinstance(params, Layer):
+            params = params.parameters()
+        params = list(params)
+        if len(params) == 0:
+            raise ValueError("optimizer got an empty parameter list")
+        if not isinstance(params[0], dict):
+            params = [{'params': params}]
+        self.defaults = defaults
+        self.param_groups = []
+        self.state = {}
+        for group in params:
+            self.add_param_group(group)
+
+    def add_param_group(self, param_group: Dict[str, Any]) -> None:
+        """
+        Adds a group of parameters, allocating their optimizer state.
+        Args:
+            param_group (Dict[str, Any]): The parameters under 'params' and the hyperparameters of the group.
+        """
+        group = dict(self.defaults)
+        group.update(param_group)
+        group['params'] = list(group['params'])
+        for param in group['params']:
+            self.state[id(param)] = self.init_state(param, group)
+        self.param_groups.append(group)
+
+    def init_state(self, param: Parameter, group: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Allocates the optimizer state of one parameter.
+        Args:
+            param (Parameter): The parameter.
+            group (Dict[str, Any]): The group of the parameter.
+        Returns:
+            Dict[str, Any]: The state of the parameter.
+        """
+        return {}
+
+    def grads(self, group: Dict[str, Any]) -> List[Tensor]:
+        """
+        Returns the gradients of the parameters of a group.
+        A parameter uses its grad if calc_grad(inputs=...) set it, else the gradient of the last calc_grad().
+        """
+        return [param.get_grad() if getattr(param, 'grad', None) is None else param.grad for param in group['params']]
+
+    def zero_grad(self, set_to_none: bool = True) -> None:
+        """
+        Resets the gradients of all optimized parameters.
+        Args:
+            set_to_none (bool): If True, set grad to None, keeping the buffer for the next calc_grad,
+                otherwise fill the gradients with zeros in place.
+        """
+        for group in self.param_groups:
+            zero_grad(group['params'], set_to_none)
+
+    def step(self) -> None:
+        """
+        Updates the parameters with their gradients.
+        """
+        raise NotImplementedError
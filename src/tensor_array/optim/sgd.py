@@ -0,0 +1,65 @@
+from typing import Any, Dict, Iterable, Union
+from tensor_array.layers import Layer
+from tensor_array.layers import Parameter
+from .optimizer import Optimizer
+from .optimizer import zeros_like
+
+class SGD(Optimizer):
+    """
+    Stochastic gradient descent, with optional momentum, Nesterov momentum and weight decay.
+    """
+
+    def __init__(
+            self,
+            params: Union[Layer, Iterable[Parameter], Iterable[Dict[str, Any]]],
+            lr: float = 1e-3,
+            momentum: float = 0,
+            dampening: float = 0,
+            weight_decay: float = 0,
+            nesterov: bool = False,
+            maximize: bool = False,
+            foreach: bool = True
+            ) -> None:
+        """
+        Initializes the optimizer.
+        Args:
+            params (Union[Layer, Iterable[Parameter], Iterable[Dict[str, Any]]]): The parameters to optimize.
+            lr (float): The learning rate.
+            momentum (float): The momentum factor, 0 to disable momentum.
+            dampening (float): The dampening of the momentum.
+            weight_decay (float): The L2 penalty added to the gradients.
+            nesterov (bool): Whether to use Nesterov momentum.
+            maximize (bool): Whether to maximize the objective instead of minimizing it.
+            foreach (bool): If True, each group is updated by one native call, otherwise by one call per parameter.
+        Raises:
+            ValueError: If Nesterov momentum is requested without momentum or with dampening.
+        """
+        if nesterov and (momentum <= 0 or dampening != 0):
+            raise ValueError("Nesterov momentum requires a momentum and zero dampening")
+        defaults = dict(lr = lr, momentum = momentum, dampening = dampening, weight_decay = weight_decay, nesterov = nesterov, maximize = maximize, foreach = foreach)
+        super().__init__(params, defaults)
+
+    def init_state(self, param: Parameter, group: Dict[str, Any]) -> Dict[str, Any]:
+        return {'momentum_buffer': zeros_like(param), 'step': 0}
+
+    def step(self) -> None:
+        """
+        Updates the parameters with their gradients.
+        Raises:
+            ValueError: If a parameter has no gradient or a gradient of another shape or type.
+        """
+        from tensor_array.tensor2 import sgd_foreach as _sgd_foreach
+        for group in self.param_groups:
+            params = group['params']
+            states = [self.state[id(param)] for param in params]
+            grads = self.grads(group)
+            buffers = [state['momentum_buffer'] for state in states]
+            first_step = states[0]['step'] == 0
+            hyperparameters = (group['lr'], group['momentum'], group['dampening'], group['weight_decay'], group['nesterov'], group['maximize'], first_step)
+            if group['foreach']:
+                _sgd_foreach(params, grads, buffers, *hyperparameters)
+            else:
+                for param, grad, buffer in zip(params, grads, buffers):
+                    _sgd_foreach([param], [grad], [buffer], *hyperparameters)
+            for state in states:
+                state['step'] += 1
@@ -0,0 +1,30 @@
+"""
+# src/tensor_array/parallel.py
+# This module controls the intra-op thread pool of the native kernels.
+# Elementwise activations, softmax, attention, fused graph ops and optimizer updates split their work
+# across the pool, while inputs below the grain size of a kernel stay on the calling thread.
+"""
+
+def get_num_threads() -> int:
+    """
+    Returns the number of threads used by the native kernels, the calling thread included.
+    It defaults to TENSOR_ARRAY_NUM_THREADS, OMP_NUM_THREADS or MKL_NUM_THREADS, in that order,
+    or else to the number of hardware threads.
+    Returns:
+        int: The number of threads.
+    """
+    from tensor_array.tensor2 import get_num_threads as _get_num_threads
+    return _get_num_threads()
+
+def set_num_threads(num_threads: int) -> None:
+    """
+    Sets the number of threads used by the native kernels, 1 to run every kernel serially.
+    Args:
+        num_threads (int): The number of threads, the calling thread included.
+    Raises:
+        ValueError: If num_threads is smaller than 1.
+    """
+    if num_threads < 1:
+        raise ValueError(f"num_threads must be at least 1, got {num_threads}")
+    from tensor_array.tensor2 import set_num_threads as _set_num_threads
+    _set_num_threads(num_threads)
@@ -0,0 +1,260 @@
+"""
+# src/tensor_array/serving.py
+# This module batches concurrent inference requests to a layer on an asyncio event loop.
+# Requests arriving within max_wait_ms of each other are padded to a common length, stacked into one batch
+# and run in a single forward pass on a worker thread, so the event loop keeps accepting requests meanwhile
+# and the matmuls of the layer run on a whole batch instead of one sample at a time.
+"""
+
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Union
+import numpy as np
+from tensor_array.core import Tensor
+from tensor_array.core import inference_mode
+
+def attention_mask(lengths: np.ndarray, length: int) -> Tensor:
+    """
+    Builds the mask of a batch of padded sequences for self-attention, as taken by MultiheadAttention.
+    Args:
+        lengths (np.ndarray): The number of real positions of every sequence.
+        length (int): The padded length.
+    Returns:
+        Tensor: A BOOL tensor of shape [batch, 1, length, length], True for the keys that are not padding.
+    """
+    keys = np.arange(length) < lengths[:, None]
+    return Tensor(np.ascontiguousarray(np.broadcast_to(keys[:, None, None, :], (len(lengths), 1, length, length))))
+
+class _Request:
+    __slots__ = ('data', 'future', 'arrival')
+
+    def __init__(self, data: np.ndarray, future: asyncio.Future, arrival: float) -> None:
+        self.data = data
+        self.future = future
+        self.arrival = arrival
+
+class BatchedInference:
+    """
+    Serves a layer to concurrent asyncio callers, running their requests in batches.
+    A request is one sample without the batch dimension, a Tensor or a numeric array of at least one dimension.
+    Samples may differ in the length of their first dimension, the sequence. Samples that differ in the other dimensions
+    or in the data type from the oldest pending request wait for a later batch, so they never fail the batch of others.
+    Shorter sequences are padded with pad_value, and the output of a request is cut back to its length when the layer
+    keeps the sequence dimension. The forward pass runs without recording the autograd graph.
+    """
+
+    def __init__(
+            self,
+            layer: Callable[..., Any],
+            max_batch_size: int = 32,
+            max_wait_ms: float = 2.0,
+            pad_value: Union[int, float] = 0,
+            mask_argument: Optional[str] = None,
+            make_mask: Callable[[np.ndarray, int], Any] = attention_mask,
+            latency_window: int = 10000
+            ) -> None:
+        """
+        Initializes the batcher. Its worker starts with the first request, on the event loop of that request.
+        Args:
+            layer (Callable[..., Any]): The layer, called with a batch and returning a Tensor whose first dimension is the batch.
+            max_batch_size (int): The largest number of requests run together.
+            max_wait_ms (float): How long the first request of a batch waits for others, in milliseconds.
+            pad_value (Union[int, float]): The value of the padding positions.
+            mask_argument (Optional[str]): The keyword argument of layer taking the mask of a padded batch,
+                such as 'mask' for TransformerEncoderImpl. If None, no mask is passed, which suits layers
+                that treat the positions independently. Batches needing no padding are called without a mask.
+            make_mask (Callable[[np.ndarray, int], Any]): Builds the mask from the lengths of the sequences and the padded length.
+            latency_window (int): The number of latest requests the latency percentiles are computed over.
+        Raises:
+            ValueError: If max_batch_size is smaller than 1 or max_wait_ms is negative.
+        """
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}")
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms must not be negative, got {max_wait_ms}")
+        self.layer = layer
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.pad_value = pad_value
+        self.mask_argument = mask_argument
+        self.make_mask = make_mask
+        self._pending: Deque[_Request] = deque()
+        self._arrived: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        # A single thread runs the forward passes, the native kernels parallelize each of them.
+        self._executor = ThreadPoolExecutor(1)
+        self._in_flight = 0
+        self._batch_sizes: Dict[int, int] = {}
+        self._latencies: Deque[float] = deque(maxlen = latency_window)
+        self._requests = 0
+        self._batches = 0
+
+    async def __call__(self, input: Union[Tensor, np.ndarray]) -> Tensor:
+        """
+        Runs the layer on one sample, batched with the concurrent requests.
+        Args:
+            input (Union[Tensor, np.ndarray]): The sample, without the batch dimension.
+        Returns:
+            Tensor: The output of the layer for this sample, without the batch dimension.
+        Raises:
+            RuntimeError: If the batcher is closed.
+            ValueError: If the sample has no dimension.
+            TypeError: If the sample is not numeric.
+            Exception: Whatever the layer raised for the batch of the request.
+        """
+        if self._executor is None:
+            raise RuntimeError("the BatchedInference is closed")
+        data = input.numpy() if isinstance(input, Tensor) else np.asarray(input)
+        # Checked here, so that a bad request fails alone instead of failing the batch it would join.
+        if data.ndim == 0:
+            raise ValueError("a request must have at least one dimension, the sequence")
+        if data.dtype.kind not in 'biuf':
+            raise TypeError(f"a request must be a numeric array, got data type {data.dtype}")
+        loop = asyncio.get_running_loop()
+        if self._worker is None:
+            self._arrived = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        request = _Request(data, loop.create_future(), time.perf_counter())
+        self._pending.append(request)
+        self._arrived.set()
+        return await request.future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+            deadline = self._pending[0].arrival + self.max_wait_ms / 1000
+            while len(self._pending) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch = self._take_batch()
+            if not batch:
+                continue
+            self._in_flight = len(batch)
+            try:
+                outputs = await loop.run_in_executor(self._executor, self._forward, [request.data for request in batch])
+            except asyncio.CancelledError:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(RuntimeError("the BatchedInference was closed"))
+                raise
+            except Exception as error:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(error)
+                continue
+            finally:
+                self._in_flight = 0
+            now = time.perf_counter()
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            for request, output in zip(batch, outputs):
+                self._latencies.append(now - request.arrival)
+                if not request.future.done():
+                    request.future.set_result(output)
+
+    def _take_batch(self) -> List[_Request]:
+        """
+        Takes up to max_batch_size pending requests that stack with the oldest one, dropping the cancelled ones.
+        The requests of other shapes or data types are left at the front of the queue for the next batch.
+        """
+        batch: List[_Request] = []
+        deferred: List[_Request] = []
+        while self._pending and len(batch) < self.max_batch_size:
+            request = self._pending.popleft()
+            if request.future.cancelled():
+                continue
+            first = batch[0].data if batch else request.data
+            if request.data.shape[1:] != first.shape[1:] or request.data.dtype != first.dtype:
+                deferred.append(request)
+            else:
+                batch.append(request)
+        self._pending.extendleft(reversed(deferred))
+        return batch
+
+    def _forward(self, samples: List[np.ndarray]) -> List[Tensor]:
+        """
+        Pads and stacks samples, runs the layer and splits its output, on the worker thread.
+        The samples agree on the data type and on every dimension but the first, see _take_batch().
+        """
+        first = samples[0]
+        lengths = np.array([len(sample) for sample in samples], dtype = np.int64)
+        length = int(lengths.max())
+        padded = bool((lengths != length).any())
+        batch = np.full((len(samples), length) + first.shape[1:], self.pad_value, dtype = first.dtype)
+        for i, sample in enumerate(samples):
+            batch[i, :len(sample)] = sample
+        kwds = {}
+        if padded and self.mask_argument is not None:
+            kwds[self.mask_argument] = self.make_mask(lengths, length)
+        with inference_mode():
+            output = self.layer(Tensor(batch), **kwds)
+        output = output.numpy()
+        if len(output) != len(samples):
+            raise ValueError(f"the layer returned {len(output)} outputs for a batch of {len(samples)}")
+        keeps_sequence = padded and output.ndim > 1 and output.shape[1] == length
+        return [Tensor(np.ascontiguousarray(output[i, :lengths[i]] if keeps_sequence else output[i])) for i in range(len(samples))]
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Returns the statistics of the batcher.
+        Returns:
+            Dict[str, Any]: The statistics, with the keys
+                queue_depth: the number of requests waiting for a batch,
+                in_flight: the number of requests in the running forward pass,
+                requests: the number of requests answered,
+                batches: the number of forward passes,
+                mean_batch_size: requests / batches,
+                batch_size_histogram: the number of forward passes by batch size,
+                latency_ms: the 50th, 90th and 99th percentiles of the time from the arrival of a request
+                    to its answer over the latest requests, by 'p50', 'p90' and 'p99'.
+        """
+        latencies = np.array(self._latencies) * 1000
+        return {
+            'queue_depth': len(self._pending),
+            'in_flight': self._in_flight,
+            'requests': self._requests,
+            'batches': self._batches,
+            'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+            'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+            'latency_ms': {
+                f'p{q}': float(np.percentile(latencies, q)) if len(latencies) else 0.0
+                for q in (50, 90, 99)
+            },
+        }
+
+    async def close(self) -> None:
+        """
+        Stops the worker, failing the requests still waiting, and releases its thread.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        while self._pending:
+            request = self._pending.popleft()
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("the BatchedInference was closed"))
+        if self._executor is not None:
+            self._executor.shutdown(wait = False)
+            self._executor = None
+
+    async def __aenter__(self) -> 'BatchedInference':
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
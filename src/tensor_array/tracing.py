@@ -0,0 +1,149 @@
+"""
+# src/tensor_array/tracing.py
+# This module captures the native ops run by a layer into a graph that is replayed from C++.
+# A replay skips Layer.__call__, the attribute lookups of the layers and the Python wrappers of the ops,
+# so small inputs run at the speed of the native ops alone.
+"""
+
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+from tensor_array.core import Tensor
+from tensor_array.core import no_grad
+from tensor_array.layers import Layer
+
+OPTIMIZATION_PASSES = (
+    'eliminate_common_subexpressions',
+    'fuse_elementwise',
+    'eliminate_dead_nodes',
+)
+
+def optimize_graph(graph: Any, passes: Sequence[str] = OPTIMIZATION_PASSES, freeze: bool = False, debug: bool = False) -> Dict[str, int]:
+    """
+    Runs optimization passes over a recorded graph, in order.
+    Args:
+        graph (TraceGraph): The graph to optimize in place.
+        passes (Sequence[str]): The names of the passes, among 'fold_constants', 'eliminate_common_subexpressions',
+            'fuse_elementwise' and 'eliminate_dead_nodes'.
+        freeze (bool): If True, run 'fold_constants' first. Folding freezes the current values of the parameters
+            into the graph, so later in-place updates are not seen by replays.
+        debug (bool): If True, print the graph before and after each pass.
+    Returns:
+        Dict[str, int]: The number of ops changed by each pass.
+    """
+    if freeze and 'fold_constants' not in passes:
+        passes = ('fold_constants',) + tuple(passes)
+    changes = {}
+    for name in passes:
+        if debug:
+            print(f"--- before {name}\n{graph.dump()}")
+        changes[name] = getattr(graph, name)()
+        if debug:
+            print(f"--- after {name} ({changes[name]} changed)\n{graph.dump()}")
+    return changes
+
+def _signature(inputs: Sequence[Tensor]) -> Tuple:
+    return tuple((tuple(value.shape()), value.dtype()) for value in inputs)
+
+class TracedLayer:
+    """
+    A layer whose forward pass is replayed from recorded graphs of native ops, one per input signature.
+    Calling it with inputs of new shapes or data types records a new graph first.
+    Tensors the layer uses but that are not computed from the inputs, such as parameters, are captured by handle,
+    so in-place updates by an optimizer or by Layer.load_state_dict() are seen by later calls. Values computed outside the native ops,
+    for example through NumPy or Python control flow depending on the data, are frozen at trace time.
+    Replays do not record the autograd graph.
+    """
+
+    def __init__(
+            self,
+            layer: Layer,
+            example_inputs: Union[Tensor, Sequence[Tensor]],
+            passes: Optional[Sequence[str]] = OPTIMIZATION_PASSES,
+            freeze: bool = False,
+            debug: bool = False
+            ) -> None:
+        """
+        Initializes the traced layer and records its first graph.
+        Args:
+            layer (Layer): The layer to trace.
+            example_inputs (Union[Tensor, Sequence[Tensor]]): The inputs used to record the graph.
+            passes (Optional[Sequence[str]]): The optimization passes run on every recorded graph, None to run none.
+            freeze (bool): If True, also fold the ops that depend only on parameters and constants.
+            debug (bool): If True, print every graph before and after each pass.
+        """
+        self.layer = layer
+        self.passes = passes
+        self.freeze = freeze
+        self.debug = debug
+        self.graphs: Dict[Tuple, Any] = {}
+        self.single_output: Dict[Tuple, bool] = {}
+        if isinstance(example_inputs, Tensor):
+            example_inputs = (example_inputs,)
+        self.record(tuple(example_inputs))
+
+    def record(self, inputs: Tuple[Tensor, ...]) -> Any:
+        """
+        Runs the layer once on inputs and records its native ops.
+        Args:
+            inputs (Tuple[Tensor, ...]): The inputs of the layer.
+        Returns:
+            The outputs of the layer.
+        Raises:
+            TypeError: If the layer does not return a Tensor or a tuple or list of Tensors.
+        """
+        from tensor_array.tensor2 import TraceGraph as _TraceGraph
+        from tensor_array.tensor2 import Tensor as _Tensor
+        graph = _TraceGraph()
+        with no_grad():
+            graph.begin(list(inputs))
+            try:
+                outputs = self.layer(*inputs)
+            except BaseException:
+                graph.end([])
+                raise
+            single_output = isinstance(outputs, _Tensor)
+            output_list = [outputs] if single_output else list(outputs) if isinstance(outputs, (tuple, list)) else None
+            if output_list is None or not all(isinstance(value, _Tensor) for value in output_list):
+                graph.end([])
+                raise TypeError("traced layers must return a Tensor or a tuple or list of Tensors")
+            graph.end(output_list)
+        if self.passes is not None:
+            optimize_graph(graph, self.passes, self.freeze, self.debug)
+        signature = _signature(inputs)
+        self.graphs[signature] = graph
+        self.single_output[signature] = single_output
+        return outputs
+
+    def __call__(self, *inputs: Tensor) -> Any:
+        """
+        Replays the graph recorded for the shapes and data types of inputs, recording it first if needed.
+        Args:
+            *inputs (Tensor): The inputs of the layer.
+        Returns:
+            The outputs of the layer, a Tensor or a tuple of Tensors.
+        """
+        signature = _signature(inputs)
+        graph = self.graphs.get(signature)
+        if graph is None:
+            return self.record(inputs)
+        outputs = graph.run(list(inputs))
+        return outputs[0] if self.single_output[signature] else tuple(outputs)
+
+def trace(
+        layer: Layer,
+        example_inputs: Union[Tensor, Sequence[Tensor]],
+        passes: Optional[Sequence[str]] = OPTIMIZATION_PASSES,
+        freeze: bool = False,
+        debug: bool = False
+        ) -> TracedLayer:
+    """
+    Records the native ops run by layer on example_inputs into a graph replayed from C++.
+    Args:
+        layer (Layer): The layer to trace.
+        example_inputs (Union[Tensor, Sequence[Tensor]]): The inputs used to record the graph.
+        passes (Optional[Sequence[str]]): The optimization passes run on every recorded graph, None to run none.
+        freeze (bool): If True, also fold the ops that depend only on parameters and constants.
+        debug (bool): If True, print every graph before and after each pass.
+    Returns:
+        TracedLayer: A callable replaying the graph, that records a new graph when the input shapes change.
+    """
+    return TracedLayer(layer, example_inputs, passes, freeze, debug)
@@ -1,5 +1,6 @@
 import tensor_array.core as ta
 import numpy as np
+import pytest
 
 def test_add():
     example_tensor_array = ta.Tensor(np.array([
@@ -13,3 +14,584 @@ def test_add():
     example_tensor_sum.calc_grad()
     print(example_tensor_array.get_grad())
     print(example_tensor_array_scalar.get_grad())
+
+def test_numpy_view():
+    example_tensor_array = ta.Tensor(np.arange(12, dtype=np.float32).reshape(3, 4))
+    example_view = example_tensor_array.numpy()
+    assert not example_view.flags.writeable
+    assert np.shares_memory(example_view, np.asarray(example_tensor_array))
+    assert np.shares_memory(example_view, example_tensor_array.__array__(np.float32, copy=False))
+    with pytest.raises(ValueError):
+        example_tensor_array.__array__(np.float64, copy=False)
+    example_copy = example_tensor_array.numpy(copy=True)
+    assert example_copy.flags.writeable
+    assert not np.shares_memory(example_view, example_copy)
+    np.testing.assert_array_equal(example_view, example_copy)
+
+def test_numpy_dtypes():
+    for example_dtype in (np.bool_, np.uint8, np.int64, np.float16, np.float64):
+        example_array = np.ones((2, 3), dtype=example_dtype)
+        np.testing.assert_array_equal(ta.Tensor(example_array).numpy(), example_array)
+    example_strided = np.arange(16, dtype=np.int64).reshape(4, 4)[:, ::2]
+    with pytest.warns(ta.TensorCopyWarning):
+        np.testing.assert_array_equal(ta.Tensor(example_strided).numpy(), example_strided)
+    with pytest.raises(ValueError):
+        ta.Tensor(example_strided, copy=False)
+
+def test_numpy_bfloat16():
+    ml_dtypes = pytest.importorskip("ml_dtypes")
+    example_array = np.arange(6, dtype=np.float32).reshape(2, 3).astype(ml_dtypes.bfloat16)
+    example_tensor = ta.Tensor(example_array)
+    assert ta.DataTypes(example_tensor.dtype()) == ta.DataTypes.BFLOAT16
+    np.testing.assert_array_equal(example_tensor.numpy(), example_array)
+
+def test_no_grad():
+    assert ta.is_grad_enabled()
+    with ta.no_grad():
+        assert not ta.is_grad_enabled()
+        with ta.enable_grad():
+            assert ta.is_grad_enabled()
+        assert not ta.is_grad_enabled()
+    assert ta.is_grad_enabled()
+
+    @ta.inference_mode()
+    def example_forward(example_tensor):
+        assert not ta.is_grad_enabled()
+        return example_tensor + example_tensor
+
+    example_forward(ta.Tensor(np.ones((2, 2), dtype=np.float32)))
+    assert ta.is_grad_enabled()
+
+def test_activation():
+    from tensor_array import activation
+    example_array = np.linspace(-3, 3, 24, dtype=np.float64).reshape(2, 3, 4)
+    example_tensor_array = ta.Tensor(example_array)
+    np.testing.assert_allclose(activation.relu(example_tensor_array).numpy(), np.maximum(example_array, 0))
+    np.testing.assert_allclose(activation.sigmoid(example_tensor_array).numpy(), 1 / (1 + np.exp(-example_array)))
+    example_exp = np.exp(example_array - example_array.max(axis=1, keepdims=True))
+    example_softmax = example_exp / example_exp.sum(axis=1, keepdims=True)
+    np.testing.assert_allclose(activation.softmax(example_tensor_array, 1).numpy(), example_softmax)
+    np.testing.assert_allclose(activation.log_softmax(example_tensor_array, 1).numpy(), np.log(example_softmax))
+    with ta.no_grad():
+        example_copy = ta.Tensor(example_array.copy())
+        activation.relu_(example_copy)
+        np.testing.assert_allclose(example_copy.numpy(), np.maximum(example_array, 0))
+    with pytest.raises(RuntimeError):
+        activation.relu_(example_tensor_array)
+    example_integers = np.arange(-3, 3, dtype=np.int32)
+    np.testing.assert_array_equal(activation.relu(ta.Tensor(example_integers)).numpy(), np.maximum(example_integers, 0))
+    for function in (activation.relu, activation.silu, activation.gelu):
+        example_infinite = ta.Tensor(np.array([-np.inf, -1.0, 1.0, np.inf], dtype=np.float32))
+        example_output = function(example_infinite)
+        np.testing.assert_array_equal(example_output.numpy()[[0, 3]], [0.0, np.inf])
+        example_output.calc_grad()
+        np.testing.assert_array_equal(example_infinite.get_grad().numpy()[[0, 3]], [0.0, 1.0])
+
+def test_scaled_dot_product_attention():
+    from tensor_array.layers.attention.attention import scaled_dot_product_attention
+    example_rng = np.random.default_rng(0)
+    example_q, example_k, example_v = (example_rng.standard_normal((2, 3, 70, 8)) for _ in range(3))
+    example_scores = example_q @ np.swapaxes(example_k, -1, -2) / np.sqrt(8)
+    example_scores = np.where(np.tril(np.ones((70, 70), dtype=bool)), example_scores, -np.inf)
+    example_probs = np.exp(example_scores - example_scores.max(-1, keepdims=True))
+    example_expected = example_probs / example_probs.sum(-1, keepdims=True) @ example_v
+    example_inputs = [ta.Tensor(example_value) for example_value in (example_q, example_k, example_v)]
+    for example_grad in (True, False):
+        with ta.set_grad_enabled(example_grad):
+            example_output = scaled_dot_product_attention(*example_inputs, is_causal=True)
+            np.testing.assert_allclose(example_output.numpy(), example_expected, rtol=1e-6, atol=1e-9)
+            example_mask = ta.Tensor(np.tril(np.ones((70, 70), dtype=bool)))
+            example_output = scaled_dot_product_attention(*example_inputs, mask=example_mask)
+            np.testing.assert_allclose(example_output.numpy(), example_expected, rtol=1e-6, atol=1e-9)
+            example_mask = np.tril(np.ones((70, 70), dtype=bool))
+            example_mask[5] = False
+            example_output = scaled_dot_product_attention(*example_inputs, mask=ta.Tensor(example_mask)).numpy()
+            np.testing.assert_array_equal(example_output[:, :, 5], 0)
+            np.testing.assert_allclose(np.delete(example_output, 5, axis=2), np.delete(example_expected, 5, axis=2), rtol=1e-6, atol=1e-9)
+    example_query = ta.Tensor(example_q)
+    scaled_dot_product_attention(example_query, *example_inputs[1:], is_causal=True).calc_grad()
+    assert np.isfinite(example_query.get_grad().numpy()).all()
+
+def test_kv_cache():
+    from tensor_array.layers.attention import KVCache
+    from tensor_array.layers.attention.attention import scaled_dot_product_attention
+    example_rng = np.random.default_rng(0)
+    example_q, example_k, example_v = (example_rng.standard_normal((2, 3, 10, 4)).astype(np.float32) for _ in range(3))
+    with ta.no_grad():
+        example_expected = scaled_dot_product_attention(*(ta.Tensor(example_value) for example_value in (example_q, example_k, example_v)), is_causal=True).numpy()
+        example_cache = KVCache(batch_size=2, max_length=16, n_head=3, head_dim=4)
+        for example_repeat in range(2):
+            example_cache.reset()
+            for example_step in range(10):
+                example_positions = list(example_cache.lengths)
+                example_keys, example_values = example_cache.append(ta.Tensor(example_k[:, :, example_step:example_step + 1].copy()), ta.Tensor(example_v[:, :, example_step:example_step + 1].copy()))
+                example_output = scaled_dot_product_attention(ta.Tensor(example_q[:, :, example_step:example_step + 1].copy()), example_keys, example_values, is_causal=True, key_lengths=example_cache.lengths, query_offsets=example_positions)
+                np.testing.assert_allclose(example_output.numpy(), example_expected[:, :, example_step:example_step + 1], rtol=1e-5, atol=1e-6)
+        assert example_cache.lengths == [10, 10]
+
+def test_packed_qkv():
+    from tensor_array.layers import Parameter
+    from tensor_array.layers.attention import MultiheadAttention
+    example_rng = np.random.default_rng(0)
+    example_input = ta.Tensor(example_rng.standard_normal((2, 5, 8)).astype(np.float32))
+    example_layer = MultiheadAttention(8, 2)
+    with ta.no_grad():
+        example_layer(example_input, example_input, example_input)
+        for example_linear in (example_layer.linear_q, example_layer.linear_k, example_layer.linear_v, example_layer.linear_o):
+            example_linear.register_parameter('w', Parameter(ta.Tensor(example_rng.standard_normal((8, 8)).astype(np.float32))))
+            example_linear.register_parameter('b', Parameter(ta.Tensor(example_rng.standard_normal(8).astype(np.float32))))
+        example_expected = example_layer(example_input, example_input, example_input).numpy()
+        example_layer.pack_qkv()
+        example_output = example_layer(example_input, example_input, example_input).numpy()
+    np.testing.assert_allclose(example_output, example_expected, rtol=1e-5, atol=1e-5)
+
+def test_checkpoint(tmp_path):
+    from tensor_array.layers import Parameter
+    from tensor_array.layers.util import Linear
+    example_layer = Linear(3)
+    example_layer.register_parameter('w', Parameter(ta.Tensor(np.arange(6, dtype=np.float32).reshape(2, 3))))
+    assert [example_name for example_name, _ in example_layer.named_parameters()] == ['b', 'w']
+    import tensor_array
+    tensor_array.save_checkpoint(example_layer, str(tmp_path / "linear.ckpt"))
+    example_state = tensor_array.load_checkpoint(str(tmp_path / "linear.ckpt"))
+    assert isinstance(example_state['w'], Parameter)
+    example_loaded = Linear(3)
+    example_loaded.load_state_dict(example_state)
+    np.testing.assert_array_equal(example_loaded.w.numpy(), example_layer.w.numpy())
+    example_bias = example_loaded.b
+    with ta.no_grad():
+        example_layer.b.add_(1.0)
+    example_loaded.load_state_dict(example_layer.state_dict())
+    assert example_loaded.b is example_bias
+    np.testing.assert_array_equal(example_bias.numpy(), example_layer.b.numpy())
+    with pytest.raises(KeyError):
+        Linear(3).load_state_dict({'v': example_state['w']})
+
+def test_optimizer():
+    from tensor_array.layers import Parameter
+    from tensor_array.optim import SGD
+    example_param = Parameter(ta.Tensor(np.array([1.0, -2.0, 3.0], dtype=np.float32)))
+    example_optimizer = SGD([example_param], lr=0.5)
+    example_loss = example_param * example_param
+    example_loss.calc_grad()
+    example_optimizer.step()
+    np.testing.assert_allclose(example_param.numpy(), np.zeros(3, dtype=np.float32))
+
+def test_optimizer_reference():
+    from tensor_array.layers import Parameter
+    from tensor_array.optim import SGD, Adam, AdamW
+    def example_sgd(example_p, example_grads, lr, momentum, weight_decay, nesterov):
+        example_buffer = None
+        for example_g in example_grads:
+            example_d = example_g + weight_decay * example_p
+            example_buffer = example_d if example_buffer is None else momentum * example_buffer + example_d
+            example_p = example_p - lr * (example_d + momentum * example_buffer if nesterov else example_buffer)
+        return example_p
+    def example_adam(example_p, example_grads, lr, betas, eps, weight_decay, decoupled):
+        example_m = np.zeros_like(example_p)
+        example_v = np.zeros_like(example_p)
+        for example_t, example_g in enumerate(example_grads, 1):
+            if decoupled:
+                example_p = example_p * (1 - lr * weight_decay)
+            else:
+                example_g = example_g + weight_decay * example_p
+            example_m = betas[0] * example_m + (1 - betas[0]) * example_g
+            example_v = betas[1] * example_v + (1 - betas[1]) * example_g * example_g
+            example_denom = np.sqrt(example_v) / np.sqrt(1 - betas[1] ** example_t) + eps
+            example_p = example_p - lr / (1 - betas[0] ** example_t) * example_m / example_denom
+        return example_p
+    example_rng = np.random.default_rng(0)
+    example_start = example_rng.standard_normal(5)
+    example_grads = [example_rng.standard_normal(5) for _ in range(4)]
+    example_cases = [
+        (lambda example_params: SGD(example_params, lr=0.1, momentum=0.9, weight_decay=0.01), lambda: example_sgd(example_start, example_grads, 0.1, 0.9, 0.01, False)),
+        (lambda example_params: SGD(example_params, lr=0.1, momentum=0.9, nesterov=True), lambda: example_sgd(example_start, example_grads, 0.1, 0.9, 0.0, True)),
+        (lambda example_params: Adam(example_params, lr=0.01, weight_decay=0.1), lambda: example_adam(example_start, example_grads, 0.01, (0.9, 0.999), 1e-8, 0.1, False)),
+        (lambda example_params: AdamW(example_params, lr=0.01, weight_decay=0.1), lambda: example_adam(example_start, example_grads, 0.01, (0.9, 0.999), 1e-8, 0.1, True)),
+    ]
+    for example_make, example_reference in example_cases:
+        example_param = Parameter(ta.Tensor(example_start.astype(np.float32)))
+        example_optimizer = example_make([example_param])
+        for example_g in example_grads:
+            example_param.grad = ta.Tensor(example_g.astype(np.float32))
+            example_optimizer.step()
+        np.testing.assert_allclose(example_param.numpy(), example_reference(), rtol=1e-5, atol=1e-6)
+        example_param.grad = ta.Tensor(np.zeros(4, dtype=np.float32))
+        with pytest.raises(ValueError):
+            example_optimizer.step()
+
+def test_grad_buffers():
+    from tensor_array.layers import Parameter
+    example_param = Parameter(ta.Tensor(np.array([1.0, 2.0], dtype=np.float32)))
+    for _ in range(2):
+        example_loss = example_param * example_param
+        example_loss.calc_grad(inputs=[example_param])
+    grad_buffer = example_param.grad
+    np.testing.assert_allclose(grad_buffer.numpy(), np.array([4.0, 8.0], dtype=np.float32))
+    (example_param * example_param).calc_grad(inputs=[example_param], accumulate=False)
+    np.testing.assert_allclose(example_param.grad.numpy(), np.array([2.0, 4.0], dtype=np.float32))
+    from tensor_array.layers.parameter import zero_grad
+    zero_grad([example_param])
+    assert example_param.grad is None
+    (example_param * example_param).calc_grad(inputs=[example_param])
+    assert example_param.grad is grad_buffer
+
+def test_trace():
+    from tensor_array import trace
+    from tensor_array.layers import Layer
+    from tensor_array.activation import relu
+
+    class ExampleLayer(Layer):
+        def calculate(self, t):
+            return relu(t * t - t) + t
+
+    example_layer = ExampleLayer()
+    traced_layer = trace(example_layer, ta.Tensor(np.zeros((2, 3), dtype=np.float32)))
+    for shape in ((2, 3), (2, 3), (4, 5)):
+        example_data = np.random.randn(*shape).astype(np.float32)
+        expected = np.maximum(example_data * example_data - example_data, 0) + example_data
+        np.testing.assert_allclose(traced_layer(ta.Tensor(example_data)).numpy(), expected, rtol=1e-6)
+    assert len(traced_layer.graphs) == 2
+    from tensor_array.layers.util import Activation
+    traced_activation = trace(Activation("relu", inplace=True).eval(), ta.Tensor(np.zeros((2, 3), dtype=np.float32)))
+    example_data = np.random.randn(2, 3).astype(np.float32)
+    np.testing.assert_array_equal(traced_activation(ta.Tensor(example_data)).numpy(), np.maximum(example_data, 0))
+
+def test_graph_passes():
+    from tensor_array import trace
+    from tensor_array.layers import Layer
+    from tensor_array.activation import relu
+
+    class ExampleLayer(Layer):
+        def calculate(self, t):
+            unused = t - t
+            return relu(t * t + t * t - t)
+
+    example_data = np.random.randn(4, 8).astype(np.float32)
+    example_input = ta.Tensor(example_data)
+    plain_layer = trace(ExampleLayer(), example_input, passes=None)
+    optimized_layer = trace(ExampleLayer(), example_input)
+    plain_graph, = plain_layer.graphs.values()
+    optimized_graph, = optimized_layer.graphs.values()
+    assert plain_graph.node_count() == 6
+    assert optimized_graph.node_count() < plain_graph.node_count()
+    assert "fused[" in optimized_graph.dump()
+    expected = np.maximum(2 * example_data * example_data - example_data, 0)
+    np.testing.assert_allclose(optimized_layer(example_input).numpy(), expected, rtol=1e-5)
+
+def test_memory_stats():
+    import tensor_array
+    from tensor_array.layers.attention.attention import scaled_dot_product_attention
+    example_q = ta.Tensor(np.random.randn(1, 4, 8).astype(np.float32))
+    with ta.no_grad():
+        scaled_dot_product_attention(example_q, example_q, example_q)
+        stats_before = tensor_array.memory_stats()
+        scaled_dot_product_attention(example_q, example_q, example_q)
+        stats_after = tensor_array.memory_stats()
+    assert stats_after['num_allocs'] > stats_before['num_allocs']
+    assert stats_after['num_system_allocs'] == stats_before['num_system_allocs']
+    assert stats_after['allocated_bytes'] == stats_before['allocated_bytes']
+    tensor_array.empty_cache()
+    assert tensor_array.memory_stats()['cached_bytes'] == 0
+
+def test_concurrent_inference():
+    from concurrent.futures import ThreadPoolExecutor
+    from tensor_array.layers import Layer, Parameter
+    from tensor_array.activation import relu
+
+    class ExampleLayer(Layer):
+        def __init__(self):
+            super().__init__()
+            self.w = Parameter(ta.Tensor(np.random.randn(32, 32).astype(np.float32)))
+            self.b = Parameter(ta.Tensor(np.random.randn(32).astype(np.float32)))
+
+        def calculate(self, t):
+            return relu(t @ self.w + self.b) @ self.w
+
+    example_layer = ExampleLayer().eval()
+    example_inputs = [np.random.randn(4, 32).astype(np.float32) for _ in range(16)]
+    expected = [example_layer(ta.Tensor(data)).numpy(copy=True) for data in example_inputs]
+
+    def forward(i):
+        for _ in range(20):
+            output = example_layer(ta.Tensor(example_inputs[i])).numpy(copy=True)
+            np.testing.assert_allclose(output, expected[i], rtol=1e-5)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(forward, range(len(example_inputs))))
+
+def test_num_threads():
+    import tensor_array
+    from tensor_array.activation import relu
+    example_data = np.random.randn(1 << 17).astype(np.float32)
+    previous = tensor_array.get_num_threads()
+    results = []
+    with ta.no_grad():
+        for num_threads in (1, 4):
+            tensor_array.set_num_threads(num_threads)
+            assert tensor_array.get_num_threads() == num_threads
+            results.append(relu(ta.Tensor(example_data)).numpy(copy=True))
+    tensor_array.set_num_threads(previous)
+    np.testing.assert_array_equal(results[0], results[1])
+    np.testing.assert_array_equal(results[0], np.maximum(example_data, 0))
+
+def test_matmul():
+    from tensor_array.core.operator import matmul
+    example_a = np.random.randn(3, 1, 33, 70).astype(np.float32)
+    example_b = np.random.randn(4, 70, 65).astype(np.float32)
+    with ta.no_grad():
+        example_product = matmul(ta.Tensor(example_a), ta.Tensor(example_b)).numpy(copy=True)
+        example_transposed = matmul(ta.Tensor(example_a.swapaxes(-1, -2).copy()), ta.Tensor(example_b.swapaxes(-1, -2).copy()), True, True).numpy(copy=True)
+    np.testing.assert_allclose(example_product, example_a @ example_b, rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(example_transposed, example_a @ example_b, rtol=1e-4, atol=1e-4)
+    with pytest.raises(ValueError):
+        matmul(ta.Tensor(example_b[0, :, 0].copy()), ta.Tensor(example_b[0]), True, False)
+
+def test_views():
+    example_data = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+    example_tensor = ta.Tensor(example_data)
+    with ta.no_grad():
+        np.testing.assert_array_equal(example_tensor.permute((2, 0, 1)).numpy(), example_data.transpose(2, 0, 1))
+        np.testing.assert_array_equal(example_tensor[(slice(None), slice(None, None, -2), 1)].numpy(), example_data[:, ::-2, 1])
+        np.testing.assert_array_equal(example_tensor[-1].numpy(), example_data[-1])
+        np.testing.assert_array_equal(example_tensor[(slice(None), slice(0, 1))].expand((5, 2, 3, 4)).numpy(), np.broadcast_to(example_data[:, 0:1], (5, 2, 3, 4)))
+        assert example_tensor.unsqueeze(1).shape() == (2, 1, 3, 4)
+        assert example_tensor.unsqueeze(1).squeeze().shape() == (2, 3, 4)
+    example_view = example_tensor.transpose(0, 2)
+    np.testing.assert_array_equal(example_view.numpy(), example_data.transpose(2, 1, 0))
+    example_view.calc_grad()
+    assert example_tensor.get_grad().shape() == (2, 3, 4)
+
+def test_scalar_operands():
+    from tensor_array.core.operator import condition
+    example_data = np.arange(-6, 6, dtype=np.float32).reshape(3, 4)
+    example_tensor = ta.Tensor(example_data)
+    with ta.no_grad():
+        np.testing.assert_allclose((2 * example_tensor + 1.5).numpy(), 2 * example_data + 1.5)
+        np.testing.assert_allclose((1 - example_tensor / 4).numpy(), 1 - example_data / 4)
+        np.testing.assert_array_equal((example_tensor > 0).numpy(), example_data > 0)
+        np.testing.assert_array_equal(condition(example_tensor > 0, example_tensor, 0.0).numpy(), np.where(example_data > 0, example_data, 0))
+        example_bias = ta.Tensor(np.arange(4, dtype=np.float32))
+        np.testing.assert_allclose((example_tensor + example_bias).numpy(), example_data + np.arange(4))
+    example_bias = ta.Tensor(np.ones((1, 4), dtype=np.float32))
+    example_sum = example_tensor * 3 + example_bias
+    example_sum.calc_grad()
+    np.testing.assert_allclose(example_bias.get_grad().numpy(), np.full((1, 4), 3))
+    example_weights = np.random.randn(2, 3, 4).astype(np.float32)
+    example_weight_tensor = ta.Tensor(example_weights)
+    example_expected = {(4,): (0, 1), (2, 1, 4): (1,), (2, 3, 1): (2,), (1, 3, 1): (0, 2)}
+    for shape, axes in example_expected.items():
+        example_operand = ta.Tensor(np.random.randn(*shape).astype(np.float32))
+        ((ta.Tensor(np.zeros((2, 3, 4), dtype=np.float32)) + example_operand) * example_weight_tensor).calc_grad()
+        np.testing.assert_allclose(example_operand.get_grad().numpy(), example_weights.sum(axis=axes).reshape(shape), rtol=1e-5, atol=1e-6)
+
+def test_out_and_in_place():
+    from tensor_array.core.operator import add, matmul
+    example_a = ta.Tensor(np.random.randn(64, 64).astype(np.float32))
+    example_b = ta.Tensor(np.random.randn(64, 64).astype(np.float32))
+    example_out = ta.Tensor(np.zeros((64, 64), dtype=np.float32))
+    example_acc = ta.Tensor(np.zeros((64, 64), dtype=np.float32))
+    # Arrays sharing the storage of the tensors see every write made in place.
+    example_out_storage = example_out.numpy()
+    example_acc_storage = example_acc.numpy()
+    with ta.no_grad():
+        for step in range(4):
+            assert add(example_a, example_b, out=example_out) is example_out
+            np.testing.assert_allclose(example_out_storage, example_a.numpy() + example_b.numpy(), rtol=1e-6)
+            matmul(example_a, example_b, out=example_out)
+            example_acc.mul_(0.5).add_(example_out)
+        example_result = example_a + example_b
+        assert example_result.mul_(2.0) is example_result
+        with pytest.raises(ValueError):
+            add(example_a, example_b, out=ta.Tensor(np.zeros((2, 2), dtype=np.float32)))
+        with pytest.raises(TypeError):
+            add(example_a, example_b, out=ta.Tensor(np.zeros((64, 64), dtype=np.float64)))
+    # The results land in the buffers the tensors had before the loop, no new buffer replaces them.
+    assert example_out.numpy().ctypes.data == example_out_storage.ctypes.data
+    assert example_acc.numpy().ctypes.data == example_acc_storage.ctypes.data
+    example_product = example_a.numpy() @ example_b.numpy()
+    np.testing.assert_allclose(example_out_storage, example_product, rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(example_acc_storage, example_product * 1.875, rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(example_result.numpy(), (example_a.numpy() + example_b.numpy()) * 2, rtol=1e-6)
+    # Autograd can not tell whether a recorded graph reads a tensor, so in-place writes are refused in grad mode,
+    # even to an accumulator no graph reads.
+    with pytest.raises(RuntimeError):
+        example_acc.add_(1.0)
+
+def test_reductions():
+    example_data = np.random.randn(4, 5, 6).astype(np.float32)
+    example_tensor = ta.Tensor(example_data)
+    with ta.no_grad():
+        np.testing.assert_allclose(example_tensor.sum().numpy(), example_data.sum(), rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(example_tensor.mean(1, keepdim=True).numpy(), example_data.mean(1, keepdims=True), rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(example_tensor.var((0, 2)).numpy(), example_data.var((0, 2), ddof=1), rtol=1e-4)
+        np.testing.assert_array_equal(example_tensor.max(-1).numpy(), example_data.max(-1))
+        np.testing.assert_array_equal(example_tensor.argmax(1).numpy(), example_data.argmax(1))
+        np.testing.assert_array_equal(ta.Tensor(np.arange(6, dtype=np.int32)).sum().numpy(), 15)
+        example_long = ta.Tensor(np.full(1 << 20, 0.1, dtype=np.float32))
+        np.testing.assert_allclose(example_long.sum().numpy(), 0.1 * (1 << 20), rtol=1e-6)
+        example_half = ta.Tensor(np.full(4096, 1.0, dtype=np.float16))
+        assert example_half.sum(dtype=ta.DataTypes.FLOAT).numpy() == 4096
+        # Op results are instances of the native class, which has the reductions too.
+        example_result = example_tensor * 2.0
+        np.testing.assert_allclose(example_result.sum((0, 1)).numpy(), example_data.sum((0, 1)) * 2, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(example_result.mean(dtype=ta.DataTypes.DOUBLE).numpy(), example_data.mean() * 2, rtol=1e-5)
+        np.testing.assert_allclose(example_result.var(-1, keepdim=True).numpy(), (example_data * 2).var(-1, ddof=1, keepdims=True), rtol=1e-4)
+        np.testing.assert_array_equal(example_result.min(0).numpy(), example_data.min(0) * 2)
+        np.testing.assert_array_equal(example_result.argmin(2).numpy(), example_data.argmin(2))
+    example_mean = (example_tensor * 1.0).mean((0, 2))
+    example_mean.calc_grad()
+    np.testing.assert_allclose(example_tensor.get_grad().numpy(), np.full((4, 5, 6), 1 / 24), rtol=1e-5)
+
+def test_normalization():
+    from tensor_array.layers.normalization import LayerNorm, RMSNorm
+    example_data = np.random.randn(3, 4, 40).astype(np.float32)
+    example_residual = np.random.randn(3, 4, 40).astype(np.float32)
+    example_sum = example_data + example_residual
+    example_centered = example_sum - example_sum.mean(-1, keepdims=True)
+    example_layer_norm = LayerNorm(40)
+    example_rms_norm = RMSNorm((4, 40))
+    with ta.no_grad():
+        example_output = example_layer_norm(ta.Tensor(example_data), ta.Tensor(example_residual)).numpy()
+        np.testing.assert_allclose(example_output, example_centered / np.sqrt(example_sum.var(-1, keepdims=True) + 1e-5), rtol=1e-4, atol=1e-4)
+        example_output = example_rms_norm(ta.Tensor(example_data)).numpy()
+        example_mean_square = (example_data ** 2).mean((-2, -1), keepdims=True)
+        np.testing.assert_allclose(example_output, example_data / np.sqrt(example_mean_square + 1e-6), rtol=1e-4, atol=1e-4)
+    example_input = ta.Tensor(example_data)
+    example_layer_norm(example_input).calc_grad()
+    # The outputs of a row sum to the bias whatever the input, so their gradient is zero.
+    np.testing.assert_allclose(example_input.get_grad().numpy(), np.zeros((3, 4, 40)), atol=1e-4)
+
+def test_activation_checkpoint():
+    from tensor_array.layers.util import Activation, Linear, Sequential
+    from tensor_array.layers.parameter import zero_grad
+    from tensor_array.activation import relu
+    example_model = Sequential([Linear(16), Activation(relu), Linear(16), Activation(relu), Linear(4)])
+    example_input = ta.Tensor(np.random.randn(8, 16).astype(np.float32))
+    example_model(example_input)
+    example_params = list(example_model.parameters())
+    example_grads = []
+    for segments in (0, 3):
+        example_model.checkpoint_segments = segments
+        zero_grad(example_params)
+        example_model(example_input).sum().calc_grad(inputs=example_params)
+        example_grads.append([param.grad.numpy().copy() for param in example_params])
+    for expected, actual in zip(*example_grads):
+        np.testing.assert_allclose(actual, expected, rtol=1e-4, atol=1e-5)
+    with pytest.raises(RuntimeError):
+        example_model(example_input).sum().calc_grad()
+
+def test_activation_checkpoint_abandoned():
+    from tensor_array.layers.util import Linear
+    from tensor_array.layers.util.checkpoint import checkpoint, has_checkpoints
+    example_layer = Linear(4)
+    example_input = ta.Tensor(np.random.randn(3, 4).astype(np.float32))
+    example_layer(example_input)
+    example_params = list(example_layer.parameters())
+    example_layer(example_input).sum().calc_grad(inputs=example_params, accumulate=False)
+    example_expected = [param.grad.numpy().copy() for param in example_params]
+    example_calls = []
+
+    def example_function(t):
+        example_calls.append(t)
+        return example_layer(t)
+
+    # A forward that is never backwarded is dropped by the next backward pass without being recomputed.
+    checkpoint(example_function, example_input)
+    example_layer(example_input).sum().calc_grad(inputs=example_params, accumulate=False)
+    assert len(example_calls) == 1 and not has_checkpoints()
+    for expected, param in zip(example_expected, example_params):
+        np.testing.assert_allclose(param.grad.numpy(), expected, rtol=1e-5)
+    checkpoint(example_function, example_input)
+    checkpoint(example_function, example_input).sum().calc_grad(inputs=example_params, accumulate=False)
+    assert len(example_calls) == 4
+    for expected, param in zip(example_expected, example_params):
+        np.testing.assert_allclose(param.grad.numpy(), expected, rtol=1e-5)
+
+def test_data_loader():
+    from tensor_array.data import ArrayDataset, DataLoader, IterableDataset
+    example_features = np.random.randn(10, 3).astype(np.float32)
+    example_labels = np.arange(10, dtype=np.int64)
+    example_dataset = ArrayDataset(example_features, example_labels)
+    for worker_type in ('thread', 'process'):
+        example_loader = DataLoader(example_dataset, batch_size=4, shuffle=True, seed=0, num_workers=2, worker_type=worker_type)
+        example_batches = list(example_loader)
+        assert len(example_batches) == len(example_loader) == 3
+        example_seen = np.concatenate([labels.numpy() for _, labels in example_batches])
+        assert sorted(example_seen) == list(range(10))
+        for features, labels in example_batches:
+            np.testing.assert_array_equal(features.numpy(), example_features[labels.numpy()])
+
+    class ExampleStream(IterableDataset):
+        def __iter__(self):
+            return iter(range(20))
+
+    example_shards = [
+        DataLoader(ExampleStream(), batch_size=3, shuffle_buffer_size=4, seed=0, num_shards=2, shard_index=index)
+        for index in range(2)
+        ]
+    example_seen = [int(value) for loader in example_shards for batch in loader for value in batch.numpy()]
+    assert sorted(example_seen) == list(range(20))
+
+def test_batched_inference():
+    import asyncio
+    from tensor_array import BatchedInference
+    example_inputs = [np.random.randn(length, 3).astype(np.float32) for length in range(1, 6)]
+
+    example_other = np.random.randn(2, 4).astype(np.float32)
+
+    async def serve():
+        async with BatchedInference(lambda batch: batch * 2.0, max_batch_size=8, max_wait_ms=50) as example_server:
+            outputs = await asyncio.gather(*(example_server(data) for data in example_inputs + [example_other]))
+            with pytest.raises(ValueError):
+                await example_server(np.float32(1.0))
+            return outputs, example_server.metrics()
+
+    example_outputs, example_metrics = asyncio.run(serve())
+    for data, output in zip(example_inputs + [example_other], example_outputs):
+        np.testing.assert_allclose(output.numpy(), data * 2.0)
+    assert example_metrics['batch_size_histogram'] == {1: 1, 5: 1}
+    assert example_metrics['queue_depth'] == 0
+
+def test_autocast():
+    from tensor_array import autocast, GradScaler
+    from tensor_array.amp import cast_parameter
+    from tensor_array.activation import softmax
+    from tensor_array.layers import Parameter
+    from tensor_array.optim import SGD
+    example_a = np.random.randn(8, 32).astype(np.float32)
+    example_b = np.random.randn(32, 16).astype(np.float32)
+    with ta.no_grad(), autocast(ta.DataTypes.BFLOAT16):
+        example_product = ta.Tensor(example_a) @ ta.Tensor(example_b)
+        assert ta.DataTypes(example_product.dtype()) == ta.DataTypes.BFLOAT16
+        assert ta.DataTypes(softmax(example_product, -1).dtype()) == ta.DataTypes.FLOAT
+        assert ta.DataTypes(example_product.sum().dtype()) == ta.DataTypes.FLOAT
+        np.testing.assert_allclose(example_product.cast(ta.DataTypes.FLOAT.value).numpy(), example_a @ example_b, rtol=3e-2, atol=3e-1)
+        example_param = Parameter(ta.Tensor(example_b))
+        assert cast_parameter(example_param) is cast_parameter(example_param)
+    assert cast_parameter(example_param) is example_param
+
+    # A region spanning several steps casts the parameters again after each update.
+    example_param = Parameter(ta.Tensor(np.ones(4, dtype=np.float32)))
+    example_optimizer = SGD([example_param], lr=0.5)
+    with autocast(ta.DataTypes.BFLOAT16):
+        for example_step in range(2):
+            example_loss = cast_parameter(example_param).sum()
+            np.testing.assert_allclose(example_loss.numpy(), 4.0 - 2.0 * example_step)
+            example_loss.calc_grad(inputs=[example_param])
+            example_optimizer.step()
+
+    example_param = Parameter(ta.Tensor(np.ones(4, dtype=np.float32)))
+    example_scaler = GradScaler(init_scale=4.0)
+    example_optimizer = SGD([example_param], lr=0.5)
+    with autocast(ta.DataTypes.HALF):
+        example_loss = (ta.Tensor(np.ones(4, dtype=np.float32)) * cast_parameter(example_param)).sum()
+    example_scaler.scale(example_loss).calc_grad(inputs=[example_param])
+    assert example_scaler.step(example_optimizer)
+    example_scaler.update()
+    np.testing.assert_allclose(example_param.numpy(), np.full(4, 0.5))
+    example_param.grad = ta.Tensor(np.full(4, np.inf, dtype=np.float32))
+    assert not example_scaler.step(example_optimizer)
+    example_scaler.update()
+    assert example_scaler.get_scale() == 2.0
+    np.testing.assert_allclose(example_param.numpy(), np.full(4, 0.5))